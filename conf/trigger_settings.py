@@ -33,6 +33,17 @@ TACACSRC_USE_PASSPHRASE = False
 # USING THIS IN YOUR ENVIRONMENT.
 TACACSRC_PASSPHRASE = 'bacon is awesome, son.' # NYI
 
+# How many seconds credentials read from the .tacacsrc are kept in memory, so
+# that connecting to many devices doesn't decrypt the file for every one of
+# them. Writing the file clears them. Set to 0 to disable.
+TACACSRC_CACHE_TTL = 300
+
+# Where the credential agent (tacacsrc_agent) listens. If an agent is running
+# there, .tacacsrc credentials are fetched from it instead of the file.
+TACACSRC_AGENT_SOCKET = os.getenv('TRIGGER_AGENT_SOCK',
+                                  os.path.join(USER_HOME, '.trigger',
+                                               'agent.sock'))
+
 # Default login realm to store user credentials (username, password) for
 # general use within the .tacacsrc
 DEFAULT_REALM = 'aol'
@@ -178,6 +189,33 @@ SSH_PORT = 22
 # The preferred order in which SSH authentication methods are tried.
 SSH_AUTHENTICATION_ORDER = ['password', 'keyboard-interactive', 'publickey']
 
+# Whether Trigger keeps metrics (such as active connections and command
+# latency) that can be served to Prometheus by long-running services. See
+# trigger.metrics.
+METRICS_ENABLED = True
+
+# The lowest level of messages logged by trigger.twister and trigger.cmds:
+# 'DEBUG', 'INFO', 'WARNING' or 'ERROR'. Debug messages include everything
+# sent to and received from devices, which is slow to format for large
+# outputs. Defaults to 'DEBUG' if the DEBUG environment variable is set.
+LOG_LEVEL = 'DEBUG' if os.getenv('DEBUG') else 'INFO'
+
+# Whether the XMLRPC server keeps SSH sessions to devices open between
+# requests, so that it doesn't log in and send the startup commands every
+# time. See trigger.twister.SessionPool.
+SESSION_POOL_ENABLED = False
+
+# How many SSH sessions a session pool keeps open to each device.
+SESSION_POOL_MAX_PER_DEVICE = 1
+
+# How many seconds a pooled session may sit idle before it's closed. Set to 0
+# to keep idle sessions open until the device closes them.
+SESSION_POOL_IDLE_TIMEOUT = 300
+
+# How often, in seconds, idle pooled sessions are checked with an SSH
+# keepalive, and closed if they don't answer. Set to 0 to disable.
+SESSION_POOL_HEALTH_CHECK_INTERVAL = 60
+
 # Default port for Telnet
 TELNET_PORT = 23
 
@@ -196,6 +234,14 @@ SSH_ASYNC_DISABLED = {
     'foundry': ['SWITCH'], # Old Foundry switches only do SSHv1
 }
 
+# Vendors whose devices can run each command in its own SSH exec channel, for
+# the exec_channels option of twister.execute and Commando. Cisco Nexus
+# switches can as well.
+SSH_EXEC_VENDORS = (
+    'arista',
+    'juniper',
+)
+
 # Vendors that basically just emulate Cisco's IOS and can be treated
 # accordingly for the sake of interaction.
 IOSLIKE_VENDORS = (
@@ -286,6 +332,17 @@ NETDEVICES_SOURCE = os.environ.get(
 # Assign NETDEVICES_SOURCE to NETDEVICES_FILE for backwards compatibility
 NETDEVICES_FILE = NETDEVICES_SOURCE
 
+# Path to a snapshot file used to cache the compiled NetDevice objects built
+# from NETDEVICES_SOURCE. When set, NetDevices loads the snapshot instead of
+# re-parsing the source for as long as the source and relevant settings are
+# unchanged. Set to None to disable.
+NETDEVICES_SNAPSHOT_FILE = os.environ.get('NETDEVICES_SNAPSHOT_FILE', None)
+
+# How often (in seconds) long-running Trigger services such as the XMLRPC
+# server should call NetDevices.reload() to pick up changes to
+# NETDEVICES_SOURCE. Set to 0 to disable.
+NETDEVICES_RELOAD_INTERVAL = 0
+
 # TextFSM Vendor Mappings. Override this if you have defined your own TextFSM templates.
 TEXTFSM_VENDOR_MAPPINGS = {
         "cisco": [ "ios", "nxos" ],
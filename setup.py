@@ -102,6 +102,7 @@ setup(
         'bin/optimizer',
         'bin/find_access',
         'bin/run_cmds',
+        'bin/tacacsrc_agent',
         'tools/gen_tacacsrc.py',
         'tools/convert_tacacsrc.py',
         'tools/tacacsrc2gpg.py',
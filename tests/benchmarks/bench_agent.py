@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure what reading ``.tacacsrc`` costs a new process, with and without a
+credential agent (`~trigger.agent`).
+
+Starts an agent on a temporary socket and times creating
+`~trigger.tacacsrc.Tacacsrc` objects, as each ``gong`` or ``run_cmds`` does
+once, reading the sample ``.tacacsrc`` used by the tests and asking the agent.
+With :setting:`USE_GPG_AUTH` reading the file forks ``gpg2`` as well, so the
+time it takes to run ``gpg2 --version`` is shown as the least that costs.
+Decrypting takes longer, and may prompt for a passphrase.
+
+Usage::
+
+    python tests/benchmarks/bench_agent.py [options]
+"""
+
+import optparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # Sets up the environment
+
+from trigger import agent
+from trigger.conf import settings
+from trigger.tacacsrc import Tacacsrc
+
+
+class SampleTacacsrc(Tacacsrc):
+    """Reads the sample .tacacsrc used by the tests."""
+    def _get_key_nonce_old(self):
+        return 'jschmoe\n'
+
+
+def read(number):
+    """Return the seconds each of ``number`` reads of .tacacsrc took."""
+    begin = timeit.default_timer()
+    for _ in xrange(number):
+        SampleTacacsrc()
+    return (timeit.default_timer() - begin) / number
+
+def run_gpg(number):
+    """Return the seconds each of ``number`` runs of gpg2 took, or None."""
+    with open(os.devnull, 'w') as devnull:
+        begin = timeit.default_timer()
+        try:
+            for _ in xrange(number):
+                subprocess.call(['gpg2', '--version'], stdout=devnull)
+        except OSError:
+            return None
+    return (timeit.default_timer() - begin) / number
+
+def main(argv):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--number', type='int', default=1000,
+                      help='Reads per measurement (default: %default)')
+    opts, args = parser.parse_args(argv)
+
+    tempdir = tempfile.mkdtemp()
+    path = os.path.join(tempdir, 'agent.sock')
+    process = subprocess.Popen([sys.executable, '-m', 'trigger.agent',
+                                '--foreground', '--no-load', '--socket', path])
+    try:
+        while not os.path.exists(path):
+            time.sleep(0.05)
+
+        settings.TACACSRC_AGENT_SOCKET = None
+        from_file = read(opts.number)
+        settings.TACACSRC_AGENT_SOCKET = path
+        SampleTacacsrc()  # Hands the credentials to the agent
+        from_agent = read(opts.number)
+        agent.AgentClient(path).stop()
+        process.wait()
+    finally:
+        if process.poll() is None:
+            process.terminate()
+        process.wait()
+        shutil.rmtree(tempdir)
+
+    print '%-24s %12s' % ('Tacacsrc()', 'us per read')
+    print '%-24s %12.0f' % ('file', from_file * 1e6)
+    print '%-24s %12.0f' % ('agent', from_agent * 1e6)
+    gpg = run_gpg(min(opts.number, 100))
+    if gpg is not None:
+        print '%-24s %12.0f' % ('gpg2 --version', gpg * 1e6)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure what fetching credentials from ``.tacacsrc`` costs when starting
+connections to many devices.
+
+Creates a `~trigger.twister.TriggerClientFactory` without credentials for
+each device, as `~trigger.cmds.Commando` does, with
+`~trigger.tacacsrc.CREDENTIAL_CACHE` enabled and disabled. Without the cache
+every factory reads the keyfile and ``.tacacsrc`` and decrypts them; with
+:setting:`USE_GPG_AUTH` it forks ``gpg2`` as well, which isn't measured here.
+
+Usage::
+
+    python tests/benchmarks/bench_credentials.py [options]
+"""
+
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # Sets up the environment
+
+from twisted.internet import defer
+
+from trigger.conf import settings
+from trigger import tacacsrc
+from trigger.twister import TriggerClientFactory
+
+
+class SampleTacacsrc(tacacsrc.Tacacsrc):
+    """Reads the sample .tacacsrc used by the tests."""
+    def _get_key_nonce_old(self):
+        return 'jschmoe\n'
+
+
+def write_tacacsrc(path):
+    """Write the sample credentials to ``path`` for the current user."""
+    tcrc = SampleTacacsrc(tacacsrc_file=settings.TACACSRC)
+    tcrc.__class__ = tacacsrc.Tacacsrc  # Encrypt them for the current user
+    tcrc.file_name = path
+    tcrc.write()
+
+def start(devices):
+    """Create a factory for each device and return how long it took."""
+    begin = timeit.default_timer()
+    for _ in xrange(devices):
+        TriggerClientFactory(defer.Deferred())
+    return timeit.default_timer() - begin
+
+def main(argv):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-d', '--devices', type='int', default=10000,
+                      help='Devices to start (default: %default)')
+    opts, args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    original = settings.TACACSRC
+    try:
+        path = os.path.join(tmpdir, 'tacacsrc')
+        write_tacacsrc(path)
+        settings.TACACSRC = path
+
+        print '%-10s %10s %14s' % ('cache', 'seconds', 'us per device')
+        for label, ttl in (('disabled', 0), ('enabled', 300)):
+            tacacsrc.CREDENTIAL_CACHE = tacacsrc.CredentialCache(ttl=ttl)
+            elapsed = start(opts.devices)
+            print '%-10s %10.3f %14.1f' % (label, elapsed,
+                                           elapsed / opts.devices * 1e6)
+    finally:
+        settings.TACACSRC = original
+        shutil.rmtree(tmpdir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure running commands in parallel SSH ``exec`` channels over one
+connection, as `~trigger.twister.execute` does with ``exec_channels``.
+
+Starts a `~trigger.simulator.DeviceFarm` in a separate process whose devices
+take ``--latency`` seconds to answer each command, and runs ``--commands``
+commands on every device in a shell, then in exec channels with each number
+of ``--channels`` at once, reporting how long each device took. Results that
+come back out of order or fail are counted as failures.
+
+Usage::
+
+    python tests/benchmarks/bench_exec_channels.py [options]
+"""
+
+import json
+import optparse
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # Sets up the environment
+
+from bench_simulator import percentile, start_farm
+
+os.environ.setdefault('TERM', 'vt100')
+
+
+def bench(devices, opts, modes):
+    """Run commands on every device in each mode and return the seconds."""
+    from twisted.internet import defer, reactor
+    from trigger.tacacsrc import Credentials
+
+    creds = Credentials('bench', 'bench', 'simulator')
+    commands = ['show simulated %d' % num for num in xrange(opts.commands)]
+    seconds = dict((label, []) for label, _ in modes)
+    failures = dict((label, 0) for label, _ in modes)
+
+    def run_device(label, device, exec_channels):
+        start = time.time()
+        d = device.execute(commands, creds=creds, timeout=opts.timeout,
+                           exec_channels=exec_channels, force_cli=True)
+
+        def done(results):
+            seconds[label].append(time.time() - start)
+            for command, result in zip(commands, results):
+                if command not in result:
+                    failures[label] += 1
+            failures[label] += len(commands) - len(results)
+
+        def failed(failure):
+            failures[label] += len(commands)
+        return d.addCallbacks(done, failed)
+
+    @defer.inlineCallbacks
+    def run():
+        try:
+            for label, exec_channels in modes:
+                yield defer.DeferredList([
+                    run_device(label, device, exec_channels)
+                    for device in devices])
+        finally:
+            reactor.callLater(0.1, reactor.stop)
+
+    reactor.callWhenRunning(run)
+    reactor.run()
+    return seconds, failures
+
+def main(argv):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--devices', type='int', default=10,
+                      help='Number of devices (default: %default)')
+    parser.add_option('-c', '--commands', type='int', default=16,
+                      help='Commands per device (default: %default)')
+    parser.add_option('--channels', default='1,2,4,8',
+                      help='Comma-separated numbers of exec channels to run '
+                           'at once (default: %default)')
+    parser.add_option('--output-size', type='int', default=1024,
+                      help='Bytes of output per command (default: %default)')
+    parser.add_option('--latency', type='float', default=0.05,
+                      help='Simulated seconds per command (default: '
+                           '%default)')
+    parser.add_option('--jitter', type='float', default=0.02,
+                      help='Random seconds added to the latency (default: '
+                           '%default)')
+    parser.add_option('--timeout', type='int', default=60,
+                      help='Command timeout in seconds (default: %default)')
+    opts, args = parser.parse_args(argv)
+    opts.personality, opts.transport = 'junos', 'ssh'
+    opts.error_rate = 0
+    modes = [('shell', None)] + [('exec x%d' % int(n), int(n))
+                                 for n in opts.channels.split(',')]
+
+    tmpdir = tempfile.mkdtemp()
+    proc = None
+    try:
+        path = os.path.join(tmpdir, 'netdevices.json')
+        proc = start_farm(opts, path)
+
+        from trigger.netdevices import NetDevice
+        with open(path) as fh:
+            records = json.load(fh)
+        devices = [NetDevice(data=record, with_acls=False)
+                   for record in records]
+        seconds, failures = bench(devices, opts, modes)
+    finally:
+        if proc is not None:
+            os.kill(proc.pid, signal.SIGTERM)
+            proc.wait()
+        shutil.rmtree(tmpdir)
+
+    print '%d devices, %d commands each, %.0f ms per command' % (
+        len(devices), opts.commands, opts.latency * 1000)
+    print
+    print '%-12s %12s %12s %12s' % ('ms/device', 'p50', 'p95', 'failed')
+    for label, _ in modes:
+        print '%-12s %12.1f %12.1f %12d' % (
+            label, percentile(seconds[label], 50) * 1000,
+            percentile(seconds[label], 95) * 1000, failures[label])
+    return 1 if any(failures.values()) else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark how `~trigger.netdevices` scales with the size of the inventory.
+
+Synthetic inventories (see `synthetic`) are generated in every supported
+format, and the following tasks are measured for each, each in a fresh process
+so that peak RSS isn't polluted by earlier runs:
+
+``load``
+    Read every record using the loader for that format and throw it away,
+    which isolates the cost of the loader itself.
+``populate``
+    Build a `~trigger.netdevices.NetDevices` from the source, which is what
+    every Trigger tool does at startup.
+``query``
+    Time `~trigger.netdevices.NetDevices.find_many()`,
+    `~trigger.netdevices.NetDevices.search()` and
+    `~trigger.netdevices.NetDevices.match()`, both the first call (which builds
+    the indexes) and repeated calls. Only run for the first format, since
+    queries don't depend on where devices came from.
+
+Results are written as a JSON document so that runs can be compared across
+releases, and ``--compare`` reports any measurements that got slower or
+bigger than a previous run by more than ``--threshold``.
+
+Usage::
+
+    python tests/benchmarks/bench_inventory.py [options] [count ...]
+
+Defaults to 1,000, 10,000 and 100,000 devices in every format. For example, to
+check for regressions against a previous release::
+
+    python tests/benchmarks/bench_inventory.py -o before.json 1000 500000
+    ...
+    python tests/benchmarks/bench_inventory.py -c before.json 1000 500000
+"""
+
+import json
+import optparse
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+LOADERS = 'trigger.netdevices.loaders.filesystem.'
+
+# Format: (filename, writer, loader, settings)
+FORMATS = {
+    'json': ('netdevices.json', synthetic.write_json,
+             LOADERS + 'JSONLoader', {}),
+    'xml': ('netdevices.xml', synthetic.write_xml,
+            LOADERS + 'XMLLoader', {}),
+    'csv': ('netdevices.csv', synthetic.write_csv,
+            LOADERS + 'CSVLoader', {}),
+    'rancid': ('rancid', synthetic.write_rancid,
+               LOADERS + 'RancidLoader', {'RANCID_RECURSE_SUBDIRS': True}),
+    'sqlite': ('netdevices.sql', synthetic.write_sqlite,
+               LOADERS + 'SQLiteLoader', {}),
+}
+FORMAT_ORDER = ('json', 'xml', 'csv', 'rancid', 'sqlite')
+TASKS = ('load', 'populate', 'query')
+COUNTS = [1000, 10000, 100000]
+
+# Queries for the ``query`` task
+QUERIES = [
+    {'vendor': 'juniper'},
+    {'site': 'site042'},
+    {'vendor': 'cisco', 'devicetype': 'firewall', 'owningteam': 'team 07'},
+    {'make': 'bacon'},
+]
+SEARCHES = ['dev00099', 'site12', 'net.example']
+ROUNDS = 10
+
+# Measurements compared by --compare, where bigger is worse.
+METRICS = ('seconds', 'peak_kb', 'first_ms', 'repeat_ms')
+
+
+def peak_kb():
+    """Return the peak RSS of this process in KB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def configure(fmt, source):
+    """Point Trigger at ``source`` using only the loader for ``fmt``."""
+    from trigger.conf import settings
+    filename, writer, loader, extra = FORMATS[fmt]
+    settings.NETDEVICES_SOURCE = source
+    settings.NETDEVICES_LOADERS = (loader,)
+    settings.NETDEVICES_SNAPSHOT_FILE = None
+    settings.WITH_ACLS = False
+    for key, value in extra.iteritems():
+        setattr(settings, key, value)
+    return loader
+
+def measure_load(fmt, source):
+    """Read every record from ``source`` with the loader for ``fmt``."""
+    from trigger.netdevices import loader
+    data_loader = loader.find_data_loader(configure(fmt, source))
+    base = peak_kb()
+    start = time.time()
+    count = 0
+    for record in data_loader.load_data_source(source):
+        dict(record)
+        count += 1
+    return [{'count': count, 'seconds': time.time() - start,
+             'peak_kb': peak_kb(), 'growth_kb': peak_kb() - base}]
+
+def measure_populate(fmt, source):
+    """Build `NetDevices` from ``source``."""
+    configure(fmt, source)
+    base = peak_kb()
+    start = time.time()
+    from trigger.netdevices import NetDevices
+    count = len(NetDevices(production_only=False))
+    return [{'count': count, 'seconds': time.time() - start,
+             'peak_kb': peak_kb(), 'growth_kb': peak_kb() - base}]
+
+def timed(func, *args, **kwargs):
+    """
+    Return the time in ms of the first call to ``func`` and the mean of
+    `ROUNDS` more calls, and the result.
+    """
+    start = time.time()
+    result = func(*args, **kwargs)
+    first = (time.time() - start) * 1000
+    start = time.time()
+    for _ in xrange(ROUNDS):
+        func(*args, **kwargs)
+    repeat = (time.time() - start) * 1000 / ROUNDS
+    return first, repeat, result
+
+def measure_query(fmt, source):
+    """Time queries against `NetDevices` built from ``source``."""
+    configure(fmt, source)
+    from trigger.netdevices import NetDevices
+    nd = NetDevices(production_only=False)
+
+    names = sorted(nd.keys())
+    step = max(len(names) // 100, 1)
+    keys = [name.split('.', 1)[0] for name in names[::step]] + ['bacon']
+
+    calls = [('find_many(%d)' % len(keys), nd.find_many, (keys,), {})]
+    for token in SEARCHES:
+        calls.append(('search(%r)' % token, nd.search, (token,), {}))
+    for query in QUERIES:
+        label = 'match(%s)' % ', '.join('%s=%r' % kv for kv in
+                                        sorted(query.items()))
+        calls.append((label, nd.match, (), query))
+
+    results = []
+    for label, func, args, kwargs in calls:
+        first, repeat, result = timed(func, *args, **kwargs)
+        results.append({'query': label, 'count': len(nd),
+                        'hits': len(result), 'first_ms': first,
+                        'repeat_ms': repeat})
+    return results
+
+MEASUREMENTS = {
+    'load': measure_load,
+    'populate': measure_populate,
+    'query': measure_query,
+}
+
+def run(task, fmt, source):
+    """Run a measurement in a child process and return its results."""
+    output = subprocess.check_output([sys.executable, __file__, '--measure',
+                                      task, fmt, source])
+    return json.loads(output.splitlines()[-1])
+
+def report(result):
+    """Print a line for ``result`` to stderr."""
+    if 'query' in result:
+        line = '  %-6s %-8s %-48s first %9.2f ms  repeat %9.3f ms' % (
+            result['format'], result['task'], result['query'],
+            result['first_ms'], result['repeat_ms'])
+    else:
+        line = '  %-6s %-8s %9.2f s  peak %8.1f MB  growth %8.1f MB' % (
+            result['format'], result['task'], result['seconds'],
+            result['peak_kb'] / 1024.0, result['growth_kb'] / 1024.0)
+    print >>sys.stderr, line
+
+def bench(count, formats, tasks):
+    """Generate and measure inventories of ``count`` devices."""
+    results = []
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for fmt in formats:
+            filename, writer, loader, extra = FORMATS[fmt]
+            source = writer(os.path.join(tmpdir, filename), count)
+            print >>sys.stderr, '%d devices (%s)' % (count, fmt)
+            for task in tasks:
+                if task == 'query' and fmt != formats[0]:
+                    continue
+                for result in run(task, fmt, source):
+                    assert result['count'] == count, (fmt, task, result)
+                    result.update(format=fmt, task=task)
+                    report(result)
+                    results.append(result)
+    finally:
+        shutil.rmtree(tmpdir)
+    return results
+
+def result_key(result):
+    """Return what identifies ``result`` across runs."""
+    return (result['format'], result['task'], result['count'],
+            result.get('query'))
+
+def compare(baseline, results, threshold):
+    """
+    Print the measurements in ``results`` that are worse than in ``baseline``
+    by more than ``threshold`` and return how many there were.
+    """
+    before = dict((result_key(r), r) for r in baseline['results'])
+    regressions = 0
+    for result in results:
+        old = before.get(result_key(result))
+        if old is None:
+            continue
+        for metric in METRICS:
+            if metric not in result or not old.get(metric):
+                continue
+            ratio = result[metric] / float(old[metric])
+            if ratio > threshold:
+                regressions += 1
+                print >>sys.stderr, 'REGRESSION %s %s: %.3f -> %.3f (%.2fx)' % (
+                    ' '.join(str(k) for k in result_key(result) if k),
+                    metric, old[metric], result[metric], ratio)
+    return regressions
+
+def main(argv):
+    if argv[:1] == ['--measure']:
+        task, fmt, source = argv[1:]
+        print json.dumps(MEASUREMENTS[task](fmt, source))
+        return 0
+
+    parser = optparse.OptionParser(usage='%prog [options] [count ...]')
+    parser.add_option('-f', '--formats', default=','.join(FORMAT_ORDER),
+                      help='Comma-separated formats to generate '
+                           '(default: %default)')
+    parser.add_option('-t', '--tasks', default=','.join(TASKS),
+                      help='Comma-separated tasks to run (default: %default)')
+    parser.add_option('-o', '--output',
+                      help='Write results to this file instead of stdout')
+    parser.add_option('-c', '--compare',
+                      help='Compare results against this earlier output')
+    parser.add_option('--threshold', type='float', default=1.25,
+                      help='Ratio above which a measurement counts as a '
+                           'regression (default: %default)')
+    opts, args = parser.parse_args(argv)
+
+    formats = opts.formats.split(',')
+    tasks = opts.tasks.split(',')
+    for fmt in formats:
+        if fmt not in FORMATS:
+            parser.error('Unknown format: %r' % fmt)
+    for task in tasks:
+        if task not in TASKS:
+            parser.error('Unknown task: %r' % task)
+    counts = [int(arg) for arg in args] or COUNTS
+
+    import trigger
+    results = []
+    for count in counts:
+        results.extend(bench(count, formats, tasks))
+    document = {
+        'trigger_version': trigger.full_version,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': results,
+    }
+
+    if opts.output:
+        with open(opts.output, 'w') as fh:
+            json.dump(document, fh, indent=2, sort_keys=True)
+    else:
+        print json.dumps(document, indent=2, sort_keys=True)
+
+    if opts.compare:
+        with open(opts.compare) as fh:
+            baseline = json.load(fh)
+        if compare(baseline, results, opts.threshold):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
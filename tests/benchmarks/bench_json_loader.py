@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare peak memory and time of the streaming
+`~trigger.netdevices.loaders.filesystem.JSONLoader` against loading the whole
+document with ``json.load()``.
+
+Each measurement runs in a fresh process so that peak RSS isn't polluted by
+earlier runs. Two things are measured for each method:
+
+``decode``
+    Decode every record and throw it away, which isolates the cost of the
+    loader itself.
+``netdevices``
+    Build a `~trigger.netdevices.NetDevices` from the file, which is what
+    every Trigger tool does at startup.
+
+Usage::
+
+    python tests/benchmarks/bench_json_loader.py [count]
+
+Defaults to 200,000 devices.
+"""
+
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+METHODS = ('json.load', 'stream')
+TASKS = ('decode', 'netdevices')
+
+
+def use_json_load():
+    """Put back the original, non-streaming JSONLoader.get_data()."""
+    from trigger.netdevices.loaders.filesystem import JSONLoader
+
+    def get_data(self, data_source):
+        with open(data_source, 'r') as contents:
+            data = json.load(contents)
+        return data
+    JSONLoader.get_data = get_data
+
+def measure(method, task, source):
+    """Run a single measurement in this process and print the results."""
+    from trigger.conf import settings
+    settings.NETDEVICES_SOURCE = source
+    settings.NETDEVICES_SNAPSHOT_FILE = None
+    settings.WITH_ACLS = False
+
+    if method == 'json.load':
+        use_json_load()
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.time()
+    if task == 'decode':
+        from trigger.netdevices.loaders.filesystem import JSONLoader
+        count = 0
+        for record in JSONLoader().load_data_source(source):
+            count += 1
+    else:
+        from trigger.netdevices import NetDevices
+        count = len(NetDevices(production_only=False))
+    elapsed = time.time() - start
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print json.dumps({'count': count, 'seconds': elapsed,
+                      'peak_kb': peak_rss, 'growth_kb': peak_rss - base_rss})
+
+def run(method, task, source):
+    """Run a measurement in a child process and return its results."""
+    output = subprocess.check_output([sys.executable, __file__, '--measure',
+                                      method, task, source])
+    return json.loads(output.splitlines()[-1])
+
+def bench(count):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = synthetic.write_json(os.path.join(tmpdir, 'nd.json'), count)
+        size_mb = os.path.getsize(source) / 1024.0 / 1024
+        print '%d devices (%.1f MB of JSON)' % (count, size_mb)
+        for task in TASKS:
+            for method in METHODS:
+                result = run(method, task, source)
+                assert result['count'] == count, result
+                print '  %-12s %-10s %8.2f s  peak %8.1f MB  growth %8.1f MB' % (
+                    task, method, result['seconds'],
+                    result['peak_kb'] / 1024.0, result['growth_kb'] / 1024.0)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def main(args):
+    if args[:1] == ['--measure']:
+        return measure(*args[1:])
+    counts = [int(arg) for arg in args] or [200000]
+    for count in counts:
+        bench(count)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
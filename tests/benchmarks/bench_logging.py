@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure what logging costs while receiving large command outputs.
+
+Feeds outputs of increasing size to a telnet
+`~trigger.twister.IoslikeSendExpect` a packet at a time, with Twisted logging
+to ``/dev/null`` the way ``run_cmds`` always logs to a file, and times it
+with :setting:`LOG_LEVEL` set to ``DEBUG`` and to ``INFO``. At ``DEBUG`` the
+``repr()`` of every packet and of the whole result is formatted and written;
+at ``INFO`` none of it is.
+
+It also times a single debug message about a packet of each size, logged
+the old way with ``log.msg()`` and the new way with a logger at ``INFO``.
+
+Usage::
+
+    python tests/benchmarks/bench_logging.py [options]
+"""
+
+import optparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # Sets up the environment
+
+from twisted.internet import defer, task
+from twisted.python import log
+from twisted.test import proto_helpers
+
+from trigger import logger, twister
+from trigger.twister import IoslikeSendExpect, TriggerClientFactory
+
+
+LINE = '  10.%d.%d.0/24 via 192.168.0.1, GigabitEthernet0/1, 2w3d\r\n'
+PROMPT = 'router1#'
+
+
+class Device(object):
+    nodeName = 'router1'
+    startup_commands = []
+    delimiter = '\n'
+
+    def __str__(self):
+        return self.nodeName
+
+
+def make_packets(megabytes, packet_size):
+    """Return the echoed command and its output, split into packets."""
+    lines = ['show ip route\r\n']
+    size = 0
+    num = 0
+    while size < megabytes * 1024 * 1024:
+        line = LINE % (num // 256 % 256, num % 256)
+        lines.append(line)
+        size += len(line)
+        num += 1
+    output = ''.join(lines) + PROMPT
+    return [output[i:i + packet_size]
+            for i in xrange(0, len(output), packet_size)]
+
+def receive(packets):
+    """Run a command with the output ``packets`` and return its duration."""
+    clock = task.Clock()
+    twister.reactor = clock
+    proto = IoslikeSendExpect(Device(), ['show ip route'])
+    proto.factory = TriggerClientFactory(defer.Deferred(),
+                                         creds=('bacon', 'eggs'))
+    proto.factory.d.addErrback(lambda failure: None)
+    transport = proto_helpers.StringTransport()
+    proto.write = transport.write
+    proto.loseConnection = lambda: None
+    proto.makeConnection(transport)
+    proto.dataReceived('\r\n' + PROMPT)
+    clock.advance(0)
+
+    start = timeit.default_timer()
+    for packet in packets:
+        proto.dataReceived(packet)
+    elapsed = timeit.default_timer() - start
+    assert len(proto.results) == 1
+    proto.setTimeout(None)
+    return elapsed
+
+def time_message(packet, number):
+    """
+    Return the seconds per message about ``packet`` logged the old way and
+    the new way.
+    """
+    device = Device()
+    log_ = logger.get_logger('bench')
+    start = timeit.default_timer()
+    for _ in xrange(number):
+        log.msg('[%s] BYTES: %r' % (device, packet))
+    old = timeit.default_timer() - start
+    start = timeit.default_timer()
+    for _ in xrange(number):
+        log_.debug('[%s] BYTES: %r', device, packet)
+    new = timeit.default_timer() - start
+    return old / number, new / number
+
+def main(argv):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-s', '--sizes', default='1,5,10',
+                      help='Output sizes in MB (default: %default)')
+    parser.add_option('-p', '--packet-size', type='int', default=32768,
+                      help='Bytes per packet (default: %default)')
+    parser.add_option('-n', '--number', type='int', default=1000,
+                      help='Messages per measurement (default: %default)')
+    opts, args = parser.parse_args(argv)
+
+    devnull = open(os.devnull, 'w')
+    log.startLogging(devnull, setStdout=False)
+    reactor = twister.reactor
+
+    print '%8s %8s %12s %12s' % ('MB', 'packets', 'DEBUG s', 'INFO s')
+    try:
+        for size in [float(size) for size in opts.sizes.split(',')]:
+            packets = make_packets(size, opts.packet_size)
+            times = []
+            for level in ('DEBUG', 'INFO'):
+                logger.set_level(level)
+                times.append(receive(packets))
+            print '%8g %8d %12.3f %12.3f' % (size, len(packets), times[0],
+                                             times[1])
+    finally:
+        twister.reactor = reactor
+
+    logger.set_level('INFO')
+    print
+    print '%8s %14s %14s' % ('packet', 'log.msg() us', 'debug() us')
+    for packet_size in (1460, 4096, 32768):
+        packet = make_packets(1, packet_size)[1]
+        old, new = time_message(packet, opts.number)
+        print '%8d %14.1f %14.2f' % (packet_size, old * 1e6, new * 1e6)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
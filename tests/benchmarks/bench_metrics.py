@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure what `~trigger.metrics` costs on the hot path.
+
+Times each way Trigger updates a metric, with metrics enabled and disabled
+(:setting:`METRICS_ENABLED`), and how long rendering takes. Compare the cost
+per device, a few dozen updates at most, against the milliseconds a real
+device takes. For the overhead end to end, run
+``tests/benchmarks/bench_simulator.py`` with and without ``--no-metrics``.
+
+Usage::
+
+    python tests/benchmarks/bench_metrics.py [options]
+"""
+
+import optparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # Sets up the environment
+
+from trigger.metrics import Registry
+
+
+OPERATIONS = (
+    ('gauge.inc()', 'gauge.inc()'),
+    ('counter.labels(x).inc()', "counter.labels('ok').inc()"),
+    ('histogram.observe()', 'histogram.observe(0.3)'),
+    ('histogram.labels(x).observe()',
+     "histogram.labels('kex').observe(0.3)"),
+)
+
+
+def make_metrics(enabled):
+    """Return a registry and a namespace of metrics to time."""
+    registry = Registry(enabled=enabled)
+    namespace = {
+        'gauge': registry.gauge('bench_gauge', 'Gauge.'),
+        'counter': registry.counter('bench_total', 'Counter.', ['result']),
+        'histogram': registry.histogram('bench_seconds', 'Histogram.',
+                                        ['phase']),
+    }
+    return registry, namespace
+
+def main(argv):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--number', type='int', default=1000000,
+                      help='Updates per measurement (default: %default)')
+    parser.add_option('-l', '--labels', type='int', default=1000,
+                      help='Label values to render (default: %default)')
+    opts, args = parser.parse_args(argv)
+
+    # The cost of the loop itself, which is taken off of each measurement
+    baseline = min(_time('pass', {}, opts.number) for _ in xrange(3))
+
+    print '%-32s %12s %12s' % ('ns per update', 'enabled', 'disabled')
+    for label, stmt in OPERATIONS:
+        times = []
+        for enabled in (True, False):
+            registry, namespace = make_metrics(enabled)
+            elapsed = min(_time(stmt, namespace, opts.number)
+                          for _ in xrange(3))
+            times.append(max(elapsed - baseline, 0) / opts.number * 1e9)
+        print '%-32s %12.0f %12.0f' % (label, times[0], times[1])
+
+    registry, namespace = make_metrics(True)
+    for num in xrange(opts.labels):
+        namespace['histogram'].labels('phase%d' % num).observe(0.3)
+    elapsed = min(_time('registry.render()', {'registry': registry}, 10)
+                  for _ in xrange(3)) / 10
+    print
+    print 'Rendering %d histograms: %.1f ms' % (opts.labels, elapsed * 1000)
+    return 0
+
+def _time(stmt, namespace, number):
+    """Return how many seconds running ``stmt`` ``number`` times takes."""
+    code = compile('for _ in _range:\n    %s\n' % stmt, '<bench>', 'exec')
+    namespace = dict(namespace, _range=xrange(number))
+    start = timeit.default_timer()
+    exec code in namespace
+    return timeit.default_timer() - start
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
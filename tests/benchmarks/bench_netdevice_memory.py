@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure the memory used by `~trigger.netdevices.NetDevice` objects.
+
+Devices are built from synthetic records the same way
+`~trigger.netdevices.NetDevices` builds them, and the growth in RSS is reported
+per device. Each count runs in a fresh process.
+
+Usage::
+
+    python tests/benchmarks/bench_netdevice_memory.py [count ...]
+
+Defaults to 100,000 devices.
+"""
+
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+
+def rss_mb():
+    """Return the current RSS of this process in MB."""
+    with open('/proc/self/statm') as fh:
+        pages = int(fh.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024.0 / 1024
+
+def measure(count):
+    """Build ``count`` devices in this process and print the results."""
+    from trigger import netdevices
+
+    # Decode from JSON so values are the same types a loader would return.
+    lines = [json.dumps(r) for r in synthetic.device_records(count)]
+    netdevices.NetDevice(data=json.loads(lines[0]))
+    gc.collect()
+    base = rss_mb()
+
+    start = time.time()
+    devices = list(netdevices._build_devices(json.loads(l) for l in lines))
+    elapsed = time.time() - start
+    gc.collect()
+
+    growth = rss_mb() - base
+    print json.dumps({'count': len(devices), 'seconds': elapsed,
+                      'growth_mb': growth})
+
+def bench(count):
+    output = subprocess.check_output([sys.executable, __file__, '--measure',
+                                      str(count)])
+    result = json.loads(output.splitlines()[-1])
+    per_device = result['growth_mb'] * 1024 * 1024 / count
+    print '%8d devices  %8.1f MB  %6d bytes/device  %6.2f s' % (
+        count, result['growth_mb'], per_device, result['seconds'])
+
+def main(args):
+    if args[:1] == ['--measure']:
+        return measure(int(args[1]))
+    counts = [int(arg) for arg in args] or [100000]
+    for count in counts:
+        bench(count)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare indexed `NetDevices.match()`, `NetDevices.search()` and
+`NetDevices.find()` against the full scans they replace.
+
+Usage::
+
+    python tests/benchmarks/bench_netdevices_index.py [count ...]
+
+Defaults to 10,000 and 100,000 devices.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+QUERIES = [
+    {'vendor': 'juniper'},
+    {'site': 'site042'},
+    {'nodename': 'dev0123'},
+    {'vendor': 'cisco', 'devicetype': 'firewall', 'owningteam': 'team 07'},
+    {'model': 'ex4200', 'site': 'site1'},
+    {'make': 'bacon'},
+]
+SEARCHES = ['dev00999', 'site12', 'net.example']
+ROUNDS = 20
+
+
+def scan_match(nd, **kwargs):
+    """The original implementation of NetDevices.match()."""
+    devices = iter(nd.all())
+    for attr, val in kwargs.iteritems():
+        attr = nd._all_field_names[attr.lower()]
+        val = str(val).lower()
+        devices = [d for d in devices
+                   if val in str(getattr(d, attr, '')).lower()]
+    return devices
+
+def scan_search(nd, token, field='nodeName'):
+    """The original implementation of NetDevices.search()."""
+    return [x for x in nd.all() if token in getattr(x, field)]
+
+def scan_find(nd, key):
+    """The original implementation of NetDevices.find()."""
+    key = key.lower()
+    if key in nd:
+        return nd[key]
+    matches = [x for x in nd.keys() if x.startswith(key + '.')]
+    if matches:
+        return nd[matches[0]]
+    raise KeyError(key)
+
+def scan_find_many(nd, keys):
+    results = []
+    for key in keys:
+        try:
+            results.append(scan_find(nd, key))
+        except KeyError:
+            results.append(None)
+    return results
+
+def timed(func, *args, **kwargs):
+    start = time.time()
+    for _ in xrange(ROUNDS):
+        result = func(*args, **kwargs)
+    return (time.time() - start) / ROUNDS, result
+
+def bench(count):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = synthetic.write_json(os.path.join(tmpdir, 'nd.json'), count)
+        from trigger.conf import settings
+        settings.NETDEVICES_SOURCE = source
+        from trigger.netdevices import NetDevices
+        NetDevices._Singleton = None
+        nd = NetDevices(with_acls=False)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print '%d devices' % len(nd)
+    nd.match(nodename='warmup')  # Populate the field name cache.
+
+    start = time.time()
+    for query in QUERIES:
+        nd.match(**query)
+    for token in SEARCHES:
+        nd.search(token)
+    print '  %-50s %9.2f ms' % ('index build (first queries)',
+                                (time.time() - start) * 1000)
+
+    for query in QUERIES:
+        scan_time, expected = timed(scan_match, nd, **query)
+        index_time, result = timed(nd.match, **query)
+        assert result == expected, query
+        label = 'match(%s)' % ', '.join('%s=%r' % kv for kv in
+                                        sorted(query.items()))
+        print '  %-50s scan %8.2f ms  index %8.3f ms  (%d hits, %.0fx)' % (
+            label, scan_time * 1000, index_time * 1000, len(result),
+            scan_time / max(index_time, 1e-9))
+
+    for token in SEARCHES:
+        scan_time, expected = timed(scan_search, nd, token)
+        index_time, result = timed(nd.search, token)
+        assert result == expected, token
+        label = 'search(%r)' % token
+        print '  %-50s scan %8.2f ms  index %8.3f ms  (%d hits, %.0fx)' % (
+            label, scan_time * 1000, index_time * 1000, len(result),
+            scan_time / max(index_time, 1e-9))
+
+    # Short names as passed to Commando. Only a few for the scan, since it's
+    # O(N) per lookup.
+    names = sorted(nd.keys())
+    step = max(len(names) // 50, 1)
+    keys = [name.split('.', 1)[0] for name in names[::step]] + ['bacon']
+    scan_time, expected = timed(scan_find_many, nd, keys)
+    index_time, result = timed(nd.find_many, keys)
+    assert result == expected
+    label = 'find_many(%d short names)' % len(keys)
+    print '  %-50s scan %8.2f ms  index %8.3f ms  (%.0fx)' % (
+        label, scan_time * 1000, index_time * 1000,
+        scan_time / max(index_time, 1e-9))
+
+    keys = [name.split('.', 1)[0] for name in names]
+    index_time, result = timed(nd.find_many, keys)
+    label = 'find_many(%d short names)' % len(keys)
+    print '  %-50s scan %11s  index %8.3f ms' % (label, 'n/a',
+                                                  index_time * 1000)
+
+def main(argv):
+    counts = [int(arg) for arg in argv[1:]] or [10000, 100000]
+    for count in counts:
+        bench(count)
+
+if __name__ == '__main__':
+    main(sys.argv)
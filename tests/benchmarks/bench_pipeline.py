@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure writing commands ahead of their results, as `~trigger.twister.execute`
+does with ``pipeline``, over a slow link.
+
+Starts a `~trigger.simulator.DeviceFarm` in a separate process and reaches
+each device through a proxy in this process that delays data by half of
+``--rtt`` each way. Runs ``--commands`` commands on every device waiting for
+the prompt after each, then with each of the ``--windows`` of commands
+written ahead, reporting how long each device took. Results that come back
+out of order or fail are counted as failures.
+
+Usage::
+
+    python tests/benchmarks/bench_pipeline.py [options]
+"""
+
+import collections
+import json
+import optparse
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # Sets up the environment
+
+from bench_simulator import percentile, start_farm
+
+os.environ.setdefault('TERM', 'vt100')
+
+
+def delay_proxy(address, port, delay):
+    """
+    Listen on a port of 127.0.0.1 that forwards to ``address`` and ``port``,
+    delaying everything by ``delay`` seconds, and return the port.
+    """
+    from twisted.internet import protocol, reactor
+
+    class DelayedWriter(object):
+        """Write data to ``transport`` ``delay`` seconds later, in order."""
+        def __init__(self, transport):
+            self.transport = transport
+            self.queue = collections.deque()
+
+        def send(self, data):
+            self.queue.append((time.time() + delay, data))
+            reactor.callLater(delay, self.flush)
+
+        def flush(self):
+            now = time.time()
+            while self.queue and self.queue[0][0] <= now + 0.001:
+                self.transport.write(self.queue.popleft()[1])
+
+    class Device(protocol.Protocol):
+        def __init__(self, server):
+            self.server = server
+
+        def connectionMade(self):
+            self.server.proto = self
+            self.server.device = DelayedWriter(self.transport)
+            self.server.transport.resumeProducing()
+
+        def dataReceived(self, data):
+            self.server.client.send(data)
+
+        def connectionLost(self, reason):
+            reactor.callLater(delay, self.server.transport.loseConnection)
+
+    class Server(protocol.Protocol):
+        device = None
+
+        def connectionMade(self):
+            self.client = DelayedWriter(self.transport)
+            self.transport.pauseProducing()
+            device = protocol.ClientCreator(reactor, Device, self)
+            device.connectTCP(address, port)
+
+        def dataReceived(self, data):
+            self.device.send(data)
+
+        def connectionLost(self, reason):
+            if self.device is not None:
+                reactor.callLater(delay, self.proto.transport.loseConnection)
+
+    factory = protocol.ServerFactory()
+    factory.protocol = Server
+    return reactor.listenTCP(0, factory, interface='127.0.0.1').getHost().port
+
+def bench(devices, opts, modes):
+    """Run commands on every device in each mode and return the seconds."""
+    from twisted.internet import defer, reactor
+    from trigger.tacacsrc import Credentials
+
+    creds = Credentials('bench', 'bench', 'simulator')
+    commands = ['show simulated %d' % num for num in xrange(opts.commands)]
+    seconds = dict((label, []) for label, _ in modes)
+    failures = dict((label, 0) for label, _ in modes)
+
+    def run_device(label, device, pipeline):
+        start = time.time()
+        d = device.execute(commands, creds=creds, timeout=opts.timeout,
+                           pipeline=pipeline)
+
+        def done(results):
+            seconds[label].append(time.time() - start)
+            for command, result in zip(commands, results):
+                if command not in result:
+                    failures[label] += 1
+            failures[label] += len(commands) - len(results)
+
+        def failed(failure):
+            failures[label] += len(commands)
+        return d.addCallbacks(done, failed)
+
+    @defer.inlineCallbacks
+    def run():
+        try:
+            for label, pipeline in modes:
+                yield defer.DeferredList([
+                    run_device(label, device, pipeline)
+                    for device in devices])
+        finally:
+            reactor.callLater(0.1, reactor.stop)
+
+    reactor.callWhenRunning(run)
+    reactor.run()
+    return seconds, failures
+
+def main(argv):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--devices', type='int', default=5,
+                      help='Number of devices (default: %default)')
+    parser.add_option('-c', '--commands', type='int', default=50,
+                      help='Commands per device (default: %default)')
+    parser.add_option('--windows', default='4,16,64',
+                      help='Comma-separated numbers of commands to write '
+                           'ahead (default: %default)')
+    parser.add_option('--rtt', type='float', default=0.1,
+                      help='Round trip time to the devices in seconds '
+                           '(default: %default)')
+    parser.add_option('--output-size', type='int', default=1024,
+                      help='Bytes of output per command (default: %default)')
+    parser.add_option('-t', '--transport', default='ssh',
+                      help='ssh or telnet (default: %default)')
+    parser.add_option('--timeout', type='int', default=120,
+                      help='Command timeout in seconds (default: %default)')
+    opts, args = parser.parse_args(argv)
+    opts.personality = 'ios'
+    opts.latency = opts.jitter = opts.error_rate = 0
+    modes = [('serial', None)] + [('window %d' % int(n), int(n))
+                                  for n in opts.windows.split(',')]
+
+    tmpdir = tempfile.mkdtemp()
+    proc = None
+    try:
+        path = os.path.join(tmpdir, 'netdevices.json')
+        proc = start_farm(opts, path)
+
+        from trigger.netdevices import NetDevice
+        with open(path) as fh:
+            records = json.load(fh)
+        devices = []
+        for record in records:
+            record['nodePort'] = delay_proxy(record['nodeName'],
+                                             record['nodePort'],
+                                             opts.rtt / 2)
+            record['nodeName'] = '127.0.0.1'
+            device = NetDevice(data=record, with_acls=False)
+            # The proxy can't answer the blocking check for SSH while the
+            # reactor waits on it
+            use_ssh = opts.transport == 'ssh'
+            device.has_ssh = lambda: use_ssh
+            devices.append(device)
+        seconds, failures = bench(devices, opts, modes)
+    finally:
+        if proc is not None:
+            os.kill(proc.pid, signal.SIGTERM)
+            proc.wait()
+        shutil.rmtree(tmpdir)
+
+    print '%d IOS devices over %s, %d commands each, %.0f ms round trips' % (
+        len(devices), opts.transport, opts.commands, opts.rtt * 1000)
+    print
+    print '%-12s %12s %12s %12s' % ('ms/device', 'p50', 'p95', 'failed')
+    for label, _ in modes:
+        print '%-12s %12.1f %12.1f %12d' % (
+            label, percentile(seconds[label], 50) * 1000,
+            percentile(seconds[label], 95) * 1000, failures[label])
+    return 1 if any(failures.values()) else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
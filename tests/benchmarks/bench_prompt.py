@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure finding the prompt at the end of large command outputs.
+
+Feeds outputs of increasing size, such as a full routing table, to
+`~trigger.twister.PromptBuffer` a packet at a time and checks for the prompt
+after each packet, the way the SSH and telnet channels do. The time per
+megabyte should stay flat as the output grows. For comparison, the old way of
+appending each packet to a string and searching all of it is timed too, up to
+``--old-limit`` megabytes, since it takes time quadratic in the size of the
+output.
+
+Usage::
+
+    python tests/benchmarks/bench_prompt.py [options]
+"""
+
+import optparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # Sets up the environment
+
+from trigger.conf import settings
+from trigger.twister import PromptBuffer, is_awaiting_confirmation
+
+
+LINE = '  10.%d.%d.0/24 via 192.168.0.1, GigabitEthernet0/1, 2w3d\r\n'
+PROMPT = 'router1#'
+
+
+def make_packets(megabytes, packet_size):
+    """Return the output of a command, split into packets."""
+    lines = []
+    size = 0
+    num = 0
+    while size < megabytes * 1024 * 1024:
+        line = LINE % (num // 256 % 256, num % 256)
+        lines.append(line)
+        size += len(line)
+        num += 1
+    output = ''.join(lines) + PROMPT
+    return [output[i:i + packet_size]
+            for i in xrange(0, len(output), packet_size)]
+
+def find_buffered(packets, prompt):
+    """Find the prompt with a PromptBuffer."""
+    buf = PromptBuffer()
+    for packet in packets:
+        buf.append(packet)
+        m = buf.find(prompt)
+        if m is None:
+            is_awaiting_confirmation(buf.tail(buf.window))
+    return buf.getvalue()[:m.start()]
+
+def find_rescanning(packets, prompt):
+    """Find the prompt by searching all of the data after every packet."""
+    data = ''
+    for packet in packets:
+        data += packet
+        m = prompt.search(data)
+        if m is None:
+            is_awaiting_confirmation(data)
+    return data[:m.start()]
+
+def main(argv):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-s', '--sizes', default='1,2,5,10',
+                      help='Output sizes in MB (default: %default)')
+    parser.add_option('-p', '--packet-size', type='int', default=32768,
+                      help='Bytes per packet (default: %default)')
+    parser.add_option('-o', '--old-limit', type='float', default=2,
+                      help='Largest size in MB to time the old way for '
+                           '(default: %default)')
+    opts, args = parser.parse_args(argv)
+
+    prompt = re.compile(settings.IOSLIKE_PROMPT_PAT)
+    sizes = [float(size) for size in opts.sizes.split(',')]
+
+    print '%8s %8s %14s %14s %14s' % ('MB', 'packets', 'buffered s',
+                                      'buffered s/MB', 'rescanning s')
+    for size in sizes:
+        packets = make_packets(size, opts.packet_size)
+        start = timeit.default_timer()
+        result = find_buffered(packets, prompt)
+        buffered = timeit.default_timer() - start
+        assert not result.endswith(PROMPT)
+
+        rescanning = '-'
+        if size <= opts.old_limit:
+            start = timeit.default_timer()
+            assert find_rescanning(packets, prompt) == result
+            rescanning = '%.3f' % (timeit.default_timer() - start)
+        print '%8g %8d %14.3f %14.3f %14s' % (size, len(packets), buffered,
+                                              buffered / size, rescanning)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure what a `~trigger.twister.SessionPool` saves when polling the same
+devices over and over, as the XMLRPC server does.
+
+Starts a `~trigger.simulator.DeviceFarm` in a separate process and polls
+every device ``--rounds`` times, with `~trigger.twister.execute` and then with
+a session pool, reporting how long each round took. With the pool only the
+first round connects, logs in and sends the startup commands.
+
+Usage::
+
+    python tests/benchmarks/bench_session_pool.py [options]
+"""
+
+import json
+import optparse
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # Sets up the environment
+
+from bench_simulator import percentile, start_farm
+
+os.environ.setdefault('TERM', 'vt100')
+
+
+def bench(devices, opts):
+    """Poll every device in rounds and return the seconds each round took."""
+    from twisted.internet import defer, reactor
+    from trigger.tacacsrc import Credentials
+    from trigger.twister import SessionPool
+
+    creds = Credentials('bench', 'bench', 'simulator')
+    commands = ['show simulated %d' % num for num in xrange(opts.commands)]
+    rounds = {'execute': [], 'pool': []}
+    failures = []
+    pool = SessionPool(max_per_device=1)
+
+    def poll(label, execute):
+        start = time.time()
+        deferreds = [execute(device, commands, creds=creds,
+                             timeout=opts.timeout) for device in devices]
+        d = defer.DeferredList(deferreds)
+
+        def done(results):
+            rounds[label].append(time.time() - start)
+            failures.extend(r for ok, r in results if not ok)
+        return d.addCallback(done)
+
+    @defer.inlineCallbacks
+    def run():
+        try:
+            for _ in xrange(opts.rounds):
+                yield poll('execute', lambda device, *a, **kw:
+                           device.execute(*a, **kw))
+            for _ in xrange(opts.rounds):
+                yield poll('pool', pool.execute)
+        finally:
+            pool.close()
+            reactor.callLater(0.1, reactor.stop)
+
+    reactor.callWhenRunning(run)
+    reactor.run()
+    return rounds, failures
+
+def main(argv):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--devices', type='int', default=50,
+                      help='Number of devices (default: %default)')
+    parser.add_option('-r', '--rounds', type='int', default=10,
+                      help='Times to poll every device (default: %default)')
+    parser.add_option('-c', '--commands', type='int', default=2,
+                      help='Commands per poll (default: %default)')
+    parser.add_option('--output-size', type='int', default=1024,
+                      help='Bytes of output per command (default: %default)')
+    parser.add_option('--latency', type='float', default=0.01,
+                      help='Simulated seconds per command (default: '
+                           '%default)')
+    parser.add_option('--timeout', type='int', default=60,
+                      help='Command timeout in seconds (default: %default)')
+    opts, args = parser.parse_args(argv)
+    opts.personality, opts.transport = 'ios', 'ssh'
+    opts.jitter = opts.error_rate = 0
+
+    tmpdir = tempfile.mkdtemp()
+    proc = None
+    try:
+        path = os.path.join(tmpdir, 'netdevices.json')
+        proc = start_farm(opts, path)
+
+        from trigger.netdevices import NetDevice
+        with open(path) as fh:
+            records = json.load(fh)
+        devices = [NetDevice(data=record, with_acls=False)
+                   for record in records]
+        rounds, failures = bench(devices, opts)
+    finally:
+        if proc is not None:
+            os.kill(proc.pid, signal.SIGTERM)
+            proc.wait()
+        shutil.rmtree(tmpdir)
+
+    print '%d IOS devices, %d commands per poll, %d rounds' % (
+        len(devices), opts.commands, opts.rounds)
+    print
+    print '%-22s %12s %12s' % ('ms per round', 'execute', 'pool')
+    print '%-22s %12.1f %12.1f' % ('first', rounds['execute'][0] * 1000,
+                                   rounds['pool'][0] * 1000)
+    for pct in (50, 95):
+        print '%-22s %12.1f %12.1f' % (
+            'p%d of the rest' % pct,
+            percentile(rounds['execute'][1:], pct) * 1000,
+            percentile(rounds['pool'][1:], pct) * 1000)
+    print '%-22s %12d' % ('failed polls', len(failures))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure how `~trigger.sharding.ShardedCommando` throughput scales with the
+number of worker processes.
+
+Devices are faked by replacing `~trigger.netdevices.NetDevice.execute`: each
+"session" burns a fixed amount of CPU, standing in for SSH crypto and prompt
+parsing, and answers after a fixed latency, standing in for the network. With
+enough connections in flight a single reactor is CPU-bound, so throughput
+should go up roughly linearly with shards until there are no more cores.
+
+Usage::
+
+    python tests/benchmarks/bench_sharding.py [options] [shards ...]
+
+Defaults to 1, 2 and 4 shards and then every power of 2 up to the number of
+CPUs.
+"""
+
+import hashlib
+import multiprocessing
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+
+def calibrate(cpu_ms):
+    """Return how many rounds of `burn` take ``cpu_ms`` milliseconds."""
+    rounds = 1000
+    while True:
+        start = time.time()
+        burn(rounds)
+        elapsed = (time.time() - start) * 1000
+        if elapsed > 50:
+            return max(int(rounds * cpu_ms / elapsed), 1)
+        rounds *= 2
+
+def burn(rounds):
+    """Keep a CPU busy for ``rounds`` rounds of hashing."""
+    digest = 'trigger'
+    for _ in xrange(rounds):
+        digest = hashlib.sha256(digest).digest()
+    return digest
+
+class FakeSession(object):
+    """Stand-in for `NetDevice.execute`."""
+    def __init__(self, rounds, latency):
+        self.rounds = rounds
+        self.latency = latency
+
+    def __call__(self, device, commands, **kwargs):
+        from twisted.internet import reactor, task
+        burn(self.rounds)
+        return task.deferLater(reactor, self.latency, self.done, device,
+                               commands)
+
+    def done(self, device, commands):
+        burn(self.rounds)
+        return ['%s output' % cmd for cmd in commands]
+
+def bench(shards, names, session, max_conns):
+    """Run against every device in ``names`` and return the elapsed time."""
+    from trigger.netdevices import NetDevice
+    from trigger.sharding import ShardedCommando
+
+    NetDevice.execute = lambda device, commands, **kwargs: session(
+        device, commands, **kwargs)
+    sc = ShardedCommando(devices=names, commands=['show version'],
+                         shards=shards, max_conns=max_conns, force_cli=True,
+                         production_only=False)
+    start = time.time()
+    sc.run()
+    elapsed = time.time() - start
+    assert len(sc.results) == len(names), sc.errors.items()[:1]
+    return elapsed
+
+def default_shards():
+    """Return 1, 2, 4, ... up to the number of CPUs."""
+    cpus = multiprocessing.cpu_count()
+    shards = [1, 2, 4]
+    while shards[-1] < cpus:
+        shards.append(shards[-1] * 2)
+    return shards
+
+def main(argv):
+    parser = optparse.OptionParser(usage='%prog [options] [shards ...]')
+    parser.add_option('-n', '--devices', type='int', default=2000,
+                      help='Number of devices (default: %default)')
+    parser.add_option('-m', '--max-conns', type='int', default=200,
+                      help='Connection budget (default: %default)')
+    parser.add_option('--cpu-ms', type='float', default=5,
+                      help='CPU time per device in ms, spent half before and '
+                           'half after the latency (default: %default)')
+    parser.add_option('--latency', type='float', default=0.05,
+                      help='Latency per device in seconds '
+                           '(default: %default)')
+    opts, args = parser.parse_args(argv)
+    shard_counts = [int(arg) for arg in args] or default_shards()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = synthetic.write_json(os.path.join(tmpdir, 'netdevices.json'),
+                                      opts.devices)
+        from trigger.conf import settings
+        settings.NETDEVICES_SOURCE = source
+        settings.NETDEVICES_SNAPSHOT_FILE = None
+        settings.WITH_ACLS = False
+
+        # Only the vendors Commando supports out of the box
+        from trigger.netdevices import NetDevices
+        nd = NetDevices(production_only=False)
+        names = [dev.nodeName for dev in nd.itervalues()
+                 if dev.vendor in settings.SUPPORTED_VENDORS]
+
+        session = FakeSession(calibrate(opts.cpu_ms / 2), opts.latency)
+        print '%d devices, %d CPUs, %.1f ms CPU and %.0f ms latency each' % (
+            len(names), multiprocessing.cpu_count(), opts.cpu_ms,
+            opts.latency * 1000)
+        print '%6s %10s %12s %8s %10s' % ('shards', 'seconds', 'devices/s',
+                                          'speedup', 'efficiency')
+        # Speedup is relative to the first run.
+        base = None
+        for shards in shard_counts:
+            elapsed = bench(shards, names, session, opts.max_conns)
+            rate = len(names) / elapsed
+            if base is None:
+                base = (rate, shards)
+            speedup = rate / base[0]
+            efficiency = speedup / (float(shards) / base[1])
+            print '%6d %10.2f %12.1f %7.2fx %9.0f%%' % (
+                shards, elapsed, rate, speedup, efficiency * 100)
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
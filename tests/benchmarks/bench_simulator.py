@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure `~trigger.twister.execute` against simulated devices.
+
+Starts a `~trigger.simulator.DeviceFarm` in a separate process (``python -m
+trigger.simulator``) and then runs a few commands on every device, at most
+``--max-conns`` at a time, reporting:
+
+* devices per second,
+* time to connect and log in (until the first prompt),
+* latency of each command, from sending it to getting its result back, less
+  the simulated latency,
+* how long each phase of each connection took (see `~trigger.timing`), and
+* peak memory (RSS) of this process.
+
+Usage::
+
+    python tests/benchmarks/bench_simulator.py [options]
+
+The farm and this process share the machine, so on a single core the farm's
+share of the CPU counts against the results.
+"""
+
+import json
+import optparse
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # Sets up the environment
+
+os.environ.setdefault('TERM', 'vt100')
+
+
+def peak_kb():
+    """Return the peak RSS of this process in KB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def percentile(values, pct):
+    """Return the ``pct`` percentile of ``values``."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(int(round(pct / 100.0 * (len(values) - 1))), len(values) - 1)
+    return values[idx]
+
+def start_farm(opts, path):
+    """Run a farm in another process and wait until it's listening."""
+    argv = [sys.executable, '-m', 'trigger.simulator', '-n', str(opts.devices),
+            '-p', opts.personality, '-t', opts.transport,
+            '--output-size', str(opts.output_size),
+            '--latency', str(opts.latency), '--jitter', str(opts.jitter),
+            '--error-rate', str(opts.error_rate), '-o', path]
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(synthetic.TESTS_DIR))
+    proc = subprocess.Popen(argv, stdout=subprocess.PIPE, env=env)
+    for line in iter(proc.stdout.readline, ''):
+        if line.startswith('Listening'):
+            return proc
+    raise SystemExit('The simulator exited with %s' % proc.wait())
+
+def commands_for(device, count):
+    """Return ``count`` commands for ``device``."""
+    commands = ['show simulated %d' % num for num in xrange(count)]
+    if device.vendor == 'juniper':
+        from xml.etree.cElementTree import Element
+        elements = []
+        for command in commands:
+            element = Element('command')
+            element.text = command
+            elements.append(element)
+        return elements
+    return commands
+
+def bench(devices, opts):
+    """Run commands on every device and return the measurements."""
+    from twisted.internet import defer, reactor
+    from trigger.tacacsrc import Credentials
+    from trigger.timing import PhaseStats
+
+    creds = Credentials('bench', 'bench', 'simulator')
+    sem = defer.DeferredSemaphore(opts.max_conns)
+    stats = {'login': [], 'command': [], 'errors': {},
+             'phases': PhaseStats()}
+
+    def run(device):
+        started = [time.time(), None]
+
+        def incremental(results):
+            now = time.time()
+            if started[1] is None:
+                stats['login'].append(now - started[0])
+            else:
+                stats['command'].append(now - started[1] - opts.latency)
+            started[1] = now
+
+        def failed(failure):
+            name = failure.type.__name__
+            stats['errors'][name] = stats['errors'].get(name, 0) + 1
+
+        d = device.execute(commands_for(device, opts.commands), creds=creds,
+                           incremental=incremental, timeout=opts.timeout)
+        d.addBoth(lambda result: stats['phases'].add(d.timings) or result)
+        return d.addErrback(failed)
+
+    def done(_):
+        stats['elapsed'] = time.time() - start
+        reactor.stop()
+
+    start = time.time()
+    d = defer.DeferredList([sem.run(run, device) for device in devices])
+    d.addCallback(done)
+    reactor.run()
+    return stats
+
+def main(argv):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--devices', type='int', default=500,
+                      help='Number of devices (default: %default)')
+    parser.add_option('-p', '--personality',
+                      default='ios,junos,netscreen,netscaler',
+                      help='Comma-separated personalities (default: '
+                           '%default)')
+    parser.add_option('-t', '--transport', default='ssh',
+                      help='ssh or telnet (default: %default)')
+    parser.add_option('-c', '--commands', type='int', default=3,
+                      help='Commands per device (default: %default)')
+    parser.add_option('-m', '--max-conns', type='int', default=50,
+                      help='Devices at once (default: %default)')
+    parser.add_option('--output-size', type='int', default=4096,
+                      help='Bytes of output per command (default: %default)')
+    parser.add_option('--latency', type='float', default=0.01,
+                      help='Simulated seconds per command (default: '
+                           '%default)')
+    parser.add_option('--jitter', type='float', default=0,
+                      help='Up to this many more seconds per command '
+                           '(default: %default)')
+    parser.add_option('--error-rate', type='float', default=0,
+                      help='Fraction of commands that fail (default: '
+                           '%default)')
+    parser.add_option('--timeout', type='int', default=60,
+                      help='Command timeout in seconds (default: %default)')
+    parser.add_option('--no-metrics', action='store_true', default=False,
+                      help='Disable trigger.metrics, to measure its overhead')
+    opts, args = parser.parse_args(argv)
+
+    if opts.no_metrics:
+        from trigger.conf import settings
+        settings.METRICS_ENABLED = False
+
+    tmpdir = tempfile.mkdtemp()
+    proc = None
+    try:
+        path = os.path.join(tmpdir, 'netdevices.json')
+        proc = start_farm(opts, path)
+
+        from trigger.netdevices import NetDevice
+        with open(path) as fh:
+            records = json.load(fh)
+        base_kb = peak_kb()
+        devices = [NetDevice(data=record, with_acls=False)
+                   for record in records]
+        stats = bench(devices, opts)
+    finally:
+        if proc is not None:
+            os.kill(proc.pid, signal.SIGTERM)
+            proc.wait()
+        shutil.rmtree(tmpdir)
+
+    failed = sum(stats['errors'].values())
+    print '%d devices (%s over %s), %d commands each, %d at once' % (
+        len(devices), opts.personality, opts.transport, opts.commands,
+        opts.max_conns)
+    print '%d bytes per command, %.0f ms simulated latency' % (
+        opts.output_size, opts.latency * 1000)
+    print
+    print '%-22s %10.2f' % ('seconds', stats['elapsed'])
+    print '%-22s %10.1f' % ('devices/s', len(devices) / stats['elapsed'])
+    print '%-22s %10d' % ('failed devices', failed)
+    for name, count in sorted(stats['errors'].iteritems()):
+        print '  %-20s %10d' % (name, count)
+    for label, key in (('login ms', 'login'), ('command ms', 'command')):
+        values = stats[key]
+        for pct in (50, 95, 99):
+            print '%-22s %10.1f' % ('%s p%d' % (label, pct),
+                                    percentile(values, pct) * 1000)
+    for phase, summary in stats['phases'].summary().iteritems():
+        for pct in (50, 95, 99):
+            print '%-22s %10.1f' % ('%s phase ms p%d' % (phase, pct),
+                                    summary['p%d' % pct] * 1000)
+    print '%-22s %10d' % ('peak RSS KB', peak_kb())
+    print '%-22s %10d' % ('RSS growth KB', peak_kb() - base_kb)
+    return 0 if not failed or opts.error_rate else 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare throughput and peak memory of the two
+`~trigger.netdevices.loaders.filesystem.XMLLoader` modes: parsing the whole
+tree (``xml_mode=parse``, the default) and streaming it
+(``xml_mode=iterparse``).
+
+Each measurement runs in a fresh process so that peak RSS isn't polluted by
+earlier runs. Two things are measured for each mode:
+
+``decode``
+    Parse every device and throw it away, which isolates the cost of the
+    loader itself.
+``netdevices``
+    Build a `~trigger.netdevices.NetDevices` from the file, which is what
+    every Trigger tool does at startup.
+
+Usage::
+
+    python tests/benchmarks/bench_xml_loader.py [count ...]
+
+Defaults to 200,000 devices.
+"""
+
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+MODES = ('parse', 'iterparse')
+TASKS = ('decode', 'netdevices')
+
+
+def measure(mode, task, path):
+    """Run a single measurement in this process and print the results."""
+    from trigger.conf import settings
+    source = '%s?xml_mode=%s' % (path, mode)
+    settings.NETDEVICES_SOURCE = source
+    settings.NETDEVICES_SNAPSHOT_FILE = None
+    settings.WITH_ACLS = False
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.time()
+    if task == 'decode':
+        from trigger.netdevices.loaders.filesystem import XMLLoader
+        count = 0
+        for node in XMLLoader().load_data_source(path, xml_mode=mode):
+            for pair in node:
+                pass
+            count += 1
+    else:
+        from trigger.netdevices import NetDevices
+        count = len(NetDevices(production_only=False))
+    elapsed = time.time() - start
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print json.dumps({'count': count, 'seconds': elapsed,
+                      'peak_kb': peak_rss, 'growth_kb': peak_rss - base_rss})
+
+def run(mode, task, path):
+    """Run a measurement in a child process and return its results."""
+    output = subprocess.check_output([sys.executable, __file__, '--measure',
+                                      mode, task, path])
+    return json.loads(output.splitlines()[-1])
+
+def bench(count):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = synthetic.write_xml(os.path.join(tmpdir, 'nd.xml'), count)
+        size_mb = os.path.getsize(path) / 1024.0 / 1024
+        print '%d devices (%.1f MB of XML)' % (count, size_mb)
+        for task in TASKS:
+            for mode in MODES:
+                result = run(mode, task, path)
+                assert result['count'] == count, result
+                rate = count / result['seconds']
+                print ('  %-12s %-10s %8.2f s  %8d dev/s  peak %8.1f MB  '
+                       'growth %8.1f MB' % (task, mode, result['seconds'], rate,
+                                            result['peak_kb'] / 1024.0,
+                                            result['growth_kb'] / 1024.0))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def main(args):
+    if args[:1] == ['--measure']:
+        return measure(*args[1:])
+    counts = [int(arg) for arg in args] or [200000]
+    for count in counts:
+        bench(count)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic NetDevices metadata for benchmarks.
+
+Generates device records that look enough like a real inventory (a handful of
+vendors, a few hundred sites, a few dozen teams) that index sizes and
+selectivity are realistic.
+"""
+
+import json
+import os
+import sys
+from xml.sax.saxutils import escape
+
+# Make sure we can import Trigger from this checkout using the test settings.
+TESTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(TESTS_DIR, 'data')
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+os.environ.setdefault('TRIGGER_SETTINGS', os.path.join(DATA_DIR, 'settings.py'))
+os.environ.setdefault('AUTOACL_FILE', os.path.join(DATA_DIR, 'autoacl.py'))
+os.environ.setdefault('BOUNCE_FILE', os.path.join(DATA_DIR, 'bounce.py'))
+
+VENDORS = (
+    ('JUNIPER', 'ROUTER', 'MX960-BASE-AC'),
+    ('JUNIPER', 'SWITCH', 'EX4200-48T'),
+    ('CISCO SYSTEMS', 'SWITCH', 'WS-C6509-E'),
+    ('CISCO SYSTEMS', 'FIREWALL', 'ASA5550'),
+    ('ARISTA NETWORKS', 'SWITCH', 'DCS-7050S-64'),
+    ('BROCADE', 'SWITCH', 'FCX648S'),
+    ('CITRIX', 'SWITCH', 'NETSCALER MPX'),
+)
+TEAMS = ['Team %02d' % i for i in xrange(40)]
+SITES = ['SITE%03d' % i for i in xrange(300)]
+
+
+def device_record(num):
+    """Return a dict of metadata for the ``num``-th synthetic device."""
+    manufacturer, device_type, model = VENDORS[num % len(VENDORS)]
+    site = SITES[num % len(SITES)]
+    return {
+        'nodeName': 'dev%06d-%s.net.example.com' % (num, site.lower()),
+        'adminStatus': 'PRODUCTION' if num % 10 else 'NON-PRODUCTION',
+        'manufacturer': manufacturer,
+        'deviceType': device_type,
+        'make': '%s %s' % (manufacturer, device_type),
+        'model': model,
+        'serialNumber': 'SN%08d' % num,
+        'assetID': '%010d' % num,
+        'site': site,
+        'room': 'ROOM%d' % (num % 7),
+        'coordinate': '%02dZZ' % (num % 50),
+        'owningTeam': TEAMS[num % len(TEAMS)],
+        'onCallName': TEAMS[(num * 7) % len(TEAMS)],
+        'owner': '12345678 - Network Engineering',
+        'budgetCode': str(1000000 + num % 100),
+        'budgetName': 'Data Center',
+        'operationStatus': 'MONITORED',
+        'lifecycleStatus': 'INSTALLED',
+        'projectName': 'Project %d' % (num % 25),
+        'lastUpdate': '2016-01-01 00:00:00.0',
+    }
+
+def device_records(count):
+    """Return a generator of ``count`` synthetic device records."""
+    return (device_record(num) for num in xrange(count))
+
+def write_json(path, count):
+    """
+    Write ``count`` synthetic devices to ``path`` as a JSON array, one device
+    per line, without holding them all in memory.
+    """
+    with open(path, 'w') as fh:
+        fh.write('[\n')
+        for num, record in enumerate(device_records(count)):
+            if num:
+                fh.write(',\n')
+            json.dump(record, fh)
+        fh.write('\n]\n')
+    return path
+
+def write_xml(path, count):
+    """
+    Write ``count`` synthetic devices to ``path`` in ``netdevices.xml`` format,
+    without holding them all in memory.
+    """
+    with open(path, 'w') as fh:
+        fh.write('<?xml version="1.0" encoding="UTF-8"?>\n<NetDevices>\n')
+        for record in device_records(count):
+            fh.write('  <device nodeName="%s">\n' % record['nodeName'])
+            for key in sorted(record):
+                fh.write('    <%s>%s</%s>\n' % (key, escape(record[key]), key))
+            fh.write('  </device>\n')
+        fh.write('</NetDevices>\n')
+    return path
+
+def write_csv(path, count):
+    """
+    Write ``count`` synthetic devices to ``path`` in the format read by
+    `~trigger.netdevices.loaders.filesystem.CSVLoader`.
+    """
+    with open(path, 'w') as fh:
+        for record in device_records(count):
+            fh.write(','.join(rancid_fields(record)) + '\n')
+    return path
+
+def write_rancid(path, count, groups=10):
+    """
+    Write ``count`` synthetic devices to a tree of RANCID instances rooted at
+    ``path``, spread across ``groups`` subdirectories that each have a
+    ``router.db`` and an empty ``configs`` directory.
+    """
+    os.mkdir(path)
+    files = []
+    for group in xrange(groups):
+        group_dir = os.path.join(path, 'group%02d' % group)
+        os.makedirs(os.path.join(group_dir, 'configs'))
+        files.append(open(os.path.join(group_dir, 'router.db'), 'w'))
+    try:
+        for num, record in enumerate(device_records(count)):
+            files[num % groups].write(':'.join(rancid_fields(record)) + '\n')
+    finally:
+        for fh in files:
+            fh.close()
+    return path
+
+def rancid_fields(record):
+    """
+    Return the RANCID ``router.db`` fields (name, vendor, status and type) for
+    ``record``.
+    """
+    status = 'up' if record['adminStatus'] == 'PRODUCTION' else 'down'
+    return (record['nodeName'], record['manufacturer'].split()[0].lower(),
+            status, record['deviceType'].lower())
+
+def write_sqlite(path, count, table_name='netdevices'):
+    """
+    Write ``count`` synthetic devices to a SQLite database at ``path`` in a
+    table named ``table_name``, with a text column for every field.
+    """
+    import sqlite3
+
+    columns = sorted(device_record(0))
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute('create table %s (%s)' % (
+            table_name, ', '.join('%s text' % c for c in columns)))
+        connection.executemany(
+            'insert into %s values (%s)' % (
+                table_name, ', '.join('?' * len(columns))),
+            ([r[c] for c in columns] for r in device_records(count)))
+        connection.commit()
+    finally:
+        connection.close()
+    return path
@@ -19,6 +19,9 @@ LONGPW_TACACSRC = os.getenv('TACACSRC', os.path.join(PREFIX, 'longpw_tacacsrc'))
 BROKENPW_TACACSRC = os.getenv('TACACSRC', os.path.join(PREFIX, 'brokenpw_tacacsrc'))
 EMPTYPW_TACACSRC = os.getenv('TACACSRC', os.path.join(PREFIX, 'emptypw_tacacsrc'))
 
+# Don't use a credential agent that happens to be running
+TACACSRC_AGENT_SOCKET = None
+
 # Enable ACL support
 WITH_ACLS = True
 
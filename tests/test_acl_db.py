@@ -64,6 +64,22 @@ class TestAclsDB(unittest.TestCase):
         acl_set = 'bogus'
         self.assertRaises(exp, adb.get_acl_set, self.device, acl_set)
 
+    def test_08_get_acl_dicts(self):
+        """Test get dicts of associations for many devices in bulk"""
+        adb.add_acl(self.device, self.acl)
+        try:
+            devices = self.nd.all()
+            exp = dict((dev.nodeName, adb.get_acl_dict(dev)) for dev in devices)
+            self.assertEqual(exp, adb.get_acl_dicts(devices))
+            self.assertEqual(exp, adb.get_acl_dicts(devices, batch_size=1))
+            self.assertTrue(self.acl in exp[DEVICE_NAME]['explicit'])
+        finally:
+            adb.remove_acl(self.device, self.acl)
+
+    def test_09_get_acl_dicts_empty(self):
+        """Test get dicts of associations for no devices"""
+        self.assertEqual({}, adb.get_acl_dicts([]))
+
     def tearDown(self):
         NetDevices._Singleton = None
 
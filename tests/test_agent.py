@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the functionality of `~trigger.agent`.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from mock import patch
+from twisted.internet import task
+from twisted.test import proto_helpers
+
+from trigger import agent
+from trigger.conf import settings
+from trigger.exceptions import AgentError
+from trigger.tacacsrc import Tacacsrc, Credentials
+
+
+# Constants
+aol = Credentials('jschmoe', 'abc123', 'aol')
+bacon = Credentials('bacon', 'eggs', 'bacon')
+
+
+class Testing_Tacacsrc(Tacacsrc):
+    def _get_key_nonce_old(self):
+        '''Dependency injection'''
+        return 'jschmoe\n'
+
+class AgentFactoryTest(unittest.TestCase):
+    """Test the agent's protocol without a reactor."""
+    def setUp(self):
+        self.clock = task.Clock()
+        self.factory = agent.AgentFactory({'aol': aol}, lifetime=60,
+                                          clock=self.clock.seconds)
+
+    def _request(self, **request):
+        proto = self.factory.buildProtocol(None)
+        transport = proto_helpers.StringTransport()
+        proto.makeConnection(transport)
+        proto.dataReceived(json.dumps(request) + '\n')
+        return json.loads(transport.value())
+
+    def test_get(self):
+        """Test getting credentials"""
+        response = self._request(command='get')
+        self.assertEqual({'ok': True, 'creds': {'aol': list(aol)}}, response)
+
+    def test_set(self):
+        """Test replacing credentials"""
+        response = self._request(command='set', creds={'bacon': list(bacon)})
+        self.assertTrue(response['ok'])
+        self.assertEqual({None: {'bacon': list(bacon)}}, self.factory.creds)
+
+    def test_files(self):
+        """Test that credentials are kept by the file they came from"""
+        self._request(command='set', creds={'bacon': list(bacon)},
+                      file='/tmp/bacon')
+        self.assertEqual({}, self._request(command='get',
+                                           file='/tmp/eggs')['creds'])
+        self.assertEqual({'bacon': list(bacon)},
+                         self._request(command='get',
+                                       file='/tmp/bacon')['creds'])
+        self.assertEqual({'aol': list(aol)},
+                         self._request(command='get')['creds'])
+
+    def test_lifetime(self):
+        """Test that credentials are forgotten after their lifetime"""
+        self.clock.advance(59)
+        self.assertEqual(['aol'], self._request(command='get')['creds'].keys())
+        self.clock.advance(1)
+        self.assertEqual({}, self._request(command='get')['creds'])
+
+    def test_bad_request(self):
+        """Test that bad requests fail"""
+        self.assertFalse(self._request(command='bacon')['ok'])
+        self.assertFalse(self._request(bacon='eggs')['ok'])
+        self.assertFalse(self._request(command='set', creds='eggs')['ok'])
+
+
+class AgentTest(unittest.TestCase):
+    """Test a running agent."""
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'agent', 'agent.sock')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'trigger.agent', '--foreground',
+             '--no-load', '--socket', self.path])
+        for _ in xrange(100):
+            if os.path.exists(self.path):
+                break
+            time.sleep(0.05)
+        self.client = agent.get_agent(self.path)
+
+    def tearDown(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+        self.process.wait()
+        shutil.rmtree(self.tempdir)
+
+    def test_permissions(self):
+        """Test that only the owner can use the socket"""
+        self.assertTrue(self.client is not None)
+        mode = os.stat(self.path).st_mode
+        self.assertEqual(0, mode & 0077)
+        self.assertEqual(0, os.stat(os.path.dirname(self.path)).st_mode & 0077)
+        os.chmod(self.path, 0666)
+        self.assertEqual(None, agent.get_agent(self.path))
+
+    def test_credentials(self):
+        """Test setting, getting and clearing credentials"""
+        self.assertEqual({}, self.client.get_credentials())
+        self.client.set_credentials({'aol': aol})
+        self.assertEqual({'aol': aol}, self.client.get_credentials())
+        self.client.clear()
+        self.assertEqual({}, self.client.get_credentials())
+
+    def test_stop(self):
+        """Test stopping the agent"""
+        self.client.stop()
+        self.assertEqual(0, self.process.wait())
+        self.assertFalse(os.path.exists(self.path))
+        self.assertRaises(AgentError, self.client.get_credentials)
+
+    def test_tacacsrc(self):
+        """Test that Tacacsrc gets credentials from the agent first"""
+        with patch.object(settings, 'TACACSRC_AGENT_SOCKET', self.path):
+            # Read from the file, and handed to the agent
+            self.assertEqual(aol, Testing_Tacacsrc().creds['aol'])
+            self.assertEqual(aol, self.client.get_credentials()['aol'])
+
+            # Read from the agent
+            self.client.set_credentials({'aol': bacon})
+            with patch.object(Testing_Tacacsrc, '_read_file_old') as read:
+                self.assertEqual(bacon, Testing_Tacacsrc().creds['aol'])
+                self.assertFalse(read.called)
+
+            # Never read from the agent if a file is given
+            tcrc = Testing_Tacacsrc(tacacsrc_file=settings.TACACSRC)
+            self.assertEqual(aol, tcrc.creds['aol'])
+
+    def test_tacacsrc_other_file(self):
+        """Test that Tacacsrc only gets credentials read from its file"""
+        other = os.path.join(self.tempdir, 'tacacsrc')
+        shutil.copy(settings.TACACSRC, other)
+        with patch.object(settings, 'TACACSRC_AGENT_SOCKET', self.path):
+            self.client.set_credentials({'aol': bacon})
+            with patch.object(settings, 'TACACSRC', other):
+                self.assertEqual(aol, Testing_Tacacsrc().creds['aol'])
+            self.assertEqual(bacon, self.client.get_credentials()['aol'])
+            self.assertEqual(aol, self.client.get_credentials(other)['aol'])
+
+    def test_tacacsrc_write_fails(self):
+        """Test that the agent isn't given credentials that weren't saved"""
+        with patch.object(settings, 'TACACSRC_AGENT_SOCKET', self.path):
+            tcrc = Testing_Tacacsrc()
+            tcrc.creds['aol'] = bacon
+            with patch.object(Testing_Tacacsrc, '_write_old',
+                              side_effect=IOError('disk full')):
+                self.assertRaises(IOError, tcrc.write)
+            self.assertEqual(aol, self.client.get_credentials()['aol'])
+
+    def test_tacacsrc_without_agent(self):
+        """Test that Tacacsrc reads the file if the agent is gone"""
+        self.client.stop()
+        self.process.wait()
+        with patch.object(settings, 'TACACSRC_AGENT_SOCKET', self.path):
+            self.assertEqual(aol, Testing_Tacacsrc().creds['aol'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,630 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the functionality of `~trigger.cmds.Commando`.
+
+This uses the mockups of netdevices.xml in tests/data, and replaces
+`~trigger.netdevices.NetDevice.execute` so that no connections are made.
+"""
+
+import json
+import mock
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+from xml.etree.cElementTree import Element, SubElement
+
+from twisted.internet import defer, task
+
+from trigger.cmds import Commando
+from trigger.contrib.docommand import CommandRunner, ConfigLoader
+from trigger.conf import settings
+from trigger import metrics
+from trigger.exceptions import LoginTimeout
+from trigger.netdevices import NetDevices, NetDevice
+from trigger.pools import ParsePool
+from trigger.scheduler import AdaptiveConcurrency
+from trigger.sinks import CallbackSink
+from trigger.timing import PhaseTimer
+
+
+# Constants
+DEVICE_NAME = 'test1-abc.net.aol.com'
+DEVICE2_NAME = 'test2-abc.net.aol.com'
+
+
+def _reset_netdevices():
+    """Reset the Singleton state of NetDevices class."""
+    NetDevices._Singleton = None
+
+
+class FakeExecute(object):
+    """
+    Stand-in for `NetDevice.execute` returning a Deferred per call, which
+    tests fire themselves.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, commands, **kwargs):
+        d = defer.Deferred()
+        self.calls.append(d)
+        return d
+
+class TimedExecute(FakeExecute):
+    """
+    A `FakeExecute` whose Deferreds carry ``timings`` on a fake clock, like
+    those returned by `~trigger.twister.execute`.
+    """
+    def __init__(self):
+        super(TimedExecute, self).__init__()
+        self.clock = task.Clock()
+
+    def __call__(self, commands, **kwargs):
+        d = super(TimedExecute, self).__call__(commands, **kwargs)
+        d.timings = PhaseTimer('connect', clock=self.clock.seconds)
+        return d
+
+class ManualPool(ParsePool):
+    """A parse pool that runs what's submitted when tests flush it."""
+    def __init__(self, size=1, backlog=0, run_callbacks=True):
+        super(ManualPool, self).__init__(size, backlog)
+        self.run_callbacks = run_callbacks
+        self.submitted = []
+        self.flushing = False
+
+    @property
+    def in_worker(self):
+        return self.flushing
+
+    def submit(self, func, *args, **kwargs):
+        d = defer.Deferred()
+        self.submitted.append((d, func, args, kwargs))
+        return d
+
+    def flush(self):
+        """Run everything submitted so far."""
+        submitted, self.submitted = self.submitted, []
+        for d, func, args, kwargs in submitted:
+            self.flushing = True
+            try:
+                result = defer.maybeDeferred(func, *args, **kwargs)
+            finally:
+                self.flushing = False
+            result.chainDeferred(d)
+
+class FakeFarm(object):
+    """
+    Stand-in for `NetDevice.execute` simulating a farm of devices behind AAA
+    servers that can log in ``capacity`` sessions at once in ``latency``
+    seconds. Each session beyond that adds ``latency`` to every login, and
+    logins taking longer than ``login_timeout`` fail with `LoginTimeout`.
+    """
+    def __init__(self, clock, capacity, latency=1, login_timeout=5,
+                 command_time=2):
+        self.clock = clock
+        self.capacity = capacity
+        self.latency = latency
+        self.login_timeout = login_timeout
+        self.command_time = command_time
+        self.active = 0
+        self.peak = 0
+        self.logins = 0
+        self.timeouts = 0
+
+    def __call__(self, commands, incremental=None, **kwargs):
+        d = defer.Deferred()
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        overload = max(0, self.active - self.capacity)
+        latency = self.latency * (1 + overload)
+        if latency > self.login_timeout:
+            self.clock.callLater(self.login_timeout, self._timeout, d)
+        else:
+            self.clock.callLater(latency, self._login, d, commands,
+                                 incremental)
+        return d
+
+    def _timeout(self, d):
+        self.active -= 1
+        self.timeouts += 1
+        d.errback(LoginTimeout('Timed out while logging in'))
+
+    def _login(self, d, commands, incremental):
+        self.logins += 1
+        if incremental is not None:
+            incremental([])
+        self.clock.callLater(self.command_time, self._done, d, commands)
+
+    def _done(self, d, commands):
+        self.active -= 1
+        d.callback(['output of %s' % c for c in commands])
+
+
+class TestCommandoScheduler(unittest.TestCase):
+    def setUp(self):
+        self.execute = FakeExecute()
+        patcher = mock.patch.object(NetDevice, 'execute',
+                                    side_effect=self.execute)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _commando(self, **kwargs):
+        return Commando(devices=[DEVICE_NAME, DEVICE2_NAME],
+                        commands=['show version'], force_cli=True, **kwargs)
+
+    def test_no_limits(self):
+        """Test that max_conns is the only limit by default"""
+        commando = self._commando()
+        commando._add_worker()
+        self.assertEqual(2, len(self.execute.calls))
+        self.assertEqual(2, commando.curr_conns)
+
+    def test_jobs_list(self):
+        """Test that the job queue is a list without limits"""
+        commando = self._commando()
+        self.assertEqual(list, type(commando.jobs))
+        first = commando.jobs.pop(0)
+        commando.jobs.insert(0, first)
+        self.assertEqual(first, commando.jobs[0])
+        commando._add_worker()
+        self.assertEqual(2, len(self.execute.calls))
+        self.execute.calls[0].callback(['Junos 1.0'])
+        self.execute.calls[1].callback(['Junos 1.0'])
+        self.assertEqual(0, commando.curr_conns)
+        self.assertEqual(2, len(commando.results))
+
+    def test_concurrency_limits(self):
+        """Test that devices wait on concurrency limits"""
+        # Both devices are at site LAB.
+        commando = self._commando(concurrency_limits=['site<=1'])
+        commando._add_worker()
+        self.assertEqual(1, len(self.execute.calls))
+        self.assertEqual(1, commando.curr_conns)
+        self.assertTrue(commando.jobs.blocked)
+
+        self.execute.calls[0].callback(['Junos 1.0'])
+        self.assertEqual(2, len(self.execute.calls))
+        self.assertEqual(1, commando.curr_conns)
+
+        self.execute.calls[1].errback(RuntimeError('bacon'))
+        self.assertEqual(0, commando.curr_conns)
+        self.assertFalse(commando.jobs)
+        self.assertEqual(0, commando.jobs.running)
+        self.assertEqual(1, len(commando.results))
+        self.assertEqual(1, len(commando.errors))
+
+    def test_class_limits(self):
+        """Test setting concurrency limits on a subclass"""
+        class LimitedCommando(Commando):
+            concurrency_limits = {'site': 1}
+        commando = LimitedCommando(devices=[DEVICE_NAME, DEVICE2_NAME],
+                                   commands=['show version'], force_cli=True)
+        commando._add_worker()
+        self.assertEqual(1, len(self.execute.calls))
+
+    def test_realm_from_creds(self):
+        """Test that devices are in the realm of the credentials"""
+        commando = self._commando(creds=('bacon', 'eggs', 'spam'),
+                                  concurrency_limits=['realm<=1'])
+        commando._add_worker()
+        self.assertEqual(1, len(self.execute.calls))
+        self.assertEqual((('realm', 'spam'),),
+                         commando.jobs._combination(commando.nd[DEVICE_NAME]))
+
+    def tearDown(self):
+        _reset_netdevices()
+
+
+class TestCommandoSinks(unittest.TestCase):
+    def setUp(self):
+        self.execute = FakeExecute()
+        patcher = mock.patch.object(NetDevice, 'execute',
+                                    side_effect=self.execute)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.written = []
+        self.sink = CallbackSink(
+            lambda *args: self.written.append(('result',) + args),
+            on_error=lambda *args: self.written.append(('error',) + args))
+
+    def _run(self, commando, result=None):
+        commando._add_worker()
+        self.execute.calls[0].callback(result or ['Junos 1.0'])
+        self.execute.calls[1].errback(RuntimeError('bacon'))
+
+    def test_sink(self):
+        """Test that results are written to the sink as devices finish"""
+        commando = Commando(devices=[DEVICE_NAME, DEVICE2_NAME],
+                            commands=['show version'], force_cli=True,
+                            sink=self.sink)
+        commando._add_worker()
+        self.assertEqual([], self.written)
+        self.execute.calls[0].callback(['Junos 1.0'])
+        self.assertEqual(1, len(self.written))
+        self.execute.calls[1].errback(RuntimeError('bacon'))
+
+        self.assertEqual(['result', 'error'], [w[0] for w in self.written])
+        self.assertEqual({'show version': 'Junos 1.0'}, self.written[0][2])
+        self.assertEqual(1, len(commando.results))
+        self.assertEqual(1, len(commando.errors))
+
+    def test_keep_nothing(self):
+        """Test keeping nothing in memory"""
+        commando = Commando(devices=[DEVICE_NAME, DEVICE2_NAME],
+                            commands=['show version'], force_cli=True,
+                            sink=self.sink, keep_results=False)
+        self._run(commando)
+        self.assertEqual(2, len(self.written))
+        self.assertEqual({}, commando.results)
+        self.assertEqual({}, commando.errors)
+
+    def test_sink_spec(self):
+        """Test opening a sink by name and closing it when done"""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'results.jsonl')
+        commando = Commando(devices=[DEVICE_NAME, DEVICE2_NAME],
+                            commands=['show version'], force_cli=True,
+                            sink='jsonl:' + path)
+        self._run(commando)
+        self.assertTrue(commando.sink.fileobj.closed)
+        records = [json.loads(line) for line in open(path)]
+        self.assertEqual(['result', 'error'], [r['kind'] for r in records])
+
+    def test_command_runner(self):
+        """Test that CommandRunner writes to the sink"""
+        runner = CommandRunner(devices=[DEVICE_NAME, DEVICE2_NAME],
+                               commands=['show version'], force_cli=True,
+                               sink=self.sink, keep_results=False)
+        with mock.patch('sys.stdout'):
+            self._run(runner)
+        self.assertEqual(['result', 'error'], [w[0] for w in self.written])
+        self.assertEqual({'show version': 'Junos 1.0'},
+                         dict(self.written[0][2]))
+        self.assertEqual({}, runner.data)
+
+    def test_config_loader(self):
+        """Test that ConfigLoader writes to the sink"""
+        ns = '{http://xml.juniper.net/xnm/1.1/xnm}'
+        reply = Element('rpc-reply')
+        loaded = SubElement(reply, ns + 'load-configuration-results')
+        SubElement(loaded, ns + 'load-success')
+        loader = ConfigLoader(devices=[DEVICE_NAME, DEVICE2_NAME],
+                              commands=['set system host-name foo'],
+                              sink=self.sink, keep_results=False)
+        with mock.patch('sys.stdout'):
+            self._run(loader, [Element('ok'), reply, Element('ok')])
+        self.assertEqual(['result', 'error'], [w[0] for w in self.written])
+        self.assertEqual({'load-configuration': 'Success'},
+                         dict(self.written[0][2]))
+        self.assertEqual({}, loader.data)
+
+    def tearDown(self):
+        _reset_netdevices()
+
+
+class TestCommandoParsePool(unittest.TestCase):
+    def setUp(self):
+        self.execute = FakeExecute()
+        patcher = mock.patch.object(NetDevice, 'execute',
+                                    side_effect=self.execute)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _commando(self, pool, **kwargs):
+        return Commando(devices=[DEVICE_NAME, DEVICE2_NAME],
+                        commands=['show version'], force_cli=True,
+                        parse_pool=pool, **kwargs)
+
+    def test_parse_in_pool(self):
+        """Test that devices are parsed in the pool"""
+        pool = ManualPool(size=2)
+        commando = self._commando(pool)
+        commando._add_worker()
+        self.execute.calls[0].callback(['Junos 1.0'])
+        self.assertEqual(1, commando.parsing)
+        self.assertEqual(commando._parse_results, pool.submitted[0][1])
+        self.assertEqual({}, commando.results)
+
+        pool.flush()
+        self.assertEqual(0, commando.parsing)
+        self.assertEqual({'show version': 'Junos 1.0'},
+                         commando.results[DEVICE2_NAME])
+
+    def test_connection_freed(self):
+        """Test that a device's connection is free while it's parsed"""
+        commando = self._commando(ManualPool(size=2), max_conns=1)
+        commando._add_worker()
+        self.assertEqual(1, len(self.execute.calls))
+        self.execute.calls[0].callback(['Junos 1.0'])
+        self.assertEqual(1, commando.curr_conns)
+        self.assertEqual(2, len(self.execute.calls))
+
+    def test_back_pressure(self):
+        """Test that connecting waits on a backed up parse pool"""
+        pool = ManualPool(size=1)
+        commando = self._commando(pool, max_conns=1)
+        commando._add_worker()
+        self.execute.calls[0].callback(['Junos 1.0'])
+        self.assertTrue(commando.parse_backlogged)
+        self.assertEqual(0, commando.curr_conns)
+        self.assertEqual(1, len(self.execute.calls))
+
+        pool.flush()
+        self.assertEqual(2, len(self.execute.calls))
+        self.execute.calls[1].callback(['Junos 1.0'])
+        pool.flush()
+        self.assertEqual(2, len(commando.results))
+
+    def test_parse_errors(self):
+        """Test that errors while parsing are stored"""
+        pool = ManualPool(size=2)
+        commando = self._commando(pool)
+        commando._add_worker()
+        self.execute.calls[0].callback(None)
+        pool.flush()
+        self.assertEqual([DEVICE2_NAME], list(commando.errors))
+        self.assertEqual(0, commando.parsing)
+
+    def test_run_parser(self):
+        """Test that run_parser() uses the pool"""
+        pool = ManualPool(run_callbacks=False)
+        commando = self._commando(pool)
+        d = commando.run_parser(len, 'bacon')
+        self.assertEqual(len, pool.submitted[0][1])
+        results = []
+        d.addCallback(results.append)
+        pool.flush()
+        self.assertEqual([5], results)
+
+        # Without a pool, parsers are just called.
+        commando = self._commando(None)
+        commando.run_parser(len, 'bacon').addCallback(results.append)
+        self.assertEqual([5, 5], results)
+
+    def tearDown(self):
+        _reset_netdevices()
+
+
+class FakeSessionPool(FakeExecute):
+    """Stand-in for a `~trigger.twister.SessionPool`."""
+    def __init__(self):
+        super(FakeSessionPool, self).__init__()
+        self.devices = []
+
+    def execute(self, device, commands, **kwargs):
+        self.devices.append(device.nodeName)
+        return self(commands, **kwargs)
+
+
+class TestCommandoSessionPool(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(NetDevice, 'execute',
+                                    side_effect=AssertionError)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_session_pool(self):
+        """Test that commands are run over the session pool"""
+        pool = FakeSessionPool()
+        commando = Commando(devices=[DEVICE_NAME, DEVICE2_NAME],
+                            commands=['show version'], force_cli=True,
+                            session_pool=pool)
+        commando._add_worker()
+        self.assertEqual([DEVICE_NAME, DEVICE2_NAME], sorted(pool.devices))
+        for d in pool.calls:
+            d.callback(['Junos 1.0'])
+        self.assertEqual(2, len(commando.results))
+
+
+class TestCommandoTimings(unittest.TestCase):
+    def setUp(self):
+        self.execute = TimedExecute()
+        patcher = mock.patch.object(NetDevice, 'execute',
+                                    side_effect=self.execute)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run(self, **kwargs):
+        commando = Commando(devices=[DEVICE_NAME, DEVICE2_NAME],
+                            commands=['show version'], force_cli=True,
+                            **kwargs)
+        commando._add_worker()
+        clock = self.execute.clock
+        ok, failed = self.execute.calls
+        clock.advance(1)
+        ok.timings.start('kex')
+        clock.advance(2)
+        ok.timings.finish()
+        failed.timings.finish()
+        ok.callback(['Junos 1.0'])
+        failed.errback(RuntimeError('bacon'))
+        return commando
+
+    def test_timings(self):
+        """Test that timings are kept for devices that fail or succeed"""
+        commando = self._run()
+        self.assertEqual(set([DEVICE_NAME, DEVICE2_NAME]),
+                         set(commando.timings))
+        self.assertEqual([{'connect': 1, 'kex': 2}, {'connect': 3}],
+                         sorted(commando.timings.values(), key=len,
+                                reverse=True))
+        summary = commando.timing_stats.summary()
+        self.assertEqual(['connect', 'kex', 'total'], list(summary))
+        self.assertEqual(2, summary['connect']['count'])
+        self.assertEqual(3, summary['connect']['p99'])
+        self.assertEqual(3, summary['total']['p50'])
+
+    def test_keep_nothing(self):
+        """Test that only the stats are kept without keep_results"""
+        commando = self._run(sink=CallbackSink(lambda *args: None),
+                             keep_results=False)
+        self.assertEqual({}, commando.timings)
+        self.assertEqual(2, len(commando.timing_stats))
+
+    def test_dump_timings(self):
+        """Test dumping timings as JSON"""
+        commando = self._run()
+        fileobj = StringIO.StringIO()
+        commando.dump_timings(fileobj)
+        data = json.loads(fileobj.getvalue())
+        self.assertEqual(2, data['kex']['max'])
+
+    def tearDown(self):
+        _reset_netdevices()
+
+
+class TestCommandoMetrics(unittest.TestCase):
+    def setUp(self):
+        self.execute = FakeExecute()
+        patcher = mock.patch.object(NetDevice, 'execute',
+                                    side_effect=self.execute)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _values(self):
+        return (metrics.DEVICES_QUEUED.value, metrics.DEVICES_RUNNING.value,
+                metrics.DEVICES.labels('ok').value,
+                metrics.DEVICES.labels('error').value)
+
+    def test_metrics(self):
+        """Test that queued, running and finished devices are counted"""
+        queued, running, ok, failed = self._values()
+        commando = Commando(devices=[DEVICE_NAME, DEVICE2_NAME],
+                            commands=['show version'], force_cli=True,
+                            concurrency_limits=['site<=1'])
+        self.assertEqual((queued, running, ok, failed), self._values())
+
+        commando._add_worker()
+        self.assertEqual((queued + 1, running + 1, ok, failed),
+                         self._values())
+
+        self.execute.calls[0].callback(['Junos 1.0'])
+        self.assertEqual((queued, running + 1, ok + 1, failed),
+                         self._values())
+
+        self.execute.calls[1].errback(RuntimeError('bacon'))
+        self.assertEqual((queued, running, ok + 1, failed + 1),
+                         self._values())
+
+    def test_metrics_failed_run(self):
+        """Test that devices stop being counted when a run fails"""
+        queued, running, ok, failed = self._values()
+        commando = Commando(devices=[DEVICE_NAME, DEVICE2_NAME],
+                            commands=['show version'], force_cli=True,
+                            concurrency_limits=['site<=1'])
+        with mock.patch.object(Commando, '_start',
+                               side_effect=RuntimeError('bacon')):
+            self.assertRaises(RuntimeError, commando.run)
+        self.assertEqual((queued, running, ok, failed), self._values())
+
+        # A device that finishes anyway isn't uncounted twice, and the next
+        # one is counted as it starts.
+        self.execute.calls[0].callback(['Junos 1.0'])
+        self.assertEqual((queued, running + 1, ok + 1, failed),
+                         self._values())
+
+    def tearDown(self):
+        _reset_netdevices()
+
+
+class TestCommandoAdaptive(unittest.TestCase):
+    """Test adaptive concurrency against a simulated device farm."""
+    num_devices = 300
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        source = os.path.join(self.tmpdir, 'netdevices.json')
+        self.names = ['dev%03d.abc.example.com' % i
+                      for i in range(self.num_devices)]
+        with open(source, 'w') as fh:
+            json.dump([{'nodeName': name, 'manufacturer': 'JUNIPER',
+                        'deviceType': 'ROUTER', 'adminStatus': 'PRODUCTION'}
+                       for name in self.names], fh)
+
+        self.orig_source = settings.NETDEVICES_SOURCE
+        self.orig_snapshot_file = settings.NETDEVICES_SNAPSHOT_FILE
+        settings.NETDEVICES_SOURCE = source
+        settings.NETDEVICES_SNAPSHOT_FILE = None
+        _reset_netdevices()
+        self.clock = task.Clock()
+
+    def _run(self, farm, **kwargs):
+        """Run a Commando against ``farm`` and return it."""
+        limits = []
+        with mock.patch.object(NetDevice, 'execute', side_effect=farm):
+            commando = Commando(devices=self.names, commands=['show version'],
+                                force_cli=True, **kwargs)
+            commando._add_worker()
+            while commando.curr_conns:
+                limits.append(commando.conn_limit)
+                self.clock.advance(0.5)
+        self.assertEqual(self.num_devices,
+                         len(commando.results) + len(commando.errors))
+        self.assertFalse(commando.jobs)
+        commando.limits = limits
+        return commando
+
+    def _aimd(self, **kwargs):
+        return AdaptiveConcurrency(clock=self.clock.seconds, max_latency=3,
+                                   **kwargs)
+
+    def test_fixed_overloads(self):
+        """Test that a fixed max_conns overloads a struggling farm"""
+        farm = FakeFarm(self.clock, capacity=10)
+        self._run(farm, max_conns=50)
+        self.assertEqual(50, farm.peak)
+        self.assertTrue(farm.timeouts > 100)
+
+    def test_grows_when_healthy(self):
+        """Test that concurrency grows to max_conns on a healthy farm"""
+        farm = FakeFarm(self.clock, capacity=100)
+        commando = self._run(farm, max_conns=40, adaptive=self._aimd())
+        self.assertEqual(40, max(commando.limits))
+        self.assertEqual(commando.adaptive.limit,
+                         metrics.CONCURRENCY_LIMIT.value)
+        self.assertEqual(40, farm.peak)
+        self.assertEqual(0, farm.timeouts)
+        self.assertEqual(0, commando.adaptive.backoffs)
+        self.assertEqual(self.num_devices, len(commando.results))
+
+    def test_backs_off_when_struggling(self):
+        """Test that concurrency settles near what the farm can handle"""
+        farm = FakeFarm(self.clock, capacity=10)
+        commando = self._run(farm, max_conns=50, adaptive=self._aimd())
+        self.assertTrue(commando.adaptive.backoffs > 0)
+        self.assertTrue(farm.peak < 50)
+        self.assertTrue(farm.timeouts < 20, farm.timeouts)
+        self.assertEqual(commando.adaptive.limit,
+                         metrics.CONCURRENCY_LIMIT.value)
+
+        # Once past slow start, it saws up and down around the farm's
+        # capacity.
+        settled = commando.limits[len(commando.limits) // 2:]
+        self.assertTrue(3 <= min(settled), settled)
+        self.assertTrue(max(settled) <= 20, settled)
+        mean = sum(settled) / float(len(settled))
+        self.assertTrue(5 <= mean <= 15, mean)
+
+    def test_adaptive_true(self):
+        """Test enabling adaptive concurrency with the defaults"""
+        farm = FakeFarm(self.clock, capacity=100)
+        with mock.patch.object(NetDevice, 'execute', side_effect=farm):
+            commando = Commando(devices=self.names, commands=['show version'],
+                                force_cli=True, max_conns=30, adaptive=True)
+        self.assertEqual(30, commando.adaptive.maximum)
+        self.assertEqual(2, commando.conn_limit)
+
+    def tearDown(self):
+        settings.NETDEVICES_SOURCE = self.orig_source
+        settings.NETDEVICES_SNAPSHOT_FILE = self.orig_snapshot_file
+        shutil.rmtree(self.tmpdir)
+        _reset_netdevices()
+
+
+if __name__ == '__main__':
+    unittest.main()
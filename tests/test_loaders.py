@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the built-in NetDevices loaders in `~trigger.netdevices.loaders`.
+"""
+
+import json
+import mock
+import os
+import shutil
+import sqlite3
+import StringIO
+import tempfile
+import unittest
+
+from utils import mock_mongo
+
+from trigger import netdevices
+from trigger.exceptions import LoaderFailed
+from trigger.netdevices.loader import parse_fields, pushable_filters
+from trigger.netdevices.loaders import mongodb
+from trigger.netdevices.loaders.filesystem import (JSONLoader, SQLiteLoader,
+                                                   XMLLoader, iter_json_array)
+
+
+# Constants
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+XML_FILE = os.path.join(TESTS_DIR, 'data', 'netdevices.xml')
+RECORDS = [
+    {'nodeName': 'test1-abc.net.aol.com', 'manufacturer': 'JUNIPER',
+     'ports': [1, 2, 30], 'weight': 1.5, 'enabled': True, 'owner': None},
+    {'nodeName': u'test2-abc.net.aol.com', 'notes': u'caf\xe9 [a, b]',
+     'escaped': '"quoted" \\ }{'},
+    {},
+    12345,
+    'string',
+]
+DEVICES = [
+    {'nodeName': 'prod1.example.com', 'adminStatus': 'PRODUCTION',
+     'manufacturer': 'JUNIPER', 'deviceType': 'ROUTER', 'site': 'LAB'},
+    {'nodeName': 'spare1.example.com', 'adminStatus': 'NON-PRODUCTION',
+     'manufacturer': 'JUNIPER', 'deviceType': 'ROUTER', 'site': 'LAB'},
+    {'nodeName': 'prod2.example.com', 'adminStatus': 'PRODUCTION',
+     'manufacturer': 'CISCO SYSTEMS', 'deviceType': 'SWITCH', 'site': 'DC'},
+]
+PRODUCTION = {'adminStatus': 'PRODUCTION'}
+
+
+class TestIterJSONArray(unittest.TestCase):
+    def _decode(self, text, chunk_size=4096):
+        return list(iter_json_array(StringIO.StringIO(text), chunk_size))
+
+    def test_matches_json_load(self):
+        """Test that streamed records match json.loads() at any chunk size"""
+        text = json.dumps(RECORDS, indent=2)
+        for chunk_size in (1, 2, 7, 64, 4096):
+            self.assertEqual(json.loads(text), self._decode(text, chunk_size))
+
+    def test_whitespace(self):
+        """Test whitespace between tokens"""
+        text = ' \n[ 1 ,\t2\r\n, {"a" : 3} ] \n'
+        self.assertEqual([1, 2, {'a': 3}], self._decode(text, 3))
+
+    def test_empty(self):
+        """Test an empty array"""
+        self.assertEqual([], self._decode('[]'))
+        self.assertEqual([], self._decode(' [ \n ] ', 1))
+
+    def test_not_array(self):
+        """Test that anything other than an array is an error"""
+        for text in ('', '   ', '{"a": 1}', '<devices/>'):
+            self.assertRaises(ValueError, self._decode, text)
+
+    def test_malformed(self):
+        """Test malformed arrays"""
+        for text in ('[1 2]', '[1,]', '[,1]', '[1', '[{"a": 1}',
+                     '[{"a": }]'):
+            for chunk_size in (1, 4096):
+                self.assertRaises(ValueError, self._decode, text, chunk_size)
+
+    def test_lazy(self):
+        """Test that records are decoded as they're consumed"""
+        fileobj = StringIO.StringIO('[1, 2, 3, oops]')
+        records = iter_json_array(fileobj, 1)
+        self.assertEqual([1, 2], [next(records), next(records)])
+        self.assertRaises(ValueError, list, records)
+
+
+class TestJSONLoader(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.loader = JSONLoader()
+
+    def _write(self, text):
+        path = os.path.join(self.tmpdir, 'netdevices.json')
+        with open(path, 'w') as fh:
+            fh.write(text)
+        return path
+
+    def test_load_array(self):
+        """Test loading an array of devices"""
+        path = self._write(json.dumps(RECORDS))
+        data = self.loader.load_data_source(path)
+        self.assertFalse(isinstance(data, list))
+        self.assertEqual(RECORDS, list(data))
+
+    def test_load_empty(self):
+        """Test loading an empty array"""
+        path = self._write('[]')
+        self.assertEqual([], list(self.loader.load_data_source(path)))
+
+    def test_load_not_array(self):
+        """Test that JSON that isn't an array is loaded whole"""
+        path = self._write('{"a": 1}')
+        self.assertEqual({'a': 1}, self.loader.load_data_source(path))
+
+    def test_load_not_json(self):
+        """Test that a file that isn't JSON fails up front"""
+        self.assertRaises(LoaderFailed, self.loader.load_data_source, XML_FILE)
+        self.assertRaises(LoaderFailed, self.loader.load_data_source,
+                          self._write('[oops]'))
+
+    def test_load_truncated(self):
+        """Test that a truncated file fails once the bad record is reached"""
+        path = self._write(json.dumps(RECORDS)[:-10])
+        data = self.loader.load_data_source(path)
+        self.assertRaises(LoaderFailed, list, data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+class TestXMLLoader(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.loader = XMLLoader()
+
+    def _write(self, text):
+        path = os.path.join(self.tmpdir, 'netdevices.xml')
+        with open(path, 'w') as fh:
+            fh.write(text)
+        return path
+
+    def _load(self, path, **kwargs):
+        return [list(node) for node in
+                self.loader.load_data_source(path, **kwargs)]
+
+    def test_iterparse_matches_parse(self):
+        """Test that both modes load the same devices"""
+        expected = self._load(XML_FILE)
+        self.assertTrue(expected)
+        self.assertEqual(expected, self._load(XML_FILE, xml_mode='parse'))
+        self.assertEqual(expected, self._load(XML_FILE, xml_mode='iterparse'))
+
+    def test_iterparse_top_level_only(self):
+        """Test that only device elements beneath the root are loaded"""
+        path = self._write('<NetDevices><device><a>1</a><device>2</device>'
+                           '</device><other><device><b/></device></other>'
+                           '<device><c>3</c></device></NetDevices>')
+        expected = [[('a', '1'), ('device', '2')], [('c', '3')]]
+        self.assertEqual(expected, self._load(path))
+        self.assertEqual(expected, self._load(path, xml_mode='iterparse'))
+
+    def test_iterparse_empty(self):
+        """Test a file without devices"""
+        path = self._write('<NetDevices/>')
+        self.assertEqual([], self._load(path, xml_mode='iterparse'))
+
+    def test_iterparse_not_xml(self):
+        """Test that a file that isn't XML fails up front"""
+        path = self._write(json.dumps(RECORDS))
+        self.assertRaises(LoaderFailed, self.loader.load_data_source, path,
+                          xml_mode='iterparse')
+
+    def test_iterparse_truncated(self):
+        """Test that a truncated file fails once the bad device is reached"""
+        with open(XML_FILE) as fh:
+            path = self._write(fh.read()[:-50])
+        data = self.loader.load_data_source(path, xml_mode='iterparse')
+        self.assertRaises(LoaderFailed, list, data)
+
+    def test_bogus_mode(self):
+        """Test an unknown xml_mode"""
+        self.assertRaises(LoaderFailed, self.loader.load_data_source,
+                          XML_FILE, xml_mode='bogus')
+
+    def test_source_url(self):
+        """Test selecting iterparse from NETDEVICES_SOURCE"""
+        from trigger.netdevices import _munge_source_data
+        expected = [dict(node) for node in _munge_source_data(XML_FILE)]
+        data = _munge_source_data(XML_FILE + '?xml_mode=iterparse')
+        self.assertEqual(expected, [dict(node) for node in data])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+class TestLoaderHints(unittest.TestCase):
+    def test_parse_fields(self):
+        """Test normalizing the fields hint"""
+        self.assertEqual(None, parse_fields(None))
+        self.assertEqual(None, parse_fields(''))
+        expected = ['adminStatus', 'deviceType', 'manufacturer', 'nodeName',
+                    'site']
+        self.assertEqual(expected, parse_fields('site'))
+        self.assertEqual(expected, parse_fields(' site,nodeName, '))
+        self.assertEqual(expected, parse_fields(['site']))
+        self.assertEqual(['a', 'b'], parse_fields('b,a', required=()))
+
+    def test_pushable_filters(self):
+        """Test which filters may be applied to stored data"""
+        self.assertEqual([], pushable_filters(None))
+        self.assertEqual([('adminStatus', 'PRODUCTION', ('deviceStatus',))],
+                         pushable_filters(PRODUCTION))
+        self.assertEqual([('adminStatus', 'PRODUCTION', ())],
+                         pushable_filters(PRODUCTION, ['adminStatus']))
+        self.assertEqual([], pushable_filters(PRODUCTION, ['nodeName']))
+        self.assertEqual([], pushable_filters(PRODUCTION, ['adminStatus',
+                                                           'deviceStatus']))
+
+class TestSQLiteLoader(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'netdevices.sql')
+        self.loader = SQLiteLoader()
+        self.columns = ['nodeName', 'adminStatus', 'manufacturer',
+                        'deviceType', 'site']
+        self._create(self.columns, DEVICES)
+
+    def _create(self, columns, devices):
+        connection = sqlite3.connect(self.path)
+        connection.execute('drop table if exists netdevices')
+        connection.execute('create table netdevices (%s)' % ', '.join(columns))
+        for dev in devices:
+            connection.execute(
+                'insert into netdevices values (%s)' % ', '.join('?' * len(columns)),
+                [dev.get(c) for c in columns])
+        connection.commit()
+        connection.close()
+
+    def _load(self, **kwargs):
+        return [dict(row) for row in
+                self.loader.load_data_source(self.path, **kwargs)]
+
+    def test_load_all(self):
+        """Test loading every device"""
+        self.assertEqual(DEVICES, self._load())
+
+    def test_filters(self):
+        """Test that filters become a where clause"""
+        expected = [d for d in DEVICES if d['adminStatus'] == 'PRODUCTION']
+        self.assertEqual(expected, self._load(filters=PRODUCTION))
+
+    def test_filters_derived(self):
+        """Test that filters on derived fields aren't applied"""
+        self.columns.append('deviceStatus')
+        self._create(self.columns, DEVICES)
+        self.assertEqual(3, len(self._load(filters=PRODUCTION)))
+
+    def test_fields(self):
+        """Test that fields become a column list"""
+        rows = self._load(fields='site')
+        self.assertEqual(DEVICES, rows)
+        rows = self._load(fields='bogus', filters=PRODUCTION)
+        self.assertEqual(['adminStatus', 'deviceType', 'manufacturer',
+                          'nodeName'], sorted(rows[0]))
+        self.assertEqual(2, len(rows))
+
+    def test_build_query(self):
+        """Test the generated SQL"""
+        sql, params, columns = self.loader.build_query(
+            'netdevices', self.columns, PRODUCTION, 'site')
+        self.assertEqual('select "nodeName", "adminStatus", "manufacturer", '
+                         '"deviceType", "site" from netdevices '
+                         'where "adminStatus" = ?', sql)
+        self.assertEqual(['PRODUCTION'], params)
+        self.assertEqual(self.columns, columns)
+
+    def test_production_only(self):
+        """Test that NetDevices asks the loader for production devices"""
+        devices = list(netdevices._load_devices(self.path,
+                                                production_only=True))
+        self.assertEqual(['prod1.example.com', 'prod2.example.com'],
+                         [dev.nodeName for dev in devices])
+        devices = list(netdevices._load_devices(self.path))
+        self.assertEqual(3, len(devices))
+
+    def test_not_sqlite(self):
+        """Test that a file that isn't SQLite fails up front"""
+        self.assertRaises(LoaderFailed, self.loader.load_data_source,
+                          XML_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+class TestMongoDBLoader(unittest.TestCase):
+    def setUp(self):
+        mock_mongo.MockMongo.reset()
+        collection = mock_mongo.MockMongo.collection('trigger', 'netdevices')
+        for dev in DEVICES:
+            collection.insert(dev)
+        patcher = mock.patch.object(mongodb, 'MongoClient',
+                                    mock_mongo.MongoClient, create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loader = mongodb.MongoDBLoader()
+        self.kwargs = {'hostname': 'localhost', 'port': 27017,
+                       'database': 'trigger', 'table_name': 'netdevices'}
+
+    def _load(self, **kwargs):
+        kwargs.update(self.kwargs)
+        docs = list(self.loader.load_data_source('mongodb://', **kwargs))
+        for doc in docs:
+            doc.pop('_id')
+        return docs
+
+    def _cursor(self):
+        client = mock_mongo.MockMongo.clients[-1]
+        self.assertTrue(client.closed)
+        return client['trigger']['netdevices'].cursors[-1]
+
+    def test_load_all(self):
+        """Test loading every device"""
+        self.assertEqual(DEVICES, self._load())
+        self.assertEqual({}, self._cursor().query)
+        self.assertEqual(None, self._cursor().projection)
+        self.assertEqual(mongodb.BATCH_SIZE, self._cursor().batch)
+
+    def test_filters(self):
+        """Test that filters become a query"""
+        expected = [d for d in DEVICES if d['adminStatus'] == 'PRODUCTION']
+        self.assertEqual(expected, self._load(filters=PRODUCTION))
+
+        collection = mock_mongo.MockMongo.collection('trigger', 'netdevices')
+        collection.insert({'nodeName': 'rancid1.example.com',
+                           'deviceStatus': 'up'})
+        names = [d['nodeName'] for d in self._load(filters=PRODUCTION)]
+        self.assertEqual(['prod1.example.com', 'prod2.example.com',
+                          'rancid1.example.com'], names)
+
+    def test_fields(self):
+        """Test that fields become a projection"""
+        docs = self._load(fields='bogus', batch_size='10')
+        self.assertEqual(['adminStatus', 'deviceType', 'manufacturer',
+                          'nodeName'], sorted(docs[0]))
+        self.assertEqual(10, self._cursor().batch)
+
+    def test_streaming(self):
+        """Test that documents are fetched as they're consumed"""
+        data = self.loader.load_data_source('mongodb://', **self.kwargs)
+        cursor = mock_mongo.MockMongo.clients[-1]['trigger']['netdevices'].cursors[-1]
+        self.assertEqual(1, cursor.fetched)
+        next(data)
+        self.assertEqual(1, cursor.fetched)
+        list(data)
+        self.assertEqual(3, cursor.fetched)
+
+    def test_empty(self):
+        """Test an empty collection"""
+        mock_mongo.MockMongo.reset()
+        self.assertEqual([], self._load())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the functionality of `~trigger.logger`.
+"""
+
+import unittest
+
+from twisted.python import log
+
+from trigger import logger
+
+
+class Unformattable(object):
+    """An argument that fails the test if it's ever formatted."""
+    def __repr__(self):
+        raise AssertionError('Formatted a message that was not logged')
+
+    __str__ = __repr__
+
+
+class TestLogger(unittest.TestCase):
+    def setUp(self):
+        self.level = logger.get_level()
+        self.addCleanup(logger.set_level, self.level)
+        self.events = []
+        log.addObserver(self.events.append)
+        self.addCleanup(log.removeObserver, self.events.append)
+        self.log = logger.get_logger('trigger.tests')
+
+    def test_get_logger(self):
+        """Test that loggers are shared by name"""
+        self.assertTrue(self.log is logger.get_logger('trigger.tests'))
+
+    def test_levels(self):
+        """Test that only messages at or above the level are logged"""
+        logger.set_level('INFO')
+        self.log.debug('[%s] BYTES: %r', 'bacon', Unformattable())
+        self.log.info('[%s] Sending command %r', 'bacon', 'show ver')
+        self.log.warning('[%s] Command failed', 'bacon')
+        messages = [event['message'] for event in self.events]
+        self.assertEqual([("[bacon] Sending command 'show ver'",),
+                          ('[bacon] Command failed',)], messages)
+        self.assertEqual([logger.INFO, logger.WARNING],
+                         [event['logLevel'] for event in self.events])
+        self.assertEqual('trigger.tests', self.events[0]['logger'])
+        self.assertFalse(self.log.is_enabled_for(logger.DEBUG))
+
+    def test_set_level(self):
+        """Test changing the level of existing loggers"""
+        logger.set_level('error')
+        self.log.warning('eggs')
+        logger.set_level(logger.DEBUG)
+        self.log.debug('spam %d%%', 100)
+        self.log.debug('100%')
+        self.assertEqual([('spam 100%',), ('100%',)],
+                         [event['message'] for event in self.events])
+        self.assertRaises(ValueError, logger.set_level, 'LOUD')
+
+
+if __name__ == '__main__':
+    unittest.main()
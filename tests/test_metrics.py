@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the functionality of `~trigger.metrics`.
+"""
+
+import unittest
+
+from twisted.internet import defer, error
+from twisted.python.failure import Failure
+from twisted.web.test.requesthelper import DummyRequest
+
+from trigger import exceptions, metrics
+from trigger.metrics import Registry, MetricsResource
+from trigger.twister import TriggerClientFactory
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter(self):
+        """Test a counter with labels"""
+        counter = self.registry.counter('bacon_total', 'Bacon eaten.',
+                                        ['kind'])
+        counter.labels('crispy').inc()
+        counter.labels(kind='crispy').inc(2)
+        counter.labels('chewy').inc()
+        self.assertEqual(
+            '# HELP bacon_total Bacon eaten.\n'
+            '# TYPE bacon_total counter\n'
+            'bacon_total{kind="chewy"} 1\n'
+            'bacon_total{kind="crispy"} 3\n', self.registry.render())
+        self.assertRaises(ValueError, counter.labels, 'a', 'b')
+
+    def test_gauge(self):
+        """Test a gauge without labels"""
+        gauge = self.registry.gauge('eggs', 'Eggs in the pan.')
+        gauge.inc(3)
+        gauge.dec()
+        self.assertTrue(self.registry.render().endswith('\neggs 2\n'))
+        gauge.set(0.5)
+        self.assertTrue(self.registry.render().endswith('\neggs 0.5\n'))
+
+    def test_histogram(self):
+        """Test that histogram buckets are cumulative"""
+        histogram = self.registry.histogram('spam_seconds', 'Spam.',
+                                            buckets=(1, 5))
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value)
+        lines = self.registry.render().splitlines()[2:]
+        self.assertEqual(['spam_seconds_bucket{le="1.0"} 2',
+                          'spam_seconds_bucket{le="5.0"} 3',
+                          'spam_seconds_bucket{le="+Inf"} 4',
+                          'spam_seconds_sum 14.5',
+                          'spam_seconds_count 4'], lines)
+
+    def test_escaping(self):
+        """Test escaping label values"""
+        counter = self.registry.counter('eggs_total', 'Eggs.', ['name'])
+        counter.labels('a "b"\\\n').inc()
+        self.assertTrue('eggs_total{name="a \\"b\\"\\\\\\n"} 1' in
+                        self.registry.render())
+
+    def test_register_twice(self):
+        """Test that registering a name again returns the same metric"""
+        first = self.registry.counter('bacon_total', 'Bacon.')
+        self.assertTrue(first is self.registry.counter('bacon_total', 'Bacon.'))
+        self.assertRaises(ValueError, self.registry.gauge, 'bacon_total',
+                          'Bacon.')
+
+    def test_disabled(self):
+        """Test that a disabled registry's metrics do nothing"""
+        registry = Registry(enabled=False)
+        histogram = registry.histogram('spam_seconds', 'Spam.', ['kind'])
+        histogram.labels('canned').observe(1)
+        registry.gauge('eggs', 'Eggs.').inc()
+        self.assertEqual('', registry.render())
+
+    def test_resource(self):
+        """Test serving the metrics over HTTP"""
+        self.registry.gauge('eggs', 'Eggs.').inc()
+        request = DummyRequest([''])
+        body = MetricsResource(self.registry).render(request)
+        self.assertTrue(body.endswith('\neggs 1\n'))
+        self.assertEqual(metrics.CONTENT_TYPE,
+                         request.outgoingHeaders['content-type'])
+
+
+class TestTwisterMetrics(unittest.TestCase):
+    """Test the metrics kept by the client factories."""
+    def setUp(self):
+        self.factory = TriggerClientFactory(defer.Deferred(),
+                                            creds=('bacon', 'eggs'))
+        self.factory.d.addErrback(lambda failure: None)
+        self.active = metrics.CONNECTIONS_ACTIVE.value
+
+    def _count(self, result):
+        return metrics.CONNECTIONS.labels(result).value
+
+    def test_connection_lost(self):
+        """Test a connection that fails after connecting"""
+        timeouts = self._count('LoginTimeout')
+        commands = metrics.COMMAND_SECONDS.count
+        self.factory.startedConnecting(None)
+        self.assertEqual(self.active + 1, metrics.CONNECTIONS_ACTIVE.value)
+
+        self.factory.command_sent()
+        self.factory.command_done()
+        self.factory.command_done()
+        self.assertEqual(commands + 1, metrics.COMMAND_SECONDS.count)
+
+        self.factory.err = exceptions.LoginTimeout('Timed out')
+        self.factory.clientConnectionLost(None, Failure(error.ConnectionDone()))
+        self.assertEqual(self.active, metrics.CONNECTIONS_ACTIVE.value)
+        self.assertEqual(timeouts + 1, self._count('LoginTimeout'))
+
+    def test_connection_failed(self):
+        """Test a connection that's refused"""
+        refused = self._count('ConnectionRefusedError')
+        connects = metrics.PHASE_SECONDS.labels('connect').count
+        self.factory.startedConnecting(None)
+        self.factory.clientConnectionFailed(
+            None, Failure(error.ConnectionRefusedError()))
+        self.assertEqual(self.active, metrics.CONNECTIONS_ACTIVE.value)
+        self.assertEqual(refused + 1, self._count('ConnectionRefusedError'))
+        self.assertEqual(connects + 1,
+                         metrics.PHASE_SECONDS.labels('connect').count)
+
+    def test_not_connected(self):
+        """Test that connections that never started aren't counted"""
+        self.factory.clientConnectionLost(None, Failure(error.ConnectionDone()))
+        self.assertEqual(self.active, metrics.CONNECTIONS_ACTIVE.value)
+
+
+if __name__ == '__main__':
+    unittest.main()
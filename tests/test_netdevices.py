@@ -13,7 +13,13 @@ __maintainer__ = 'Jathan McCollum'
 __copyright__ = 'Copyright 2005-2011 AOL Inc.; 2013 Salesforce.com'
 __version__ = '2.0'
 
+import gc
+import json
+import mock
 import os
+import shutil
+import stat
+import tempfile
 import unittest
 
 # Make sure we load the mock redis library
@@ -22,7 +28,10 @@ from utils import mock_redis
 mock_redis.install()
 
 # Now we can import from Trigger
+from trigger.conf import settings
+from trigger import netdevices
 from trigger.netdevices import NetDevices, NetDevice, Vendor
+from trigger.netdevices.index import FieldIndex, PrefixTrie
 from trigger import changemgmt
 
 
@@ -70,6 +79,13 @@ class TestNetDevicesWithAcls(unittest.TestCase):
         self.assertEqual(self.nd.find(nodebasename), self.device)
         self.assertRaises(KeyError, lambda: self.nd.find(self.nodename[0:3]))
 
+    def test_find_many(self):
+        """Test the find_many() method."""
+        nodebasename = self.nodename[:self.nodename.index('.')]
+        expected = [self.device, None, self.device2, self.device]
+        keys = [self.nodename, 'bacon', DEVICE2_NAME.upper(), nodebasename]
+        self.assertEqual(expected, self.nd.find_many(keys))
+
     def test_all(self):
         """Test the all() method."""
         expected = [self.device, self.device2]
@@ -115,6 +131,17 @@ class TestNetDevicesWithAcls(unittest.TestCase):
         # Case-insensitive attr *and* value
         self.assertEqual(expected, self.nd.match(SITE='NONE'))
 
+    def test_search_bogus_field(self):
+        """Test that search() on a bogus field still raises an error."""
+        self.assertRaises(AttributeError, self.nd.search, 'ash', field='bacon')
+
+    def test_match_reset_indexes(self):
+        """Test that match() reflects changes after resetting indexes."""
+        self.assertEqual([], self.nd.match(site='bacon'))
+        self.device.site = 'BACON'
+        self.nd._reset_indexes()
+        self.assertEqual([self.device], self.nd.match(site='bacon'))
+
     def tearDown(self):
         _reset_netdevices()
 
@@ -187,6 +214,13 @@ class TestNetDeviceObject(unittest.TestCase):
         self.assertFalse(self.device.is_ioslike())
         self.assertFalse(self.device.is_brocade_vdx())
 
+    def test_brocade_vdx_without_make(self):
+        """Test is_brocade_vdx() for a Brocade switch with no make"""
+        dev = NetDevice(data={'nodeName': 'fcx1-abc.net.aol.com',
+                              'manufacturer': 'BROCADE',
+                              'deviceType': 'SWITCH'})
+        self.assertFalse(dev.is_brocade_vdx())
+
     def test_hash_ssh(self):
         """Exercise NetDevice ssh test."""
         # TODO (jathan): Mock SSH connections so we can test actual connectivity
@@ -195,6 +229,18 @@ class TestNetDeviceObject(unittest.TestCase):
         # Since there's no SSH, no aync
         self.assertFalse(self.device.can_ssh_pty())
 
+    def test_has_ssh_port(self):
+        """Test that the SSH check uses nodePort"""
+        dev = NetDevice(data={'nodeName': 'test1-abc.net.aol.com:2222',
+                              'manufacturer': 'CISCO SYSTEMS'})
+        with mock.patch.object(netdevices.network, 'test_ssh') as test_ssh:
+            dev.has_ssh()
+        test_ssh.assert_called_once_with('test1-abc.net.aol.com', 2222)
+        with mock.patch.object(netdevices.network, 'test_ssh') as test_ssh:
+            self.device.has_ssh()
+        test_ssh.assert_called_once_with(self.device.nodeName,
+                                         settings.SSH_PORT)
+
     def test_reachability(self):
         """Exercise NetDevice ssh test."""
         # TODO (jathan): Mock SSH connections so we can test actual connectivity
@@ -220,6 +266,471 @@ class TestNetDeviceObject(unittest.TestCase):
         _reset_netdevices()
 
 
+class TestNetDeviceCompact(unittest.TestCase):
+    """
+    Test the compact representation of NetDevice objects.
+    """
+    def setUp(self):
+        self.data = {
+            'nodeName': 'compact1.example.com', 'manufacturer': 'JUNIPER',
+            'deviceType': 'router', 'site': 'LAB',
+        }
+
+    def _device(self, **kwargs):
+        data = dict(self.data, **kwargs)
+        return NetDevice(data=data)
+
+    def test_no_extra_attributes(self):
+        """Test that devices with only core fields don't have a __dict__"""
+        device = self._device()
+        self.assertEqual({}, device._extra_attributes())
+        self.assertFalse([r for r in gc.get_referents(device) if type(r) is dict])
+        self.assertEqual('ROUTER', device.deviceType)
+        self.assertTrue('site' in device._field_names())
+
+    def test_extra_attributes(self):
+        """Test fields without slots, from the source and set later"""
+        device = self._device(onCallID='17', os='junos')
+        self.assertEqual('17', device.onCallID)
+        device.bacon = 'yummy'
+        self.assertEqual('yummy', device.bacon)
+        self.assertEqual({'onCallID': '17', 'os': 'junos', 'bacon': 'yummy'},
+                         device._extra_attributes())
+        self.assertTrue('onCallID' in device._field_names())
+        self.assertRaises(AttributeError, getattr, device, 'eggs')
+
+    def test_shared_profile(self):
+        """Test that similar devices share derived attributes"""
+        dev1 = self._device()
+        dev2 = self._device(nodeName='compact2.example.com')
+        dev3 = self._device(deviceType='SWITCH', manufacturer='CISCO SYSTEMS')
+        self.assertTrue(netdevices.profile_factory(dev1) is
+                        netdevices.profile_factory(dev2))
+        self.assertEqual(['set cli screen-length 0'], dev1.startup_commands)
+        self.assertEqual(['terminal length 0'], dev3.startup_commands)
+        self.assertEqual(['write memory'], dev3.commit_commands)
+
+        # Overriding or changing a device doesn't change the others.
+        dev1.startup_commands = ['bacon']
+        self.assertEqual(['set cli screen-length 0'], dev2.startup_commands)
+        dev2.startup_commands.append('set cli screen-width 0')
+        dev2.commit_commands.append('and-quit')
+        dev4 = self._device(nodeName='compact4.example.com')
+        self.assertEqual(['set cli screen-length 0'], dev4.startup_commands)
+        self.assertFalse('and-quit' in dev4.commit_commands)
+        self.assertEqual(['bacon'], dev1.startup_commands)
+
+    def test_identity_after_change(self):
+        """Test that is_*() methods follow changes to the device"""
+        dev = NetDevice(data={'nodeName': 'vdx1-abc.net.aol.com',
+                              'manufacturer': 'BROCADE',
+                              'deviceType': 'SWITCH', 'make': 'VDX6740'})
+        self.assertTrue(dev.is_brocade_vdx())
+        dev.make = 'FCX648'
+        self.assertFalse(dev.is_brocade_vdx())
+
+        other = NetDevice(data={'nodeName': 'asa1-abc.net.aol.com',
+                                'manufacturer': 'CISCO',
+                                'deviceType': 'FIREWALL'})
+        self.assertTrue(other.is_cisco_asa())
+        dev._update(other)
+        self.assertTrue(dev.is_cisco_asa())
+        self.assertFalse(dev.is_brocade_vdx())
+
+    def test_dynamic_methods(self):
+        """Test that execute() and connect() are bound to the device"""
+        from trigger import twister
+        device = self._device()
+        self.assertEqual(twister.execute, device.execute.im_func)
+        self.assertEqual(device, device.connect.im_self)
+
+        # And can still be replaced on a single device.
+        device.execute = 'bacon'
+        self.assertEqual('bacon', device.execute)
+        self.assertNotEqual('bacon', self._device().execute)
+
+    def test_shared_strings(self):
+        """Test that devices built together share identical values"""
+        records = [dict(self.data, nodeName='compact%d.example.com' % i,
+                        owningTeam=''.join(['Team ', 'A'])) for i in range(2)]
+        dev1, dev2 = netdevices._build_devices(records)
+        self.assertTrue(dev1.owningTeam is dev2.owningTeam)
+        self.assertTrue(dev1.manufacturer is dev2.manufacturer)
+
+        # Strings and unicode are kept apart.
+        records[1]['site'] = u'LAB'
+        dev1, dev2 = netdevices._build_devices(records)
+        self.assertEqual(str, type(dev1.site))
+        self.assertEqual(unicode, type(dev2.site))
+
+
+class TestNetDevicesSnapshot(unittest.TestCase):
+    """
+    Test loading NetDevices from a snapshot (``NETDEVICES_SNAPSHOT_FILE``).
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, 'netdevices.xml')
+        shutil.copy(settings.NETDEVICES_SOURCE, self.source)
+        self.snapshot_file = os.path.join(self.tmpdir, 'netdevices.snapshot')
+
+        self.orig_source = settings.NETDEVICES_SOURCE
+        self.orig_snapshot_file = settings.NETDEVICES_SNAPSHOT_FILE
+        settings.NETDEVICES_SOURCE = self.source
+        settings.NETDEVICES_SNAPSHOT_FILE = self.snapshot_file
+
+    def _load_without_source(self):
+        """Load NetDevices, failing if the source is parsed."""
+        _reset_netdevices()
+        with mock.patch.object(netdevices, '_munge_source_data') as munge:
+            munge.side_effect = AssertionError('Source was parsed')
+            return NetDevices()
+
+    def test_snapshot_used(self):
+        """Test that a snapshot is written and then used."""
+        nd = NetDevices()
+        expected = nd[DEVICE_NAME]
+        self.assertTrue(os.path.exists(self.snapshot_file))
+
+        nd = self._load_without_source()
+        self.assertEqual(sorted(nd.keys()), [DEVICE_NAME, DEVICE2_NAME])
+        device = nd[DEVICE_NAME]
+        self.assertEqual(expected.__getstate__(), device.__getstate__())
+
+    def test_snapshot_derived_attributes(self):
+        """Test that runtime attributes are rebuilt from a snapshot."""
+        expected = NetDevices()[DEVICE_NAME]
+        device = self._load_without_source()[DEVICE_NAME]
+
+        self.assertEqual(expected.vendor, device.vendor)
+        self.assertTrue(device.vendor is expected.vendor)
+        self.assertEqual(expected.startup_commands, device.startup_commands)
+        self.assertEqual(expected.commit_commands, device.commit_commands)
+        self.assertEqual(expected.delimiter, device.delimiter)
+        self.assertEqual(device.execute.im_self, device)
+        self.assertEqual(device.connect.im_self, device)
+
+    def test_snapshot_acls(self):
+        """Test that ACLs are populated after loading a snapshot."""
+        NetDevices()
+        device = self._load_without_source()[DEVICE_NAME]
+        self.assertTrue('router-protect.core' in device.implicit_acls)
+
+    def test_snapshot_invalidated(self):
+        """Test that changing the source invalidates the snapshot."""
+        NetDevices()
+        _reset_netdevices()
+
+        # Drop the second device from the source and bump the mtime.
+        with open(self.source) as fh:
+            data = fh.read()
+        start = data.index('<device nodeName="%s">' % DEVICE2_NAME)
+        end = data.index('</device>', start) + len('</device>')
+        with open(self.source, 'w') as fh:
+            fh.write(data[:start] + data[end:])
+        mtime = os.path.getmtime(self.source) + 10
+        os.utime(self.source, (mtime, mtime))
+
+        nd = NetDevices()
+        self.assertEqual(nd.keys(), [DEVICE_NAME])
+
+        # And the rewritten snapshot is used from now on.
+        nd = self._load_without_source()
+        self.assertEqual(nd.keys(), [DEVICE_NAME])
+
+    def test_snapshot_settings_invalidated(self):
+        """Test that changing relevant settings invalidates the snapshot."""
+        NetDevices()
+        orig_fallback_type = settings.FALLBACK_TYPE
+        settings.FALLBACK_TYPE = 'BACON'
+        try:
+            self.assertRaises(AssertionError, self._load_without_source)
+        finally:
+            settings.FALLBACK_TYPE = orig_fallback_type
+
+    def test_snapshot_production_only(self):
+        """Test that one snapshot serves production_only either way."""
+        with open(self.source) as fh:
+            data = fh.read()
+        with open(self.source, 'w') as fh:
+            fh.write(data.replace('<adminStatus>PRODUCTION</adminStatus>',
+                                  '<adminStatus>NON-PRODUCTION</adminStatus>',
+                                  1))
+
+        self.assertEqual(len(NetDevices()), 1)
+        _reset_netdevices()
+        with mock.patch.object(netdevices, '_munge_source_data') as munge:
+            munge.side_effect = AssertionError('Source was parsed')
+            nd = NetDevices(production_only=False)
+            self.assertEqual(len(nd), 2)
+
+    def test_rebuild_snapshot(self):
+        """Test rebuilding a snapshot by hand."""
+        self.assertEqual(netdevices.rebuild_snapshot(), 2)
+        nd = self._load_without_source()
+        self.assertEqual(len(nd), 2)
+
+    def test_snapshot_permissions(self):
+        """Test that only the owner can read or write a snapshot."""
+        NetDevices()
+        mode = os.stat(self.snapshot_file).st_mode
+        self.assertEqual(0600, stat.S_IMODE(mode))
+
+        os.chmod(self.snapshot_file, 0620)
+        self.assertRaises(AssertionError, self._load_without_source)
+
+        # Rewritten, but not used if the directory is writable by others.
+        _reset_netdevices()
+        NetDevices()
+        self.assertEqual(len(self._load_without_source()), 2)
+        os.chmod(self.tmpdir, 0777)
+        self.assertRaises(AssertionError, self._load_without_source)
+
+    def test_snapshot_owner(self):
+        """Test that a snapshot owned by someone else is ignored."""
+        NetDevices()
+        with mock.patch('os.getuid', return_value=os.getuid() + 1):
+            self.assertRaises(AssertionError, self._load_without_source)
+
+    def test_corrupt_snapshot(self):
+        """Test that a corrupt snapshot is ignored and rewritten."""
+        with open(self.snapshot_file, 'w') as fh:
+            fh.write('bacon')
+        self.assertEqual(len(NetDevices()), 2)
+        self.assertEqual(len(self._load_without_source()), 2)
+
+    def tearDown(self):
+        settings.NETDEVICES_SOURCE = self.orig_source
+        settings.NETDEVICES_SNAPSHOT_FILE = self.orig_snapshot_file
+        shutil.rmtree(self.tmpdir)
+        _reset_netdevices()
+
+
+class TestNetDevicesReload(unittest.TestCase):
+    """
+    Test reloading NetDevices in place with ``NetDevices.reload()``.
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, 'netdevices.json')
+        self.records = {}
+        for num in range(1, 4):
+            self.records[num] = {
+                'nodeName': 'reload%d.example.com' % num,
+                'manufacturer': 'JUNIPER', 'deviceType': 'ROUTER',
+                'adminStatus': 'PRODUCTION', 'site': 'SITE%d' % num,
+            }
+        self._write()
+
+        self.orig_source = settings.NETDEVICES_SOURCE
+        self.orig_snapshot_file = settings.NETDEVICES_SNAPSHOT_FILE
+        settings.NETDEVICES_SOURCE = self.source
+        settings.NETDEVICES_SNAPSHOT_FILE = None
+        _reset_netdevices()
+        self.nd = NetDevices(with_acls=False)
+
+    def _write(self):
+        with open(self.source, 'w') as fh:
+            json.dump([self.records[k] for k in sorted(self.records)], fh)
+
+        # Make sure the change is noticed even within the same second.
+        mtime = os.path.getmtime(self.source) + len(self.records)
+        os.utime(self.source, (mtime, mtime))
+
+    def _name(self, num):
+        return 'reload%d.example.com' % num
+
+    def test_reload_unchanged(self):
+        """Test that an unchanged source isn't read again"""
+        with mock.patch.object(netdevices, '_munge_source_data') as munge:
+            munge.side_effect = AssertionError('Source was parsed')
+            changes = self.nd.reload()
+        self.assertEqual({'added': [], 'changed': [], 'removed': []}, changes)
+
+    def test_reload_force(self):
+        """Test forcing a reload of an unchanged source"""
+        device = self.nd[self._name(1)]
+        changes = self.nd.reload(force=True)
+        self.assertEqual({'added': [], 'changed': [], 'removed': []}, changes)
+        self.assertTrue(self.nd[self._name(1)] is device)
+
+    def test_reload_changes(self):
+        """Test that devices are added, changed and removed"""
+        device = self.nd[self._name(1)]
+
+        # Build the indexes so we can check they're kept up to date.
+        self.assertEqual([device], self.nd.match(site='site1'))
+        self.assertEqual([device], self.nd.search('SITE1', field='site'))
+        self.assertEqual(device, self.nd.find('reload1'))
+        self.assertEqual(3, len(self.nd.match(vendor='juniper')))
+
+        self.records[1]['site'] = 'BACON'
+        self.records[1]['rack'] = '42'
+        del self.records[2]
+        self.records[4] = dict(self.records[3], nodeName=self._name(4))
+        self._write()
+
+        changes = self.nd.reload()
+        self.assertEqual({'added': [self._name(4)],
+                          'changed': [self._name(1)],
+                          'removed': [self._name(2)]}, changes)
+
+        # Changed in place.
+        self.assertTrue(self.nd[self._name(1)] is device)
+        self.assertEqual('BACON', device.site)
+        self.assertEqual('42', device.rack)
+
+        self.assertEqual([], self.nd.match(site='site1'))
+        self.assertEqual([device], self.nd.match(site='bacon'))
+        self.assertEqual([device], self.nd.match(rack='42'))
+        self.assertEqual([device], self.nd.search('BACON', field='site'))
+        self.assertEqual(2, len(self.nd.match(site='site3')))
+        self.assertEqual(3, len(self.nd.match(vendor='juniper')))
+        self.assertEqual(self.nd[self._name(4)], self.nd.find('reload4'))
+        self.assertRaises(KeyError, self.nd.find, 'reload2')
+        self.assertEqual(sorted(self.nd.all()), sorted(self.nd.match()))
+
+    def test_reload_only_changed(self):
+        """Test that only changed records are rebuilt"""
+        self.nd.reload(force=True)
+        self.records[3]['site'] = 'BACON'
+        self._write()
+        with mock.patch.object(netdevices, 'NetDevice',
+                               wraps=NetDevice) as netdevice:
+            changes = self.nd.reload()
+        self.assertEqual([self._name(3)], changes['changed'])
+        self.assertEqual(1, netdevice.call_count)
+
+    def test_reload_production_only(self):
+        """Test that devices that are no longer production are removed"""
+        self.records[1]['adminStatus'] = 'NON-PRODUCTION'
+        self._write()
+        changes = self.nd.reload()
+        self.assertEqual([self._name(1)], changes['removed'])
+        self.assertFalse(self._name(1) in self.nd)
+
+    def test_reload_failure(self):
+        """Test that a source that can't be loaded leaves devices alone"""
+        with open(self.source, 'w') as fh:
+            fh.write('bacon')
+        self.assertRaises(RuntimeError, self.nd.reload)
+        self.assertEqual(3, len(self.nd))
+
+    def test_reload_acls(self):
+        """Test that changed devices get their ACLs"""
+        self.nd.with_acls = True
+        self.records[1]['onCallID'] = '17'
+        self._write()
+        self.nd.reload()
+        self.assertTrue('router-protect.core' in
+                        self.nd[self._name(1)].implicit_acls)
+
+    def tearDown(self):
+        settings.NETDEVICES_SOURCE = self.orig_source
+        settings.NETDEVICES_SNAPSHOT_FILE = self.orig_snapshot_file
+        shutil.rmtree(self.tmpdir)
+        _reset_netdevices()
+
+
+class TestFieldIndex(unittest.TestCase):
+    """Test the FieldIndex object used by NetDevices.match()/search()."""
+    def setUp(self):
+        self.index = FieldIndex([
+            ('dev1', 'test1-abc.net.aol.com'),
+            ('dev2', 'test2-abc.net.aol.com'),
+            ('dev3', 'fw1-xyz.net.aol.com'),
+            ('dev4', 'fw1-xyz.net.aol.com'),
+        ])
+
+    def test_lookup(self):
+        """Test substring lookups."""
+        self.assertEqual(set(['dev1', 'dev2']), self.index.lookup('-abc.'))
+        self.assertEqual(set(['dev1']), self.index.lookup('test1'))
+        self.assertEqual(set(['dev3', 'dev4']), self.index.lookup('fw1-xyz'))
+        self.assertEqual(4, len(self.index.lookup('aol.com')))
+        self.assertEqual(set(), self.index.lookup('bacon'))
+
+    def test_lookup_short_token(self):
+        """Test lookups shorter than the n-gram size."""
+        self.assertEqual(set(['dev3', 'dev4']), self.index.lookup('fw'))
+        self.assertEqual(4, len(self.index.lookup('')))
+        self.assertEqual(set(), self.index.lookup('zz'))
+
+    def test_exact(self):
+        """Test exact lookups."""
+        self.assertEqual(set(['dev3', 'dev4']),
+                         self.index.exact('fw1-xyz.net.aol.com'))
+        self.assertEqual(set(), self.index.exact('fw1-xyz'))
+
+    def test_add_remove(self):
+        """Test adding and removing keys."""
+        self.index.remove('dev3', 'fw1-xyz.net.aol.com')
+        self.assertEqual(set(['dev4']), self.index.lookup('fw1'))
+        self.index.remove('dev4', 'fw1-xyz.net.aol.com')
+        self.assertEqual(set(), self.index.lookup('fw1'))
+        self.assertEqual(2, len(self.index))
+
+        self.index.add('dev5', 'fw2-xyz.net.aol.com')
+        self.assertEqual(set(['dev5']), self.index.lookup('xyz'))
+
+        # Removing something that isn't there is harmless.
+        self.index.remove('dev5', 'bacon')
+
+
+class TestPrefixTrie(unittest.TestCase):
+    """Test the PrefixTrie object used by NetDevices.find()."""
+    def setUp(self):
+        self.trie = PrefixTrie([
+            'test1-abc.net.aol.com',
+            'test2-abc.net.aol.com',
+            'test2-abc.net.aol.com.au',
+            'fw1-xyz.net.aol.com',
+        ])
+
+    def test_find(self):
+        """Test finding exact names and dotted prefixes."""
+        find = self.trie.find
+        self.assertEqual('test1-abc.net.aol.com', find('test1-abc'))
+        self.assertEqual('test1-abc.net.aol.com', find('test1-abc.net'))
+        self.assertEqual('test1-abc.net.aol.com', find('test1-abc.net.aol.com'))
+        self.assertEqual('fw1-xyz.net.aol.com', find('fw1-xyz.net.aol'))
+
+        # Exact names win, otherwise the lowest labels win.
+        self.assertEqual('test2-abc.net.aol.com', find('test2-abc'))
+        self.assertEqual('test2-abc.net.aol.com', find('test2-abc.net.aol.com'))
+        self.assertEqual('test2-abc.net.aol.com.au',
+                         find('test2-abc.net.aol.com.au'))
+
+    def test_find_misses(self):
+        """Test that partial labels don't match."""
+        find = self.trie.find
+        self.assertEqual(None, find('test'))
+        self.assertEqual(None, find('test1-abc.ne'))
+        self.assertEqual(None, find('fw1-xyz.net.aol.org'))
+        self.assertEqual(None, find('test1-abc.net.aol.com.au'))
+        self.assertEqual(None, find('bacon'))
+
+    def test_add_remove(self):
+        """Test adding and removing names."""
+        self.assertEqual(4, len(self.trie))
+        self.trie.remove('test2-abc.net.aol.com')
+        self.assertFalse('test2-abc.net.aol.com' in self.trie)
+        self.assertEqual('test2-abc.net.aol.com.au', self.trie.find('test2-abc'))
+        self.assertEqual('test2-abc.net.aol.com.au',
+                         self.trie.find('test2-abc.net.aol.com'))
+
+        self.trie.remove('test2-abc.net.aol.com.au')
+        self.assertEqual(None, self.trie.find('test2-abc'))
+        self.assertEqual('test1-abc.net.aol.com', self.trie.find('test1-abc'))
+
+        self.trie.add('test2-abc.net.aol.com')
+        self.assertEqual('test2-abc.net.aol.com', self.trie.find('test2-abc'))
+        self.assertEqual(3, len(self.trie))
+
+        # Removing something that isn't there is harmless.
+        self.trie.remove('bacon')
+
+
 class TestVendorObject(unittest.TestCase):
     """Test Vendor object"""
     def setUp(self):
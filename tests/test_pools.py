@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the functionality of `~trigger.pools`.
+
+The tests that use real pools run `~trigger.cmds.Commando` in a worker
+process using `~trigger.sharding.ShardedCommando`, so that the reactor can be
+run, with `~trigger.netdevices.NetDevice.execute` replaced so that no
+connections are made.
+"""
+
+import cPickle as pickle
+import mock
+import os
+import sys
+import threading
+import unittest
+
+from twisted.internet import defer
+
+from trigger.cmds import Commando
+from trigger.conf import settings
+from trigger.exceptions import ImproperlyConfigured, ParseTimeout
+from trigger.netdevices import NetDevices, NetDevice
+from trigger.pools import (ThreadParsePool, ProcessParsePool, get_parse_pool,
+                           _call)
+from trigger.sharding import ShardedCommando
+
+
+# Constants
+DEVICE_NAME = 'test1-abc.net.aol.com'
+DEVICE2_NAME = 'test2-abc.net.aol.com'
+
+
+def _reset_netdevices():
+    """Reset the Singleton state of NetDevices class."""
+    NetDevices._Singleton = None
+
+def count_lines(output):
+    """A parser that reports where it ran."""
+    return {'lines': len(output.splitlines()), 'pid': os.getpid(),
+            'thread': threading.current_thread().name}
+
+def die(output):
+    """A parser that kills the process it runs in."""
+    os._exit(1)
+
+def execute(device, commands, **kwargs):
+    """Stand-in for `NetDevice.execute`."""
+    return defer.succeed(['line 1\nline 2' for cmd in commands])
+
+
+class ParsingCommando(Commando):
+    """Parse results using run_parser()."""
+    def from_juniper(self, results, device, commands=None):
+        d = self.run_parser(count_lines, results[0])
+        d.addCallback(lambda parsed: self.store_results(device, parsed))
+        return d
+
+class DyingCommando(Commando):
+    """Parse results with a parser that dies."""
+    def from_juniper(self, results, device, commands=None):
+        return self.run_parser(die, results[0])
+
+
+class TestGetParsePool(unittest.TestCase):
+    def test_types(self):
+        """Test creating pools by name"""
+        pool = get_parse_pool('thread')
+        self.assertTrue(isinstance(pool, ThreadParsePool))
+        self.assertEqual(4, pool.size)
+        pool = get_parse_pool('process:3')
+        self.assertTrue(isinstance(pool, ProcessParsePool))
+        self.assertEqual(3, pool.size)
+        self.assertEqual(6, pool.limit)
+
+    def test_invalid(self):
+        """Test that invalid pools are rejected"""
+        for spec in ('bacon', 'thread:', 'thread:many', 'process:0'):
+            self.assertRaises(ImproperlyConfigured, get_parse_pool, spec)
+
+
+class TestCall(unittest.TestCase):
+    def test_result(self):
+        """Test returning a result from a worker process"""
+        self.assertEqual((True, 3),
+                         pickle.loads(_call(len, ('abc',), {})))
+
+    def test_error(self):
+        """Test returning an error from a worker process"""
+        ok, error = pickle.loads(_call(int, ('bacon',), {}))
+        self.assertFalse(ok)
+        self.assertTrue(isinstance(error, ValueError))
+
+    def test_unpicklable(self):
+        """Test that results that can't be pickled are reported"""
+        ok, error = pickle.loads(_call(lambda: lambda: None, (), {}))
+        self.assertFalse(ok)
+        self.assertTrue('Unable to pickle' in str(error))
+
+
+class TestPools(unittest.TestCase):
+    def setUp(self):
+        # ShardedCommando refuses to fork once the reactor is imported, which
+        # other tests will have done.
+        patcher = mock.patch.dict(sys.modules)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sys.modules.pop('twisted.internet.reactor', None)
+
+    def _sharded(self, parse_pool, commando_class=ParsingCommando):
+        with mock.patch.object(NetDevice, 'execute', execute):
+            sc = ShardedCommando(devices=[DEVICE_NAME, DEVICE2_NAME],
+                                 commando_class=commando_class,
+                                 commands=['show version'], force_cli=True,
+                                 shards=1, parse_pool=parse_pool)
+            sc.run()
+        return sc
+
+    def _run(self, parse_pool):
+        sc = self._sharded(parse_pool)
+        self.assertEqual({}, sc.errors)
+        self.assertEqual(2, len(sc.results))
+        return sc.results.values()
+
+    def test_inline(self):
+        """Test parsing on the reactor thread"""
+        for result in self._run(None):
+            self.assertEqual(2, result['lines'])
+            self.assertEqual('MainThread', result['thread'])
+
+    def test_thread_pool(self):
+        """Test parsing in a thread pool"""
+        for result in self._run('thread:2'):
+            self.assertEqual(2, result['lines'])
+            self.assertTrue('trigger-parse' in result['thread'])
+
+    def test_process_pool(self):
+        """Test parsing in a process pool"""
+        for result in self._run('process:2'):
+            self.assertEqual(2, result['lines'])
+            self.assertEqual('MainThread', result['thread'])
+            self.assertNotEqual(os.getpid(), result['pid'])
+
+    def test_process_pool_worker_dies(self):
+        """Test that devices whose parse process died are reported as errors"""
+        with mock.patch.object(settings, 'DEFAULT_TIMEOUT', 1):
+            sc = self._sharded('process:2', DyingCommando)
+        self.assertEqual({}, sc.results)
+        self.assertEqual(2, len(sc.errors))
+        for error in sc.errors.itervalues():
+            self.assertTrue(error.check(ParseTimeout), error)
+
+    def tearDown(self):
+        _reset_netdevices()
+
+
+if __name__ == '__main__':
+    unittest.main()
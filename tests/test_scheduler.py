@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the functionality of `~trigger.scheduler`.
+"""
+
+import threading
+import unittest
+
+from twisted.internet import task
+from twisted.python.failure import Failure
+
+from trigger import metrics
+from trigger.conf import settings
+from trigger.exceptions import (ImproperlyConfigured, LoginTimeout,
+                                LoginFailure, CommandTimeout)
+from trigger.netdevices import NetDevice
+from trigger.scheduler import (GroupScheduler, BudgetScheduler,
+                               AdaptiveConcurrency, parse_limits,
+                               device_group, device_realm)
+
+
+def make_device(name, site='ABC', **fields):
+    """Return a NetDevice named ``name``."""
+    data = {'nodeName': name, 'manufacturer': 'JUNIPER',
+            'deviceType': 'ROUTER', 'site': site}
+    data.update(fields)
+    return NetDevice(data=data)
+
+def drain(sched):
+    """Pop and start every device that may run now."""
+    started = []
+    while True:
+        device = sched.pop()
+        if device is None:
+            return started
+        sched.start(device)
+        started.append(device)
+
+
+class TestParseLimits(unittest.TestCase):
+    def test_strings(self):
+        """Test parsing limit strings"""
+        self.assertEqual({'site': 5, 'realm': 50},
+                         parse_limits(['site<=5', ' realm <= 50 ']))
+        self.assertEqual({'site': 5, 'owningTeam': 2},
+                         parse_limits('site<=5,owningTeam<=2'))
+
+    def test_dict(self):
+        """Test parsing a dict of limits"""
+        self.assertEqual({'site': 5}, parse_limits({'site': '5'}))
+
+    def test_empty(self):
+        """Test that no limits parse to nothing"""
+        self.assertEqual({}, parse_limits(None))
+        self.assertEqual({}, parse_limits([]))
+
+    def test_invalid(self):
+        """Test that invalid limits are rejected"""
+        for limits in (['site'], ['site<5'], ['site<=0'], {'site': 0},
+                       {'site': 'bacon'}):
+            self.assertRaises(ImproperlyConfigured, parse_limits, limits)
+
+
+class TestBucketKeys(unittest.TestCase):
+    def test_device_group(self):
+        """Test grouping members of a redundant pair"""
+        self.assertEqual(('ABC', 'bordeX'),
+                         device_group(make_device('border1.abc')))
+        self.assertEqual(device_group(make_device('border1.abc')),
+                         device_group(make_device('border2.abc')))
+        self.assertNotEqual(device_group(make_device('border1.abc')),
+                            device_group(make_device('border1.xyz', 'XYZ')))
+        self.assertEqual('10.0.0.1', device_group(make_device('10.0.0.1')))
+
+    def test_device_realm(self):
+        """Test the realm of a device"""
+        self.assertEqual(settings.DEFAULT_REALM,
+                         device_realm(make_device('border1.abc')))
+        self.assertEqual('bacon',
+                         device_realm(make_device('border1.abc', realm='bacon')))
+
+
+class TestGroupScheduler(unittest.TestCase):
+    def test_no_limits(self):
+        """Test that without limits it behaves like a list"""
+        devices = [make_device('dev%d.abc' % i) for i in range(5)]
+        sched = GroupScheduler()
+        sched.extend(devices)
+        self.assertEqual(5, len(sched))
+        self.assertEqual(list(reversed(devices)), drain(sched))
+        self.assertFalse(sched)
+        self.assertEqual(5, sched.running)
+
+    def test_site_limit(self):
+        """Test limiting devices per site"""
+        abc = [make_device('dev%d.abc' % i) for i in range(3)]
+        xyz = [make_device('dev%d.xyz' % i, 'XYZ') for i in range(3)]
+        sched = GroupScheduler(['site<=2'])
+        sched.extend(abc + xyz)
+
+        started = drain(sched)
+        self.assertEqual(4, len(started))
+        self.assertEqual(2, len([d for d in started if d.site == 'ABC']))
+        self.assertTrue(sched.blocked)
+        self.assertEqual(2, len(sched))
+
+        # Releasing an ABC device only lets the last ABC device run.
+        sched.release(started[0])
+        self.assertEqual([abc[0]], drain(sched))
+        self.assertTrue(sched.blocked)
+
+        sched.release(xyz[2])
+        self.assertEqual([xyz[0]], drain(sched))
+        self.assertFalse(sched.blocked)
+        self.assertFalse(sched)
+
+    def test_multiple_limits(self):
+        """Test that every bucket's limit applies"""
+        devices = [make_device('dev%d.abc' % i, 'SITE%d' % (i % 3),
+                               owningTeam='TEAM%d' % (i % 2))
+                   for i in range(12)]
+        sched = GroupScheduler(['site<=2', 'owningTeam<=3'])
+        sched.extend(devices)
+        running, seen = [], []
+        while sched:
+            started = drain(sched)
+            self.assertTrue(started or running)
+            running.extend(started)
+            seen.extend(started)
+            for site in ('SITE0', 'SITE1', 'SITE2'):
+                self.assertTrue(
+                    len([d for d in running if d.site == site]) <= 2)
+            for team in ('TEAM0', 'TEAM1'):
+                self.assertTrue(
+                    len([d for d in running if d.owningTeam == team]) <= 3)
+            sched.release(running.pop(0))
+        self.assertEqual(sorted(devices), sorted(seen))
+
+    def test_unkeyed_devices(self):
+        """Test that devices without a key aren't limited"""
+        devices = [make_device('dev%d.abc' % i, None) for i in range(3)]
+        sched = GroupScheduler(['site<=1'])
+        sched.extend(devices)
+        self.assertEqual(3, len(drain(sched)))
+
+    def test_custom_keys(self):
+        """Test passing custom bucket keys"""
+        devices = [make_device('dev%d.abc' % i) for i in range(4)]
+        sched = GroupScheduler(['parity<=1'],
+                               keys={'parity': lambda d: devices.index(d) % 2})
+        sched.extend(devices)
+        self.assertEqual(2, len(drain(sched)))
+
+    def test_release_unknown(self):
+        """Test that releasing a device that wasn't started is harmless"""
+        sched = GroupScheduler(['site<=1'])
+        device = make_device('dev1.abc')
+        sched.append(device)
+        sched.release(make_device('dev2.abc'))
+        self.assertEqual([device], drain(sched))
+
+    def test_dropped_device(self):
+        """Test that a popped device that isn't started holds no slot"""
+        devices = [make_device('dev%d.abc' % i) for i in range(2)]
+        sched = GroupScheduler(['site<=1'])
+        sched.extend(devices)
+        self.assertEqual(devices[1], sched.pop())
+        self.assertEqual([devices[0]], drain(sched))
+
+    def test_many_blocked(self):
+        """Test selection when many devices are blocked on one bucket"""
+        devices = [make_device('dev%d.abc' % i, 'SITE%d' % (i % 1000))
+                   for i in range(5000)]
+        sched = GroupScheduler(['site<=1'])
+        sched.extend(devices)
+        started = drain(sched)
+        self.assertEqual(1000, len(started))
+        for device in started:
+            sched.release(device)
+        self.assertEqual(1000, len(drain(sched)))
+
+
+class TestBudgetScheduler(unittest.TestCase):
+    def setUp(self):
+        self.budget = threading.Semaphore(2)
+        self.devices = [make_device('dev%d' % i) for i in range(4)]
+
+    def test_shared_budget(self):
+        """Test that schedulers share the budget"""
+        sched1 = BudgetScheduler(budget=self.budget)
+        sched2 = BudgetScheduler(budget=self.budget)
+        sched1.extend(self.devices[:2])
+        sched2.extend(self.devices[2:])
+
+        sched1.start(sched1.pop())
+        started = drain(sched2)
+        self.assertEqual(1, len(started))
+        self.assertEqual([], drain(sched1))
+        self.assertTrue(sched1.starved)
+        self.assertTrue(sched1.blocked)
+
+        sched2.release(started[0])
+        self.assertEqual(1, len(drain(sched1)))
+        self.assertFalse(sched1)
+
+    def test_with_limits(self):
+        """Test that limits are still enforced"""
+        sched = BudgetScheduler(['site<=1'], budget=self.budget)
+        sched.extend(self.devices)
+        self.assertEqual(1, len(drain(sched)))
+        self.assertTrue(sched.blocked)
+        self.assertFalse(sched.starved)
+        # The blocked pop gave its slot back.
+        self.assertTrue(self.budget.acquire(False))
+        self.assertFalse(self.budget.acquire(False))
+
+    def test_dropped_device(self):
+        """Test that a popped device that is never started keeps its slot"""
+        sched = BudgetScheduler(budget=self.budget)
+        sched.extend(self.devices)
+        sched.pop()
+        self.assertEqual(2, len(drain(sched)))
+        self.assertTrue(sched.starved)
+
+    def test_release_unknown(self):
+        """Test that releasing a device that wasn't started is ignored"""
+        sched = BudgetScheduler(budget=self.budget)
+        sched.release(self.devices[0])
+        self.assertTrue(self.budget.acquire(False))
+        self.assertTrue(self.budget.acquire(False))
+        self.assertFalse(self.budget.acquire(False))
+
+    def test_no_budget(self):
+        """Test that a budget is required"""
+        self.assertRaises(ImproperlyConfigured, BudgetScheduler)
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.aimd = AdaptiveConcurrency(initial=2, maximum=50, max_latency=5,
+                                        clock=self.clock.seconds)
+
+    def connect(self, latency=1):
+        token = self.aimd.start()
+        self.clock.advance(latency)
+        self.aimd.connected(token)
+        return token
+
+    def test_slow_start(self):
+        """Test that the limit grows by one per login until trouble"""
+        for _ in range(10):
+            self.connect()
+        self.assertEqual(12, self.aimd.limit)
+        self.assertTrue(self.aimd.slow_start)
+
+    def test_maximum(self):
+        """Test that the limit never exceeds the maximum"""
+        for _ in range(100):
+            self.connect()
+        self.assertEqual(50, self.aimd.limit)
+
+    def test_backoff(self):
+        """Test multiplicative decrease and then additive increase"""
+        for _ in range(18):
+            self.connect()
+        self.assertEqual(20, self.aimd.limit)
+
+        self.aimd.failed(self.aimd.start(), Failure(LoginTimeout()))
+        self.assertEqual(10, self.aimd.limit)
+        self.assertEqual(10, metrics.CONCURRENCY_LIMIT.value)
+        self.assertFalse(self.aimd.slow_start)
+        self.assertEqual(1, self.aimd.backoffs)
+
+        # About one more per 10 logins now.
+        for _ in range(10):
+            self.connect()
+        self.assertEqual(10, self.aimd.limit)
+        self.connect()
+        self.assertEqual(11, self.aimd.limit)
+
+    def test_backoff_once_per_round(self):
+        """Test that failures started before a backoff are ignored"""
+        for _ in range(18):
+            self.connect()
+        tokens = [self.aimd.start() for _ in range(20)]
+        for token in tokens:
+            self.aimd.failed(token, CommandTimeout())
+        self.assertEqual(10, self.aimd.limit)
+
+        self.aimd.failed(self.aimd.start(), CommandTimeout())
+        self.assertEqual(5, self.aimd.limit)
+
+    def test_minimum(self):
+        """Test that the limit never drops below the minimum"""
+        for _ in range(10):
+            self.aimd.failed(self.aimd.start(), LoginTimeout())
+        self.assertEqual(1, self.aimd.limit)
+
+    def test_other_errors(self):
+        """Test that errors that aren't about load are ignored"""
+        self.aimd.failed(self.aimd.start(), Failure(LoginFailure()))
+        self.aimd.failed(self.aimd.start(), RuntimeError())
+        self.assertEqual(2, self.aimd.limit)
+        self.assertEqual(0, self.aimd.backoffs)
+
+    def test_slow_logins(self):
+        """Test that slow logins stop growth and then back off"""
+        for _ in range(8):
+            self.connect()
+        self.assertEqual(10, self.aimd.limit)
+
+        self.connect(latency=8)
+        self.assertEqual(10, self.aimd.limit)
+        for _ in range(5):
+            self.connect(latency=8)
+        self.assertTrue(self.aimd.limit < 10)
+        self.assertTrue(self.aimd.backoffs > 0)
+
+    def test_connected_once(self):
+        """Test that only the first login for a token counts"""
+        token = self.connect()
+        self.aimd.connected(token)
+        self.assertEqual(3, self.aimd.limit)
+
+    def test_invalid(self):
+        """Test invalid parameters"""
+        self.assertRaises(ImproperlyConfigured, AdaptiveConcurrency,
+                          minimum=0)
+        self.assertRaises(ImproperlyConfigured, AdaptiveConcurrency,
+                          decrease=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the functionality of `~trigger.sharding`.
+
+Worker processes are forked, so they inherit the replacement for
+`~trigger.netdevices.NetDevice.execute` and no connections are made.
+"""
+
+import json
+import mock
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from twisted.internet import task
+
+from trigger.conf import settings
+from trigger.exceptions import (ImproperlyConfigured, ShardFailed,
+                                CommandTimeout)
+from trigger.netdevices import NetDevices, NetDevice
+from trigger.sharding import ShardedCommando, partition
+from trigger.sinks import CallbackSink
+from trigger.timing import PhaseTimer
+
+
+def _reset_netdevices():
+    """Reset the Singleton state of NetDevices class."""
+    NetDevices._Singleton = None
+
+
+class FakeExecute(object):
+    """
+    Stand-in for `NetDevice.execute` that answers after ``delay`` seconds,
+    counting connections across processes.
+    """
+    def __init__(self, delay=0.01, crash=None):
+        self.delay = delay
+        self.crash = crash
+        self.active = multiprocessing.Value('i', 0)
+        self.peak = multiprocessing.Value('i', 0)
+
+    def __call__(self, device, commands, **kwargs):
+        from twisted.internet import reactor
+        if device.nodeName == self.crash:
+            os._exit(1)
+        with self.active.get_lock():
+            self.active.value += 1
+            self.peak.value = max(self.peak.value, self.active.value)
+        d = task.deferLater(reactor, self.delay, self._done, device,
+                            commands)
+        d.timings = PhaseTimer()
+        d.timings.phases.update(connect=0.5, commands=1.5)
+        return d
+
+    def _done(self, device, commands):
+        with self.active.get_lock():
+            self.active.value -= 1
+        if device.nodeName.startswith('bad'):
+            raise CommandTimeout('Timed out')
+        return ['%s: %s' % (device.nodeName, cmd) for cmd in commands]
+
+
+class ShardingTestCase(unittest.TestCase):
+    num_devices = 40
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        source = os.path.join(self.tmpdir, 'netdevices.json')
+        self.names = ['dev%02d.%s.example.com' % (i, 'abc'[i % 3])
+                      for i in range(self.num_devices)]
+        self.names.append('bad.abc.example.com')
+        with open(source, 'w') as fh:
+            json.dump([{'nodeName': name, 'manufacturer': 'JUNIPER',
+                        'deviceType': 'ROUTER', 'adminStatus': 'PRODUCTION',
+                        'site': name.split('.')[1].upper()}
+                       for name in self.names], fh)
+
+        self.orig_source = settings.NETDEVICES_SOURCE
+        self.orig_snapshot_file = settings.NETDEVICES_SNAPSHOT_FILE
+        settings.NETDEVICES_SOURCE = source
+        settings.NETDEVICES_SNAPSHOT_FILE = None
+        _reset_netdevices()
+
+    def tearDown(self):
+        settings.NETDEVICES_SOURCE = self.orig_source
+        settings.NETDEVICES_SNAPSHOT_FILE = self.orig_snapshot_file
+        shutil.rmtree(self.tmpdir)
+        _reset_netdevices()
+
+
+class TestPartition(ShardingTestCase):
+    def setUp(self):
+        super(TestPartition, self).setUp()
+        self.devices = NetDevices(with_acls=False).find_many(self.names)
+
+    def test_round_robin(self):
+        """Test dealing devices out in turn"""
+        shards = partition(self.devices, 4)
+        self.assertEqual([11, 10, 10, 10], [len(s) for s in shards])
+        self.assertEqual(self.devices[1::4], shards[1])
+
+    def test_key(self):
+        """Test keeping devices with the same key together"""
+        shards = partition(self.devices, 2, key='site')
+        sites = [set(dev.site for dev in shard) for shard in shards]
+        self.assertEqual([set(['A', 'ABC']), set(['B', 'C'])], sites)
+        self.assertEqual(self.num_devices + 1, sum(len(s) for s in shards))
+
+    def test_key_function(self):
+        """Test keying devices using a function"""
+        shards = partition(self.devices, 3,
+                           key=lambda dev: dev.nodeName.startswith('bad'))
+        self.assertEqual([40, 1, 0], [len(s) for s in shards])
+
+
+class TestShardedCommando(ShardingTestCase):
+    def setUp(self):
+        super(TestShardedCommando, self).setUp()
+        # Other tests import the reactor, which a real caller must not have
+        # done before sharding.
+        patcher = mock.patch.dict(sys.modules)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sys.modules.pop('twisted.internet.reactor', None)
+
+    def _run(self, fake, **kwargs):
+        def execute(device, commands, **kwargs):
+            return fake(device, commands, **kwargs)
+
+        with mock.patch.object(NetDevice, 'execute', execute):
+            sc = ShardedCommando(devices=self.names, commands=['show version'],
+                                 force_cli=True, **kwargs)
+            sc.run()
+        return sc
+
+    def test_results(self):
+        """Test that results and errors are merged from every shard"""
+        sc = self._run(FakeExecute(), shards=3)
+        self.assertEqual(3, len(sc.shard_devices))
+        self.assertEqual(self.num_devices, len(sc.results))
+        self.assertEqual({'show version': 'dev07.b.example.com: show version'},
+                         sc.results['dev07.b.example.com'])
+        self.assertEqual(['bad.abc.example.com'], list(sc.errors))
+        error = sc.errors['bad.abc.example.com']
+        self.assertTrue(error.check(CommandTimeout))
+
+    def test_global_budget(self):
+        """Test that max_conns is shared by every shard"""
+        fake = FakeExecute(delay=0.05)
+        sc = self._run(fake, shards=4, max_conns=3)
+        self.assertEqual(self.num_devices, len(sc.results))
+        self.assertTrue(fake.peak.value <= 3, fake.peak.value)
+        self.assertEqual(0, fake.active.value)
+
+    def test_not_found(self):
+        """Test that missing devices are reported by the parent"""
+        self.names.append('bacon.example.com')
+        sc = self._run(FakeExecute(), shards=2)
+        self.assertEqual('Device not found in NetDevices: bacon.example.com',
+                         sc.errors['bacon.example.com'])
+
+    def test_worker_crash(self):
+        """Test that a crashed worker's devices are reported as errors"""
+        fake = FakeExecute(crash='bad.abc.example.com')
+        sc = self._run(fake, shards=2, max_conns=1)
+        self.assertEqual(self.num_devices + 1,
+                         len(sc.results) + len(sc.errors))
+        self.assertTrue(sc.errors)
+        for devname, error in sc.errors.iteritems():
+            self.assertTrue(isinstance(error, ShardFailed), error)
+            self.assertTrue(devname in sc.shard_devices[0])
+
+    def test_sink(self):
+        """Test streaming to a sink in the parent"""
+        written = []
+        sink = CallbackSink(lambda *args: written.append(args))
+        sc = self._run(FakeExecute(), shards=2, sink=sink, keep_results=False)
+        self.assertEqual(self.num_devices, len(written))
+        self.assertEqual({}, sc.results)
+
+    def test_timings(self):
+        """Test that timings are collected from every shard"""
+        sc = self._run(FakeExecute(), shards=3)
+        self.assertEqual(self.num_devices + 1, len(sc.timings))
+        self.assertEqual({'connect': 0.5, 'commands': 1.5},
+                         sc.timings['dev07.b.example.com'])
+        summary = sc.timing_stats.summary()
+        self.assertEqual(self.num_devices + 1, summary['total']['count'])
+        self.assertEqual(2.0, summary['total']['p95'])
+
+    def test_reactor_imported(self):
+        """Test that workers aren't forked once the reactor is imported"""
+        sc = ShardedCommando(devices=self.names, commands=['show version'])
+        with mock.patch.dict(sys.modules,
+                             {'twisted.internet.reactor': object()}):
+            self.assertRaises(ImproperlyConfigured, sc.run)
+
+    def test_invalid_shards(self):
+        """Test that there must be at least one shard"""
+        self.assertRaises(ImproperlyConfigured, ShardedCommando,
+                          devices=self.names, shards=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the functionality of `~trigger.simulator`.
+
+Sessions are tested with a fake clock. The end-to-end tests run a farm with
+``python -m trigger.simulator`` and `~trigger.twister.execute` in a worker
+process, so that the reactor can be run.
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import unittest
+from xml.etree.cElementTree import Element, fromstring, tostring
+
+from twisted.internet import task
+from twisted.test import proto_helpers
+
+from trigger.exceptions import ImproperlyConfigured
+from trigger.netdevices import NetDevice
+from trigger.simulator import (DeviceFarm, SimulatedDevice, CLISession,
+                               JunoscriptSession, SimulatorChecker,
+                               SimulatorTelnetProtocol, generate_output,
+                               iter_addresses)
+from trigger.twister import has_junoscript_error
+
+
+# Constants
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_device(personality='ios', **options):
+    """Return a device on a fake clock."""
+    options.setdefault('clock', task.Clock())
+    return SimulatedDevice('router1', personality, '127.1.0.1', **options)
+
+def make_session(device, username='admin'):
+    """Return a started CLI session and the list it writes to."""
+    written, closed = [], []
+    session = CLISession(device, username, written.append,
+                         lambda: closed.append(True))
+    session.start()
+    session.closed = closed
+    return session, written
+
+def _execute(records, commands, queue, options):
+    """Run commands on each device in a worker process."""
+    os.environ.setdefault('TERM', 'vt100')
+    from twisted.internet import defer, reactor
+    from trigger.tacacsrc import Credentials
+
+    creds = Credentials('admin', 'admin', 'simulator')
+    results, timings = {}, {}
+
+    def store(result, name, d):
+        timings[name] = d.timings.phases.keys()
+        if isinstance(result, list):
+            results[name] = [tostring(r) if hasattr(r, 'tag') else r
+                             for r in result]
+        else:
+            results[name] = repr(result.value)
+
+    deferreds = []
+    for record in records:
+        device = NetDevice(data=record, with_acls=False)
+        cmds = commands.get(record['deviceName'], ['show version', 'show x'])
+        d = device.execute(cmds, creds=creds, timeout=10, **options)
+        d.addBoth(store, record['deviceName'], d)
+        deferreds.append(d)
+    defer.DeferredList(deferreds).addCallback(lambda _: reactor.stop())
+    reactor.callLater(30, reactor.stop)
+    reactor.run()
+    queue.put((results, timings))
+
+def _execute_pooled(record, queue):
+    """Run commands on a device twice over a pooled session."""
+    os.environ.setdefault('TERM', 'vt100')
+    from twisted.internet import reactor
+    from trigger.tacacsrc import Credentials
+    from trigger.twister import SessionPool
+
+    creds = Credentials('admin', 'admin', 'simulator')
+    device = NetDevice(data=record, with_acls=False)
+    pool = SessionPool(max_per_device=1)
+    results, timings = [], []
+
+    def run(commands):
+        d = pool.execute(device, commands, creds=creds, timeout=10)
+        d.addBoth(results.append)
+        d.addBoth(lambda _: timings.append(d.timings.phases.keys()))
+        return d
+
+    def done(_):
+        sessions = len(pool)
+        pool.close()
+        reactor.callLater(0.1, reactor.stop)
+        queue.put((results, timings, sessions))
+
+    d = run(['show version'])
+    d.addCallback(lambda _: run(['show x', 'show y']))
+    d.addBoth(done)
+    reactor.callLater(30, reactor.stop)
+    reactor.run()
+
+
+class TestHelpers(unittest.TestCase):
+    def test_generate_output(self):
+        """Test that output is about the size that's asked for"""
+        output = generate_output('show version', 4096)
+        self.assertTrue(output.startswith("Simulated output of 'show version'"))
+        self.assertTrue(4096 <= len(output) <= 4096 + 120)
+
+    def test_iter_addresses(self):
+        """Test that addresses skip .0 and .255"""
+        addresses = iter_addresses('127.1.0.254')
+        self.assertEqual(['127.1.0.254', '127.1.1.1', '127.1.1.2'],
+                         [addresses.next() for _ in xrange(3)])
+
+
+class TestSimulatedDevice(unittest.TestCase):
+    def test_invalid(self):
+        """Test that unknown personalities and transports are rejected"""
+        self.assertRaises(ImproperlyConfigured, make_device, 'bacon')
+        self.assertRaises(ImproperlyConfigured, make_device, 'junos',
+                          transport='telnet')
+
+    def test_records(self):
+        """Test that records make NetDevices of the right kind"""
+        farm = DeviceFarm()
+        farm.add_many(4, ['ios', 'junos', 'netscreen', 'netscaler'],
+                      clock=task.Clock())
+        devices = [NetDevice(data=record, with_acls=False)
+                   for record in farm.records()]
+        self.assertEqual(['127.1.0.1', '127.1.0.2', '127.1.0.3', '127.1.0.4'],
+                         [dev.nodeName for dev in devices])
+        self.assertTrue(devices[0].is_ioslike())
+        self.assertEqual('juniper', devices[1].vendor)
+        self.assertTrue(devices[2].is_netscreen())
+        self.assertTrue(devices[3].is_netscaler())
+        self.assertEqual('ios-sim00001', farm.devices[0].hostname)
+
+    def test_errors(self):
+        """Test error injection"""
+        device = make_device(error_commands=['show bogus'])
+        self.assertTrue(device.is_error('show bogus'))
+        self.assertFalse(device.is_error('show version'))
+        device = make_device(error_rate=1)
+        self.assertTrue('% Invalid input' in device.respond('show version'))
+        self.assertEqual(1, device.stats['errors'])
+
+
+class TestCLISession(unittest.TestCase):
+    def test_prompt(self):
+        """Test the banner and prompt of each personality"""
+        prompts = {'ios': 'router1#', 'junos': 'admin@router1> ',
+                   'netscreen': 'router1-> ', 'netscaler': ' Done\n'}
+        for personality, prompt in prompts.iteritems():
+            session, written = make_session(make_device(personality))
+            self.assertTrue(''.join(written).endswith(prompt))
+
+    def test_command(self):
+        """Test that commands are echoed and answered"""
+        device = make_device(paging=False, outputs={'show clock': '12:00\n'})
+        session, written = make_session(device)
+        del written[:]
+        session.dataReceived('show clock\n')
+        self.assertEqual('show clock\r\n12:00\r\nrouter1#', ''.join(written))
+
+    def test_latency(self):
+        """Test that answers wait for the latency, and input is buffered"""
+        device = make_device(paging=False, latency=1,
+                             outputs={'one': '1\n', 'two': '2\n'})
+        session, written = make_session(device)
+        del written[:]
+        session.dataReceived('one\ntwo\n')
+        self.assertEqual('one\r\n', ''.join(written))
+        device.clock.advance(1)
+        self.assertEqual('one\r\n1\r\nrouter1#two\r\n', ''.join(written))
+        device.clock.advance(1)
+        self.assertTrue(''.join(written).endswith('2\r\nrouter1#'))
+
+    def test_paging(self):
+        """Test that output is paged until paging is turned off"""
+        device = make_device(page_length=2, outputs={'show': 'a\nb\nc\n'})
+        session, written = make_session(device)
+        del written[:]
+        session.dataReceived('show\n')
+        self.assertEqual('show\r\na\r\nb\r\n --More-- ', ''.join(written))
+        session.dataReceived(' ')
+        self.assertTrue(''.join(written).endswith('c\r\nrouter1#'))
+
+        del written[:]
+        session.dataReceived('terminal length 0\nshow\n')
+        self.assertTrue(''.join(written).endswith('a\r\nb\r\nc\r\nrouter1#'))
+
+    def test_exit(self):
+        """Test that exit ends the session"""
+        session, written = make_session(make_device())
+        session.dataReceived('exit\n')
+        self.assertEqual([True], session.closed)
+
+
+class TestJunoscriptSession(unittest.TestCase):
+    def _session(self, **options):
+        device = make_device('junos', **options)
+        written = []
+        session = JunoscriptSession(device, written.append, lambda: None)
+        session.start()
+        session.dataReceived('<?xml version="1.0" encoding="us-ascii"?>\n'
+                             '<junoscript version="1.0">\n')
+        return device, session, written
+
+    def _reply(self, written):
+        return fromstring(written[-1])
+
+    def test_rpc(self):
+        """Test that an rpc gets an rpc-reply"""
+        device, session, written = self._session()
+        session.dataReceived('<rpc><command>show version</command></rpc>')
+        device.clock.advance(0)
+        reply = self._reply(written)
+        self.assertEqual('rpc-reply', reply.tag)
+        self.assertTrue('show version' in tostring(reply))
+        self.assertFalse(has_junoscript_error(reply))
+
+    def test_error(self):
+        """Test that errors are xnm:error elements"""
+        device, session, written = self._session(
+            error_commands=['get-bogus-information'])
+        session.dataReceived('<rpc><get-bogus-information/></rpc>')
+        device.clock.advance(0)
+        self.assertTrue(has_junoscript_error(self._reply(written)))
+
+
+class TestTelnetLogin(unittest.TestCase):
+    def _login(self, password):
+        device = make_device(paging=False)
+        proto = SimulatorTelnetProtocol(device, SimulatorChecker('admin',
+                                                                 'admin'))
+        proto.makeConnection(proto_helpers.StringTransport())
+        proto.dataReceived('admin\n')
+        proto.dataReceived(password + '\n')
+        return proto
+
+    def test_login(self):
+        """Test logging in"""
+        proto = self._login('admin')
+        output = proto.transport.value()
+        self.assertTrue(output.endswith('Password: \nrouter1#'))
+
+    def test_login_failure(self):
+        """Test a bad password"""
+        proto = self._login('bacon')
+        self.assertTrue(proto.transport.value().endswith(
+            '% Login invalid\n\nUsername: '))
+        self.assertEqual(None, proto.session)
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'),
+                     'Needs all of 127.0.0.0/8 on loopback')
+class TestEndToEnd(unittest.TestCase):
+    """Run `~trigger.twister.execute` against a farm."""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        path = os.path.join(self.tmpdir, 'netdevices.json')
+        env = dict(os.environ, PYTHONPATH=REPO_DIR)
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'trigger.simulator', '-n', '5',
+             '-p', 'ios,ios,junos,netscreen,netscaler', '-u', 'admin',
+             '-P', 'admin', '--base-address', '127.2.0.1',
+             '--output-size', '100', '--error-command', 'show bogus',
+             '-o', path], stdout=subprocess.PIPE,
+            env=env)
+        for line in iter(self.proc.stdout.readline, ''):
+            if line.startswith('Listening'):
+                break
+        with open(path) as fh:
+            self.records = json.load(fh)
+
+    def tearDown(self):
+        os.kill(self.proc.pid, signal.SIGTERM)
+        self.proc.wait()
+        shutil.rmtree(self.tmpdir)
+
+    def execute(self, commands=None, **options):
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(
+            target=_execute,
+            args=(self.records, commands or {}, queue, options))
+        proc.start()
+        results, self.timings = queue.get(timeout=60)
+        proc.join()
+        return results
+
+    def test_execute(self):
+        """Test each personality end to end"""
+        rpc = Element('command')
+        rpc.text = 'show version'
+        results = self.execute({'junos-sim00003': [rpc],
+                                'ios-sim00002': ['show bogus']})
+        self.assertEqual(5, len(results))
+        for name in ('ios-sim00001', 'netscreen-sim00004',
+                     'netscaler-sim00005'):
+            self.assertEqual(2, len(results[name]), results[name])
+            self.assertTrue(results[name][0].startswith(
+                "Simulated output of 'show version'"), results[name])
+            self.assertTrue(results[name][1].startswith(
+                "Simulated output of 'show x'"), results[name])
+        self.assertTrue('CommandFailure' in results['ios-sim00002'])
+        self.assertTrue('show version' in results['junos-sim00003'][0])
+
+    def test_session_pool(self):
+        """Test that a pooled session is reused"""
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=_execute_pooled,
+                                       args=(self.records[0], queue))
+        proc.start()
+        results, timings, sessions = queue.get(timeout=60)
+        proc.join()
+        self.assertEqual(2, len(results), results)
+        self.assertEqual(1, len(results[0]), results)
+        self.assertEqual(2, len(results[1]), results)
+        self.assertTrue(results[1][1].startswith(
+            "Simulated output of 'show y'"), results)
+        self.assertEqual(['connect', 'kex', 'auth', 'startup', 'commands'],
+                         timings[0])
+        self.assertEqual(['commands'], timings[1])
+        self.assertEqual(1, sessions)
+
+    def test_exec_channels(self):
+        """Test running commands in parallel exec channels"""
+        commands = ['show %s' % c for c in 'abcde']
+        results = self.execute({'junos-sim00003': commands,
+                                'ios-sim00001': commands},
+                               exec_channels=3, force_cli=True)
+        for name in ('junos-sim00003', 'ios-sim00001'):
+            self.assertEqual(len(commands), len(results[name]))
+            for command, result in zip(commands, results[name]):
+                self.assertTrue(result.startswith(
+                    "Simulated output of '%s'" % command), result)
+
+        results = self.execute({'junos-sim00003': ['show a', 'show bogus']},
+                               exec_channels=3, force_cli=True)
+        self.assertTrue('CommandFailure' in results['junos-sim00003'],
+                        results['junos-sim00003'])
+
+    def test_pipeline(self):
+        """Test writing commands ahead of the results"""
+        commands = ['show %s' % c for c in 'abcdef']
+        results = self.execute({'ios-sim00001': commands,
+                                'ios-sim00002': ['show a', 'show bogus'],
+                                'junos-sim00003': commands,
+                                'netscreen-sim00004': commands},
+                               pipeline=4, force_cli=True)
+        for name in ('ios-sim00001', 'junos-sim00003', 'netscreen-sim00004'):
+            for command, result in zip(commands, results[name]):
+                self.assertTrue(result.startswith(
+                    "Simulated output of '%s'" % command), result)
+        self.assertEqual(6, len(results['ios-sim00001']))
+        self.assertEqual(6, len(results['junos-sim00003']))
+        self.assertEqual(6, len(results['netscreen-sim00004']))
+        self.assertEqual(2, len(results['netscaler-sim00005']))
+        self.assertTrue('CommandFailure' in results['ios-sim00002'],
+                        results['ios-sim00002'])
+
+    def test_timings(self):
+        """Test that each phase of each connection is timed"""
+        self.execute()
+        ssh = ['connect', 'kex', 'auth', 'startup', 'commands']
+        for name in ('ios-sim00001', 'junos-sim00003', 'netscreen-sim00004',
+                     'netscaler-sim00005'):
+            self.assertEqual(ssh, self.timings[name])
+
+
+if __name__ == '__main__':
+    unittest.main()
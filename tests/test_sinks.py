@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the functionality of `~trigger.sinks`.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from xml.etree.cElementTree import Element
+
+from twisted.python.failure import Failure
+
+from trigger.exceptions import CommandTimeout, ImproperlyConfigured
+from trigger.sinks import (JSONLinesSink, DirectorySink, SQLiteSink,
+                           CallbackSink, open_sink, to_jsonable)
+
+
+RESULTS = {'show version': 'Junos 1.0', 'show clock': '12:00'}
+
+
+class TestToJSONable(unittest.TestCase):
+    def test_errors(self):
+        """Test serializing exceptions and failures"""
+        expected = {'type': 'CommandTimeout', 'message': 'Timed out'}
+        self.assertEqual(expected, to_jsonable(CommandTimeout('Timed out')))
+        self.assertEqual(expected,
+                         to_jsonable(Failure(CommandTimeout('Timed out'))))
+
+    def test_element(self):
+        """Test serializing XML elements"""
+        element = Element('output')
+        element.text = 'bacon'
+        self.assertEqual('<output>bacon</output>', to_jsonable(element))
+
+
+class SinkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def write_all(self, sink):
+        sink.write_result('dev1', RESULTS)
+        sink.write_parsed('dev1', {'show version': {'version': '1.0'}})
+        sink.write_error('dev2', Failure(CommandTimeout('Timed out')))
+
+
+class TestJSONLinesSink(SinkTestCase):
+    def test_write(self):
+        """Test writing a line per device"""
+        path = self.path('results.jsonl')
+        with JSONLinesSink(path) as sink:
+            self.write_all(sink)
+            # Written as we go.
+            self.assertEqual(3, len(open(path).readlines()))
+
+        records = [json.loads(line) for line in open(path)]
+        self.assertEqual(['dev1', 'dev1', 'dev2'],
+                         [r['device'] for r in records])
+        self.assertEqual(['result', 'parsed', 'error'],
+                         [r['kind'] for r in records])
+        self.assertEqual(RESULTS, records[0]['data'])
+        self.assertEqual('CommandTimeout', records[2]['data']['type'])
+        self.assertTrue(records[0]['time'])
+
+
+class TestDirectorySink(SinkTestCase):
+    def test_write(self):
+        """Test writing a file per device"""
+        path = self.path('out')
+        sink = DirectorySink(path)
+        self.write_all(sink)
+        self.assertEqual(['dev1.parsed.json', 'dev1.txt', 'dev2.error'],
+                         sorted(os.listdir(path)))
+
+        text = open(os.path.join(path, 'dev1.txt')).read()
+        self.assertTrue('### show version\nJunos 1.0\n' in text)
+        self.assertEqual({'show version': {'version': '1.0'}},
+                         json.load(open(os.path.join(path,
+                                                     'dev1.parsed.json'))))
+        self.assertEqual('CommandTimeout: Timed out\n',
+                         open(os.path.join(path, 'dev2.error')).read())
+
+
+class TestSQLiteSink(SinkTestCase):
+    def test_write(self):
+        """Test writing a row per device"""
+        path = self.path('results.db')
+        sink = SQLiteSink(path)
+        self.write_all(sink)
+
+        # Committed as we go.
+        rows = sqlite3.connect(path).execute(
+            'select device, kind, data from results').fetchall()
+        sink.close()
+        self.assertEqual([('dev1', 'result'), ('dev1', 'parsed'),
+                          ('dev2', 'error')], [r[:2] for r in rows])
+        self.assertEqual(RESULTS, json.loads(rows[0][2]))
+
+
+class TestCallbackSink(SinkTestCase):
+    def test_write(self):
+        """Test calling functions per device"""
+        results, errors = [], []
+        sink = CallbackSink(lambda *args: results.append(args),
+                            on_error=lambda *args: errors.append(args))
+        self.write_all(sink)
+        self.assertEqual([('dev1', RESULTS)], results)
+        self.assertEqual(['dev2'], [e[0] for e in errors])
+
+
+class TestOpenSink(SinkTestCase):
+    def test_open(self):
+        """Test opening sinks by name"""
+        sink = open_sink('jsonl:' + self.path('results.jsonl'))
+        self.assertTrue(isinstance(sink, JSONLinesSink))
+        sink.close()
+        self.assertTrue(isinstance(open_sink('dir:' + self.path('out')),
+                                   DirectorySink))
+        sink = open_sink('sqlite:' + self.path('results.db'))
+        self.assertTrue(isinstance(sink, SQLiteSink))
+        sink.close()
+
+    def test_invalid(self):
+        """Test that invalid sinks are rejected"""
+        for spec in ('results.jsonl', 'bacon:results', 'jsonl:'):
+            self.assertRaises(ImproperlyConfigured, open_sink, spec)
+
+
+if __name__ == '__main__':
+    unittest.main()
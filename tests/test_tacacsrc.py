@@ -12,8 +12,11 @@ import os
 import unittest
 import tempfile
 from mock import patch
+from twisted.internet import task
 from trigger.conf import settings
-from trigger.tacacsrc import Tacacsrc, Credentials
+from trigger import tacacsrc
+from trigger.tacacsrc import (Tacacsrc, Credentials, CredentialCache,
+                              CREDENTIAL_CACHE)
 
 
 # Constants
@@ -121,5 +124,62 @@ class TacacsrcTest(unittest.TestCase):
         new_perms = self._get_perms(fname)
         self.assertNotEqual(new_perms, RIGHT_PERMS)
 
+class CredentialCacheTest(unittest.TestCase):
+    def setUp(self):
+        CREDENTIAL_CACHE.invalidate()
+        self.addCleanup(CREDENTIAL_CACHE.invalidate)
+
+    def test_ttl(self):
+        """Test that cached credentials expire."""
+        clock = task.Clock()
+        cache = CredentialCache(ttl=10, clock=clock.seconds)
+        cache.update({'aol': aol, 'empty': ()})
+        self.assertEqual(cache.get('aol'), aol)
+        self.assertEqual(cache.get('empty'), None)
+        clock.advance(10)
+        self.assertEqual(cache.get('aol'), None)
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self):
+        """Test that nothing is cached with a TTL of 0."""
+        cache = CredentialCache(ttl=0)
+        cache.update({'aol': aol})
+        self.assertEqual(cache.get('aol'), None)
+
+    def test_validate_credentials(self):
+        """Test that .tacacsrc is read once for many connections."""
+        with patch('trigger.tacacsrc.Tacacsrc',
+                   side_effect=Testing_Tacacsrc) as tacacsrc_class:
+            for _ in range(3):
+                self.assertEqual(tacacsrc.validate_credentials(), aol)
+            self.assertEqual(
+                tacacsrc.get_device_password('MEDIUMPWCREDS'), MEDIUMPWCREDS)
+        self.assertEqual(tacacsrc_class.call_count, 1)
+
+    def test_other_file_not_cached(self):
+        """Test that credentials from another .tacacsrc aren't cached."""
+        _, file_name = tempfile.mkstemp('_tacacsrc')
+        self.addCleanup(os.remove, file_name)
+        with open(settings.TACACSRC) as src, open(file_name, 'w') as dst:
+            dst.write(src.read())
+        t = Testing_Tacacsrc(tacacsrc_file=file_name)
+        self.assertEqual(tacacsrc.get_device_password('aol', t), aol)
+        self.assertEqual(len(CREDENTIAL_CACHE), 0)
+
+        t = Testing_Tacacsrc()
+        self.assertEqual(tacacsrc.get_device_password('aol', t), aol)
+        self.assertEqual(CREDENTIAL_CACHE.get('aol'), aol)
+
+    def test_write_invalidates(self):
+        """Test that writing .tacacsrc clears the cache."""
+        _, file_name = tempfile.mkstemp('_tacacsrc')
+        self.addCleanup(os.remove, file_name)
+        t = Testing_Tacacsrc()
+        CREDENTIAL_CACHE.update(t.creds)
+        self.assertEqual(CREDENTIAL_CACHE.get('aol'), aol)
+        t.file_name = file_name
+        t.write()
+        self.assertEqual(CREDENTIAL_CACHE.get('aol'), None)
+
 if __name__ == "__main__":
     unittest.main()
@@ -3,6 +3,8 @@ import os
 import mock
 from trigger.netdevices import NetDevices
 from trigger.cmds import Commando
+from trigger.pools import ParsePool
+from twisted.internet import defer
 from trigger.utils.templates import *
 from contextlib import contextmanager
 from StringIO import StringIO
@@ -100,6 +102,17 @@ def _reset_netdevices():
     NetDevices._Singleton = None
 
 
+class InlinePool(ParsePool):
+    """A parse pool that runs parsers as soon as they're submitted."""
+    def __init__(self):
+        super(InlinePool, self).__init__()
+        self.submitted = []
+
+    def submit(self, func, *args, **kwargs):
+        self.submitted.append(func)
+        return defer.maybeDeferred(func, *args, **kwargs)
+
+
 class CheckTemplates(unittest.TestCase):
     """Test structured CLI object data."""
 
@@ -145,6 +158,18 @@ class CheckTemplates(unittest.TestCase):
         self.assertTrue(isinstance(data[0], str))
         self.assertEquals(commando.parsed_results, {})
 
+    def testCommandoResultsPool(self):
+        """Test parsing templates in a parse pool."""
+        commands = ["show version"]
+        pool = InlinePool()
+        commando = Commando(devices=[self.device.nodeName], parse_pool=pool)
+        d = commando.parse_template(results=[big_cli_data], device=self.device, commands=commands)
+        data = []
+        d.addCallback(data.append)
+        self.assertEqual([[big_cli_data]], data)
+        self.assertEqual([parse_textfsm], pool.submitted)
+        self.assertEquals(commando.parsed_results.popitem()[1]["show version"]["hardware"], ['CSR1000V'])
+
     def tearDown(self):
         _reset_netdevices()
 
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the functionality of `~trigger.timing`.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from twisted.internet import task
+
+from trigger.timing import PhaseTimer, PhaseStats, percentile
+
+
+class TestPercentile(unittest.TestCase):
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = range(1, 101)
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(95, percentile(values, 95))
+        self.assertEqual(100, percentile(values, 100))
+        self.assertEqual(1, percentile(values, 0))
+        self.assertEqual(7, percentile([7], 99))
+        self.assertEqual(None, percentile([], 50))
+
+
+class TestPhaseTimer(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.timer = PhaseTimer('connect', clock=self.clock.seconds)
+
+    def test_phases(self):
+        """Test that starting a phase ends the one before it"""
+        self.clock.advance(1)
+        self.timer.start('kex')
+        self.clock.advance(2)
+        self.timer.start('auth')
+        self.assertEqual([('connect', 1), ('kex', 2)],
+                         self.timer.phases.items())
+        self.assertEqual('auth', self.timer.current)
+
+        self.clock.advance(0.5)
+        self.timer.finish()
+        self.assertEqual(['connect', 'kex', 'auth'], list(self.timer.phases))
+        self.assertEqual(3.5, self.timer.total)
+
+    def test_restart(self):
+        """Test that starting the current phase again doesn't split it"""
+        self.clock.advance(1)
+        self.timer.start('connect')
+        self.clock.advance(1)
+        self.timer.finish()
+        self.assertEqual({'connect': 2}, dict(self.timer.phases))
+
+    def test_finished(self):
+        """Test that nothing is recorded once finished"""
+        self.clock.advance(1)
+        self.timer.finish()
+        self.timer.start('kex')
+        self.clock.advance(1)
+        self.timer.finish()
+        self.assertEqual({'connect': 1}, dict(self.timer.phases))
+        self.assertEqual(None, self.timer.current)
+
+
+class TestPhaseStats(unittest.TestCase):
+    def setUp(self):
+        self.stats = PhaseStats()
+        for num in xrange(1, 101):
+            self.stats.add({'connect': num / 100.0, 'commands': num})
+
+    def test_summary(self):
+        """Test the summary of each phase"""
+        summary = self.stats.summary()
+        self.assertEqual(['connect', 'commands', 'total'], list(summary))
+        self.assertEqual(100, len(self.stats))
+        commands = summary['commands']
+        self.assertEqual(['count', 'min', 'mean', 'p50', 'p95', 'p99', 'max'],
+                         list(commands))
+        self.assertEqual(100, commands['count'])
+        self.assertEqual(50.5, commands['mean'])
+        self.assertEqual((50, 95, 99), (commands['p50'], commands['p95'],
+                                        commands['p99']))
+        self.assertAlmostEqual(101.0, summary['total']['max'])
+
+    def test_timer(self):
+        """Test adding a PhaseTimer, and skipping empty timings"""
+        clock = task.Clock()
+        timer = PhaseTimer('login', clock=clock.seconds)
+        clock.advance(3)
+        timer.finish()
+        stats = PhaseStats(percentiles=(90,))
+        stats.add(timer)
+        stats.add({})
+        self.assertEqual(1, len(stats))
+        self.assertEqual(3, stats.summary()['login']['p90'])
+
+    def test_merge(self):
+        """Test merging stats"""
+        other = PhaseStats()
+        other.add({'connect': 5, 'kex': 1})
+        self.stats.merge(other)
+        self.assertEqual(101, len(self.stats))
+        self.assertEqual(5, self.stats.summarize('connect')['max'])
+        self.assertEqual(1, self.stats.summarize('kex')['count'])
+
+    def test_dump(self):
+        """Test dumping the summary as JSON to a path"""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'timings.json')
+        self.stats.dump(path)
+        with open(path) as fh:
+            data = json.load(fh)
+        self.assertEqual(99, data['commands']['p99'])
+        self.assertEqual(set(['connect', 'commands', 'total']), set(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
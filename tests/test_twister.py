@@ -3,8 +3,14 @@
 import re
 
 import pytest
+from twisted.internet import defer, task
+from twisted.test import proto_helpers
 
 from trigger.conf import settings
+from trigger import twister
+from trigger.netdevices import NetDevice
+from trigger.twister import (IoslikeSendExpect, PromptBuffer, SessionPool,
+                             TriggerClientFactory)
 
 
 def test_ioslike_prompt_pattern_enabled():
@@ -36,3 +42,406 @@ def test_ioslike_prompt_pattern_nonenabled():
 
     for prompt in prompt_tests:
         assert re.search(pat, prompt) is not None
+
+
+def test_prompt_buffer_find_split_prompt():
+    """Test finding a prompt that arrives split across appends."""
+    buf = PromptBuffer(window=16)
+    prompt = re.compile(settings.IOSLIKE_PROMPT_PAT)
+    output = ''.join('line %d of output\r\n' % num for num in xrange(1000))
+
+    for num in xrange(0, len(output), 100):
+        buf.append(output[num:num + 100])
+        assert buf.find(prompt) is None
+
+    buf.append('foo-ba')
+    assert buf.find(prompt) is None
+    buf.append('r1#')
+    m = buf.find(prompt)
+    assert m is not None
+    assert m.group() == 'foo-bar1#'
+    assert m.start() == len(output)
+    assert buf.getvalue()[:m.start()] == output
+
+
+def test_prompt_buffer_find_long_match():
+    """Test that a match longer than the window is found in full."""
+    buf = PromptBuffer(window=4)
+    prompt = re.compile(r'\S+#$')
+    buf.append('junk\n')
+    assert buf.find(prompt) is None
+    buf.append('x' * 50)
+    assert buf.find(prompt) is None
+    buf.append('#')
+    m = buf.find(prompt)
+    assert (m.start(), m.end()) == (5, 56)
+
+
+def test_prompt_buffer_unanchored():
+    """Test that a pattern not ending with '$' is found mid-buffer."""
+    buf = PromptBuffer(window=4)
+    prompt = re.compile(r'\S+[#\$]|->\s?$')
+    buf.append('x' * 100)
+    assert buf.find(prompt) is None
+    buf.append(' foo# ' + 'y' * 100)
+    assert buf.find(prompt).group() == 'foo#'
+
+
+def test_prompt_buffer_anchor():
+    """Test that '^' only matches at the start of the whole buffer."""
+    buf = PromptBuffer(window=2)
+    prompt = re.compile(r'^foo#')
+    buf.append('xxxxxxxx')
+    assert buf.find(prompt) is None
+    buf.append('foo#')
+    assert buf.find(prompt) is None
+
+
+def test_prompt_buffer_tail_and_clear():
+    """Test the tail of the buffer and emptying it."""
+    buf = PromptBuffer()
+    for chunk in ('abc', 'def', 'gh'):
+        buf.append(chunk)
+    assert len(buf) == 8
+    assert buf.tail(4) == 'efgh'
+    assert buf.tail(100) == 'abcdefgh'
+    assert buf.tail(0) == ''
+    buf.clear()
+    assert len(buf) == 0
+    assert buf.getvalue() == ''
+
+
+def test_ioslike_send_expect_results(monkeypatch):
+    """Test that IoslikeSendExpect splits results on the prompt."""
+    clock = task.Clock()
+    monkeypatch.setattr(twister, 'reactor', clock)
+
+    class Device(object):
+        startup_commands = []
+        delimiter = '\n'
+
+    proto = IoslikeSendExpect(Device(), ['show version'])
+    proto.factory = TriggerClientFactory(defer.Deferred(),
+                                         creds=('bacon', 'eggs'))
+    transport = proto_helpers.StringTransport()
+    proto.write = transport.write
+    proto.makeConnection(transport)
+    proto.dataReceived('\r\nfoo-bar1#')
+    clock.advance(0)
+    assert transport.value() == 'show version\n'
+    assert proto.data == ''
+
+    output = 'Cisco IOS Software\r\n' * 1000
+    for chunk in ('show version\r\n', output, 'foo-b', 'ar1#'):
+        proto.dataReceived(chunk)
+    assert proto.results == [output]
+    proto.setTimeout(None)
+
+
+class FakeReactor(task.Clock):
+    """A clock that records connections instead of making them."""
+    def __init__(self):
+        task.Clock.__init__(self)
+        self.connections = []
+
+    def connectTCP(self, host, port, factory):
+        self.connections.append(factory)
+
+
+class FakeSession(object):
+    """
+    The connection, transport and channel of a pooled session, which answers
+    every command at once.
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self.buffer = PromptBuffer()
+        self.keepalives = []
+        factory.connection_success(self, self)
+
+    def sendGlobalRequest(self, request, data, wantReply=0):
+        d = defer.Deferred()
+        self.keepalives.append(d)
+        return d
+
+    def loseConnection(self):
+        self.factory.clientConnectionLost(None, None)
+
+    def _setup_commands(self):
+        pass
+
+    def _send_next(self):
+        for command in self.factory.commanditer:
+            self.factory.results.append('output of %s' % command)
+        self.factory.channel_finished(self)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(twister, 'reactor', FakeReactor())
+    return SessionPool(max_per_device=1, idle_timeout=300,
+                       health_check_interval=60, check_timeout=10)
+
+
+def make_juniper(name='juniper1'):
+    return NetDevice(data={'nodeName': name, 'manufacturer': 'JUNIPER',
+                           'deviceType': 'ROUTER'})
+
+def login(reactor):
+    """Log in the session that was connected last and run its commands."""
+    session = FakeSession(reactor.connections[-1])
+    session._send_next()
+    return session
+
+
+def test_session_pool_reuse(pool):
+    """Test that a session is reused by the next request."""
+    device = make_juniper()
+    results = []
+    d = pool.execute(device, ['show version'], creds=('bacon', 'eggs'),
+                     force_cli=True)
+    d.addCallback(results.append)
+    assert d.timings.current == 'connect'
+    session = login(twister.reactor)
+    assert results == [['output of show version']]
+    assert session.factory.state == twister.IDLE
+
+    d = pool.execute(device, ['show clock', 'show uptime'],
+                     creds=('bacon', 'eggs'), force_cli=True)
+    d.addCallback(results.append)
+    assert len(twister.reactor.connections) == 1
+    assert results[1] == ['output of show clock', 'output of show uptime']
+    assert d.timings.phases.keys() == ['commands']
+    assert len(pool) == 1
+
+
+def test_session_pool_lazy_commands(pool):
+    """Test that commands are only pulled once the session runs them."""
+    pulled = []
+    def commands():
+        for command in ('show version', 'show clock'):
+            pulled.append(command)
+            yield command
+    d = pool.execute(make_juniper(), commands(), creds=('bacon', 'eggs'),
+                     force_cli=True)
+    assert pulled == []
+    login(twister.reactor)
+    assert pulled == ['show version', 'show clock']
+    assert d.result == ['output of show version', 'output of show clock']
+
+
+def test_session_pool_max_per_device(pool):
+    """Test that requests wait for a free session."""
+    device = make_juniper()
+    first = pool.execute(device, ['show version'], creds=('bacon', 'eggs'),
+                         force_cli=True)
+    second = pool.execute(device, ['show clock'], creds=('bacon', 'eggs'),
+                          force_cli=True)
+    other = pool.execute(make_juniper('juniper2'), ['show clock'],
+                         creds=('bacon', 'eggs'), force_cli=True)
+    assert len(twister.reactor.connections) == 2
+    assert not second.called
+
+    login(twister.reactor)  # juniper2
+    assert other.called and not second.called
+    FakeSession(twister.reactor.connections[0])._send_next()
+    assert first.called and second.called
+    assert second.result == ['output of show clock']
+    assert len(twister.reactor.connections) == 2
+
+
+def test_session_pool_idle_timeout(pool):
+    """Test that idle sessions are closed."""
+    pool.execute(make_juniper(), ['show version'], creds=('bacon', 'eggs'),
+                 force_cli=True)
+    login(twister.reactor)
+    twister.reactor.advance(299)
+    assert len(pool) == 1
+    twister.reactor.advance(1)
+    assert len(pool) == 0
+
+
+def test_session_pool_health_check(pool):
+    """Test that idle sessions that don't answer keepalives are closed."""
+    pool.execute(make_juniper(), ['show version'], creds=('bacon', 'eggs'),
+                 force_cli=True)
+    session = login(twister.reactor)
+    twister.reactor.advance(60)
+    session.keepalives.pop().errback(Exception('request failed'))
+    twister.reactor.advance(60)
+    assert len(pool) == 1
+    assert len(session.keepalives) == 1
+    twister.reactor.advance(10)
+    assert len(pool) == 0
+
+
+def test_session_pool_unpooled(pool, monkeypatch):
+    """Test that devices that can't be pooled are executed as usual."""
+    calls = []
+    monkeypatch.setattr(twister, 'execute',
+                        lambda *args, **kwargs: calls.append(args))
+    device = make_juniper()
+    pool.execute(device, ['show version'], creds=('bacon', 'eggs'))
+    assert calls == [(device, ['show version'])]
+    assert len(pool) == 0
+
+
+class FakeExecConnection(twister.TriggerSSHMultiplexConnection):
+    """
+    The connection and transport of an exec session, which records the
+    channels it opens instead of opening them.
+    """
+    def __init__(self, factory):
+        super(FakeExecConnection, self).__init__(factory.commands)
+        self.transport = self
+        self.factory = factory
+        self.channel_class = twister.TriggerSSHCommandChannel
+        self.command_interval = 0
+        self.opened = []
+        self.lost = False
+
+    def openChannel(self, chan):
+        self.opened.append(chan)
+
+    def loseConnection(self):
+        self.lost = True
+
+
+def make_exec_factory(commands, max_channels):
+    return twister.TriggerSSHChannelFactory(
+        defer.Deferred(), commands, ('bacon', 'eggs'),
+        channel_class=twister.TriggerSSHCommandChannel,
+        connection_class=twister.TriggerSSHMultiplexConnection,
+        max_channels=max_channels)
+
+
+def test_exec_channels_in_order(monkeypatch):
+    """Test that parallel exec channels return results in command order."""
+    monkeypatch.setattr(twister, 'reactor', FakeReactor())
+    factory = make_exec_factory(['a', 'b', 'c', 'd'], max_channels=3)
+    conn = FakeExecConnection(factory)
+    conn._channelOpener()
+    assert [chan.command for chan in conn.opened] == ['a', 'b', 'c']
+
+    # The last command finishes first, and waits on the ones before it
+    conn.command_result(conn.opened[2], 'output of c')
+    conn.send_command()
+    assert [chan.command for chan in conn.opened] == ['a', 'b', 'c', 'd']
+    assert factory.results == []
+    conn.command_result(conn.opened[0], 'output of a')
+    assert factory.results == ['output of a']
+    conn.command_result(conn.opened[3], 'output of d')
+    conn.command_result(conn.opened[1], 'output of b')
+    assert factory.results == ['output of %s' % c for c in 'abcd']
+
+
+def test_exec_channels_serial(monkeypatch):
+    """Test that exec channels are opened one at a time by default."""
+    monkeypatch.setattr(twister, 'reactor', FakeReactor())
+    factory = make_exec_factory(['a', 'b'], max_channels=1)
+    conn = FakeExecConnection(factory)
+    conn._channelOpener()
+    assert [chan.command for chan in conn.opened] == ['a']
+    conn.command_result(conn.opened[0], 'output of a')
+    conn.send_command()
+    assert [chan.command for chan in conn.opened] == ['a', 'b']
+
+
+def test_exec_channels_stop_on_error(monkeypatch):
+    """Test that no more exec channels are opened once a command fails."""
+    monkeypatch.setattr(twister, 'reactor', FakeReactor())
+    factory = make_exec_factory(['a', 'b', 'c'], max_channels=2)
+    conn = FakeExecConnection(factory)
+    conn._channelOpener()
+    factory.err = RuntimeError('bacon')
+    conn.send_command()
+    assert len(conn.opened) == 2
+
+
+def test_exec_channels_unsupported(monkeypatch):
+    """Test that devices without exec channels ignore exec_channels."""
+    calls = []
+    def fake(name):
+        return lambda device, commands, **kwargs: calls.append(name)
+    for name in ('execute_exec_ssh', 'execute_ioslike', 'execute_junoscript',
+                 'execute_async_pty_ssh'):
+        monkeypatch.setattr(twister, name, fake(name))
+    monkeypatch.setattr(NetDevice, 'has_ssh', lambda self: True)
+
+    cisco = NetDevice(data={'nodeName': 'cisco1', 'manufacturer': 'CISCO',
+                            'deviceType': 'ROUTER'})
+    nexus = NetDevice(data={'nodeName': 'nexus1', 'manufacturer': 'CISCO',
+                            'deviceType': 'SWITCH', 'model': 'N7K-C7010'})
+    twister.execute(cisco, ['show version'], exec_channels=1)
+    twister.execute(nexus, ['show version'], exec_channels=4)
+    twister.execute(make_juniper(), ['show version'], exec_channels=4)
+    twister.execute(make_juniper(), ['show version'], exec_channels=4,
+                    force_cli=True)
+    assert calls == ['execute_ioslike', 'execute_exec_ssh',
+                     'execute_junoscript', 'execute_exec_ssh']
+
+
+def make_send_expect(monkeypatch, commands, pipeline):
+    """Return an IoslikeSendExpect that has logged in, and its transport."""
+    clock = task.Clock()
+    monkeypatch.setattr(twister, 'reactor', clock)
+
+    class Device(object):
+        startup_commands = []
+        delimiter = '\n'
+
+    proto = IoslikeSendExpect(Device(), commands, pipeline=pipeline)
+    proto.factory = TriggerClientFactory(defer.Deferred(),
+                                         creds=('bacon', 'eggs'))
+    transport = proto_helpers.StringTransport()
+    proto.write = transport.write
+    proto.loseConnection = transport.loseConnection
+    proto.makeConnection(transport)
+    proto.dataReceived('\r\nfoo-bar1#')
+    clock.advance(0)
+    proto.setTimeout(None)
+    return proto, transport
+
+
+def test_pipeline_results(monkeypatch):
+    """Test that pipelined output is split into a result per command."""
+    commands = ['show a', None, 'show b', 'show c']
+    proto, transport = make_send_expect(monkeypatch, commands, pipeline=2)
+    assert transport.value() == 'show a\nshow b\n'
+
+    # Split across the prompt and the echo of the next command
+    for chunk in ('show a\r\nA 1\r\nA 2 ', 'foo-bar1#', 'sho', 'w b\r\n',
+                  'B 1\r\n'):
+        proto.dataReceived(chunk)
+    assert proto.results == ['A 1\r\nA 2 ', None]
+    assert transport.value() == 'show a\nshow b\nshow c\n'
+
+    proto.dataReceived('foo-bar1#show c\r\nC 1\r\nfoo-bar1#')
+    assert proto.results == ['A 1\r\nA 2 ', None, 'B 1\r\n', 'C 1\r\n']
+    assert transport.disconnecting
+
+
+def test_pipeline_prompt_before_echo(monkeypatch):
+    """Test a prompt that arrives before the echo of the next command."""
+    proto, transport = make_send_expect(monkeypatch, ['show a', 'show b'],
+                                        pipeline=5)
+    assert transport.value() == 'show a\nshow b\n'
+    proto.dataReceived('show a\r\nA 1\r\nfoo-bar1#')
+    assert proto.results == ['A 1\r\n']
+    assert proto.data == ''
+    proto.dataReceived('show b\r\nB 1\r\nfoo-bar1#')
+    assert proto.results == ['A 1\r\n', 'B 1\r\n']
+    assert transport.disconnecting
+
+
+def test_pipeline_error(monkeypatch):
+    """Test that a failed pipelined command stops the rest."""
+    proto, transport = make_send_expect(
+        monkeypatch, ['show a', 'show bogus', 'show c'], pipeline=3)
+    proto.dataReceived('show a\r\nA 1\r\nfoo-bar1#show bogus\r\n'
+                       "% Invalid input detected at '^' marker.\r\n"
+                       'foo-bar1#show c\r\nC 1\r\nfoo-bar1#')
+    assert proto.results[0] == 'A 1\r\n'
+    assert len(proto.results) == 2
+    assert isinstance(proto.factory.err, twister.exceptions.CommandFailure)
+    assert transport.disconnecting
@@ -2,11 +2,12 @@
 Utils used for testing and especially mocking objects for testing.
 """
 
+import mock_mongo
 import mock_redis
 import os
 import sys
 
-__all__ = ['mock_redis']
+__all__ = ['mock_mongo', 'mock_redis']
 
 # misc
 from . import misc
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+A mock pymongo (MongoDB) client for use in offline testing.
+
+Only the small subset of the query language used by
+`~trigger.netdevices.loaders.mongodb.MongoDBLoader` is supported: equality,
+``$exists``, ``$and`` and ``$or``.
+"""
+__all__ = ('MongoClient', 'MockMongo')
+
+
+from collections import defaultdict
+import copy
+import itertools
+
+
+def _matches(doc, query):
+    """Return whether ``doc`` matches ``query``."""
+    for key, cond in query.iteritems():
+        if key == '$and':
+            if not all(_matches(doc, q) for q in cond):
+                return False
+        elif key == '$or':
+            if not any(_matches(doc, q) for q in cond):
+                return False
+        elif isinstance(cond, dict) and '$exists' in cond:
+            if (key in doc) != bool(cond['$exists']):
+                return False
+        elif doc.get(key) != cond:
+            return False
+    return True
+
+class MockCursor(object):
+    """Imitate a pymongo cursor."""
+    def __init__(self, docs, query, projection):
+        self.query = query
+        self.projection = projection
+        self.batch = None
+        self.fetched = 0
+        self._docs = iter(docs)
+
+    def batch_size(self, size):
+        """Emulate batch_size."""
+        self.batch = size
+        return self
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        """Return the next matching document."""
+        for doc in self._docs:
+            if not _matches(doc, self.query):
+                continue
+            self.fetched += 1
+            if self.projection:
+                doc = dict((k, v) for k, v in doc.iteritems()
+                           if k == '_id' or self.projection.get(k))
+            return copy.deepcopy(doc)
+        raise StopIteration
+
+class MockCollection(object):
+    """Imitate a pymongo collection."""
+    def __init__(self, docs):
+        self.docs = docs
+        self.cursors = []
+
+    def insert(self, doc):
+        """Emulate insert."""
+        doc = dict(doc)
+        doc.setdefault('_id', next(MockMongo.ids))
+        self.docs.append(doc)
+        return doc['_id']
+
+    def find(self, query=None, projection=None):
+        """Emulate find."""
+        cursor = MockCursor(self.docs, query or {}, projection)
+        self.cursors.append(cursor)
+        return cursor
+
+class MockMongo(object):
+    """The 'MongoDB' store, keyed by database and then collection name."""
+    store = defaultdict(lambda: defaultdict(list))
+    ids = itertools.count(1)
+    clients = []
+
+    @classmethod
+    def collection(cls, database, name):
+        """Return the `MockCollection` for ``database`` and ``name``."""
+        return MockCollection(cls.store[database][name])
+
+    @classmethod
+    def reset(cls):
+        """Forget all data and clients."""
+        cls.store.clear()
+        del cls.clients[:]
+
+class MockDatabase(object):
+    """Imitate a pymongo database."""
+    def __init__(self, name):
+        self.name = name
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = MockMongo.collection(self.name, name)
+        return self.collections[name]
+
+class MongoClient(object):
+    """Imitate a pymongo MongoClient."""
+    def __init__(self, host=None, port=None):
+        self.host = host
+        self.port = port
+        self.closed = False
+        self.databases = {}
+        MockMongo.clients.append(self)
+
+    def __getitem__(self, name):
+        if name not in self.databases:
+            self.databases[name] = MockDatabase(name)
+        return self.databases[name]
+
+    def close(self):
+        """Emulate close."""
+        self.closed = True
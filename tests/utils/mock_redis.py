@@ -42,24 +42,33 @@ class MockRedisPipeline(object):
     def __init__(self, redis):
         """Initialize the object."""
         self.redis = redis
+        self.results = []
 
     def execute(self):
         """
         Emulate the execute method. All piped commands are executed immediately
-        in this mock, so this is a no-op.
+        in this mock, so this just returns their results.
         """
-        pass
+        results, self.results = self.results, []
+        return results
 
     def delete(self, key):
         """Emulate a pipelined delete."""
 
         # Call the MockRedis' delete method
-        self.redis.delete(key)
+        self.results.append(self.redis.delete(key))
         return self
 
     def srem(self, key, member):
         """Emulate a pipelined simple srem."""
         self.redis.redis[key].discard(member)
+        self.results.append(None)
+        return self
+
+    def smembers(self, key):
+        """Emulate a pipelined smembers."""
+        # Like Redis, a missing key is an empty set (and isn't created).
+        self.results.append(set(MockRedis.redis.get(key, set())))
         return self
 
 class MockRedis(object):
@@ -128,7 +137,7 @@ class MockRedis(object):
         """Emulate lock."""
         return MockRedisLock(self, key)
 
-    def pipeline(self):
+    def pipeline(self, transaction=True):  # pylint: disable=W0613
         """Emulate a redis-python pipeline."""
         return MockRedisPipeline(self)
 
@@ -27,6 +27,7 @@ __email__ = 'jathan@gmail.com'
 __copyright__ = 'Copyright 2010-2012, AOL Inc.; 2013 Salesforce.com'
 
 from collections import defaultdict
+import itertools
 import redis
 import sys
 
@@ -39,6 +40,9 @@ from trigger.conf import settings
 ACLSDB_BACKUP = './acls.csv'
 DEBUG = False
 
+# Number of devices to fetch per pipelined round trip in get_acl_dicts()
+BULK_BATCH_SIZE = 1000
+
 # The redis instance. It doesn't care if it can't reach Redis until you actually
 # try to talk to Redis.
 r = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT,
@@ -114,15 +118,55 @@ class AclsDB(object):
         'explicit': set(['test-bluej', 'testgreenj', 'testops_blockmj']),
         'implicit': set(['115j', 'protectRE', 'protectRE.policer'])}
         """
-        acls = {}
-
         # Explicit (we want to make sure the key exists before we try to assign
         # a value)
         expl_key = 'acls:explicit:%s' % device.nodeName
         if self.redis.exists(expl_key):
-            acls['explicit'] = self.redis.smembers(expl_key) or set()
+            explicit = self.redis.smembers(expl_key) or set()
         else:
-            acls['explicit'] = set()
+            explicit = set()
+
+        return self._make_acl_dict(device, explicit)
+
+    def get_acl_dicts(self, devices, batch_size=BULK_BATCH_SIZE):
+        """
+        Returns a dict of acl mappings (as returned by `get_acl_dict`) keyed
+        by nodeName for each of @devices, which are expected to be NetDevice
+        objects.
+
+        The explicit acls are fetched using pipelined batches of
+        @batch_size devices, so that many devices only take a few round trips
+        to Redis.
+
+        >>> acl_dicts = a.get_acl_dicts(nd.all())
+        >>> acl_dicts['test1-abc.net.aol.com']['explicit']
+        set(['abc123'])
+        """
+        acl_dicts = {}
+        devices = iter(devices)
+        while True:
+            batch = list(itertools.islice(devices, batch_size))
+            if not batch:
+                break
+
+            # SMEMBERS returns an empty set for a missing key, so there's no
+            # need to check that each key exists first.
+            pipe = self.redis.pipeline(transaction=False)
+            for device in batch:
+                pipe.smembers('acls:explicit:%s' % device.nodeName)
+
+            for device, explicit in itertools.izip(batch, pipe.execute()):
+                acl_dicts[device.nodeName] = self._make_acl_dict(
+                    device, explicit or set())
+
+        return acl_dicts
+
+    def _make_acl_dict(self, device, explicit):
+        """
+        Returns the acl mappings for @device given its set of @explicit acls.
+        """
+        acls = {}
+        acls['explicit'] = explicit
 
         # Implicit (automatically-assigned). We're passing the explicit_acls to
         # autoacl so that we can use them logically for auto assignments.
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+
+"""
+A credential agent that keeps the contents of ``.tacacsrc`` in memory, so that
+short-lived Trigger processes don't each have to decrypt it.
+
+Decrypting ``.tacacsrc.gpg`` means running ``gpg2``, which takes a while and
+may prompt for a passphrase. Much like ``ssh-agent``, the agent decrypts it
+once and hands the `~trigger.tacacsrc.Credentials` to every process that asks
+over a UNIX socket::
+
+    $ eval $(tacacsrc_agent)
+    Agent pid 12345
+    $ gong router1   # No gpg2 here
+
+`~trigger.tacacsrc.Tacacsrc` asks the agent at :setting:`TACACSRC_AGENT_SOCKET`
+first, if it's running, and only reads the file if the agent can't answer.
+When a process does read the file, or writes it after updating a password, it
+gives the credentials to the agent for the next process. Credentials are kept
+by the path of the file they came from, so a process using another
+``.tacacsrc`` (see :setting:`TACACSRC`) never gets them.
+
+Only the user running the agent can use it: the socket is created with mode
+``0600`` in a directory with mode ``0700``, the agent checks the user id of
+every process that connects where the operating system allows it, and clients
+refuse to use a socket owned by anyone else.
+
+The agent answers one JSON object per line, for requests like
+``{"command": "get", "file": "/home/jschmoe/.tacacsrc"}``. See `~trigger.agent.AgentClient` for the commands.
+"""
+
+
+# Imports
+import errno
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import time
+
+from twisted.internet import protocol
+from twisted.protocols import basic
+from twisted.python import log
+
+from trigger.conf import settings
+from trigger.exceptions import AgentError
+
+
+# Exports
+__all__ = ('AgentClient', 'AgentFactory', 'AgentProtocol', 'get_agent',
+           'listen')
+
+
+# Constants
+# Seconds to wait for the agent to answer before giving up on it
+DEFAULT_TIMEOUT = 1.0
+
+# Longest request or response line, which is plenty for a .tacacsrc
+MAX_LENGTH = 1024 * 1024
+
+# Python 2 doesn't define SO_PEERCRED, but it's always 17 on Linux
+SO_PEERCRED = getattr(socket, 'SO_PEERCRED',
+                      17 if sys.platform.startswith('linux') else None)
+
+
+# Functions
+def _peer_uid(sock):
+    """
+    Return the user id of the process at the other end of the UNIX socket
+    ``sock``, or ``None`` if the operating system won't say.
+    """
+    if sock is None or SO_PEERCRED is None:
+        return None
+    try:
+        creds = sock.getsockopt(socket.SOL_SOCKET, SO_PEERCRED,
+                                struct.calcsize('3i'))
+    except socket.error:
+        return None
+    pid, uid, gid = struct.unpack('3i', creds)
+    return uid
+
+def _check_socket(path):
+    """
+    Raise `~trigger.exceptions.AgentError` unless ``path`` is a socket that
+    only the current user can use.
+    """
+    try:
+        st = os.stat(path)
+    except OSError as err:
+        raise AgentError('No agent at %s: %s' % (path, err.strerror))
+    if not stat.S_ISSOCK(st.st_mode):
+        raise AgentError('%s is not a socket' % path)
+    if st.st_uid != os.getuid():
+        raise AgentError('%s is owned by another user' % path)
+    if st.st_mode & 0077:
+        raise AgentError('%s can be used by other users' % path)
+
+def _encode_creds(creds):
+    """
+    Turn a dict of realms to Credentials into JSON-friendly lists. Passwords
+    may be any bytes, so they're decoded as Latin-1, which maps every byte to
+    a character and back.
+    """
+    return dict((realm.decode('latin-1'),
+                 [value.decode('latin-1') for value in realm_creds])
+                for realm, realm_creds in creds.iteritems() if realm_creds)
+
+def _decode_creds(data):
+    """Turn the lists sent by the agent back into Credentials."""
+    from trigger.tacacsrc import Credentials
+    return dict((realm.encode('latin-1'),
+                 Credentials(*[value.encode('latin-1') for value in values]))
+                for realm, values in data.iteritems())
+
+def _resolve(file_name=None):
+    """Return the real path of ``file_name``, or of :setting:`TACACSRC`."""
+    if file_name is None:
+        file_name = settings.TACACSRC
+    return os.path.realpath(os.path.expanduser(file_name))
+
+def get_agent(path=None):
+    """
+    Return an `~trigger.agent.AgentClient` for the agent at ``path``, or at
+    :setting:`TACACSRC_AGENT_SOCKET`, or ``None`` if there's no usable agent
+    there.
+    """
+    if path is None:
+        path = settings.TACACSRC_AGENT_SOCKET
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        _check_socket(path)
+    except AgentError as err:
+        log.msg('Not using credential agent: %s' % err)
+        return None
+    return AgentClient(path)
+
+def listen(path=None, creds=None, lifetime=None, reactor=None,
+           file_name=None):
+    """
+    Start an agent listening at ``path`` and return the listening port.
+
+    :param path:
+        (Optional) Where to create the socket. Defaults to
+        :setting:`TACACSRC_AGENT_SOCKET`. Its directory is created with mode
+        ``0700`` if need be.
+
+    :param creds:
+        (Optional) A dict mapping realms to `~trigger.tacacsrc.Credentials`
+        to start with.
+
+    :param lifetime:
+        (Optional) Forget credentials this many seconds after they're given
+        to the agent.
+
+    :param reactor:
+        (Optional) The reactor to listen with.
+
+    :param file_name:
+        (Optional) The file ``creds`` came from. Defaults to
+        :setting:`TACACSRC`.
+    """
+    if reactor is None:
+        from twisted.internet import reactor
+    if path is None:
+        path = settings.TACACSRC_AGENT_SOCKET
+    if not path:
+        raise AgentError('TACACSRC_AGENT_SOCKET is not set')
+
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0700)
+
+    # Remove a socket left behind by an agent that's gone, but not one that's
+    # still answering.
+    if os.path.exists(path):
+        try:
+            AgentClient(path).request('ping')
+        except AgentError:
+            os.unlink(path)
+        else:
+            raise AgentError('An agent is already running at %s' % path)
+
+    factory = AgentFactory(creds, lifetime=lifetime,
+                           file_name=_resolve(file_name))
+    port = reactor.listenUNIX(path, factory, mode=0600)
+    factory.port = port
+    return port
+
+
+# Classes
+class AgentProtocol(basic.LineReceiver):
+    """Answer the requests of one client of the agent."""
+    delimiter = '\n'
+    MAX_LENGTH = MAX_LENGTH
+
+    def connectionMade(self):
+        uid = _peer_uid(getattr(self.transport, 'socket', None))
+        if uid is not None and uid != os.getuid():
+            log.msg('Refusing credential agent client with uid %s' % uid)
+            self.transport.loseConnection()
+
+    def lineReceived(self, line):
+        try:
+            request = json.loads(line)
+            command = request['command']
+            handler = getattr(self.factory, 'do_' + command)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            response = {'ok': False, 'error': 'Bad request'}
+        else:
+            response = handler(request)
+        self.sendLine(json.dumps(response))
+        if self.factory.stopping:
+            self.transport.loseConnection()
+
+    def lineLengthExceeded(self, line):
+        self.transport.loseConnection()
+
+    def connectionLost(self, reason):
+        # Stop once the answer to "stop" has been sent
+        if self.factory.stopping:
+            from twisted.internet import reactor
+            if reactor.running:
+                reactor.stop()
+
+class AgentFactory(protocol.ServerFactory):
+    """
+    Hold credentials for the clients of the agent, by the file they came
+    from.
+
+    :param creds:
+        (Optional) A dict mapping realms to `~trigger.tacacsrc.Credentials`.
+
+    :param lifetime:
+        (Optional) Forget credentials this many seconds after they're given.
+
+    :param clock:
+        (Optional) A function returning the current time in seconds.
+
+    :param file_name:
+        (Optional) The file ``creds`` came from.
+    """
+    protocol = AgentProtocol
+    port = None
+    stopping = False
+
+    def __init__(self, creds=None, lifetime=None, clock=time.time,
+                 file_name=None):
+        self.lifetime = lifetime
+        self.clock = clock
+        self.creds = {}
+        self.expires = {}
+        if creds:
+            self.set(creds, file_name)
+
+    def set(self, creds, file_name=None):
+        """Replace the credentials held by the agent for ``file_name``."""
+        self.creds[file_name] = _encode_creds(creds)
+        if self.lifetime:
+            self.expires[file_name] = self.clock() + self.lifetime
+
+    def get(self, file_name=None):
+        """Return the credentials held for ``file_name``, as sent to clients."""
+        expires = self.expires.get(file_name)
+        if expires is not None and self.clock() >= expires:
+            del self.creds[file_name]
+            del self.expires[file_name]
+        return self.creds.get(file_name, {})
+
+    def do_ping(self, request):
+        return {'ok': True}
+
+    def do_get(self, request):
+        return {'ok': True, 'creds': self.get(request.get('file'))}
+
+    def do_set(self, request):
+        try:
+            self.set(_decode_creds(request['creds']), request.get('file'))
+        except (KeyError, TypeError, AttributeError):
+            return {'ok': False, 'error': 'Bad credentials'}
+        return {'ok': True}
+
+    def do_clear(self, request):
+        self.creds = {}
+        self.expires = {}
+        return {'ok': True}
+
+    def do_stop(self, request):
+        self.stopping = True
+        self.creds = {}
+        if self.port is not None:
+            self.port.stopListening()
+        return {'ok': True}
+
+class AgentClient(object):
+    """
+    Talk to the agent at ``path``. Every request opens a new connection, and
+    raises `~trigger.exceptions.AgentError` if the agent can't be reached or
+    fails it.
+
+    The commands are:
+
+    ``get``
+        Return the credentials held by the agent for ``file``, as ``creds``.
+    ``set``
+        Replace the credentials held by the agent for ``file`` with ``creds``.
+    ``clear``
+        Forget all credentials.
+    ``stop``
+        Stop the agent.
+    ``ping``
+        Do nothing.
+
+    :param path:
+        The path of the agent's socket.
+
+    :param timeout:
+        (Optional) Seconds to wait for the agent to answer.
+    """
+    def __init__(self, path, timeout=DEFAULT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, self.path)
+
+    def request(self, command, **kwargs):
+        """Send ``command`` to the agent and return its response."""
+        kwargs['command'] = command
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+            sock.sendall(json.dumps(kwargs) + '\n')
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if chunk.endswith('\n'):
+                    break
+        except socket.error as err:
+            raise AgentError('Agent at %s failed: %s' % (self.path, err))
+        finally:
+            sock.close()
+
+        try:
+            response = json.loads(''.join(chunks))
+        except ValueError:
+            raise AgentError('Agent at %s sent a bad response' % self.path)
+        if not response.get('ok'):
+            raise AgentError('Agent at %s failed %r: %s' % (
+                self.path, command, response.get('error')))
+        return response
+
+    def get_credentials(self, file_name=None):
+        """
+        Return a dict mapping realms to `~trigger.tacacsrc.Credentials` held
+        by the agent for the ``.tacacsrc`` at ``file_name``, or at
+        :setting:`TACACSRC`, which is empty if it has none.
+        """
+        response = self.request('get', file=_resolve(file_name))
+        return _decode_creds(response.get('creds', {}))
+
+    def set_credentials(self, creds, file_name=None):
+        """
+        Give the agent a dict mapping realms to credentials read from the
+        ``.tacacsrc`` at ``file_name``, or at :setting:`TACACSRC`.
+        """
+        self.request('set', creds=_encode_creds(creds),
+                     file=_resolve(file_name))
+
+    def clear(self):
+        """Make the agent forget all credentials."""
+        self.request('clear')
+
+    def stop(self):
+        """Stop the agent."""
+        self.request('stop')
+
+
+def main(argv=None):
+    """Run an agent, in the background unless told otherwise."""
+    import optparse
+    parser = optparse.OptionParser(
+        usage='%prog [options]',
+        description='Keep .tacacsrc credentials in memory for other Trigger '
+                    'processes. Prints shell commands to set '
+                    'TRIGGER_AGENT_SOCK for them.')
+    parser.add_option('-a', '--socket', metavar='PATH',
+                      default=settings.TACACSRC_AGENT_SOCKET,
+                      help='Where to listen (default: %default)')
+    parser.add_option('-t', '--lifetime', type='int', metavar='SECONDS',
+                      help='Forget credentials after this many seconds')
+    parser.add_option('-n', '--no-load', action='store_false', dest='load',
+                      default=True,
+                      help="Don't read .tacacsrc now; wait for a client to "
+                           "hand over credentials")
+    parser.add_option('-f', '--foreground', action='store_true',
+                      help="Don't go into the background")
+    parser.add_option('-k', '--kill', action='store_true',
+                      help='Stop the agent listening at --socket')
+    opts, args = parser.parse_args(argv)
+
+    if opts.kill:
+        try:
+            AgentClient(opts.socket).stop()
+        except AgentError as err:
+            parser.error(err)
+        print 'unset TRIGGER_AGENT_SOCK;'
+        return 0
+
+    creds = file_name = None
+    if opts.load:
+        from trigger.tacacsrc import Tacacsrc
+        tcrc = Tacacsrc(use_agent=False)
+        creds, file_name = tcrc.creds, tcrc.file_name
+
+    from twisted.internet import reactor
+    try:
+        port = listen(opts.socket, creds, opts.lifetime, reactor, file_name)
+    except (AgentError, OSError) as err:
+        parser.error(err)
+
+    if not opts.foreground:
+        pid = os.fork()
+        if pid:
+            print 'TRIGGER_AGENT_SOCK=%s; export TRIGGER_AGENT_SOCK;' % (
+                opts.socket)
+            print 'echo Agent pid %d;' % pid
+            sys.stdout.flush()
+            os._exit(0)
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+
+    try:
+        reactor.run()
+    finally:
+        try:
+            os.unlink(opts.socket)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
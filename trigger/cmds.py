@@ -19,6 +19,7 @@ __version__ = '2.7'
 # Imports
 import collections
 import datetime
+import functools
 import itertools
 import os
 from IPy import IP
@@ -28,9 +29,14 @@ from twisted.python import log
 from twisted.internet import defer, task
 
 from trigger.netdevices import NetDevices
-from trigger.utils.templates import load_cmd_template, get_textfsm_object, get_template_path
+from trigger.pools import get_parse_pool
+from trigger.scheduler import GroupScheduler, AdaptiveConcurrency
+from trigger.sinks import open_sink
+from trigger.timing import PhaseStats
+from trigger.utils.templates import get_template_path, parse_textfsm
 from trigger.conf import settings
-from trigger import exceptions
+from trigger import exceptions, metrics
+from trigger.logger import get_logger
 
 
 # Exports
@@ -40,6 +46,8 @@ __all__ = ('Commando', 'ReactorlessCommando', 'NetACLInfo')
 # Default timeout in seconds for commands to return a result
 DEFAULT_TIMEOUT = 30
 
+logger = get_logger(__name__)
+
 
 # Classes
 class Commando(object):
@@ -84,6 +92,43 @@ class Commando(object):
     :param max_conns:
         (Optional) The maximum number of simultaneous connections to keep open.
 
+    :param concurrency_limits:
+        (Optional) Limits on simultaneous connections per group of devices,
+        such as ``['site<=5', 'realm<=50']``, enforced in addition to
+        ``max_conns``. See `~trigger.scheduler` for the available buckets.
+        If set, ``jobs`` is a `~trigger.scheduler.GroupScheduler` instead of
+        a list.
+
+    :param adaptive:
+        (Optional) Adapt the number of simultaneous connections, up to
+        ``max_conns``, to how quickly devices can be logged in to, backing off
+        when logins or commands time out or connections fail. Set to ``True``,
+        or pass a `~trigger.scheduler.AdaptiveConcurrency` object to tune it.
+        The current limit is available as ``conn_limit``.
+
+    :param sink:
+        (Optional) A `~trigger.sinks.ResultSink` to write results, parsed
+        results and errors to as each device is done, or a string to pass to
+        `~trigger.sinks.open_sink`, in which case the sink is closed once all
+        devices are done.
+
+    :param keep_results:
+        (Optional) Whether to keep results, parsed results and errors in
+        ``results``, ``parsed_results`` and ``errors``. Set to ``False`` with a
+        ``sink`` to keep nothing in memory. Defaults to ``True``.
+
+    :param parse_pool:
+        (Optional) A `~trigger.pools.ParsePool` to parse results in instead of
+        on the reactor thread, or a string to pass to
+        `~trigger.pools.get_parse_pool` such as ``'thread:4'``, in which case
+        the pool is stopped once all devices are done. No more devices are
+        connected to while the pool is backed up.
+
+    :param session_pool:
+        (Optional) A `~trigger.twister.SessionPool` to run commands over
+        instead of connecting to each device anew. Sessions are left open in
+        the pool once the devices are done, for the next ``Commando``.
+
     :param verbose:
         (Optional) Whether or not to display informational messages to the
         console.
@@ -115,6 +160,20 @@ class Commando(object):
 
     :param command_interval:
          (Optional) Amount of time in seconds to wait between sending commands.
+
+    :param exec_channels:
+         (Optional) Run each command in its own SSH ``exec`` channel, with up
+         to this many at once per device. See `~trigger.twister.execute`.
+
+    :param pipeline:
+         (Optional) Write up to this many commands ahead to each device instead
+         of waiting for the prompt after each one. See
+         `~trigger.twister.execute`.
+
+    How long each phase of each connection took is collected in
+    ``timing_stats`` (see `~trigger.timing`), and kept per device in
+    ``timings`` if ``keep_results`` is set. Use ``dump_timings()`` to write
+    the percentiles of each phase to a JSON file at the end of a run.
     """
     # Defaults to all supported vendors
     vendors = settings.SUPPORTED_VENDORS
@@ -140,11 +199,37 @@ class Commando(object):
     # How errors are stored (defaults to {})
     errors = None
 
+    # How the timings of each device are stored (defaults to {})
+    timings = None
+
+    # Limits on simultaneous connections per group of devices (defaults to
+    # none)
+    concurrency_limits = None
+
+    # The job queue used to select devices, which is created using
+    # ``concurrency_limits`` (``jobs`` is a plain list if there are none)
+    scheduler_class = GroupScheduler
+
+    # Where results are written as each device is done (defaults to none)
+    sink = None
+
+    # Whether results are kept in memory (defaults to True)
+    keep_results = True
+
+    # Where results are parsed (defaults to the reactor thread)
+    parse_pool = None
+
+    # Where sessions to devices are kept open (defaults to none)
+    session_pool = None
+
     def __init__(self, devices=None, commands=None, creds=None,
                  incremental=None, max_conns=10, verbose=False,
                  timeout=DEFAULT_TIMEOUT, production_only=True,
                  allow_fallback=True, with_errors=True, force_cli=False,
-                 with_acls=False, command_interval=0):
+                 with_acls=False, command_interval=0,
+                 concurrency_limits=None, adaptive=False, sink=None,
+                 keep_results=None, parse_pool=None, session_pool=None,
+                 exec_channels=None, pipeline=None):
         if devices is None:
             raise exceptions.ImproperlyConfigured('You must specify some `devices` to interact with!')
 
@@ -160,13 +245,30 @@ class Commando(object):
         self.with_errors = with_errors
         self.force_cli = force_cli
         self.command_interval = command_interval
+        self.exec_channels = exec_channels
+        self.pipeline = pipeline
         self.curr_conns = 0
-        self.jobs = []
+        self._queued = self._running = 0
+        self.concurrency_limits = (concurrency_limits or
+                                   self.concurrency_limits)
+        self.jobs = self._setup_scheduler()
+        if adaptive is True:
+            adaptive = AdaptiveConcurrency(maximum=max_conns)
+        self.adaptive = adaptive or None
+        self._setup_sink(sink, keep_results)
+        self._setup_parse_pool(parse_pool)
+        self.session_pool = session_pool or self.session_pool
 
         # Always fallback to {} for these
         self.errors = self.errors if self.errors is not None else {}
         self.results = self.results if self.results is not None else {}
         self.parsed_results = self.parsed_results if self.parsed_results is not None else collections.defaultdict(dict)
+        self.timings = self.timings if self.timings is not None else {}
+        self.timing_stats = PhaseStats()
+
+        # Parsing in threads can't swap out parsed_results as it goes.
+        if self.parse_pool is not None:
+            self.parsed_results = dict(self.parsed_results)
 
         #self.deferrals = []
         self.supported_platforms = self._validate_platforms()
@@ -205,20 +307,220 @@ class Commando(object):
         self.curr_conns += 1
         return True
 
+    def _setup_scheduler(self):
+        """
+        Create the job queue, which hands out devices according to
+        ``concurrency_limits``. If there are no limits and ``scheduler_class``
+        hasn't been changed, the job queue is a list.
+        """
+        if (not self.concurrency_limits and
+                self.scheduler_class is GroupScheduler):
+            return []
+
+        keys = {}
+        # Everything will log in to the realm we were given, if any.
+        if self.creds is not None and len(self.creds) > 2:
+            realm = self.creds[2]
+            keys['realm'] = lambda device: realm
+        return self.scheduler_class(self.concurrency_limits, keys=keys)
+
+    def _release_device(self, data, device):
+        """
+        Called by _add_worker() as both callback/errback to let the job queue
+        know that ``device`` is done.
+        """
+        if isinstance(self.jobs, GroupScheduler):
+            self.jobs.release(device)
+        return data
+
+    def _setup_sink(self, sink, keep_results):
+        """Open the result sink, if any."""
+        sink = sink or self.sink
+        self._owns_sink = isinstance(sink, basestring)
+        if self._owns_sink:
+            sink = open_sink(sink)
+        self.sink = sink
+        if keep_results is not None:
+            self.keep_results = keep_results
+
+    def _close_sink(self):
+        """Close the result sink if we opened it."""
+        if self._owns_sink:
+            self.sink.close()
+            self._owns_sink = False
+
+    def _setup_parse_pool(self, parse_pool):
+        """Create the parse pool, if any."""
+        parse_pool = parse_pool or self.parse_pool
+        self._owns_parse_pool = isinstance(parse_pool, basestring)
+        if self._owns_parse_pool:
+            parse_pool = get_parse_pool(parse_pool)
+        self.parse_pool = parse_pool
+        self.parsing = 0
+
+    def _close_parse_pool(self):
+        """Stop the parse pool if we created it."""
+        if self._owns_parse_pool:
+            self.parse_pool.close()
+            self._owns_parse_pool = False
+
+    @property
+    def parse_backlogged(self):
+        """
+        Whether as many devices are being parsed or waiting to be parsed as
+        ``parse_pool`` allows, in which case no more devices are connected to.
+        """
+        return (self.parse_pool is not None and
+                self.parsing >= self.parse_pool.limit)
+
+    def _parse_in_pool(self, results, device, commands):
+        """
+        Called by _add_worker() as a callback to parse ``results`` using
+        ``parse_pool``, once the connection to ``device`` is done with.
+        """
+        self.parsing += 1
+        if self.parse_pool.run_callbacks:
+            d = self.parse_pool.submit(self._parse_results, results, device,
+                                       commands)
+        else:
+            d = defer.maybeDeferred(self._parse_results, results, device,
+                                    commands)
+        d.addBoth(self._parse_done)
+
+        # Our connection is free for another device.
+        self._add_worker()
+        return d
+
+    def _parse_results(self, results, device, commands):
+        """Run parse_template() and then parse() on ``results``."""
+        d = defer.maybeDeferred(self.parse_template, results, device, commands)
+        d.addCallback(self.parse, device, commands)
+        return d
+
+    def _parse_done(self, data):
+        """Stop counting a device as being parsed."""
+        self.parsing -= 1
+        return data
+
+    def run_parser(self, func, *args, **kwargs):
+        """
+        Call ``func`` with the given arguments to parse results, in
+        ``parse_pool`` if there is one, and return a ``Deferred`` that fires
+        with what it returns.
+
+        Use this from ``from_{vendor}`` methods for CPU-heavy parsing so that
+        it can run in a `~trigger.pools.ProcessParsePool`. ``func`` must be a
+        module-level function for that to work.
+        """
+        if self.parse_pool is not None and not self.parse_pool.in_worker:
+            return self.parse_pool.submit(func, *args, **kwargs)
+        return defer.maybeDeferred(func, *args, **kwargs)
+
+    @property
+    def conn_limit(self):
+        """
+        The number of simultaneous connections allowed right now, which
+        changes as the run goes on when ``adaptive`` is set.
+        """
+        if self.adaptive is not None:
+            return min(self.adaptive.limit, self.max_conns)
+        return self.max_conns
+
+    def _track_connection(self, token, incremental=None):
+        """
+        Return an ``incremental`` callback that reports to ``self.adaptive``
+        once the device has been logged in to, and then calls ``incremental``.
+        """
+        def connected(results):
+            self._connected(token)
+            if incremental is not None:
+                return incremental(results)
+        return connected
+
+    def _connected(self, token):
+        """Report a login and add workers if the limit went up."""
+        limit = self.conn_limit
+        self.adaptive.connected(token)
+        if self.conn_limit > limit:
+            self._add_worker()
+
+    def _connection_done(self, results, token):
+        """
+        Called by _add_worker() as a callback in case the device finished
+        without calling ``incremental``.
+        """
+        self._connected(token)
+        return results
+
+    def _connection_failed(self, failure, token):
+        """
+        Called by _add_worker() as an errback to let ``self.adaptive`` know
+        that the device failed.
+        """
+        self.adaptive.failed(token, failure)
+        return failure
+
+    def _store_timings(self, data, device, timings):
+        """
+        Called by _add_worker() as both callback/errback to store how long
+        each phase of the connection to ``device`` took.
+        """
+        if timings is not None and timings.phases:
+            self.store_timings(device, timings.phases)
+        return data
+
+    def _device_succeeded(self, data):
+        """Called by _add_worker() as a callback to count a device as ok."""
+        metrics.DEVICES.labels('ok').inc()
+        return data
+
+    def _device_failed(self, failure):
+        """Called by _add_worker() as an errback to count a failed device."""
+        metrics.DEVICES.labels('error').inc()
+        return failure
+
+    def _device_done(self, data):
+        """
+        Called by _add_worker() as both callback/errback once a device has
+        been connected to and parsed.
+        """
+        # Unless it was stopped being counted when the run failed.
+        if self._running:
+            self._running -= 1
+            metrics.DEVICES_RUNNING.dec()
+        return data
+
+    def _count_queued(self):
+        """Count the devices in the job queue as queued, once per run."""
+        if not self._queued and not self._running:
+            self._queued = len(self.jobs)
+            metrics.DEVICES_QUEUED.inc(self._queued)
+
+    def _clear_metrics(self):
+        """
+        Stop counting devices that are still queued or running, once the run
+        is over or has failed.
+        """
+        metrics.DEVICES_QUEUED.dec(self._queued)
+        metrics.DEVICES_RUNNING.dec(self._running)
+        self._queued = self._running = 0
+
     def _setup_jobs(self):
         """
         "Maps device hostnames to `~trigger.netdevices.NetDevice` objects and
         populates the job queue.
         """
-        for dev in self.devices:
-            log.msg('Adding', dev)
+        # Look them all up at once rather than one at a time.
+        devices = list(self.devices)
+        devobjs = self.nd.find_many(str(dev) for dev in devices)
+
+        for dev, devobj in itertools.izip(devices, devobjs):
+            logger.debug('Adding %s', dev)
             if self.verbose:
                 print 'Adding', dev
 
             # Make sure that devices are actually in netdevices and keep going
-            try:
-                devobj = self.nd.find(str(dev))
-            except KeyError:
+            if devobj is None:
                 msg = 'Device not found in NetDevices: %s' % dev
                 log.err(msg)
                 if self.verbose:
@@ -239,7 +541,8 @@ class Commando(object):
         """
         Select another device for the active queue.
 
-        Currently only returns the next device in the job queue. This is
+        Currently only returns the next device in the job queue that may run
+        within ``concurrency_limits``, or ``None`` if there are none. This is
         abstracted out so that this behavior may be customized, such as for
         future support for incremental callbacks.
 
@@ -259,53 +562,106 @@ class Commando(object):
     def _add_worker(self):
         """
         Adds devices to the work queue to keep it populated with the maximum
-        connections as specified by ``max_conns``.
+        connections as specified by ``max_conns`` (or ``adaptive``), within
+        the limits specified by ``concurrency_limits``.
         """
-        while self.jobs and self.curr_conns < self.max_conns:
+        self._count_queued()
+        scheduled = isinstance(self.jobs, GroupScheduler)
+        while self.jobs and self.curr_conns < self.conn_limit:
+            if self.parse_backlogged:
+                logger.info('Waiting for %d devices to be parsed.',
+                            self.parsing)
+                break
+
             device = self.select_next_device()
             if device is None:
-                log.msg('No device returned when adding worker. Moving on.')
+                if scheduled and self.jobs.blocked:
+                    logger.info('Remaining devices are waiting on concurrency '
+                                'limits.')
+                    break
+                logger.info('No device returned when adding worker. Moving '
+                            'on.')
                 continue
 
+            if scheduled:
+                self.jobs.start(device)
+            self._queued -= 1
+            self._running += 1
+            metrics.DEVICES_QUEUED.dec()
+            metrics.DEVICES_RUNNING.inc()
             self._increment_connections()
-            log.msg('connections:', self.curr_conns)
-            log.msg('Adding work to queue...')
+            logger.debug('connections: %s', self.curr_conns)
+            logger.debug('Adding work to queue...')
             if self.verbose:
                 print 'connections:', self.curr_conns
                 print 'Adding work to queue...'
 
+            # Track how long it takes to log in if we're adapting to it.
+            incremental = self.incremental
+            if self.adaptive is not None:
+                token = self.adaptive.start()
+                incremental = self._track_connection(token, incremental)
+
             # Setup the async Deferred object with a timeout and error printing.
             commands = self.generate(device)
-            async = device.execute(commands, creds=self.creds,
-                                   incremental=self.incremental,
-                                   timeout=self.timeout,
-                                   with_errors=self.with_errors,
-                                   force_cli=self.force_cli,
-                                   command_interval=self.command_interval)
-
-            # Add the template parser callback for great justice!
-            async.addCallback(self.parse_template, device, commands)
-
-            # Add the parser callback for even greater justice!
-            async.addCallback(self.parse, device, commands)
+            if self.session_pool is not None:
+                execute = functools.partial(self.session_pool.execute, device)
+            else:
+                execute = device.execute
+            async = execute(commands, creds=self.creds,
+                            incremental=incremental, timeout=self.timeout,
+                            with_errors=self.with_errors,
+                            force_cli=self.force_cli,
+                            command_interval=self.command_interval,
+                            exec_channels=self.exec_channels,
+                            pipeline=self.pipeline)
+            async.addBoth(self._store_timings, device,
+                          getattr(async, 'timings', None))
+
+            if self.adaptive is not None:
+                async.addCallbacks(self._connection_done,
+                                   self._connection_failed,
+                                   callbackArgs=(token,), errbackArgs=(token,))
+
+            if self.parse_pool is None:
+                # Add the template parser callback for great justice!
+                async.addCallback(self.parse_template, device, commands)
+
+                # Add the parser callback for even greater justice!
+                async.addCallback(self.parse, device, commands)
+            else:
+                # The connection is done with, so let another device have it
+                # while we parse.
+                async.addBoth(self._release_device, device)
+                async.addBoth(self._decrement_connections)
+                async.addCallback(self._parse_in_pool, device, commands)
 
             # If parse fails, still decrement and track the error
             async.addErrback(self.errback, device)
+            async.addCallbacks(self._device_succeeded, self._device_failed)
 
             # Make sure any further uncaught errors get logged
             async.addErrback(log.err)
 
             # Here we addBoth to continue on after pass/fail, decrement the
             # connections and move on.
-            async.addBoth(self._decrement_connections)
+            if self.parse_pool is None:
+                async.addBoth(self._release_device, device)
+                async.addBoth(self._decrement_connections)
+            async.addBoth(self._device_done)
             async.addBoth(lambda x: self._add_worker())
 
         # Do this once we've exhausted the job queue
         else:
-            if not self.curr_conns and self.reactor_running:
+            done = not self.curr_conns and not self.parsing
+            if done and not self.jobs:
+                self._clear_metrics()
+                self._close_sink()
+                self._close_parse_pool()
+            if done and self.reactor_running:
                 self._stop()
             elif not self.jobs and not self.reactor_running:
-                log.msg('No work left.')
+                logger.info('No work left.')
                 if self.verbose:
                     print 'No work left.'
 
@@ -346,15 +702,12 @@ class Commando(object):
 
         if device_type in vendor_types:
             if hasattr(self, method_name):
-                log.msg(
-                    '[%s] Found %r method: %s' % (device, method, method_name)
-                )
+                logger.info('[%s] Found %r method: %s', device, method,
+                            method_name)
                 desired_method = method_name
             else:
-                log.msg(
-                    '[%s] Did not find %r method: %s' % (device, method,
-                                                         method_name)
-                )
+                logger.info('[%s] Did not find %r method: %s', device, method,
+                            method_name)
         else:
             raise exceptions.UnsupportedDeviceType(
                 'Device %r has an invalid type %r for vendor %r. Must be '
@@ -365,8 +718,8 @@ class Commando(object):
         if desired_method is None:
             if self.allow_fallback:
                 desired_method = METHOD_MAP[method] % 'base'
-                log.msg('[%s] Fallback enabled. Using base method: %r' %
-                        (device, desired_method))
+                logger.info('[%s] Fallback enabled. Using base method: %r',
+                            device, desired_method)
             else:
                 raise exceptions.UnsupportedVendor(
                     'The vendor %r had no available %s method. Please check '
@@ -426,20 +779,41 @@ class Commando(object):
 
         device_type = device.os
         ret = []
+        # Templates are parsed in parse_pool, unless we're already in it.
+        offload = (self.parse_pool is not None and
+                   not self.parse_pool.in_worker)
+        parsing = []
 
         for idx, command in enumerate(commands):
-            if device_type:
+            if device_type and offload:
+                d = self.run_parser(parse_textfsm, command, device_type,
+                                    results[idx])
+                d.addCallback(self._store_template_results, device, command)
+                d.addErrback(self._template_failed)
+                parsing.append(d)
+            elif device_type:
                 try:
-                    re_table = load_cmd_template(command, dev_type=device_type)
-                    fsm = get_textfsm_object(re_table, results[idx])
+                    fsm = parse_textfsm(command, device_type, results[idx])
                     self.append_parsed_results(device, self.map_parsed_results(command, fsm))
                 except:
-                    log.msg("Unable to load TextFSM template, just updating with unstructured output")
+                    self._template_failed()
             ret.append(results[idx])
 
-        self.parsed_results = dict(self.parsed_results)
+        if isinstance(self.parsed_results, collections.defaultdict):
+            self.parsed_results = dict(self.parsed_results)
+        if parsing:
+            return defer.DeferredList(parsing).addCallback(lambda x: ret)
         return ret
 
+    def _store_template_results(self, fsm, device, command):
+        """Store the results of a template parsed by parse_template()."""
+        self.append_parsed_results(device, self.map_parsed_results(command, fsm))
+
+    def _template_failed(self, failure=None):
+        """Called when a template couldn't be loaded or parsed."""
+        logger.info("Unable to load TextFSM template, just updating with "
+                    "unstructured output")
+
     def parse(self, results, device, commands=None):
         """
         Parse output from a device. Calls to ``self._lookup_method`` to find
@@ -487,7 +861,8 @@ class Commando(object):
     def store_error(self, device, error):
         """
         A simple method for storing an error called by all default
-        parse/generate methods.
+        parse/generate methods. The error is written to ``sink``, if any,
+        and kept in ``errors`` if ``keep_results`` is set.
 
         If you want to customize the default method for storing results,
         overload this in your subclass.
@@ -500,13 +875,17 @@ class Commando(object):
             ``Failure`` instance.
         """
         devname = str(device)
-        self.errors[devname] = error
+        if self.sink is not None:
+            self.sink.write_error(devname, error)
+        if self.keep_results:
+            self.errors[devname] = error
         return True
 
     def append_parsed_results(self, device, results):
         """
         A simple method for appending results called by template parser
-        method.
+        method. The results are written to ``sink``, if any, and kept in
+        ``parsed_results`` if ``keep_results`` is set.
 
         If you want to customize the default method for storing parsed
         results, overload this in your subclass.
@@ -518,14 +897,18 @@ class Commando(object):
             The results to store. Anything you want really.
         """
         devname = str(device)
-        log.msg("Appending results for %r: %r" % (devname, results))
-        self.parsed_results[devname].update(results)
+        logger.debug("Appending results for %r: %r", devname, results)
+        if self.sink is not None:
+            self.sink.write_parsed(devname, results)
+        if self.keep_results:
+            self.parsed_results.setdefault(devname, {}).update(results)
         return True
 
     def store_results(self, device, results):
         """
         A simple method for storing results called by all default
-        parse/generate methods.
+        parse/generate methods. The results are written to ``sink``, if any,
+        and kept in ``results`` if ``keep_results`` is set.
 
         If you want to customize the default method for storing results,
         overload this in your subclass.
@@ -537,10 +920,39 @@ class Commando(object):
             The results to store. Anything you want really.
         """
         devname = str(device)
-        log.msg("Storing results for %r: %r" % (devname, results))
-        self.results[devname] = results
+        logger.debug("Storing results for %r: %r", devname, results)
+        if self.sink is not None:
+            self.sink.write_result(devname, results)
+        if self.keep_results:
+            self.results[devname] = results
+        return True
+
+    def store_timings(self, device, timings):
+        """
+        Add the timings of each phase of the connection to ``device`` to
+        ``timing_stats``, and keep them in ``timings`` if ``keep_results`` is
+        set. Overload this to customize how timings are stored.
+
+        :param device:
+            NetDevice object
+
+        :param timings:
+            A dict mapping phases to seconds
+        """
+        devname = str(device)
+        logger.debug('Timings for %s: %r', devname, timings)
+        self.timing_stats.add(timings)
+        if self.keep_results:
+            self.timings[devname] = dict(timings)
         return True
 
+    def dump_timings(self, dest):
+        """
+        Write the count, mean and percentiles of each connection phase to
+        ``dest``, a file-like object or the path of a file to create, as JSON.
+        """
+        self.timing_stats.dump(dest)
+
     def map_parsed_results(self, command=None, fsm=None):
         """Return a dict of ``{command: fsm, ...}``"""
         if fsm is None:
@@ -561,12 +973,12 @@ class Commando(object):
     def reactor_running(self):
         """Return whether reactor event loop is running or not"""
         from twisted.internet import reactor
-        log.msg("Reactor running? %s" % reactor.running)
+        logger.debug("Reactor running? %s", reactor.running)
         return reactor.running
 
     def _stop(self):
         """Stop the reactor event loop"""
-        log.msg('stopping reactor')
+        logger.info('stopping reactor')
         if self.verbose:
             print 'stopping reactor'
 
@@ -575,16 +987,20 @@ class Commando(object):
 
     def _start(self):
         """Start the reactor event loop"""
-        log.msg('starting reactor')
+        logger.info('starting reactor')
         if self.verbose:
             print 'starting reactor'
 
-        if self.curr_conns:
+        if self.curr_conns or self.parsing:
             from twisted.internet import reactor
-            reactor.run()
+            try:
+                reactor.run()
+            finally:
+                # Nothing else will finish once the reactor has stopped.
+                self._clear_metrics()
         else:
             msg = "Won't start reactor with no work to do!"
-            log.msg(msg)
+            logger.info(msg)
             if self.verbose:
                 print msg
 
@@ -592,20 +1008,24 @@ class Commando(object):
         """
         Nothing happens until you execute this to perform the actual work.
         """
-        self._add_worker()
-        self._start()
+        try:
+            self._add_worker()
+            self._start()
+        except:
+            self._clear_metrics()
+            raise
 
     #=======================================
     # Base generate (to_)/parse (from_) methods
     #=======================================
     def to_base(self, device, commands=None, extra=None):
         commands = commands or self.commands
-        log.msg('Sending %r to %s' % (commands, device))
+        logger.debug('Sending %r to %s', commands, device)
         return commands
 
     def from_base(self, results, device, commands=None):
         commands = commands or self.commands
-        log.msg('Received %r from %s' % (results, device))
+        logger.debug('Received %r from %s', results, device)
         self.store_results(device, self.map_results(commands, results))
 
     #=======================================
@@ -669,19 +1089,19 @@ class ReactorlessCommando(Commando):
     """
     def _start(self):
         """Initializes ``all_done`` instead of starting the reactor"""
-        log.msg("._start() called")
+        logger.debug("._start() called")
         self.all_done = False
 
     def _stop(self):
         """Sets ``all_done`` to True instead of stopping the reactor"""
-        log.msg("._stop() called")
+        logger.debug("._stop() called")
         self.all_done = True
 
     def run(self):
         """
         We've overloaded the run method to return a Deferred task object.
         """
-        log.msg(".run() called")
+        logger.debug(".run() called")
 
         # This is the default behavior
         super(ReactorlessCommando, self).run()
@@ -838,9 +1258,12 @@ class NetACLInfo(Commando):
         self.results[device.nodeName] = data #"MY OWN IOS DATA"
         alld = data[0]
 
-        log.msg('Parsing interface data (%d bytes)' % len(alld))
+        logger.info('Parsing interface data (%d bytes)', len(alld))
         if not device.is_cisco_asa():
-            self.config[device] = _parse_ios_interfaces(alld, skip_disabled=self.skip_disabled)
+            d = self.run_parser(_parse_ios_interfaces, alld,
+                                skip_disabled=self.skip_disabled)
+            d.addCallback(self._store_config, device)
+            return d
         else:
             self.config[device] = {
                     "unsupported": "ASA ACL parsing unsupported this release"
@@ -848,6 +1271,11 @@ class NetACLInfo(Commando):
 
         return True
 
+    def _store_config(self, config, device):
+        """Store the parsed interface ``config`` for ``device``."""
+        self.config[device] = config
+        return True
+
     # Other IOS-like vendors are Cisco-enough
     from_arista = from_cisco
     from_brocade = from_cisco
@@ -16,6 +16,7 @@ __version__ = '3.2.1'
 
 
 # Imports
+import collections
 import os
 import re
 import socket
@@ -34,7 +35,30 @@ __all__.extend(core.__all__)
 
 
 # Classes
-class DoCommandBase(Commando):
+class StoreDataMixin(object):
+    """
+    Keep the output of each device in ``data`` and write it to the ``sink``.
+    """
+    def store_data(self, device, outs):
+        """
+        Write the command output for ``device`` to ``sink``, if any, and keep
+        it in ``data`` if ``keep_results`` is set.
+
+        :param device:
+            A `~trigger.netdevices.NetDevice` object
+
+        :param outs:
+            A list of dicts of ``cmd``, ``out`` and ``dev``
+        """
+        if self.sink is not None:
+            results = collections.OrderedDict((d['cmd'], d['out'])
+                                              for d in outs)
+            self.sink.write_result(device.nodeName, results)
+        if self.keep_results:
+            self.data[device.nodeName] = outs
+
+
+class DoCommandBase(StoreDataMixin, Commando):
     """
     Base class for docommand action classes.
 
@@ -51,7 +75,6 @@ class DoCommandBase(Commando):
         log.msg('Received %r from %s' % (results, device))
         self.store_results(device, results)
 
-
 # TODO: Right now if you are loading commands from files, this will ultimately
 # fail with a ReactorNotRestartable error because the core.main() function is
 # calling each action class separately. We need to account for this. See
@@ -139,7 +162,7 @@ class CommandRunner(DoCommandBase):
             cmd = self.commands[i]
             d = {'cmd': cmd, 'out': out, 'dev': device}
             outs.append(d)
-        self.data[devname] = outs
+        self.store_data(device, outs)
         return True
 
     def __children_with_namespace(self, ns):
@@ -168,11 +191,11 @@ class CommandRunner(DoCommandBase):
             if self.debug:
                 print '\ndata["%s"]:' % i
                 ET.dump(xml)
-        self.data[devname] = outs
+        self.store_data(device, outs)
         return True
 
 
-class ConfigLoader(Commando):
+class ConfigLoader(StoreDataMixin, Commando):
     """
     Load configuration changes on network devices.
 
@@ -287,7 +310,8 @@ class ConfigLoader(Commando):
         if self.debug:
             print '-->store_results(device=%r, results=%r)' % (devname, results)
         out = '\n'.join(results)
-        self.data[devname] = [{'dev': device, 'cmd': 'load-configuration', 'out': out}]
+        self.store_data(device, [{'dev': device, 'cmd': 'load-configuration',
+                                  'out': out}])
         return True
 
     def __children_with_namespace(self, ns):
@@ -323,10 +347,14 @@ class ConfigLoader(Commando):
                 msg = msg + emes + " in '" + etok + "'\n    line:"+elin+",col:"+ecol
                 msg = "%s %s in %r\n    line: %s, col: %s" % (msg, emes, etok,
                                                               elin, ecol)
-        if success:
-            self.data[devname] = [{'dev': device, 'cmd': 'load-configuration', 'out': 'Success'}]
         if error:
-            self.data[devname] = [{'dev': device, 'cmd': 'load-configuration', 'out': msg}]
+            out = msg
+        elif success:
+            out = 'Success'
+        else:
+            return True
+        self.store_data(device, [{'dev': device, 'cmd': 'load-configuration',
+                                  'out': out}])
         return True
 
 
@@ -59,6 +59,8 @@ VERBOSE = False
 PUSH = False
 FORCE_CLI = False
 TIMEOUT = 30
+OUTPUT = None
+TIMINGS = None
 
 
 # Exports
@@ -239,6 +241,20 @@ def do_work(work=None, action_class=None):
     ret = []
     if VERBOSE:
         print_work(work)
+
+    # Write results to the sink as devices are done instead of keeping them.
+    sink = None
+    if OUTPUT is not None and PUSH:
+        from trigger.sinks import open_sink
+        sink = open_sink(OUTPUT)
+        print 'Writing results to %s' % OUTPUT
+
+    # Collect connection timings across all of the jobs.
+    timing_stats = None
+    if TIMINGS is not None and PUSH:
+        from trigger.timing import PhaseStats
+        timing_stats = PhaseStats()
+
     for job in work:
         f = job['f']
         d = job['d']
@@ -250,7 +266,8 @@ def do_work(work=None, action_class=None):
         # See: https://gist.github.com/jathanism/4543974
         n = action_class(
             devices=d, files=f, commands=c, verbose=VERBOSE, debug=DEBUG,
-            timeout=TIMEOUT, production_only=PROD_ONLY, force_cli=FORCE_CLI
+            timeout=TIMEOUT, production_only=PROD_ONLY, force_cli=FORCE_CLI,
+            sink=sink, keep_results=sink is None
         )
 
         if PUSH:
@@ -259,11 +276,19 @@ def do_work(work=None, action_class=None):
             n.run()
         else:
             print "*** Dry-run mode; Skipping command execution***"
+        if timing_stats is not None:
+            timing_stats.merge(n.timing_stats)
         for devname in n.data:
             data = n.data[devname]
             res = {'devname': devname, 'data': data}
             ret.append(res)
         del n
+
+    if sink is not None:
+        sink.close()
+    if timing_stats is not None:
+        timing_stats.dump(TIMINGS)
+        print 'Wrote connection timings to %s' % TIMINGS
     return ret
 
 def print_work(work=None):
@@ -391,6 +416,16 @@ def parse_args(argv, description=None):
     '''
     parser.add_option('-j', '--jobs', type='int', default=5,
                       help='maximum simultaneous connections (default 5).')
+    parser.add_option('-o', '--output', type='string', default=OUTPUT,
+                      help='Write results to this sink as each device is '
+                           'done instead of displaying them at the end, e.g. '
+                           '"jsonl:results.jsonl", "dir:results/" or '
+                           '"sqlite:results.db".')
+    parser.add_option('--timings', type='string', default=TIMINGS,
+                      metavar='FILE',
+                      help='Write the percentiles of how long each phase of '
+                           'connecting to devices and running commands took '
+                           'to this file as JSON.')
     parser.add_option('-t', '--timeout', type='int', default=TIMEOUT,
                       help="""Time in seconds to wait for each command to
                       complete (default %s).""" % TIMEOUT)
@@ -432,6 +467,11 @@ def verify_opts(opts):
     isdf = len(opts.device_file) > 0
     iscf = len(opts.config_file) > 0
     isp = opts.device_path is not None
+    if opts.output is not None:
+        from trigger.sinks import SINK_TYPES
+        kind = opts.output.partition(':')[0]
+        if kind not in SINK_TYPES or ':' not in opts.output:
+            return False, 'ERROR: Invalid output %r\n' % opts.output
     if isp:
         if not os.path.isdir(opts.device_path):
             return False, 'ERROR: %r is not a valid directory\n' % opts.device_path
@@ -476,9 +516,16 @@ def set_globals_from_opts(opts):
     global PUSH
     global TIMEOUT
     global FORCE_CLI
+    global OUTPUT
+    global TIMINGS
     DEBUG = opts.debug
+    if DEBUG:
+        from trigger import logger
+        logger.set_level('DEBUG')
     VERBOSE = opts.verbose
     PUSH = opts.push
     TIMEOUT = opts.timeout
     FORCE_CLI = opts.force_cli
+    OUTPUT = opts.output
+    TIMINGS = opts.timings
 
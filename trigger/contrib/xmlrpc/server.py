@@ -16,7 +16,10 @@ import os
 import sys
 import types
 
+from trigger.conf import settings
 from trigger.contrib.commando import CommandoApplication
+from trigger.netdevices import NetDevices
+from trigger.twister import SessionPool
 from trigger.utils import importlib
 from twisted.internet import defer
 from twisted.python import log
@@ -41,6 +44,11 @@ class TriggerXMLRPCServer(xmlrpc.XMLRPC):
         self._procedure_map = {}
         self.addHandlers(self._handlers)
 
+        # Keep sessions to devices open between requests
+        self.session_pool = None
+        if settings.SESSION_POOL_ENABLED:
+            self.session_pool = SessionPool()
+
     def lookupProcedure(self, procedurePath):
         """
         Lookup a method dynamically.
@@ -164,10 +172,18 @@ class TriggerXMLRPCServer(xmlrpc.XMLRPC):
 
     def xmlrpc_execute_commands(self, args, kwargs):
         """Execute ``commands`` on ``devices``"""
+        kwargs.setdefault('session_pool', self.session_pool)
         c = CommandoApplication(*args, **kwargs)
         d = c.run()
         return d
 
+    def xmlrpc_reload_netdevices(self, force=False):
+        """
+        Reload NetDevices from the source data and return the names of the
+        devices that were added, changed or removed.
+        """
+        return NetDevices().reload(force=force)
+
     def xmlrpc_add(self, x, y):
         """Adds x and y"""
         return x + y
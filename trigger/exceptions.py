@@ -191,6 +191,17 @@ class MissingPlatform(CommandoError):
     """Raised when a specific device platform is not supported."""
 
 
+class ShardFailed(CommandoError):
+    """Raised when a worker process of a sharded Commando run dies."""
+
+
+class ParseTimeout(CommandoError):
+    """
+    Raised when a parse pool's worker doesn't return a result in time, such
+    as when it dies.
+    """
+
+
 ####################
 # Twister Exceptions
 ####################
@@ -304,3 +315,7 @@ class MissingRealmName(TacacsrcError):
 
 class VersionMismatch(TacacsrcError):
     """Raised when the TACACSrc version does not match."""
+
+
+class AgentError(TacacsrcError):
+    """Raised when the credential agent can't be reached or fails a request."""
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+Level-gated logging on top of ``twisted.python.log``.
+
+`~trigger.twister` and `~trigger.cmds` log everything they send to and receive
+from devices, which for large command outputs means formatting the ``repr()``
+of megabytes of data. Messages are only formatted if their level is at least
+:setting:`LOG_LEVEL`, so debug messages cost next to nothing unless they're
+wanted::
+
+    >>> from trigger.logger import get_logger
+    >>> log = get_logger(__name__)
+    >>> log.debug('[%s] BYTES: %r', device, bytes)
+
+Messages that are logged go to ``twisted.python.log.msg()`` with the level as
+``logLevel``, so they end up wherever Twisted's log observers send them, and
+at the right level when ``PythonLoggingObserver`` is used.
+
+The level can be changed at run-time, such as for a ``--debug`` option, with
+`~trigger.logger.set_level()`.
+"""
+
+
+# Imports
+import logging
+
+from twisted.python import log as twisted_log
+
+from trigger.conf import settings
+
+
+# Exports
+__all__ = ('Logger', 'get_logger', 'get_level', 'set_level', 'DEBUG', 'INFO',
+           'WARNING', 'ERROR')
+
+
+# Constants
+# The same levels as the logging module
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+LEVELS = {
+    'DEBUG': DEBUG,
+    'INFO': INFO,
+    'WARNING': WARNING,
+    'ERROR': ERROR,
+}
+
+# Every logger, by name
+_loggers = {}
+
+# The current level, read from settings.LOG_LEVEL when first needed
+_level = None
+
+
+# Functions
+def _to_level(level):
+    """Turn a level name such as ``'DEBUG'``, or a number, into a number."""
+    if isinstance(level, basestring):
+        try:
+            return LEVELS[level.upper()]
+        except KeyError:
+            raise ValueError('Unknown log level: %r' % level)
+    return int(level)
+
+def get_level():
+    """Return the current log level as a number."""
+    global _level
+    if _level is None:
+        _level = _to_level(settings.LOG_LEVEL)
+    return _level
+
+def set_level(level):
+    """
+    Change the log level of every logger.
+
+    :param level:
+        A level name such as ``'DEBUG'``, or a number such as
+        `~trigger.logger.DEBUG`.
+    """
+    global _level
+    _level = _to_level(level)
+    for logger in _loggers.itervalues():
+        logger.level = _level
+
+def get_logger(name):
+    """Return the `~trigger.logger.Logger` for ``name``, creating it."""
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers[name] = Logger(name)
+    return logger
+
+
+# Classes
+class Logger(object):
+    """
+    Log messages at or above the current level to ``twisted.python.log``.
+
+    Messages are formatted with ``%`` and the arguments passed after them, but
+    only if they're going to be logged. Use `get_logger()` to get one.
+
+    :param name:
+        The name of the logger, usually the name of the module using it.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.level = get_level()
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, self.name)
+
+    def is_enabled_for(self, level):
+        """Return whether messages at ``level`` would be logged."""
+        return level >= self.level
+
+    def log(self, level, msg, *args):
+        """Log ``msg % args`` at ``level``."""
+        if level < self.level:
+            return
+        if args:
+            msg = msg % args
+        twisted_log.msg(msg, logLevel=level, logger=self.name)
+
+    def debug(self, msg, *args):
+        """Log ``msg % args`` at the ``DEBUG`` level."""
+        if self.level > DEBUG:
+            return
+        self.log(DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        """Log ``msg % args`` at the ``INFO`` level."""
+        if self.level > INFO:
+            return
+        self.log(INFO, msg, *args)
+
+    def warning(self, msg, *args):
+        """Log ``msg % args`` at the ``WARNING`` level."""
+        self.log(WARNING, msg, *args)
+
+    def error(self, msg, *args):
+        """Log ``msg % args`` at the ``ERROR`` level."""
+        self.log(ERROR, msg, *args)
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+
+"""
+Counters, gauges and histograms for long-running Trigger services, in the
+Prometheus text format.
+
+`~trigger.twister` and `~trigger.cmds.Commando` keep the metrics below in the
+default registry, ``REGISTRY``, as they go:
+
+``trigger_connections_active``
+    Connections to devices that are being made or are open.
+``trigger_connections_total{result}``
+    Connections that have closed, by ``result``: ``ok``, or the name of the
+    error they failed with, such as ``LoginTimeout``.
+``trigger_connection_phase_seconds{phase}``
+    How long each phase of a connection took (see `~trigger.timing`).
+``trigger_command_seconds``
+    How long each command took, from sending it to getting its result.
+``trigger_commando_devices_queued``
+    Devices waiting for a connection in every ``Commando``.
+``trigger_commando_devices_running``
+    Devices being connected to or parsed by every ``Commando``.
+``trigger_commando_concurrency_limit``
+    The concurrency limit most recently chosen by a
+    `~trigger.scheduler.AdaptiveConcurrency`, such as that of a ``Commando``
+    with ``adaptive`` set. ``max_conns`` still applies on top of it.
+``trigger_commando_devices_total{result}``
+    Devices that every ``Commando`` is done with, by ``result``: ``ok`` or
+    ``error``.
+
+Serve them from the reactor with `~trigger.metrics.MetricsResource`, which the
+``trigger-xmlrpc`` twistd plugin does if given a ``--metrics-port``. The
+metrics aren't authenticated, so listen on a trusted interface::
+
+    >>> from twisted.web import server
+    >>> from trigger.metrics import MetricsResource
+    >>> reactor.listenTCP(8002, server.Site(MetricsResource()),
+    ...                   interface='127.0.0.1')
+
+Updating a metric is a dict lookup at most and an addition, and metrics are
+meant to be updated from the reactor thread. Set :setting:`METRICS_ENABLED`
+to ``False`` to replace Trigger's own metrics with ones that do nothing.
+Worker processes, such as those of `~trigger.sharding.ShardedCommando`, have
+registries of their own, which aren't served.
+"""
+
+
+# Imports
+import bisect
+import collections
+
+from twisted.web import resource
+
+from trigger.conf import settings
+
+
+# Exports
+__all__ = ('Registry', 'Counter', 'Gauge', 'Histogram', 'MetricsResource',
+           'REGISTRY', 'DEFAULT_BUCKETS')
+
+
+# Constants
+# Histogram buckets in seconds, which run longer than Prometheus' defaults
+# because logging in to a device can take a while.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# Functions
+def _format_value(value):
+    """Format a sample value the way Prometheus expects it."""
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def _escape(value):
+    """Escape a label value."""
+    return (str(value).replace('\\', r'\\').replace('\n', r'\n')
+            .replace('"', r'\"'))
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value))
+                             for name, value in labels)
+
+
+# Classes
+class Metric(object):
+    """
+    Base class for metrics.
+
+    A metric with ``labelnames`` has a child for every combination of label
+    values, which is returned by `labels()` and updated instead of the
+    metric itself.
+
+    :param name:
+        The name of the metric, such as ``trigger_connections_total``.
+
+    :param documentation:
+        What the metric measures.
+
+    :param labelnames:
+        (Optional) The names of the labels of the metric.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self
+
+    def labels(self, *values, **kwargs):
+        """
+        Return the child for the given label values, by position or by name,
+        creating it if need be.
+        """
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError('%s takes labels %r, not %r' %
+                                 (self.name, self.labelnames, values))
+            child = self._children[values] = self._child()
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """
+        Yield ``(name, labels, value)`` for every sample, where ``labels`` is
+        a sequence of ``(name, value)`` pairs.
+        """
+        for values, child in sorted(self._children.iteritems()):
+            labels = zip(self.labelnames, values)
+            for suffix, extra, value in child._samples():
+                yield self.name + suffix, labels + extra, value
+
+    def render(self):
+        """Return the metric in the Prometheus text format."""
+        lines = ['# HELP %s %s' % (self.name, self.documentation.replace(
+                     '\\', r'\\').replace('\n', r'\n')),
+                 '# TYPE %s %s' % (self.name, self.type)]
+        for name, labels, value in self.samples():
+            lines.append('%s%s %s' % (name, _format_labels(labels),
+                                      _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+class Counter(Metric):
+    """A count that only goes up."""
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.value = 0
+        super(Counter, self).__init__(name, documentation, labelnames)
+
+    def _child(self):
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount=1):
+        """Add ``amount`` to the count."""
+        self.value += amount
+
+    def _samples(self):
+        yield '', [], self.value
+
+class Gauge(Metric):
+    """A value that can go up and down."""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.value = 0
+        super(Gauge, self).__init__(name, documentation, labelnames)
+
+    def _child(self):
+        return Gauge(self.name, self.documentation)
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def _samples(self):
+        yield '', [], self.value
+
+class Histogram(Metric):
+    """
+    Counts of observed values in buckets, along with their sum.
+
+    :param buckets:
+        (Optional) The upper bounds of the buckets, in increasing order. A
+        bucket for everything (``+Inf``) is always added.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        super(Histogram, self).__init__(name, documentation, labelnames)
+
+    def _child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value):
+        """Count ``value``."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def _samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield '_bucket', [('le', _format_value(float(bound)))], cumulative
+        yield '_sum', [], self.sum
+        yield '_count', [], self.count
+
+class _NullMetric(object):
+    """A metric that does nothing, for when metrics are disabled."""
+    def labels(self, *values, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    dec = inc
+
+    def set(self, value):
+        pass
+
+    observe = set
+
+class Registry(object):
+    """
+    A collection of metrics to be served together.
+
+    :param enabled:
+        (Optional) If ``False``, the metrics returned by `counter()`,
+        `gauge()` and `histogram()` do nothing and aren't rendered.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.metrics = collections.OrderedDict()
+
+    def register(self, metric):
+        """
+        Add ``metric`` and return it, or return the metric already registered
+        under its name.
+        """
+        if not self.enabled:
+            return _NullMetric()
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric):
+                raise ValueError('%s is already registered as a %s' %
+                                 (metric.name, existing.type))
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Register and return a `Counter`."""
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        """Register and return a `Gauge`."""
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        """Register and return a `Histogram`."""
+        return self.register(Histogram(name, documentation, labelnames,
+                                       buckets))
+
+    def render(self):
+        """Return every metric in the Prometheus text format."""
+        return ''.join(metric.render() for metric in self.metrics.itervalues())
+
+class MetricsResource(resource.Resource):
+    """
+    A ``twisted.web`` resource serving the metrics in a registry in the
+    Prometheus text format.
+
+    :param registry:
+        (Optional) The registry to serve. Defaults to ``REGISTRY``.
+    """
+    isLeaf = True
+
+    def __init__(self, registry=None):
+        resource.Resource.__init__(self)
+        self.registry = registry if registry is not None else REGISTRY
+
+    def render_GET(self, request):
+        request.setHeader('Content-Type', CONTENT_TYPE)
+        return self.registry.render()
+
+
+# The default registry, and the metrics kept by Trigger
+REGISTRY = Registry(enabled=settings.METRICS_ENABLED)
+
+CONNECTIONS_ACTIVE = REGISTRY.gauge(
+    'trigger_connections_active',
+    'Connections to devices that are being made or are open.')
+CONNECTIONS = REGISTRY.counter(
+    'trigger_connections_total',
+    'Connections to devices that have closed, by result.', ['result'])
+PHASE_SECONDS = REGISTRY.histogram(
+    'trigger_connection_phase_seconds',
+    'Seconds spent in each phase of connections to devices.', ['phase'])
+COMMAND_SECONDS = REGISTRY.histogram(
+    'trigger_command_seconds',
+    'Seconds from sending a command to a device to getting its result.')
+DEVICES_QUEUED = REGISTRY.gauge(
+    'trigger_commando_devices_queued',
+    'Devices waiting for a connection.')
+DEVICES_RUNNING = REGISTRY.gauge(
+    'trigger_commando_devices_running',
+    'Devices being connected to or parsed.')
+CONCURRENCY_LIMIT = REGISTRY.gauge(
+    'trigger_commando_concurrency_limit',
+    'Concurrency limit last chosen by adaptive concurrency.')
+DEVICES = REGISTRY.counter(
+    'trigger_commando_devices_total',
+    'Devices that are done, by result.', ['result'])
@@ -30,6 +30,7 @@ __version__ = '2.3.2'
 
 # Imports
 import copy
+import hashlib
 import itertools
 import os
 import re
@@ -42,7 +43,8 @@ from trigger.utils.url import parse_url
 from trigger import changemgmt, exceptions, rancid
 from UserDict import DictMixin
 import xml.etree.cElementTree as ET
-from . import loader
+from . import loader, snapshot
+from .index import FieldIndex, PrefixTrie
 try:
     from trigger.acl.db import AclsDB
 except ImportError:
@@ -55,25 +57,138 @@ JUNIPER_COMMIT = ET.Element('commit-configuration')
 JUNIPER_COMMIT_FULL = copy.copy(JUNIPER_COMMIT)
 ET.SubElement(JUNIPER_COMMIT_FULL, 'full')
 
+# The ACLs of a device without any. This is shared and immutable.
+NO_ACLS = frozenset()
+
 
 # Exports
-__all__ = ['device_match', 'NetDevice', 'NetDevices', 'Vendor']
+__all__ = ['device_match', 'DeviceProfile', 'NetDevice', 'NetDevices', 'Vendor']
 
 
 # Functions
-def _munge_source_data(data_source=settings.NETDEVICES_SOURCE):
+def _munge_source_data(data_source=settings.NETDEVICES_SOURCE, **hints):
     """
     Read the source data in the specified format, parse it, and return a
 
     :param data_source:
         Absolute path to source data file
+
+    :param hints:
+        Optional hints for the loader such as ``filters`` (see
+        `~trigger.netdevices.loader`). Anything in the query string of
+        ``data_source`` takes precedence.
     """
     log.msg('LOADING FROM: ', data_source)
     kwargs = parse_url(data_source)
     path = kwargs.pop('path')
+    for key, value in hints.iteritems():
+        kwargs.setdefault(key, value)
     return loader.load_metadata(path, **kwargs)
 
-def _populate(netdevices, data_source, production_only, with_acls):
+def _share_strings(data, strings):
+    """
+    Return a list of the key/value pairs in ``data`` with every string
+    replaced by an identical one from ``strings``, adding any that are new.
+
+    :param data:
+        A dict or iterable of key/value pairs
+
+    :param strings:
+        A dict of ``{type: {string: string}}``, keyed by type so that ``str``
+        and ``unicode`` values are never swapped for each other
+    """
+    if isinstance(data, dict):
+        data = data.iteritems()
+
+    shared = []
+    for key, value in data:
+        if isinstance(key, basestring):
+            key = strings.setdefault(type(key), {}).setdefault(key, key)
+        if isinstance(value, basestring):
+            value = strings.setdefault(type(value), {}).setdefault(value, value)
+        shared.append((key, value))
+    return shared
+
+def _build_devices(device_data):
+    """
+    Return a generator of `~trigger.netdevices.NetDevice` objects built from
+    ``device_data``, as returned by `~trigger.netdevices._munge_source_data`.
+
+    Devices with identical values (such as the same site or team) share a
+    single copy of the string rather than each keeping their own.
+    """
+    strings = {}
+    for obj in device_data:
+        yield NetDevice(data=_share_strings(obj, strings))
+
+def _loader_hints(production_only):
+    """Return the hints to pass to loaders (see `~trigger.netdevices.loader`)."""
+    hints = {}
+    if production_only:
+        hints['filters'] = {'adminStatus': 'PRODUCTION'}
+    return hints
+
+def _load_devices(data_source, snapshot_file=None, production_only=False):
+    """
+    Return an iterable of the `~trigger.netdevices.NetDevice` objects found in
+    ``data_source``.
+
+    If ``snapshot_file`` is set, devices are loaded from the snapshot when it
+    is still valid for ``data_source``, otherwise they are built from the
+    source and the snapshot is (re)written. Snapshots always contain every
+    device, regardless of ``adminStatus``.
+
+    :param data_source:
+        Absolute path or URL to source data
+
+    :param snapshot_file:
+        Path to a snapshot file (see :setting:`NETDEVICES_SNAPSHOT_FILE`)
+
+    :param production_only:
+        Ask the loader to only return devices with an ``adminStatus`` of
+        ``PRODUCTION``. Loaders may ignore this, so callers must still filter
+        the devices themselves. Ignored when ``snapshot_file`` is set.
+    """
+    if not snapshot_file:
+        device_data = _munge_source_data(data_source=data_source,
+                                         **_loader_hints(production_only))
+        return _build_devices(device_data)
+
+    key = snapshot.snapshot_key(data_source)
+    devices = snapshot.load_snapshot(snapshot_file, key)
+    if devices is None:
+        device_data = _munge_source_data(data_source=data_source)
+        devices = list(_build_devices(device_data))
+        snapshot.save_snapshot(snapshot_file, key, devices)
+
+    return devices
+
+def _keep_device(dev, production_only):
+    """
+    Return whether ``dev`` belongs in `~trigger.netdevices.NetDevices`.
+    """
+    # Only return devices with adminStatus of 'PRODUCTION' unless
+    # `production_only` is True
+    if dev.adminStatus != 'PRODUCTION' and production_only:
+        #log.msg('DEVICE NOT PRODUCTION')
+        return False
+
+    # These checks should be done on generation of netdevices.xml.
+    # Skip empty nodenames
+    if dev.nodeName is None:
+        return False
+
+    return True
+
+def _record_digest(data):
+    """
+    Return a digest of the source record ``data`` (a list of key/value pairs)
+    that changes whenever its contents do.
+    """
+    return hashlib.md5(repr(sorted(data))).digest()
+
+def _populate(netdevices, data_source, production_only, with_acls,
+              snapshot_file=None):
     """
     Populates the NetDevices with NetDevice objects.
 
@@ -81,7 +196,8 @@ def _populate(netdevices, data_source, production_only, with_acls):
     objects.
     """
     #start = time.time()
-    device_data = _munge_source_data(data_source=data_source)
+    devices = _load_devices(data_source, snapshot_file=snapshot_file,
+                            production_only=production_only)
 
     # Populate AclsDB if `with_acls` is set
     if with_acls:
@@ -92,25 +208,55 @@ def _populate(netdevices, data_source, production_only, with_acls):
         aclsdb = None
 
     # Populate `netdevices` dictionary with `NetDevice` objects!
-    for obj in device_data:
-        dev = NetDevice(data=obj, with_acls=aclsdb)
+    for dev in devices:
+        if _keep_device(dev, production_only):
+            netdevices[dev.nodeName] = dev
+
+    # ACLs are never stored in snapshots, so they are always populated here,
+    # in bulk, and only for the devices we keep.
+    if aclsdb is not None:
+        log.msg('Populating ACLs for %d devices' % len(netdevices))
+        acl_dicts = aclsdb.get_acl_dicts(netdevices.itervalues())
+        for name, dev in netdevices.iteritems():
+            dev._populate_acls(acls_dict=acl_dicts[name])
 
-        # Only return devices with adminStatus of 'PRODUCTION' unless
-        # `production_only` is True
-        if dev.adminStatus != 'PRODUCTION' and production_only:
-            #log.msg('DEVICE NOT PRODUCTION')
-            continue
+    #end = time.time()
+    #print 'Took %f seconds' % (end - start)
 
-        # These checks should be done on generation of netdevices.xml.
-        # Skip empty nodenames
-        if dev.nodeName is None:
-            continue
+def rebuild_snapshot(data_source=None, snapshot_file=None):
+    """
+    Rebuild the NetDevices snapshot from the source data unconditionally.
 
-        # Add to dict
-        netdevices[dev.nodeName] = dev
+    :param data_source:
+        Absolute path or URL to source data. Defaults to
+        :setting:`NETDEVICES_SOURCE`.
 
-    #end = time.time()
-    #print 'Took %f seconds' % (end - start)
+    :param snapshot_file:
+        Path to the snapshot file. Defaults to
+        :setting:`NETDEVICES_SNAPSHOT_FILE`.
+
+    :returns:
+        The number of devices written, or ``None`` if no snapshot was written.
+    """
+    if data_source is None:
+        data_source = settings.NETDEVICES_SOURCE
+    if snapshot_file is None:
+        snapshot_file = settings.NETDEVICES_SNAPSHOT_FILE
+    if not snapshot_file:
+        raise exceptions.ImproperlyConfigured(
+            'NETDEVICES_SNAPSHOT_FILE must be set to rebuild a snapshot.'
+        )
+
+    key = snapshot.snapshot_key(data_source)
+    if key is None:
+        log.msg('Cannot snapshot data source: %s' % data_source)
+        return None
+
+    device_data = _munge_source_data(data_source=data_source)
+    devices = list(_build_devices(device_data))
+    if snapshot.save_snapshot(snapshot_file, key, devices):
+        return len(devices)
+    return None
 
 def device_match(name, production_only=True):
     """
@@ -164,6 +310,22 @@ def device_match(name, production_only=True):
 
 
 # Classes
+class _TwisterMethod(object):
+    """
+    Bind a function from `~trigger.twister` to a
+    `~trigger.netdevices.NetDevice` as a method, shared by every device.
+
+    The function is looked up when it's accessed, because `~trigger.twister`
+    imports this module. It may be overridden on a single device by assigning
+    to the attribute.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, cls):
+        from trigger import twister
+        return getattr(twister, self.name).__get__(obj, cls)
+
 class NetDevice(object):
     """
     An object that represents a distinct network device and its metadata.
@@ -174,9 +336,46 @@ class NetDevice(object):
     the long-run as there are certain fields that are baked into the core
     functionality of Trigger.
 
+    The core fields are stored in slots, and the attributes derived from the
+    vendor and type are shared with every similar device through a
+    `~trigger.netdevices.DeviceProfile`, to keep large inventories compact.
+    Any other fields from the source data (or set later) are ordinary
+    attributes.
+
     Users usually won't create these objects directly! Rely instead upon
     `~trigger.netdevice.NetDevices` to do this for you.
     """
+    __slots__ = (
+        # Hostname
+        'nodeName', 'nodePort',
+
+        # Hardware Info
+        'deviceType', 'make', 'manufacturer', 'vendor', 'model',
+        'serialNumber',
+
+        # Administrivia
+        'adminStatus', 'assetID', 'budgetCode', 'budgetName', 'enablePW',
+        'owningTeam', 'owner', 'onCallName', 'operationStatus', 'lastUpdate',
+        'lifecycleStatus', 'projectName',
+
+        # Location
+        'site', 'room', 'coordinate',
+
+        # ACLs
+        'explicit_acls', 'implicit_acls', 'acls', 'bulk_acls',
+
+        # Derived from the DeviceProfile
+        '_startup_commands', '_commit_commands', 'requires_async_pty',
+        'delimiter',
+
+        # Everything else. This is only created for devices that need it.
+        '__dict__',
+    )
+
+    # Bound to functions in trigger.twister based on the vendor.
+    execute = _TwisterMethod('execute')
+    connect = _TwisterMethod('connect')
+
     def __init__(self, data=None, with_acls=None):
         # Here comes all of the bare minimum set of attributes a NetDevice
         # object needs for basic functionality within the existing suite.
@@ -231,25 +430,140 @@ class NetDevice(object):
             self._populate_deviceType()
 
         # ACLs (defaults to empty sets)
-        self.explicit_acls = self.implicit_acls = self.acls = self.bulk_acls = set()
+        self.explicit_acls = self.implicit_acls = self.acls = self.bulk_acls = NO_ACLS
         if with_acls:
             log.msg('[%s] Populating ACLs' % self.nodeName)
             self._populate_acls(aclsdb=with_acls)
 
-        # Bind the correct execute/connect methods based on deviceType
-        self._bind_dynamic_methods()
+        # Set everything that is derived from the vendor and deviceType.
+        self._set_derived_attributes()
 
-        # Set the correct command(s) to run on startup based on deviceType
-        self.startup_commands = self._set_startup_commands()
+    def _extra_attributes(self):
+        """
+        Return the dict of attributes that aren't stored in slots.
 
-        # Assign the configuration commit commands (e.g. 'write memory')
-        self.commit_commands = self._set_commit_commands()
+        Looking at ``__dict__`` creates it, so if it turns out to be empty
+        it's thrown away again to avoid wasting memory on every device.
+        """
+        extra = self.__dict__
+        if not extra:
+            del self.__dict__
+        return extra
+
+    def _field_names(self):
+        """Return the names of all of the attributes set on this device."""
+        names = [attr for attr in _slot_names(self.__class__)
+                 if not attr.startswith('_') and hasattr(self, attr)]
+        names.extend(('startup_commands', 'commit_commands'))
+        names.extend(self._extra_attributes())
+        return names
+
+    def __getstate__(self):
+        """
+        Return the state used to pickle this object (e.g. into a NetDevices
+        snapshot).
+
+        The vendor object, ACLs and the attributes taken from the
+        `~trigger.netdevices.DeviceProfile` are not kept and are rebuilt by
+        `__setstate__`.
+        """
+        state = dict(self._extra_attributes())
+        volatile = self._volatile_attributes
+        for attr in _slot_names(self.__class__):
+            if attr not in volatile and hasattr(self, attr):
+                state[attr] = getattr(self, attr)
+        return state
+
+    def __setstate__(self, state):
+        """Restore a pickled object and rebuild its runtime attributes."""
+        self._populate_data(state)
+
+        if self.manufacturer is not None:
+            self.vendor = vendor_factory(self.manufacturer)
+
+        self.explicit_acls = self.implicit_acls = self.acls = self.bulk_acls = NO_ACLS
+        self._set_derived_attributes()
+
+    # Attributes that are not pickled because they are rebuilt on load.
+    _volatile_attributes = frozenset([
+        'vendor', 'explicit_acls', 'implicit_acls', 'acls', 'bulk_acls',
+        '_startup_commands', '_commit_commands', 'requires_async_pty',
+        'delimiter',
+    ])
+
+    def _update(self, other):
+        """
+        Replace all of the attributes of this device with those of ``other``,
+        in place, so that existing references to this device see them.
+        """
+        if self._extra_attributes():
+            del self.__dict__
 
-        # Determine whether we require an async pty SSH channel
-        self.requires_async_pty = self._set_requires_async_pty()
+        for attr in _slot_names(self.__class__):
+            if hasattr(other, attr):
+                setattr(self, attr, getattr(other, attr))
+            elif hasattr(self, attr):
+                delattr(self, attr)
 
-        # Set the correct line-ending per vendor
-        self.delimiter = self._set_delimiter()
+        extra = other._extra_attributes()
+        if extra:
+            self.__dict__.update(extra)
+
+    def _profile_key(self):
+        """
+        Return the key of the `~trigger.netdevices.DeviceProfile` that this
+        device shares with similar devices.
+
+        This must include everything that the methods called by
+        `~trigger.netdevices.DeviceProfile` depend upon, so override it if you
+        customize those methods in a subclass.
+        """
+        fields = settings.JUNIPER_FULL_COMMIT_FIELDS or {}
+        return (
+            self.__class__, getattr(self.vendor, 'name', None),
+            self.deviceType, self.make, self.model,
+            tuple(getattr(self, attr, None) for attr in sorted(fields)),
+        )
+
+    def _set_derived_attributes(self):
+        """
+        Set the attributes that are derived from the vendor and deviceType.
+        """
+        profile = profile_factory(self)
+
+        # Copied from the profile the first time they're used (see
+        # startup_commands and commit_commands).
+        self._startup_commands = self._commit_commands = None
+
+        # Whether we require an async pty SSH channel
+        self.requires_async_pty = profile.requires_async_pty
+
+        # The correct line-ending per vendor
+        self.delimiter = profile.delimiter
+
+    @property
+    def startup_commands(self):
+        """The command(s) to run on startup based on deviceType."""
+        if self._startup_commands is None:
+            profile = profile_factory(self)
+            self._startup_commands = list(profile.startup_commands)
+        return self._startup_commands
+
+    @startup_commands.setter
+    def startup_commands(self, value):
+        self._startup_commands = value
+
+    @property
+    def commit_commands(self):
+        """The configuration commit commands (e.g. 'write memory')."""
+        if self._commit_commands is None:
+            profile = profile_factory(self)
+            self._commit_commands = list(profile.commit_commands)
+        return self._commit_commands
+
+    @commit_commands.setter
+    def commit_commands(self, value):
+        self._commit_commands = value
 
     def _populate_data(self, data):
         """
@@ -258,7 +572,16 @@ class NetDevice(object):
         :param data:
             An iterable of key/value pairs
         """
-        self.__dict__.update(data) # Better hope this is a dict!
+        if isinstance(data, dict):
+            data = data.iteritems()
+
+        for key, value in data:
+            try:
+                setattr(self, key, value)
+            except (AttributeError, UnicodeError):
+                # Fields that clash with a read-only property, or that aren't
+                # valid attribute names, can still be found in __dict__.
+                self.__dict__[key] = value
 
     def _cleanup_attributes(self):
         """Perform various cleanup actions. Abstracted for customization."""
@@ -266,7 +589,9 @@ class NetDevice(object):
         if self.nodeName is not None:
             self.nodeName = self.nodeName.lower()
 
-        if self.deviceType is not None:
+        # Only replace the value if it changes, so identical values can stay
+        # shared between devices.
+        if self.deviceType is not None and not self.deviceType.isupper():
             self.deviceType = self.deviceType.upper()
 
         # Make sure the password is bytes not unicode
@@ -429,30 +754,23 @@ class NetDevice(object):
         # Or it's a "commit-configuration full"
         return [JUNIPER_COMMIT_FULL]
 
-    def _bind_dynamic_methods(self):
-        """
-        Bind dynamic methods to the instance. Currently does these:
-
-            + Dynamically bind ~trigger.twister.excute` to .execute()
-            + Dynamically bind ~trigger.twister.connect` to .connect()
-
-        Note that these both rely on the value of the ``vendor`` attribute.
-        """
-        from trigger import twister
-        self.execute = twister.execute.__get__(self, self.__class__)
-        self.connect = twister.connect.__get__(self, self.__class__)
-
-    def _populate_acls(self, aclsdb=None):
+    def _populate_acls(self, aclsdb=None, acls_dict=None):
         """
         Populate the associated ACLs for this device.
 
         :param aclsdb:
             An `~trigger.acl.db.AclsDB` object.
+
+        :param acls_dict:
+            A dict of ACLs for this device as returned by
+            `~trigger.acl.db.AclsDB.get_acl_dict()`. If set, ``aclsdb`` is
+            not consulted.
         """
-        if not aclsdb:
-            return None
+        if acls_dict is None:
+            if not aclsdb:
+                return None
+            acls_dict = aclsdb.get_acl_dict(self)
 
-        acls_dict = aclsdb.get_acl_dict(self)
         self.explicit_acls = acls_dict['explicit']
         self.implicit_acls = acls_dict['implicit']
         self.acls = acls_dict['all']
@@ -580,16 +898,10 @@ class NetDevice(object):
         switches (which behave like Foundry devices) and the Brocade VDX
         switches (which behave differently from classic Foundry devices).
         """
-        if hasattr(self, '_is_brocade_vdx'):
-            return self._is_brocade_vdx
-
         if not (self.vendor == 'brocade' and self.is_switch()):
-            self._is_brocade_vdx = False
             return False
 
-        if self.make is not None:
-            self._is_brocade_vdx = 'vdx' in self.make.lower()
-        return self._is_brocade_vdx
+        return self.make is not None and 'vdx' in self.make.lower()
 
     def is_cisco_asa(self):
         """
@@ -605,19 +917,7 @@ class NetDevice(object):
         assume considering ASA (was PIX) are Cisco's flagship(if not only)
         Firewalls.
         """
-        if hasattr(self, '_is_cisco_asa'):
-            return self._is_cisco_asa
-
-        if not (self.vendor == 'cisco' and self.is_firewall()):
-            self._is_cisco_asa = False
-            return False
-
-        if self.make is not None:
-            self._is_cisco_asa = 'asa' in self.make.lower()
-
-        self._is_cisco_asa = self.vendor == 'cisco' and self.is_firewall()
-
-        return self._is_cisco_asa
+        return self.vendor == 'cisco' and self.is_firewall()
 
     def is_cisco_nexus(self):
         """
@@ -639,7 +939,8 @@ class NetDevice(object):
 
     def has_ssh(self):
         """Am I even listening on SSH?"""
-        return network.test_ssh(self.nodeName)
+        return network.test_ssh(self.nodeName,
+                                self.nodePort or settings.SSH_PORT)
 
     def _can_ssh(self, method):
         """
@@ -665,6 +966,12 @@ class NetDevice(object):
         """Am I enabled to use SSH pty?"""
         return self._can_ssh('pty')
 
+    def can_ssh_exec(self):
+        """Can I run commands in SSH exec channels?"""
+        supported = (self.vendor.name in settings.SSH_EXEC_VENDORS or
+                     self.is_cisco_nexus())
+        return supported and self.can_ssh_async()
+
     def is_reachable(self):
         """Do I respond to a ping?"""
         return network.ping(self.nodeName)
@@ -769,10 +1076,10 @@ class Vendor(object):
         return '<%s: %s>' % (self.__class__.__name__, self.title)
 
     def __eq__(self, other):
-        return self.name.__eq__(Vendor(str(other)).name)
+        return self.name.__eq__(vendor_factory(str(other)).name)
 
     def __contains__(self, other):
-        return self.name.__contains__(Vendor(str(other)).name)
+        return self.name.__contains__(vendor_factory(str(other)).name)
 
     def __hash__(self):
         return hash(self.name)
@@ -780,6 +1087,63 @@ class Vendor(object):
     def lower(self):
         return self.normalized
 
+class DeviceProfile(object):
+    """
+    The attributes of a `~trigger.netdevices.NetDevice` that are derived from
+    its vendor, type, make and model.
+
+    These are the same for every device with the same values for those, so one
+    profile is shared between all of them (see
+    `~trigger.netdevices.profile_factory`). Commands are kept as tuples, and
+    each device copies them into lists of its own when they're first used.
+
+    :param device:
+        The `~trigger.netdevices.NetDevice` to derive the attributes from
+    """
+    __slots__ = ('startup_commands', 'commit_commands', 'requires_async_pty',
+                 'delimiter')
+
+    def __init__(self, device):
+        self.startup_commands = tuple(device._set_startup_commands())
+        self.commit_commands = tuple(device._set_commit_commands())
+        self.requires_async_pty = device._set_requires_async_pty()
+        self.delimiter = device._set_delimiter()
+
+    def __repr__(self):
+        return '<%s: %r>' % (self.__class__.__name__, self.startup_commands)
+
+_profile_registry = {}
+def profile_factory(device):
+    """
+    Retrieve or create the `~trigger.netdevices.DeviceProfile` for ``device``.
+
+    :param device:
+        A `~trigger.netdevices.NetDevice` object
+    """
+    key = device._profile_key()
+    profile = _profile_registry.get(key)
+    if profile is None:
+        profile = _profile_registry[key] = DeviceProfile(device)
+    return profile
+
+_slot_registry = {}
+def _slot_names(cls):
+    """
+    Return the names of the slots of ``cls`` and its bases that hold
+    attributes, in order.
+    """
+    names = _slot_registry.get(cls)
+    if names is None:
+        names = []
+        for klass in reversed(cls.__mro__):
+            slots = klass.__dict__.get('__slots__', ())
+            if isinstance(slots, basestring):
+                slots = (slots,)
+            names.extend(n for n in slots
+                         if n not in ('__dict__', '__weakref__'))
+        names = _slot_registry[cls] = tuple(names)
+    return names
+
 _vendor_registry = {}
 def vendor_factory(vendor_name):
     """
@@ -791,7 +1155,10 @@ def vendor_factory(vendor_name):
     :param vendor_name:
         The vendor's full manufacturer name (e.g. 'CISCO SYSTEMS')
     """
-    return _vendor_registry.setdefault(vendor_name, Vendor(vendor_name))
+    vendor = _vendor_registry.get(vendor_name)
+    if vendor is None:
+        vendor = _vendor_registry[vendor_name] = Vendor(vendor_name)
+    return vendor
 
 
 class NetDevices(DictMixin):
@@ -834,10 +1201,237 @@ class NetDevices(DictMixin):
             instance as first argument (got str instance instead)
         """
         def __init__(self, production_only, with_acls):
+            self.production_only = production_only
+            self.with_acls = with_acls
             self._dict = {}
+
+            # Take note of the state of the source before reading it, so that
+            # any change made while reading is picked up by reload().
+            self._source_key = snapshot.snapshot_key(settings.NETDEVICES_SOURCE)
+            self._digests = {}
+
             _populate(netdevices=self._dict,
                       data_source=settings.NETDEVICES_SOURCE,
-                      production_only=production_only, with_acls=with_acls)
+                      production_only=production_only, with_acls=with_acls,
+                      snapshot_file=settings.NETDEVICES_SNAPSHOT_FILE)
+            self._reset_indexes()
+
+        def reload(self, force=False):
+            """
+            Re-read :setting:`NETDEVICES_SOURCE` and bring the devices up to
+            date, only rebuilding devices whose source records have changed.
+
+            Changed devices are updated in place, so existing references to
+            them see the changes. New devices are added and devices that are
+            gone are removed. The indexes used by `find()`, `match()` and
+            `search()` are updated to match.
+
+            If the source is a local file or directory, and neither it nor
+            the settings have changed since it was last read, nothing is read
+            at all, so this is cheap enough to call often (see
+            :setting:`NETDEVICES_RELOAD_INTERVAL`). This is not thread-safe,
+            so call it from the reactor thread.
+
+            :param force:
+                Re-read the source even if it doesn't appear to have changed.
+
+            :returns:
+                A dict of sorted lists of the names of the devices that were
+                ``added``, ``changed`` and ``removed``.
+            """
+            changes = {'added': [], 'changed': [], 'removed': []}
+            data_source = settings.NETDEVICES_SOURCE
+            source_key = snapshot.snapshot_key(data_source)
+            if not force and source_key is not None and \
+                    source_key == self._source_key:
+                return changes
+
+            log.msg('RELOADING NetDevices FROM: %s' % data_source)
+            device_data = _munge_source_data(
+                data_source=data_source, **_loader_hints(self.production_only)
+            )
+
+            # Read everything before changing anything, so that a failure
+            # leaves the devices as they were. Records that are identical to
+            # last time are recognized by their digest and not rebuilt.
+            old_digests = self._digests
+            digests = {}
+            devices = {}
+            strings = {}
+            for obj in device_data:
+                data = _share_strings(obj, strings)
+                digest = _record_digest(data)
+                name = old_digests.get(digest, '')
+                if name is None or name in self._dict:
+                    digests[digest] = name
+                    if name is not None:
+                        devices[name] = self._dict[name]
+                    continue
+
+                dev = NetDevice(data=data)
+                if _keep_device(dev, self.production_only):
+                    digests[digest] = dev.nodeName
+                    devices[dev.nodeName] = dev
+                else:
+                    digests[digest] = None
+
+            # Work out what changed. Devices without a digest from last time
+            # (e.g. loaded from a snapshot) are compared by their state.
+            for name, dev in devices.iteritems():
+                old = self._dict.get(name)
+                if old is None:
+                    changes['added'].append(name)
+                elif old is not dev and \
+                        old.__getstate__() != dev.__getstate__():
+                    changes['changed'].append(name)
+            changes['removed'] = [name for name in self._dict
+                                  if name not in devices]
+
+            self._apply_changes(changes, devices)
+            self._digests = digests
+            self._source_key = source_key
+
+            for key in changes:
+                changes[key].sort()
+            log.msg('RELOADED NetDevices: %d added, %d changed, %d removed' %
+                    tuple(len(changes[k]) for k in ('added', 'changed',
+                                                    'removed')))
+            return changes
+
+        def _apply_changes(self, changes, devices):
+            """
+            Apply the ``changes`` found by `reload()`, taking new and changed
+            devices from ``devices``, and keep the indexes consistent.
+            """
+            trie = self._trie
+            for name in changes['removed']:
+                self._unindex(name, self._dict.pop(name))
+                if trie is not None:
+                    trie.remove(name)
+
+            updated = []
+            for name in changes['changed']:
+                dev = self._dict[name]
+                self._unindex(name, dev)
+                dev._update(devices[name])
+                self._index(name, dev)
+                updated.append(dev)
+
+            for name in changes['added']:
+                dev = self._dict[name] = devices[name]
+                self._index(name, dev)
+                if trie is not None:
+                    trie.add(name)
+                updated.append(dev)
+
+            if changes['added'] or changes['removed']:
+                self._positions = None
+
+            all_field_names = getattr(self, '_all_field_names', None)
+            if all_field_names:
+                for dev in updated:
+                    all_field_names.update((f.lower(), f)
+                                           for f in dev._field_names())
+
+            if self.with_acls and updated:
+                acl_dicts = AclsDB().get_acl_dicts(updated)
+                for dev in updated:
+                    dev._populate_acls(acls_dict=acl_dicts[dev.nodeName])
+
+        def _index(self, name, dev):
+            """Add ``dev`` to every field index that has been built."""
+            self._update_indexes(name, dev, add=True)
+
+        def _unindex(self, name, dev):
+            """Remove ``dev`` from every field index that has been built."""
+            self._update_indexes(name, dev, add=False)
+
+        def _update_indexes(self, name, dev, add):
+            """Guts for `_index()` and `_unindex()`."""
+            for cache_key, index in self._indexes.items():
+                field, lowercase = cache_key
+                if lowercase:
+                    value = str(getattr(dev, field, '')).lower()
+                else:
+                    value = getattr(dev, field, None)
+
+                # A raw index can't hold values that aren't strings, and one
+                # that couldn't be built before might be possible now, so
+                # start over next time.
+                if index is None or not isinstance(value, basestring):
+                    del self._indexes[cache_key]
+                elif add:
+                    index.add(name, value)
+                else:
+                    index.remove(name, value)
+
+        def _reset_indexes(self):
+            """
+            Forget all field indexes so they are rebuilt on next use. Call
+            this after changing the attributes of any device that you intend
+            to search on.
+            """
+            self._indexes = {}
+            self._positions = None
+            self._trie = None
+
+        def _get_trie(self):
+            """
+            Return the `~trigger.netdevices.index.PrefixTrie` of device names,
+            building it first if needed.
+            """
+            if self._trie is None:
+                self._trie = PrefixTrie(self._dict)
+            return self._trie
+
+        def _get_index(self, field, lowercase=False):
+            """
+            Return the `~trigger.netdevices.index.FieldIndex` for ``field``,
+            building it first if needed.
+
+            If ``lowercase`` is set, values are indexed as
+            ``str(value).lower()`` as used by `match()`, and devices missing
+            ``field`` are indexed as ``''``. Otherwise the raw values are
+            indexed as used by `search()`, and ``None`` is returned if any
+            device lacks ``field`` or has a non-string value for it.
+            """
+            cache_key = (field, lowercase)
+            if cache_key in self._indexes:
+                return self._indexes[cache_key]
+
+            if lowercase:
+                items = ((name, str(getattr(dev, field, '')).lower())
+                         for name, dev in self._dict.iteritems())
+                index = FieldIndex(items)
+            else:
+                index = FieldIndex()
+                for name, dev in self._dict.iteritems():
+                    value = getattr(dev, field, None)
+                    if not isinstance(value, basestring):
+                        index = None
+                        break
+                    index.add(name, value)
+
+            self._indexes[cache_key] = index
+            return index
+
+        def _ordered(self, names):
+            """
+            Return the devices for ``names`` in the same order as `all()`.
+            """
+            # For large results a filtered pass over the dict is cheaper than
+            # sorting.
+            if len(names) * 4 >= len(self._dict):
+                return [dev for name, dev in self._dict.iteritems()
+                        if name in names]
+
+            positions = self._positions
+            if positions is None or len(positions) != len(self._dict):
+                positions = dict((name, idx) for idx, name in
+                                 enumerate(self._dict))
+                self._positions = positions
+            return [self._dict[name] for name in
+                    sorted(names, key=positions.__getitem__)]
 
         def __getitem__(self, key):
             return self._dict[key]
@@ -858,6 +1452,9 @@ class NetDevices(DictMixin):
             then any of find('test1-abc') or find('test1-abc.net') or
             find('test1-abc.net.aol.com') will match, but not find('test1').
 
+            If more than one device matches the prefix, the one with the
+            lowest labels is returned.
+
             :param string key: Hostname prefix to find.
             :returns: NetDevice object
             """
@@ -865,12 +1462,29 @@ class NetDevices(DictMixin):
             if key in self:
                 return self[key]
 
-            matches = [x for x in self.keys() if x.startswith(key + '.')]
-
-            if matches:
-                return self[matches[0]]
+            match = self._get_trie().find(key)
+            if match is not None:
+                return self[match]
             raise KeyError(key)
 
+        def find_many(self, keys):
+            """
+            Like `find()`, but for many ``keys`` at once. Rather than raising
+            ``KeyError``, ``None`` is returned for any key that can't be
+            found.
+
+            :param keys: An iterable of hostname prefixes to find.
+            :returns: List of NetDevice objects (or ``None``) in the same
+                order as ``keys``
+            """
+            results = []
+            for key in keys:
+                try:
+                    results.append(self.find(key))
+                except KeyError:
+                    results.append(None)
+            return results
+
         def all(self):
             """Returns all NetDevice objects."""
             return self.values()
@@ -906,7 +1520,15 @@ class NetDevices(DictMixin):
             # implications in outside dependencies.
             #return self.match(**{field:token})
 
-            return [x for x in self.all() if token in getattr(x, field)]
+            # Fields that can't be indexed (e.g. not present on every device)
+            # fall back to a scan, so errors are still raised as expected.
+            index = None
+            if isinstance(token, basestring):
+                index = self._get_index(field)
+            if index is None:
+                return [x for x in self.all() if token in getattr(x, field)]
+
+            return self._ordered(index.lookup(token))
 
         def match(self, **kwargs):
             """
@@ -917,6 +1539,11 @@ class NetDevices(DictMixin):
             Keys and values are case IN-senstitive. Matches against non-string
             values will FAIL.
 
+            Each field is indexed the first time it is matched on, so that
+            subsequent queries are set intersections instead of full scans.
+            If you modify device attributes afterward, call
+            ``_reset_indexes()`` for the changes to be reflected.
+
             Example by reference::
 
                 >>> nd = NetDevices()
@@ -935,28 +1562,29 @@ class NetDevices(DictMixin):
             if not all_field_names:
                 # Merge in field_names from every NetDevice
                 for dev in self.all():
-                    dev_fields = ((f.lower(), f) for f in dev.__dict__)
+                    dev_fields = ((f.lower(), f) for f in dev._field_names())
                     all_field_names.update(dev_fields)
                 self._all_field_names = all_field_names
 
-            # An iterator so we can filtering functionally
-            devices = iter(self.all())
+            # No filters means everything.
+            if not kwargs:
+                return iter(self.all())
 
             def map_attr(attr):
                 """Helper function for lower-to-regular attribute mapping."""
                 return self._all_field_names[attr.lower()]
 
-            # Use list comp. to keep filtering out the devices.
+            # Intersect the matching names for each field.
+            names = None
             for attr, val in kwargs.iteritems():
                 attr = map_attr(attr)
                 val = str(val).lower()
-                devices = [
-                    d for d in devices if (
-                        val in str(getattr(d, attr, '')).lower()
-                    )
-                ]
+                matches = self._get_index(attr, lowercase=True).lookup(val)
+                names = matches if names is None else names & matches
+                if not names:
+                    return []
 
-            return devices
+            return self._ordered(names)
 
         def get_devices_by_type(self, devtype):
             """
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-memory indexes used to speed up lookups against
+`~trigger.netdevices.NetDevices`.
+
+`~trigger.netdevices.index.FieldIndex` answers "which devices have a value
+for this field that contains this substring?" without scanning every device.
+It maps each distinct value to the set of device names having that value, and
+each n-gram (a 3-character substring by default) to the set of distinct values
+containing it. A query is answered by intersecting the posting sets for the
+n-grams of the query, and verifying the (usually few) surviving values.
+
+`~trigger.netdevices.index.PrefixTrie` resolves dot-delimited prefixes of
+device names (e.g. ``'test1-abc'`` or ``'test1-abc.net'``) to a full name in
+time proportional to the number of labels in the prefix.
+
+Indexes are built lazily by `~trigger.netdevices.NetDevices` the first time a
+field is queried and kept for the life of the singleton.
+"""
+
+
+# Exports
+__all__ = ('FieldIndex', 'PrefixTrie')
+
+
+# Classes
+class FieldIndex(object):
+    """
+    A substring index over the values of a single field.
+
+    Values must be strings. Lookups are exact with respect to case, so callers
+    wanting case-insensitive matching should lowercase values and tokens
+    themselves.
+
+    :param items:
+        An optional iterable of ``(key, value)`` pairs to index.
+
+    :param gram_size:
+        The length of the n-grams to index.
+    """
+    # Stop intersecting n-gram postings once there are this few candidates.
+    verify_threshold = 32
+
+    def __init__(self, items=None, gram_size=3):
+        self.gram_size = gram_size
+        self._keys = {}   # value -> set of keys
+        self._grams = {}  # n-gram -> set of values
+        if items is not None:
+            for key, value in items:
+                self.add(key, value)
+
+    def __len__(self):
+        return sum(len(keys) for keys in self._keys.itervalues())
+
+    def _ngrams(self, value):
+        """Return the set of n-grams found in ``value``."""
+        size = self.gram_size
+        return set([value[i:i + size] for i in xrange(len(value) - size + 1)])
+
+    def add(self, key, value):
+        """
+        Index ``key`` under ``value``.
+
+        :param key:
+            The key to return from lookups (e.g. a nodeName)
+
+        :param value:
+            The string value of the field for ``key``
+        """
+        keys = self._keys.get(value)
+        if keys is None:
+            keys = self._keys[value] = set()
+            grams = self._grams
+            for gram in self._ngrams(value):
+                values = grams.get(gram)
+                if values is None:
+                    grams[gram] = set([value])
+                else:
+                    values.add(value)
+        keys.add(key)
+
+    def remove(self, key, value):
+        """
+        Remove ``key`` from the index for ``value``. Does nothing if it isn't
+        there.
+        """
+        keys = self._keys.get(value)
+        if keys is None:
+            return None
+
+        keys.discard(key)
+        if keys:
+            return None
+
+        # That was the last key with this value, so forget the value.
+        del self._keys[value]
+        for gram in self._ngrams(value):
+            values = self._grams.get(gram)
+            if values is None:
+                continue
+            values.discard(value)
+            if not values:
+                del self._grams[gram]
+
+    def _candidates(self, token):
+        """Return the distinct values that may contain ``token``."""
+        if len(token) < self.gram_size:
+            return self._keys
+
+        postings = []
+        for gram in self._ngrams(token):
+            values = self._grams.get(gram)
+            if not values:
+                return ()
+            postings.append(values)
+
+        # Intersect starting with the smallest set to keep it cheap. If even
+        # the smallest set covers most values, or the candidates are already
+        # few, checking the values directly is cheaper than intersecting.
+        postings.sort(key=len)
+        candidates = postings[0]
+        if len(candidates) * 2 > len(self._keys):
+            return self._keys
+        for values in postings[1:]:
+            if len(candidates) <= self.verify_threshold:
+                break
+            candidates = candidates.intersection(values)
+        return candidates
+
+    def lookup(self, token):
+        """
+        Return the set of keys whose value contains ``token``.
+
+        :param token:
+            The substring to look for
+        """
+        matches = set()
+        for value in self._candidates(token):
+            if token in value:
+                matches.update(self._keys[value])
+        return matches
+
+    def exact(self, value):
+        """
+        Return the set of keys whose value is exactly ``value``.
+        """
+        return set(self._keys.get(value, ()))
+
+
+class _TrieNode(object):
+    """A node in a `~trigger.netdevices.index.PrefixTrie`."""
+    __slots__ = ('children', 'count', 'name')
+
+    def __init__(self):
+        self.children = {}  # label -> _TrieNode, or a name if it's the only one
+        self.count = 0      # Number of names at or below this node
+        self.name = None    # Set if a name ends at this node
+
+
+class PrefixTrie(object):
+    """
+    A trie of dot-delimited names (such as FQDNs) keyed on their labels.
+
+    Paths are compressed: a label with only a single name below it stores that
+    name instead of a chain of nodes, so most names only cost one entry.
+
+    :param names:
+        An optional iterable of names to add.
+
+    :param sep:
+        The label separator.
+    """
+    def __init__(self, names=None, sep='.'):
+        self.sep = sep
+        self._root = _TrieNode()
+        self._names = set()
+        if names is not None:
+            for name in names:
+                self.add(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def _place(self, node, name, depth):
+        """Put ``name`` directly beneath an empty ``node`` at ``depth``."""
+        labels = name.split(self.sep)
+        node.count += 1
+        if depth == len(labels):
+            node.name = name
+        else:
+            node.children[labels[depth]] = name
+
+    def add(self, name):
+        """Add ``name`` to the trie."""
+        if name in self._names:
+            return None
+        self._names.add(name)
+
+        labels = name.split(self.sep)
+        node = self._root
+        for depth, label in enumerate(labels):
+            node.count += 1
+            child = node.children.get(label)
+            if child is None:
+                node.children[label] = name
+                return None
+
+            # Expand a compressed name into a node so both names fit.
+            if isinstance(child, basestring):
+                other = child
+                child = node.children[label] = _TrieNode()
+                self._place(child, other, depth + 1)
+            node = child
+
+        node.count += 1
+        node.name = name
+
+    def remove(self, name):
+        """Remove ``name`` from the trie. Does nothing if it isn't there."""
+        if name not in self._names:
+            return None
+        self._names.discard(name)
+
+        labels = name.split(self.sep)
+        path = []
+        node = self._root
+        for label in labels:
+            node.count -= 1
+            child = node.children[label]
+            if isinstance(child, basestring):
+                del node.children[label]
+                break
+            path.append((node, label))
+            node = child
+        else:
+            node.count -= 1
+            node.name = None
+
+        # Prune any nodes that no longer lead anywhere.
+        for parent, label in reversed(path):
+            if parent.children[label].count:
+                break
+            del parent.children[label]
+
+    def find(self, prefix):
+        """
+        Return a name that is either ``prefix`` itself, or begins with
+        ``prefix`` followed by the separator. Returns ``None`` if there isn't
+        one.
+
+        If several names match, the one with the lowest labels wins, so
+        results are stable.
+
+        :param prefix:
+            The name or dot-delimited prefix to look for
+        """
+        labels = prefix.split(self.sep)
+        node = self._root
+        for depth, label in enumerate(labels):
+            child = node.children.get(label)
+            if child is None:
+                return None
+
+            # Only one name lies below here, so it either matches or nothing
+            # does.
+            if isinstance(child, basestring):
+                if child.split(self.sep)[:len(labels)] == labels:
+                    return child
+                return None
+            node = child
+
+        # Prefer an exact match, then descend along the lowest labels.
+        while node.name is None:
+            child = node.children[min(node.children)]
+            if isinstance(child, basestring):
+                return child
+            node = child
+        return node.name
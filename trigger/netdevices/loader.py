@@ -13,6 +13,18 @@ be also be a list/tuple of [data_source, *args]
 
 The loader must return an iterable of key/value pairs (dicts, 2-tuples, etc.).
 
+Loaders may also be passed these optional hints in ``kwargs``, which they are
+free to ignore. They exist so that loaders backed by a database can avoid
+returning devices or fields that would only be thrown away:
+
+``filters``
+    A dict of field names to values. Only devices whose fields equal these
+    values are wanted. (See `~trigger.netdevices.loader.pushable_filters`.)
+``fields``
+    A list (or comma-separated string, e.g. from the query string of
+    :setting:`NETDEVICES_SOURCE`) of the only field names that are wanted. (See
+    `~trigger.netdevices.loader.parse_fields`.)
+
 Each loader should have an ``is_usable`` attribute set. This is a boolean that
 specifies whether the loader can be used with this Python installation. Each
 loader is responsible for setting this when it is initialized.
@@ -33,7 +45,19 @@ from twisted.python import log
 
 
 # Exports
-__all__ = ('BaseLoader', 'load_metadata')
+__all__ = ('BaseLoader', 'load_metadata', 'parse_fields', 'pushable_filters')
+
+
+# Constants
+# Fields that are always loaded when a loader honors the ``fields`` hint.
+REQUIRED_FIELDS = ('nodeName', 'adminStatus', 'manufacturer', 'deviceType')
+
+# Fields whose final value on a NetDevice may be derived from other fields,
+# mapped to those fields. A filter on one of these can't be applied to the
+# stored value when any of the fields it is derived from are present.
+DERIVED_FIELDS = {
+    'adminStatus': ('deviceStatus',),
+}
 
 
 # Classes
@@ -64,6 +88,55 @@ class BaseLoader(object):
 
 
 # Functions
+def parse_fields(fields, required=REQUIRED_FIELDS):
+    """
+    Return a sorted list of the field names in a ``fields`` hint, including
+    ``required``, or ``None`` if every field is wanted.
+
+    :param fields:
+        A list of field names, a comma-separated string of field names, or
+        ``None``.
+
+    :param required:
+        Field names to include whenever ``fields`` is set
+    """
+    if not fields:
+        return None
+    if isinstance(fields, basestring):
+        fields = fields.split(',')
+    fields = set(f.strip() for f in fields)
+    fields.update(required)
+    fields.discard('')
+    return sorted(fields)
+
+def pushable_filters(filters, fields=None):
+    """
+    Return a list of ``(field, value, derived_from)`` for each of the
+    ``filters`` that a loader may apply to stored data, where ``derived_from``
+    is a tuple of other fields that may override the stored value of
+    ``field``.
+
+    :param filters:
+        A dict of field names to values, or ``None``.
+
+    :param fields:
+        If set, only return filters that can be evaluated against these (e.g.
+        the columns of a table). Filters on fields that may be derived from
+        any of these are dropped, since the stored value isn't the final
+        value.
+    """
+    pushable = []
+    for field, value in sorted((filters or {}).iteritems()):
+        derived_from = DERIVED_FIELDS.get(field, ())
+        if fields is not None:
+            if field not in fields:
+                continue
+            if any(f in fields for f in derived_from):
+                continue
+            derived_from = ()
+        pushable.append((field, value, derived_from))
+    return pushable
+
 def find_data_loader(loader):
     """
     Given a ``loader`` string/list/tuple, try to unpack, load it, and return the
@@ -11,8 +11,10 @@ __version__ = '1.1'
 
 import itertools
 import os
+import re
 from trigger.conf import settings
-from trigger.netdevices.loader import BaseLoader
+from trigger.netdevices.loader import (BaseLoader, parse_fields,
+                                       pushable_filters)
 from trigger import exceptions, rancid
 from trigger.exceptions import LoaderFailed
 try:
@@ -27,20 +29,171 @@ try:
 except ImportError:
     SQLITE_AVAILABLE = False
 
+# Constants
+# How much of a JSON file to read at a time when streaming it.
+JSON_CHUNK_SIZE = 64 * 1024
+
+# Matches the whitespace allowed between JSON tokens.
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+# Functions
+def iter_json_array(fileobj, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Incrementally decode a JSON array from ``fileobj``, yielding one element at
+    a time, so that only a single element (plus a chunk of raw text) needs to
+    be held in memory rather than the entire document.
+
+    :param fileobj:
+        A file-like object positioned at the start of a JSON array
+
+    :param chunk_size:
+        The number of bytes to read from ``fileobj`` at a time
+    """
+    decoder = json.JSONDecoder()
+    skip = JSON_WHITESPACE.match
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill(buf, pos):
+        """Read another chunk, discarding everything before ``pos``."""
+        chunk = fileobj.read(chunk_size)
+        return buf[pos:] + chunk, 0, not chunk
+
+    # Find the opening bracket.
+    while True:
+        pos = skip(buf, pos).end()
+        if pos < len(buf) or eof:
+            break
+        buf, pos, eof = fill(buf, pos)
+    if buf[pos:pos + 1] != '[':
+        raise ValueError('Expecting JSON array at position %d' % pos)
+    pos += 1
+
+    expect_value = None  # None until the first element, then after a comma
+    while True:
+        pos = skip(buf, pos).end()
+        if pos == len(buf):
+            if eof:
+                raise ValueError('Unterminated JSON array')
+            buf, pos, eof = fill(buf, pos)
+            continue
+
+        char = buf[pos]
+        if char == ']' and not expect_value:
+            return
+        if expect_value is False:
+            if char != ',':
+                raise ValueError("Expecting ',' delimiter at position %d" %
+                                 pos)
+            pos += 1
+            expect_value = True
+            continue
+
+        # Decode the next element. If it runs past the end of the buffer, or
+        # ends exactly at it (a number may continue in the next chunk), read
+        # some more and try again.
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise
+            buf, pos, eof = fill(buf, pos)
+            continue
+        if end == len(buf) and not eof:
+            buf, pos, eof = fill(buf, pos)
+            continue
+
+        pos = end
+        expect_value = False
+        yield obj
+
+
+def stream_records(data_source, fileobj, records):
+    """
+    Yield from ``records``, closing ``fileobj`` once they're exhausted.
+
+    Records are parsed as they're consumed, so errors found partway through
+    ``data_source`` are raised from here as `~trigger.exceptions.LoaderFailed`.
+    """
+    try:
+        for record in records:
+            yield record
+    except (ValueError, SyntaxError) as err:
+        raise LoaderFailed("Tried %r; and failed: %r" % (data_source, err))
+    finally:
+        fileobj.close()
+
+def iter_xml_devices(fileobj, tag='device'):
+    """
+    Incrementally parse XML from ``fileobj``, yielding a list of ``(tag,
+    text)`` pairs for each ``tag`` element directly beneath the root.
+
+    Each element is discarded once it has been yielded, so only a single
+    device needs to be held in memory rather than the entire tree.
+
+    :param fileobj:
+        A file-like object containing XML
+
+    :param tag:
+        The tag of the elements to yield
+    """
+    context = ET.iterparse(fileobj, events=('start', 'end'))
+    event, root = next(context)
+    depth = 1
+    for event, elem in context:
+        if event == 'start':
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 1:
+            if elem.tag == tag:
+                yield [(e.tag, e.text) for e in elem]
+            # Throw away everything parsed so far.
+            root.clear()
+
+
+# Classes
 class JSONLoader(BaseLoader):
     """
     Wrapper for loading metadata via JSON from the filesystem.
 
-    Parse 'netdevices.json' and return list of JSON objects.
+    Parse 'netdevices.json' and return an iterator of JSON objects.
+
+    If the file contains a JSON array (as it should), the devices are decoded
+    one at a time as they are consumed, so that very large files don't need
+    to be held in memory all at once.
     """
     is_usable = True
 
     def get_data(self, data_source):
-        with open(data_source, 'r') as contents:
-            # TODO (jathan): Can we somehow return an generator like the other
-            # _parse methods? Maybe using JSONDecoder?
-            data = json.load(contents)
-        return data
+        contents = open(data_source, 'r')
+        try:
+            start = contents.read(JSON_CHUNK_SIZE)
+            if start.lstrip()[:1] != '[':
+                # Not an array, so there is nothing to stream.
+                data = json.loads(start + contents.read())
+                contents.close()
+                return data
+
+            contents.seek(0)
+            records = iter_json_array(contents)
+
+            # Decode the first record now, so that a file that isn't JSON at
+            # all fails here and the next loader gets a chance.
+            try:
+                first = next(records)
+            except StopIteration:
+                contents.close()
+                return []
+        except Exception:
+            contents.close()
+            raise
+
+        return stream_records(data_source, contents,
+                              itertools.chain([first], records))
 
     def load_data_source(self, data_source, **kwargs):
         try:
@@ -54,10 +207,22 @@ class XMLLoader(BaseLoader):
 
     Parse 'netdevices.xml' and return a list of node 2-tuples (key, value).
     These are as good as a dict without the extra dict() call.
+
+    By default the whole file is parsed into a tree up front. For very large
+    files, add ``?xml_mode=iterparse`` to :setting:`NETDEVICES_SOURCE` to parse
+    devices one at a time as they are loaded, which uses far less memory.
     """
     is_usable = True
+    xml_modes = ('parse', 'iterparse')
+
+    def get_data(self, data_source, xml_mode='parse'):
+        if xml_mode not in self.xml_modes:
+            raise ValueError('xml_mode must be one of %r, not %r' %
+                             (self.xml_modes, xml_mode))
+
+        if xml_mode == 'iterparse':
+            return self._iterparse(data_source)
 
-    def get_data(self, data_source):
         #Parsing the complete file into a tree once and extracting outthe
         # device nodes is faster than using iterparse(). Curses!!
         xml = ET.parse(data_source).findall('device')
@@ -67,9 +232,28 @@ class XMLLoader(BaseLoader):
 
         return data
 
+    def _iterparse(self, data_source):
+        contents = open(data_source, 'rb')
+        records = iter_xml_devices(contents)
+
+        # Parse the first device now, so that a file that isn't XML at all
+        # fails here and the next loader gets a chance.
+        try:
+            first = next(records)
+        except StopIteration:
+            contents.close()
+            return []
+        except Exception:
+            contents.close()
+            raise
+
+        return stream_records(data_source, contents,
+                              itertools.chain([first], records))
+
     def load_data_source(self, data_source, **kwargs):
+        xml_mode = kwargs.get('xml_mode', 'parse')
         try:
-            return self.get_data(data_source)
+            return self.get_data(data_source, xml_mode)
         except Exception as err:
             raise LoaderFailed("Tried %r; and failed: %r" % (data_source, err))
 
@@ -101,10 +285,53 @@ class SQLiteLoader(BaseLoader):
     Wrapper for loading metadata via SQLite from the filesystem.
 
     Parse 'netdevices.sql' and return a list of stuff.
+
+    The ``filters`` and ``fields`` hints are turned into a ``WHERE`` clause and
+    column list, and rows are returned as they are fetched.
     """
     is_usable = SQLITE_AVAILABLE
 
-    def get_data(self, data_source, table_name='netdevices'):
+    def _quote(self, name):
+        """Quote an identifier for use in SQL."""
+        return '"%s"' % name.replace('"', '""')
+
+    def build_query(self, table_name, columns, filters=None, fields=None):
+        """
+        Return a tuple of ``(sql, params, columns)`` to select devices from
+        ``table_name``, where ``columns`` are the columns that will be
+        returned.
+
+        :param table_name:
+            Name of the table
+
+        :param columns:
+            The names of all of the columns in the table
+
+        :param filters:
+            The ``filters`` hint
+
+        :param fields:
+            The ``fields`` hint
+        """
+        wanted = parse_fields(fields)
+        if wanted is not None:
+            columns = [c for c in columns if c in wanted]
+            select = ', '.join(self._quote(c) for c in columns)
+        else:
+            select = '*'
+        sql = 'select %s from %s' % (select, table_name)
+
+        where, params = [], []
+        for field, value, _ in pushable_filters(filters, columns):
+            where.append('%s = ?' % self._quote(field))
+            params.append(value)
+        if where:
+            sql += ' where ' + ' and '.join(where)
+
+        return sql, params, columns
+
+    def get_data(self, data_source, table_name='netdevices', filters=None,
+                 fields=None):
         connection = sqlite3.connect(data_source)
         cursor = connection.cursor()
 
@@ -113,21 +340,30 @@ class SQLiteLoader(BaseLoader):
         results = colfetch.fetchall()
         columns = [r[1] for r in results]
 
-        # And the devices. This is a list of tuples whose values match the indexes
-        # of the column names.
-        devfetch = cursor.execute('select * from %s' % table_name)
-        devrows = devfetch.fetchall()
+        # And the devices. Each row is a tuple whose values match the indexes
+        # of the column names, fetched from the cursor as they're consumed.
+        sql, params, columns = self.build_query(table_name, columns, filters,
+                                                fields)
+        devfetch = cursor.execute(sql, params)
 
         # Another generator within a generator, which structurally is a list of
         # lists containing 2-tuples (key, value).
-        data = (itertools.izip(columns, row) for row in devrows)
+        return self._stream(connection, columns, devfetch)
 
-        return data
+    def _stream(self, connection, columns, rows):
+        """Yield rows as lists of pairs, closing ``connection`` when done."""
+        try:
+            for row in rows:
+                yield itertools.izip(columns, row)
+        finally:
+            connection.close()
 
     def load_data_source(self, data_source, **kwargs):
         table_name = kwargs.get('table_name', 'netdevices')
+        filters = kwargs.get('filters')
+        fields = kwargs.get('fields')
         try:
-            return self.get_data(data_source, table_name)
+            return self.get_data(data_source, table_name, filters, fields)
         except Exception as err:
             raise LoaderFailed("Tried %r; and failed: %r" % (data_source, err))
 
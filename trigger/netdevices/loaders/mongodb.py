@@ -1,4 +1,6 @@
-from trigger.netdevices.loader import BaseLoader
+import itertools
+from trigger.netdevices.loader import (BaseLoader, parse_fields,
+                                       pushable_filters)
 from trigger.exceptions import LoaderFailed
 try:
     from pymongo import MongoClient
@@ -7,6 +9,10 @@ except ImportError:
 else:
     PYMONGO_AVAILABLE = True
 
+# Constants
+# How many documents to fetch from the server at a time.
+BATCH_SIZE = 1000
+
 class MongoDBLoader(BaseLoader):
     """
     Wrapper for loading metadata via MongoDB.
@@ -14,23 +20,89 @@ class MongoDBLoader(BaseLoader):
     To use this define ``NETDEVICES_SOURCE`` in this format::
 
         mongodb://host:port/?database={database}?table_name={table_name}
+
+    You may also add ``batch_size={batch_size}`` to control how many documents
+    are fetched from the server at a time, and ``fields={field1,field2}`` to
+    only fetch the fields you need.
+
+    The ``filters`` and ``fields`` hints are turned into a query and
+    projection, and documents are returned as they are fetched.
     """
     is_usable = PYMONGO_AVAILABLE
- 
-    def get_data(self, data_source, host, port, database, table_name):
+
+    def build_query(self, filters=None, fields=None):
+        """
+        Return a tuple of ``(query, projection)`` to pass to ``find()``.
+
+        :param filters:
+            The ``filters`` hint
+
+        :param fields:
+            The ``fields`` hint
+        """
+        clauses = []
+        for field, value, derived_from in pushable_filters(filters):
+            clause = {field: value}
+            if derived_from:
+                # The stored value may be overridden, so keep any document
+                # that has a field it could be derived from.
+                alternatives = [{f: {'$exists': True}} for f in derived_from]
+                clause = {'$or': [clause] + alternatives}
+            clauses.append(clause)
+
+        if not clauses:
+            query = {}
+        elif len(clauses) == 1:
+            query = clauses[0]
+        else:
+            query = {'$and': clauses}
+
+        wanted = parse_fields(fields)
+        if wanted is not None:
+            projection = dict((f, True) for f in wanted)
+        else:
+            projection = None
+
+        return query, projection
+
+    def get_data(self, data_source, host, port, database, table_name,
+                 filters=None, fields=None, batch_size=BATCH_SIZE):
         client = MongoClient(host, port)
         collection = client[database][table_name]
-        data = []
-        for device in collection.find():
-            data.append(device)
-        return data
- 
+        query, projection = self.build_query(filters, fields)
+        cursor = collection.find(query, projection).batch_size(batch_size)
+
+        # Fetch the first document now, so that connection errors are raised
+        # here and the next loader gets a chance.
+        try:
+            first = next(cursor)
+        except StopIteration:
+            client.close()
+            return []
+        except Exception:
+            client.close()
+            raise
+
+        return self._stream(client, itertools.chain([first], cursor))
+
+    def _stream(self, client, cursor):
+        """Yield documents from ``cursor``, closing ``client`` when done."""
+        try:
+            for device in cursor:
+                yield device
+        finally:
+            client.close()
+
     def load_data_source(self, data_source, **kwargs):
         host = kwargs.get('hostname')
         port = kwargs.get('port')
         database = kwargs.get('database')
         table_name = kwargs.get('table_name')
+        filters = kwargs.get('filters')
+        fields = kwargs.get('fields')
         try:
-            return self.get_data(data_source, host, port, database, table_name)
+            batch_size = int(kwargs.get('batch_size', BATCH_SIZE))
+            return self.get_data(data_source, host, port, database, table_name,
+                                 filters, fields, batch_size)
         except Exception as err:
             raise LoaderFailed("Tried %r; and failed: %r" % (data_source, err))
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+"""
+Persistent snapshots of compiled `~trigger.netdevices.NetDevice` objects.
+
+Parsing :setting:`NETDEVICES_SOURCE` and building every
+`~trigger.netdevices.NetDevice` object is the most expensive part of starting
+any Trigger tool. When :setting:`NETDEVICES_SNAPSHOT_FILE` is set, the compiled
+device objects are pickled to that file and loaded directly on subsequent
+startups for as long as the source data is unchanged.
+
+A snapshot is keyed on:
+
++ The value of :setting:`NETDEVICES_SOURCE`
++ The modification time and size of the source (or, for a directory such as a
+  RANCID root, of every file within it)
++ A digest of the settings that influence how device objects are built
++ The Trigger version
+
+If any part of the key differs, the snapshot is ignored and rebuilt from the
+source. Remote sources (anything that isn't a local path) are never
+snapshotted, because there is no cheap way to tell whether they've changed.
+
+ACL associations are not stored in snapshots, since they live in Redis and
+change independently of the metadata source.
+
+Since loading a snapshot unpickles it, a snapshot is only loaded if both it and
+its directory are owned by the current user and can't be written to by anyone
+else. Snapshots are written readable only by their owner.
+"""
+
+import cPickle as pickle
+import gc
+import hashlib
+import os
+import stat
+import tempfile
+from twisted.python import log
+from trigger.conf import settings
+from trigger.utils.url import parse_url
+
+
+# Exports
+__all__ = ('snapshot_key', 'load_snapshot', 'save_snapshot')
+
+
+# Constants
+# Bump this whenever the on-disk format or NetDevice state changes.
+SNAPSHOT_FORMAT = 2
+
+# Settings that influence the attributes of a compiled NetDevice object.
+SNAPSHOT_SETTINGS = (
+    'DEFAULT_TYPES',
+    'FALLBACK_MANUFACTURER',
+    'FALLBACK_TYPE',
+    'IOSLIKE_VENDORS',
+    'JUNIPER_FULL_COMMIT_FIELDS',
+    'NETDEVICES_LOADERS',
+    'RANCID_RECURSE_SUBDIRS',
+    'SUPPORTED_VENDORS',
+    'VENDOR_MAP',
+)
+
+# Schemes that refer to something on the local filesystem.
+LOCAL_SCHEMES = (None, '', 'file')
+
+
+# Functions
+def _normalize(value):
+    """
+    Return a representation of ``value`` that is stable across processes, so
+    that dictionaries with the same contents always digest the same way.
+    """
+    if isinstance(value, dict):
+        return sorted((k, _normalize(v)) for k, v in value.iteritems())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [_normalize(v) for v in value]
+        if isinstance(value, (set, frozenset)):
+            items.sort()
+        return items
+    return value
+
+def _settings_digest(names=SNAPSHOT_SETTINGS):
+    """Return a digest of the settings that affect compiled devices."""
+    values = [(name, _normalize(getattr(settings, name, None)))
+              for name in names]
+    return hashlib.md5(repr(values)).hexdigest()
+
+def _source_signature(path):
+    """
+    Return a tuple describing the state of the source at ``path``, or ``None``
+    if it doesn't exist.
+
+    For directories every file is considered, so that adding, removing or
+    editing any ``router.db`` invalidates the snapshot.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    if not os.path.isdir(path):
+        return (st.st_mtime, st.st_size)
+
+    count = total_size = 0
+    newest = st.st_mtime
+    for root, dirs, files in os.walk(path):
+        newest = max(newest, os.stat(root).st_mtime)
+        for fname in files:
+            try:
+                fst = os.stat(os.path.join(root, fname))
+            except OSError:
+                continue
+            count += 1
+            total_size += fst.st_size
+            newest = max(newest, fst.st_mtime)
+
+    return (newest, total_size, count)
+
+def _untrusted(st):
+    """
+    Return why the file with stat result ``st`` can't be trusted to unpickle,
+    or ``None`` if it can.
+    """
+    if st.st_uid != os.getuid():
+        return 'is not owned by the current user'
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        return 'is writable by other users'
+    return None
+
+def _pack(devices):
+    """
+    Return a compact, picklable representation of ``devices``.
+
+    Each device is stored as a ``(class, state)`` pair. Identical strings are
+    collapsed into a single object so that pickle stores them only once, which
+    makes the snapshot smaller and considerably faster to load.
+    """
+    strings = {}
+    packed = []
+    for dev in devices:
+        state = {}
+        for attr, value in dev.__getstate__().iteritems():
+            attr = strings.setdefault(attr, attr)
+            if isinstance(value, basestring):
+                value = strings.setdefault(value, value)
+            state[attr] = value
+        packed.append((dev.__class__, state))
+    return packed
+
+def _unpack(packed):
+    """Return a list of device objects from the output of `_pack`."""
+    devices = []
+    for cls, state in packed:
+        dev = cls.__new__(cls)
+        dev.__setstate__(state)
+        devices.append(dev)
+    return devices
+
+def snapshot_key(data_source):
+    """
+    Return the key used to validate a snapshot of ``data_source``, or
+    ``None`` if the source can't be snapshotted.
+
+    :param data_source:
+        A path or URL as found in :setting:`NETDEVICES_SOURCE`
+    """
+    from trigger import __version__
+
+    url = parse_url(data_source)
+    if url['scheme'] not in LOCAL_SCHEMES or url['path'] is None:
+        return None
+
+    signature = _source_signature(url['path'])
+    if signature is None:
+        return None
+
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'source': data_source,
+        'signature': signature,
+        'settings': _settings_digest(),
+        'version': __version__,
+    }
+
+def load_snapshot(snapshot_file, key):
+    """
+    Return the list of devices stored in ``snapshot_file`` if its key matches
+    ``key``, otherwise ``None``.
+
+    Unreadable or corrupt snapshots are treated as a miss, as are snapshots
+    that the current user doesn't own or that others can write to.
+
+    :param snapshot_file:
+        Path to the snapshot file
+
+    :param key:
+        The key as returned by `~trigger.netdevices.snapshot.snapshot_key`
+    """
+    if key is None or not os.path.exists(snapshot_file):
+        return None
+
+    # Loading creates a lot of objects and none of them are garbage, so don't
+    # let the cyclic garbage collector waste time walking them.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        dirname = os.path.dirname(os.path.abspath(snapshot_file))
+        with open(snapshot_file, 'rb') as fh:
+            for path, st in ((dirname, os.stat(dirname)),
+                             (snapshot_file, os.fstat(fh.fileno()))):
+                problem = _untrusted(st)
+                if problem is not None:
+                    log.msg('Not loading NetDevices snapshot %s: %s %s' %
+                            (snapshot_file, path, problem))
+                    return None
+
+            header = pickle.load(fh)
+            if header != key:
+                log.msg('NetDevices snapshot is stale: %s' % snapshot_file)
+                return None
+            devices = _unpack(pickle.load(fh))
+    except Exception as err:
+        log.msg('Could not read NetDevices snapshot %s: %r' % (snapshot_file,
+                                                               err))
+        return None
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    log.msg('LOADED %d devices from snapshot: %s' % (len(devices),
+                                                     snapshot_file))
+    return devices
+
+def save_snapshot(snapshot_file, key, devices):
+    """
+    Write ``devices`` to ``snapshot_file`` stamped with ``key``.
+
+    The snapshot is written to a temporary file and renamed into place so that
+    concurrent readers never see a partial file, and is only readable by its
+    owner. Failure to write a snapshot is logged but otherwise ignored.
+
+    :param snapshot_file:
+        Path to the snapshot file
+
+    :param key:
+        The key as returned by `~trigger.netdevices.snapshot.snapshot_key`
+
+    :param devices:
+        A list of `~trigger.netdevices.NetDevice` objects
+
+    :returns:
+        ``True`` if the snapshot was written, ``False`` otherwise.
+    """
+    if key is None:
+        return False
+
+    dirname = os.path.dirname(os.path.abspath(snapshot_file))
+    tmp_name = None
+    try:
+        fd, tmp_name = tempfile.mkstemp(dir=dirname, prefix='.netdevices-')
+        with os.fdopen(fd, 'wb') as fh:
+            pickle.dump(key, fh, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(_pack(devices), fh, pickle.HIGHEST_PROTOCOL)
+        os.chmod(tmp_name, 0600)
+        os.rename(tmp_name, snapshot_file)
+    except Exception as err:
+        log.msg('Could not write NetDevices snapshot %s: %r' % (snapshot_file,
+                                                                err))
+        if tmp_name is not None and os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        return False
+
+    log.msg('SAVED %d devices to snapshot: %s' % (len(devices), snapshot_file))
+    return True
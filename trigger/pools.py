@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+"""
+Worker pools for parsing results off of the reactor thread.
+
+By default `~trigger.cmds.Commando` parses results (``parse_template()`` and
+the ``from_{vendor}`` methods) on the reactor thread, so a big parse on one
+device holds up I/O for every other device and can cause spurious
+`~trigger.exceptions.CommandTimeout` errors. Passing a ``parse_pool`` moves
+parsing into a pool of workers instead::
+
+    >>> from trigger.cmds import Commando
+    >>> c = Commando(devices=devices, commands=['show version'],
+    ...              parse_pool='thread:4')
+
+There are two kinds of pool:
+
+`~trigger.pools.ThreadParsePool`
+    Runs ``parse_template()`` and ``parse()`` for each device in a thread. Any
+    ``from_{vendor}`` method works, as long as it's safe to run in a thread.
+`~trigger.pools.ProcessParsePool`
+    Runs parsers in separate processes, which makes use of more than one core.
+    Methods can't be sent to another process, so ``parse()`` and
+    ``parse_template()`` still run on the reactor thread, but the parsers they
+    pass to `~trigger.cmds.Commando.run_parser()`, such as TextFSM, run in the
+    pool. Parsers must be module-level functions and their arguments and
+    results must be picklable.
+
+Either way, no more than ``size + backlog`` devices are parsed or waiting to
+be parsed at once: until some finish, `~trigger.cmds.Commando` stops
+connecting to more devices, so that results can't pile up in memory faster
+than they can be parsed.
+"""
+
+
+# Imports
+import cPickle as pickle
+import multiprocessing
+import threading
+
+from twisted.internet import defer, threads
+from twisted.python import log
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
+
+from trigger.conf import settings
+from trigger import exceptions
+
+
+# Exports
+__all__ = ('ParsePool', 'ThreadParsePool', 'ProcessParsePool',
+           'get_parse_pool')
+
+
+# Constants
+# Default number of workers in a pool
+DEFAULT_SIZE = 4
+
+
+# Functions
+def get_parse_pool(spec):
+    """
+    Create a pool from a string of the form ``{type}[:{size}]``, where type is
+    ``thread`` or ``process``, such as ``'process:8'``. ``size`` defaults to
+    4 for threads and the number of CPUs for processes.
+
+    :param spec:
+        The pool to create
+    """
+    kind, sep, size = spec.partition(':')
+    if kind not in POOL_TYPES or (sep and not size.isdigit()):
+        raise exceptions.ImproperlyConfigured(
+            'Invalid parse pool %r; expected one of %s, optionally followed '
+            'by ":" and a number of workers' % (
+                spec, ', '.join(sorted(POOL_TYPES))))
+    if size:
+        return POOL_TYPES[kind](size=int(size))
+    return POOL_TYPES[kind]()
+
+def _call(func, args, kwargs):
+    """
+    Call ``func`` in a worker process and return the pickled outcome, so that
+    results and errors that can't be pickled are reported instead of lost.
+    """
+    try:
+        outcome = (True, func(*args, **kwargs))
+    except Exception as err:
+        outcome = (False, err)
+    try:
+        return pickle.dumps(outcome, pickle.HIGHEST_PROTOCOL)
+    except Exception as err:
+        return pickle.dumps(
+            (False, RuntimeError('Unable to pickle the outcome of %s: %s' %
+                                 (func.__name__, err))),
+            pickle.HIGHEST_PROTOCOL)
+
+
+# Classes
+class ParsePool(object):
+    """
+    Base class for parse pools.
+
+    Subclasses must implement `submit`, and may implement `close`.
+
+    :param size:
+        (Optional) The number of workers
+
+    :param backlog:
+        (Optional) How many more devices may be waiting to be parsed once all
+        of the workers are busy. Defaults to ``size``.
+    """
+    #: Whether `~trigger.cmds.Commando` should run ``parse()`` and
+    #: ``parse_template()`` in the pool, rather than just the parsers passed
+    #: to `~trigger.cmds.Commando.run_parser()`.
+    run_callbacks = False
+
+    def __init__(self, size=DEFAULT_SIZE, backlog=None):
+        if size < 1:
+            raise exceptions.ImproperlyConfigured(
+                'A parse pool needs at least 1 worker, not %r' % size)
+        self.size = size
+        self.backlog = size if backlog is None else backlog
+
+    def __repr__(self):
+        return '<%s: size=%d, backlog=%d>' % (self.__class__.__name__,
+                                              self.size, self.backlog)
+
+    @property
+    def limit(self):
+        """How many devices may be parsed or waiting to be parsed at once."""
+        return self.size + self.backlog
+
+    @property
+    def in_worker(self):
+        """Whether we're running in one of the pool's workers."""
+        return False
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Call ``func`` in the pool and return a ``Deferred`` that fires with
+        its result. Must be called from the reactor thread.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Stop the workers."""
+        pass
+
+class ThreadParsePool(ParsePool):
+    """
+    Parse in a pool of threads.
+
+    Threads don't run Python code in parallel, but a parse in a thread no
+    longer stops the reactor from handling I/O.
+    """
+    run_callbacks = True
+
+    def __init__(self, size=DEFAULT_SIZE, backlog=None):
+        super(ThreadParsePool, self).__init__(size, backlog)
+        self._pool = None
+        self._local = threading.local()
+
+    @property
+    def in_worker(self):
+        return getattr(self._local, 'active', False)
+
+    def submit(self, func, *args, **kwargs):
+        from twisted.internet import reactor
+        if self._pool is None:
+            self._pool = ThreadPool(0, self.size, name='trigger-parse')
+            self._pool.start()
+            reactor.addSystemEventTrigger('during', 'shutdown', self.close)
+        return threads.deferToThreadPool(reactor, self._pool, self._run,
+                                         func, *args, **kwargs)
+
+    def _run(self, func, *args, **kwargs):
+        """
+        Call ``func`` in a worker thread. If it returns a ``Deferred``, which
+        must have fired already since there's no reactor here, return its
+        result instead.
+        """
+        self._local.active = True
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            self._local.active = False
+        if not isinstance(result, defer.Deferred):
+            return result
+
+        outcome = []
+        result.addBoth(outcome.append)
+        if not outcome:
+            raise RuntimeError('%r returned a Deferred that has not fired; '
+                               'parsing in a thread must be synchronous' %
+                               func)
+        if isinstance(outcome[0], Failure):
+            outcome[0].raiseException()
+        return outcome[0]
+
+    def close(self):
+        if self._pool is not None:
+            log.msg('Stopping parse threads')
+            self._pool.stop()
+            self._pool = None
+
+class ProcessParsePool(ParsePool):
+    """
+    Parse in a pool of processes, using ``multiprocessing``.
+
+    If a worker process dies, ``multiprocessing`` replaces it but never
+    reports what it was doing, so each call is given ``timeout`` seconds to
+    return before it fails with `~trigger.exceptions.ParseTimeout`.
+
+    :param size:
+        (Optional) The number of processes. Defaults to the number of CPUs.
+
+    :param timeout:
+        (Optional) Seconds to wait for each call. Defaults to
+        :setting:`DEFAULT_TIMEOUT`.
+    """
+    def __init__(self, size=None, backlog=None, timeout=None):
+        if size is None:
+            size = multiprocessing.cpu_count()
+        super(ProcessParsePool, self).__init__(size, backlog)
+        if timeout is None:
+            timeout = settings.DEFAULT_TIMEOUT
+        self.timeout = timeout
+        self._pool = None
+        self._expired = False
+
+    def submit(self, func, *args, **kwargs):
+        from twisted.internet import reactor
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.size)
+
+        d = defer.Deferred()
+        def done(outcome):
+            # Called from the pool's result thread.
+            reactor.callFromThread(self._finish, d, outcome)
+        self._pool.apply_async(_call, (func, args, kwargs), callback=done)
+
+        timer = reactor.callLater(self.timeout, self._expire, d, func)
+        def cancel(result):
+            if timer.active():
+                timer.cancel()
+            return result
+        d.addBoth(cancel)
+        return d
+
+    def _finish(self, d, outcome):
+        if d.called:
+            # Too late; it has already timed out.
+            return
+        ok, result = pickle.loads(outcome)
+        if ok:
+            d.callback(result)
+        else:
+            d.errback(result)
+
+    def _expire(self, d, func):
+        """Fail ``d`` if ``func`` hasn't returned within ``timeout``."""
+        # The call is never going to be forgotten by the pool, which would
+        # keep close() waiting for it forever.
+        self._expired = True
+        d.errback(exceptions.ParseTimeout(
+            '%s did not return within %s seconds; did a parse process die?' %
+            (func.__name__, self.timeout)))
+
+    def close(self):
+        if self._pool is not None:
+            log.msg('Stopping parse processes')
+            if self._expired:
+                self._pool.terminate()
+            else:
+                self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+# Pool types accepted by get_parse_pool()
+POOL_TYPES = {
+    'thread': ThreadParsePool,
+    'process': ProcessParsePool,
+}
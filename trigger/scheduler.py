@@ -0,0 +1,542 @@
+# -*- coding: utf-8 -*-
+
+"""
+Scheduling of devices under concurrency limits.
+
+`~trigger.scheduler.GroupScheduler` hands out devices from a job queue while
+keeping the number of devices running at once in each *bucket* under a limit.
+A bucket is named after a key function that maps a device to the group it
+belongs to, such as its site, so that a limit of ``site<=5`` means no more
+than 5 devices from any one site will be running at a time.
+
+The built-in bucket keys are:
+
+``site``
+    The device's ``site``.
+``realm``
+    The login realm used for the device, which is the device's ``realm``
+    attribute if it has one, or :setting:`DEFAULT_REALM`.
+``group``
+    Devices that look like they are members of the same redundant group
+    (e.g. ``abc1`` and ``abc2`` at the same site). See
+    `~trigger.scheduler.device_group`.
+
+Any other name is taken to be a device attribute, so ``owningTeam<=3`` limits
+devices per owning team. Devices for which a key is ``None`` aren't limited by
+that bucket.
+
+Picking the next device is amortized O(1) regardless of how many devices are
+queued or blocked: devices are queued per combination of buckets, and
+combinations that are blocked by a full bucket are parked on that bucket until
+a device in it is released.
+
+`~trigger.scheduler.BudgetScheduler` also takes a slot from a connection budget
+shared with other processes for each running device, which is how
+`~trigger.sharding.ShardedCommando` keeps ``max_conns`` across its workers.
+
+`~trigger.scheduler.AdaptiveConcurrency` adjusts the total number of
+connections instead, using additive increase, multiplicative decrease (AIMD):
+it grows while devices connect quickly and backs off when connections time out
+or fail.
+"""
+
+
+# Imports
+import collections
+import re
+import time
+
+from twisted.internet import error
+from twisted.python import log
+
+from trigger.conf import settings
+from trigger import exceptions, metrics
+
+
+# Exports
+__all__ = ('GroupScheduler', 'BudgetScheduler', 'AdaptiveConcurrency',
+           'parse_limits', 'device_group', 'device_realm', 'BUCKET_KEYS',
+           'BACKOFF_ERRORS')
+
+
+# Constants
+LIMIT_RE = re.compile(r'^\s*(?P<name>[\w.-]+)\s*<=\s*(?P<limit>\d+)\s*$')
+
+# Errors that mean we're asking too much of the network or the AAA servers
+BACKOFF_ERRORS = (
+    exceptions.LoginTimeout,
+    exceptions.CommandTimeout,
+    exceptions.ConnectionFailure,
+    error.ConnectError,
+    error.TimeoutError,
+)
+
+# Loosely based on a naming convention that is not the "strictest"; allows for
+# e.g. "36bit1".
+GROUP_RE = re.compile('[0-9]*[a-z]+')
+
+
+# Functions
+def device_group(device):
+    """
+    Use name heuristics to guess which devices are "together", such as both
+    members of a redundant pair, and return a key for the group.
+
+    Devices whose names don't follow the convention, such as IP addresses, or
+    that have no ``site``, are each in a group of their own.
+
+    :param device:
+        The `~trigger.netdevices.NetDevice` object to try to group
+    """
+    match = GROUP_RE.match(device.nodeName)
+    if not match or not device.site:
+        return device.nodeName
+
+    group_key = match.group()
+
+    # FIXME(jathan): This is some hard-coded AOL-specific legacy stuff that
+    # will probably work for most environments, but it's awfully presumptuous.
+    if len(group_key) >= 4 and group_key[-1] not in ('i', 'e'):
+        group_key = group_key[:-1] + 'X'
+
+    return (device.site, group_key)
+
+def device_realm(device):
+    """
+    Return the login realm for ``device``.
+
+    :param device:
+        A `~trigger.netdevices.NetDevice` object
+    """
+    return getattr(device, 'realm', None) or settings.DEFAULT_REALM
+
+def parse_limits(limits):
+    """
+    Parse concurrency limits into a dict of ``{bucket: limit}``.
+
+    :param limits:
+        A dict of bucket names to limits, or a list of strings like
+        ``'site<=5'``. A single comma-separated string is also accepted.
+    """
+    if not limits:
+        return {}
+    if isinstance(limits, dict):
+        items = limits.items()
+    else:
+        if isinstance(limits, basestring):
+            limits = limits.split(',')
+        items = []
+        for spec in limits:
+            match = LIMIT_RE.match(spec)
+            if match is None:
+                raise exceptions.ImproperlyConfigured(
+                    'Invalid concurrency limit %r; expected e.g. "site<=5"' %
+                    spec)
+            items.append((match.group('name'), match.group('limit')))
+
+    parsed = {}
+    for name, limit in items:
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            limit = 0
+        if limit < 1:
+            raise exceptions.ImproperlyConfigured(
+                'Concurrency limit for %r must be a positive integer' % name)
+        parsed[name] = limit
+    return parsed
+
+
+# Built-in bucket key functions
+BUCKET_KEYS = {
+    'site': lambda device: getattr(device, 'site', None),
+    'realm': device_realm,
+    'group': device_group,
+}
+
+
+# Classes
+class GroupScheduler(object):
+    """
+    A job queue of devices that only hands out devices whose buckets are all
+    under their concurrency limits.
+
+    Devices are added with `append()`. `pop()` returns the next device that
+    may run, or ``None`` if every queued device is blocked by a limit, and
+    `start()` must be called with it before popping again. When the device is
+    done, call `release()` so that devices waiting on its buckets may run.
+
+    Within a combination of buckets devices are popped from the end of the
+    queue, like a list; combinations take turns, which spreads work across
+    sites, realms and so on.
+
+        >>> sched = GroupScheduler(['site<=1'])
+        >>> sched.extend([dev1, dev2])  # Both at site ABC
+        >>> dev = sched.pop(); sched.start(dev)
+        >>> sched.pop() is None
+        True
+        >>> sched.release(dev)
+        >>> sched.pop()
+        <NetDevice: dev1>
+
+    :param limits:
+        Concurrency limits as accepted by `~trigger.scheduler.parse_limits`
+
+    :param keys:
+        (Optional) A dict of bucket names to functions that take a device and
+        return its key for that bucket, to add to or override `BUCKET_KEYS`
+    """
+    def __init__(self, limits=None, keys=None):
+        self.limits = parse_limits(limits)
+        self.keys = dict(BUCKET_KEYS)
+        if keys:
+            self.keys.update(keys)
+        self._buckets = sorted(self.limits)
+
+        # Queued devices by bucket combination, and the combinations that may
+        # be able to run, each of which is either in _ready or parked in
+        # _waiting on a full bucket.
+        self._queues = {}
+        self._ready = collections.deque()
+        self._waiting = collections.defaultdict(list)
+        self._queued = 0
+
+        # Running devices per bucket, and the combinations of started devices.
+        self._active = collections.defaultdict(int)
+        self._running = {}
+        self._last = (None, None)
+
+    def __len__(self):
+        return self._queued
+
+    def __nonzero__(self):
+        return self._queued > 0
+
+    def __repr__(self):
+        return '<%s: %d queued, %d running, limits=%r>' % (
+            self.__class__.__name__, self._queued, self.running, self.limits)
+
+    @property
+    def running(self):
+        """The number of devices that have been started but not released."""
+        return sum(len(combos) for combos in self._running.itervalues())
+
+    @property
+    def blocked(self):
+        """Whether devices are queued, but none of them may run right now."""
+        return bool(self._queued) and not self._ready
+
+    def _combination(self, device):
+        """Return the buckets ``device`` belongs to, as a tuple."""
+        combo = []
+        for name in self._buckets:
+            func = self.keys.get(name)
+            if func is None:
+                value = getattr(device, name, None)
+            else:
+                value = func(device)
+            if value is not None:
+                combo.append((name, value))
+        return tuple(combo)
+
+    def _full_bucket(self, combo):
+        """Return the first bucket in ``combo`` that is full, or ``None``."""
+        for bucket in combo:
+            if self._active.get(bucket, 0) >= self.limits[bucket[0]]:
+                return bucket
+        return None
+
+    def append(self, device):
+        """Add ``device`` to the queue."""
+        combo = self._combination(device)
+        queue = self._queues.get(combo)
+        if queue is None:
+            queue = self._queues[combo] = []
+            self._ready.append(combo)
+        queue.append(device)
+        self._queued += 1
+
+    def extend(self, devices):
+        """Add each of ``devices`` to the queue."""
+        for device in devices:
+            self.append(device)
+
+    def pop(self):
+        """
+        Remove and return a device that may run now, or ``None`` if there are
+        none.
+        """
+        while self._ready:
+            combo = self._ready.popleft()
+            full = self._full_bucket(combo)
+            if full is not None:
+                self._waiting[full].append(combo)
+                continue
+
+            queue = self._queues[combo]
+            device = queue.pop()
+            if queue:
+                self._ready.append(combo)
+            else:
+                del self._queues[combo]
+            self._queued -= 1
+            self._last = (device, combo)
+            return device
+        return None
+
+    def start(self, device):
+        """
+        Count ``device`` as running against its buckets' limits.
+
+        :param device:
+            A device, usually the one just returned by `pop()`
+        """
+        last, combo = self._last
+        if last is not device:
+            combo = self._combination(device)
+        self._last = (None, None)
+        for bucket in combo:
+            self._active[bucket] += 1
+        self._running.setdefault(id(device), []).append(combo)
+
+    def release(self, device):
+        """
+        Stop counting ``device`` as running, letting devices waiting on its
+        buckets run. Devices that weren't started are ignored.
+
+        :param device:
+            A device that was passed to `start()`
+        """
+        combos = self._running.get(id(device))
+        if not combos:
+            return
+        combo = combos.pop()
+        if not combos:
+            del self._running[id(device)]
+
+        for bucket in combo:
+            self._active[bucket] -= 1
+            if not self._active[bucket]:
+                del self._active[bucket]
+            waiting = self._waiting.pop(bucket, None)
+            if waiting:
+                self._ready.extend(waiting)
+
+class BudgetScheduler(GroupScheduler):
+    """
+    A `~trigger.scheduler.GroupScheduler` that also takes a slot from a
+    connection budget shared with other schedulers, such as those in other
+    processes, for each running device.
+
+    The budget is a semaphore such as ``multiprocessing.Semaphore(100)``,
+    which must support ``acquire(False)`` so that `pop()` never blocks. When
+    no slot is free, `pop()` returns ``None`` and `starved` is set, and the
+    caller must try again later since nothing in this process will let it
+    know when a slot is freed.
+
+    :param limits:
+        Concurrency limits as accepted by `~trigger.scheduler.parse_limits`
+
+    :param keys:
+        (Optional) Extra bucket key functions, as for `GroupScheduler`
+
+    :param budget:
+        The shared semaphore
+    """
+    def __init__(self, limits=None, keys=None, budget=None):
+        super(BudgetScheduler, self).__init__(limits, keys=keys)
+        if budget is None:
+            raise exceptions.ImproperlyConfigured(
+                'BudgetScheduler requires a budget')
+        self.budget = budget
+        self.starved = False
+        self._reserved = False
+        self._held = collections.defaultdict(int)
+
+    @property
+    def blocked(self):
+        """
+        Whether devices are queued, but none of them may run right now,
+        either because of a limit or because the budget is used up.
+        """
+        return (super(BudgetScheduler, self).blocked or
+                (self.starved and bool(self._queued)))
+
+    def pop(self):
+        """
+        Take a slot from the budget, and remove and return a device that may
+        run now, or ``None`` if there are none.
+        """
+        if not self._queued:
+            return None
+        # A slot taken for a device that was popped but never started is
+        # still ours.
+        if not self._reserved:
+            if not self.budget.acquire(False):
+                self.starved = True
+                return None
+            self._reserved = True
+        self.starved = False
+
+        device = super(BudgetScheduler, self).pop()
+        if device is None:
+            self._give_back()
+        return device
+
+    def start(self, device):
+        """Count ``device`` as running, holding the slot taken by `pop()`."""
+        super(BudgetScheduler, self).start(device)
+        if self._reserved:
+            self._reserved = False
+            self._held[id(device)] += 1
+
+    def release(self, device):
+        """Stop counting ``device`` as running and return its slot."""
+        super(BudgetScheduler, self).release(device)
+        key = id(device)
+        if self._held.get(key):
+            self._held[key] -= 1
+            if not self._held[key]:
+                del self._held[key]
+            self.budget.release()
+
+    def _give_back(self):
+        """Return the slot taken by `pop()`."""
+        self._reserved = False
+        self.budget.release()
+
+class AdaptiveConcurrency(object):
+    """
+    Decide how many connections to keep open at once using additive increase,
+    multiplicative decrease (AIMD).
+
+    Each connection is started with `start()`, which returns a token. Call
+    `connected()` with the token once the device has been logged in to (only
+    the first call for a token counts), and `failed()` if the attempt fails.
+
+    Starting from ``initial``, the limit grows by ``increase`` for every
+    healthy connection until the first sign of trouble ("slow start"), and
+    after that by ``increase`` for every `limit` healthy connections. A
+    connection is healthy if it took no longer than ``max_latency`` seconds to
+    connect and log in.
+
+    The limit is multiplied by ``decrease`` when a connection fails with one of
+    `BACKOFF_ERRORS`, or when the moving average of the connection latency
+    exceeds ``max_latency``. Connections that were started before the last
+    decrease are ignored, so a burst of failures only backs off once.
+
+    The current limit is available as `limit`.
+
+    :param initial:
+        The limit to start with
+
+    :param minimum:
+        The lowest the limit may go
+
+    :param maximum:
+        The highest the limit may go
+
+    :param increase:
+        How much to add to the limit
+
+    :param decrease:
+        The factor by which to reduce the limit
+
+    :param max_latency:
+        The number of seconds above which connecting is considered unhealthy
+
+    :param clock:
+        (Optional) A function returning the current time in seconds
+    """
+    def __init__(self, initial=2, minimum=1, maximum=100, increase=1,
+                 decrease=0.5, max_latency=10, clock=None):
+        if not 1 <= minimum <= maximum:
+            raise exceptions.ImproperlyConfigured(
+                'Adaptive concurrency requires 1 <= minimum <= maximum')
+        if not 0 < decrease < 1:
+            raise exceptions.ImproperlyConfigured(
+                'Adaptive concurrency decrease must be between 0 and 1')
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.max_latency = max_latency
+        self.clock = clock or time.time
+
+        self.level = float(min(max(initial, minimum), maximum))
+        self.latency = None
+        self.slow_start = True
+        self.backoffs = 0
+        self._epoch = 0
+
+    def __repr__(self):
+        return '<%s: limit=%d, latency=%s, backoffs=%d>' % (
+            self.__class__.__name__, self.limit,
+            '%.2fs' % self.latency if self.latency is not None else None,
+            self.backoffs)
+
+    @property
+    def limit(self):
+        """The number of connections to keep open right now."""
+        return int(self.level)
+
+    def start(self):
+        """Record the start of a connection and return its token."""
+        return [self._epoch, self.clock(), False]
+
+    def connected(self, token):
+        """
+        Record that the connection for ``token`` has logged in.
+
+        :param token:
+            The token returned by `start()`
+        """
+        epoch, started, reported = token
+        if reported:
+            return
+        token[2] = True
+        latency = self.clock() - started
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += (latency - self.latency) * 0.2
+
+        if self.latency > self.max_latency:
+            self._backoff(epoch, 'latency %.2fs' % self.latency)
+        elif latency <= self.max_latency:
+            if self.slow_start:
+                self._set_level(self.level + self.increase)
+            else:
+                self._set_level(self.level + self.increase / self.level)
+
+    def failed(self, token, failure):
+        """
+        Record that the connection for ``token`` failed.
+
+        :param token:
+            The token returned by `start()`
+
+        :param failure:
+            The `~twisted.python.failure.Failure` or exception it failed with
+        """
+        reason = getattr(failure, 'value', failure)
+        if isinstance(reason, BACKOFF_ERRORS):
+            self._backoff(token[0], reason.__class__.__name__)
+
+    def _backoff(self, epoch, reason):
+        """Reduce the limit, unless we have since ``epoch``."""
+        if epoch != self._epoch:
+            return
+        self._epoch += 1
+        self.slow_start = False
+        self.backoffs += 1
+        log.msg('Backing off concurrency (%s)' % reason)
+        self._set_level(self.level * self.decrease)
+
+    def _set_level(self, level):
+        """Set the level, keeping it within bounds and logging changes."""
+        old = self.limit
+        self.level = min(max(level, self.minimum), self.maximum)
+        if self.limit != old:
+            log.msg('Concurrency limit: %d -> %d' % (old, self.limit))
+            metrics.CONCURRENCY_LIMIT.set(self.limit)
@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+
+"""
+Run `~trigger.cmds.Commando` across multiple processes.
+
+A single Twisted reactor runs on a single core, and SSH crypto and prompt
+parsing can keep that core busy long before the network is.
+`~trigger.sharding.ShardedCommando` splits the devices into shards, runs a
+`~trigger.cmds.Commando` (or a subclass) for each shard in its own worker
+process with its own reactor, and streams results and errors back to the
+parent as each device is done::
+
+    >>> from trigger.sharding import ShardedCommando
+    >>> sc = ShardedCommando(devices=devices, commands=['show version'],
+    ...                      shards=4, max_conns=100)
+    >>> sc.run()
+    >>> sc.results['test1-abc.net.aol.com']
+    {'show version': '...'}
+
+``results``, ``parsed_results`` and ``errors`` end up in the same shape as
+they would for a single ``Commando``. ``max_conns`` is a budget shared by all
+of the workers rather than a limit per worker, so the network sees the same
+number of connections whether the run is sharded or not.
+
+Workers are forked, so they inherit the parent's
+`~trigger.netdevices.NetDevices` instead of loading it again, and the
+``Commando`` class doesn't need to be picklable, but results and errors do.
+Since a forked reactor shares its state with the parent's, the Twisted reactor
+must not have been imported in the parent when the workers are started.
+Results must be stored using ``store_results()``, ``append_parsed_results()``
+and ``store_error()`` to make it back to the parent, which the default
+``from_*`` methods and errback do. Connection timings are sent back the same
+way, using ``store_timings()``, and collected in the parent's
+``timing_stats``.
+"""
+
+
+# Imports
+import cPickle as pickle
+import functools
+import itertools
+import multiprocessing
+import Queue
+import sys
+import traceback
+
+from twisted.python import log
+
+from trigger.cmds import Commando
+from trigger.netdevices import NetDevices
+from trigger.scheduler import BudgetScheduler, BUCKET_KEYS
+from trigger.sinks import ResultSink, RESULT, PARSED, open_sink
+from trigger.timing import PhaseStats
+from trigger import exceptions
+
+
+# Exports
+__all__ = ('ShardedCommando', 'partition')
+
+
+# Constants
+# How often in seconds the parent checks on workers while waiting for results
+CHECK_INTERVAL = 1
+
+# How often in seconds a worker tries again to take a connection from the
+# budget when it's used up
+POLL_INTERVAL = 0.1
+
+# Messages from workers
+RECORD, TIMINGS, DONE, FAILED = 'record', 'timings', 'done', 'failed'
+
+# Sent by the parent to itself once it has seen that a worker exited
+EXITED = 'exited'
+
+
+# Functions
+def partition(devices, shards, key=None):
+    """
+    Split ``devices`` into ``shards`` lists.
+
+    Without a ``key`` devices are dealt out in turn. With one, devices with
+    the same key are kept in the same shard, so that concurrency limits on
+    that key hold across the whole run, and shards are balanced by the
+    number of devices in them.
+
+    :param devices:
+        A list of `~trigger.netdevices.NetDevice` objects
+
+    :param shards:
+        The number of shards
+
+    :param key:
+        (Optional) A bucket name (see `~trigger.scheduler`), device attribute
+        or function returning the key for a device
+    """
+    if key is None:
+        return [devices[i::shards] for i in xrange(shards)]
+
+    if not callable(key):
+        name = key
+        key = BUCKET_KEYS.get(name,
+                              lambda device: getattr(device, name, None))
+
+    groups = {}
+    for device in devices:
+        groups.setdefault(key(device), []).append(device)
+
+    # Biggest groups first, each to whichever shard has the fewest devices.
+    result = [[] for _ in xrange(shards)]
+    for group in sorted(groups.itervalues(), key=len, reverse=True):
+        min(result, key=len).extend(group)
+    return result
+
+def _dumps(devname, kind, data):
+    """
+    Pickle a record for the parent, falling back to the string value of
+    ``data`` if it can't be pickled.
+    """
+    try:
+        return pickle.dumps((devname, kind, data), pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        log.msg('Unable to pickle %s for %s, sending it as a string' %
+                (kind, devname))
+        if hasattr(data, 'getErrorMessage'):
+            data = '%s: %s' % (data.type.__name__, data.getErrorMessage())
+        return pickle.dumps((devname, kind, str(data)),
+                            pickle.HIGHEST_PROTOCOL)
+
+def _run_shard(index, commando_class, devices, kwargs, budget, queue):
+    """
+    Run ``commando_class`` against ``devices`` in a worker process, sending
+    each result to ``queue``.
+    """
+    try:
+        scheduler_class = functools.partial(BudgetScheduler,
+                                            budget=_ShardBudget(budget, index))
+        cls = type('Shard' + commando_class.__name__,
+                   (_ShardWorkerMixin, commando_class),
+                   {'scheduler_class': scheduler_class})
+        commando = cls(devices=devices, sink=_QueueSink(queue, index),
+                       keep_results=False, **kwargs)
+        commando.run()
+    except Exception:
+        queue.put((FAILED, index, traceback.format_exc()))
+    else:
+        queue.put((DONE, index, None))
+    queue.close()
+    queue.join_thread()
+
+
+# Classes
+class _ShardBudget(object):
+    """
+    The connection budget as seen by one worker, which counts the slots the
+    worker holds so that the parent can give them back if it dies.
+    """
+    def __init__(self, budget, index):
+        self.semaphore, self.held = budget
+        self.index = index
+
+    def acquire(self, block=True):
+        if not self.semaphore.acquire(block):
+            return False
+        with self.held.get_lock():
+            self.held[self.index] += 1
+        return True
+
+    def release(self):
+        with self.held.get_lock():
+            self.held[self.index] -= 1
+        self.semaphore.release()
+
+class _QueueSink(ResultSink):
+    """A sink that sends everything to the parent process."""
+    def __init__(self, queue, index):
+        self.queue = queue
+        self.index = index
+
+    def write(self, devname, kind, data):
+        self.queue.put((RECORD, self.index, _dumps(devname, kind, data)))
+
+    def write_timings(self, devname, timings):
+        self.queue.put((TIMINGS, self.index,
+                        pickle.dumps((devname, dict(timings)),
+                                     pickle.HIGHEST_PROTOCOL)))
+
+class _ShardWorkerMixin(object):
+    """
+    Keep a worker's Commando going while the shared connection budget is
+    used up by other workers.
+    """
+    _poll = None
+
+    def _add_worker(self):
+        super(_ShardWorkerMixin, self)._add_worker()
+        if self.jobs.starved and self._poll is None:
+            from twisted.internet import reactor
+            self._poll = reactor.callLater(POLL_INTERVAL, self._retry)
+
+    def _retry(self):
+        self._poll = None
+        self._add_worker()
+
+    def store_timings(self, device, timings):
+        super(_ShardWorkerMixin, self).store_timings(device, timings)
+        self.sink.write_timings(str(device), timings)
+        return True
+
+    def _start(self):
+        """Start the reactor even if the budget is used up for now."""
+        if self.jobs and not self.curr_conns:
+            from twisted.internet import reactor
+            reactor.run()
+        else:
+            super(_ShardWorkerMixin, self)._start()
+
+class ShardedCommando(object):
+    """
+    Execute commands on multiple network devices using several worker
+    processes, each running a `~trigger.cmds.Commando`.
+
+    :param devices:
+        A list of device hostnames or `~trigger.netdevices.NetDevice` objects
+
+    :param shards:
+        (Optional) The number of worker processes. Defaults to the number of
+        CPUs.
+
+    :param commando_class:
+        (Optional) The `~trigger.cmds.Commando` subclass to run in each
+        worker. Defaults to ``Commando``.
+
+    :param max_conns:
+        (Optional) The maximum number of simultaneous connections to keep open
+        across all of the workers.
+
+    :param shard_key:
+        (Optional) Keep devices with the same key in the same shard, such as
+        ``'site'``. ``concurrency_limits`` are enforced by each worker, so
+        they only hold across the whole run for this key. See `partition`.
+
+    :param sink:
+        (Optional) A `~trigger.sinks.ResultSink`, or a string to pass to
+        `~trigger.sinks.open_sink`, to write results to as they come in.
+
+    :param keep_results:
+        (Optional) Whether to keep results, parsed results and errors in
+        ``results``, ``parsed_results`` and ``errors``. Defaults to ``True``.
+
+    :param verbose:
+        (Optional) Whether or not to display informational messages to the
+        console.
+
+    Any other keyword arguments, such as ``commands``, ``creds`` or
+    ``timeout``, are passed to ``commando_class``.
+    """
+    commando_class = Commando
+
+    def __init__(self, devices=None, shards=None, commando_class=None,
+                 max_conns=10, shard_key=None, sink=None, keep_results=True,
+                 verbose=False, **kwargs):
+        if devices is None:
+            raise exceptions.ImproperlyConfigured('You must specify some `devices` to interact with!')
+        if shards is None:
+            shards = multiprocessing.cpu_count()
+        if shards < 1:
+            raise exceptions.ImproperlyConfigured(
+                'shards must be at least 1, not %r' % shards)
+
+        self.devices = devices
+        self.shards = shards
+        self.commando_class = commando_class or self.commando_class
+        self.max_conns = max_conns
+        self.shard_key = shard_key
+        self.verbose = verbose
+        self.keep_results = keep_results
+        self._owns_sink = isinstance(sink, basestring)
+        self.sink = open_sink(sink) if self._owns_sink else sink
+        self.kwargs = dict(kwargs, max_conns=max_conns, verbose=verbose)
+        self.nd = NetDevices(
+            production_only=kwargs.get('production_only', True),
+            with_acls=kwargs.get('with_acls', False))
+
+        self.results = {}
+        self.parsed_results = {}
+        self.errors = {}
+        self.timings = {}
+        self.timing_stats = PhaseStats()
+        self._remaining = []
+        self._setup_shards()
+
+    def _setup_shards(self):
+        """
+        Look up the devices and split them into shards, storing an error for
+        any that can't be found.
+        """
+        devices = list(self.devices)
+        devobjs = self.nd.find_many(str(dev) for dev in devices)
+
+        found = []
+        for dev, devobj in itertools.izip(devices, devobjs):
+            if devobj is None:
+                msg = 'Device not found in NetDevices: %s' % dev
+                log.err(msg)
+                if self.verbose:
+                    print 'ERROR:', msg
+                self.store_error(dev, msg)
+                continue
+            found.append(devobj)
+
+        shards = partition(found, min(self.shards, len(found)) or 1,
+                           self.shard_key)
+        self.shard_devices = [[dev.nodeName for dev in shard]
+                              for shard in shards if shard]
+
+    def run(self):
+        """
+        Start the workers and wait for them to finish, collecting results as
+        they come in.
+        """
+        if 'twisted.internet.reactor' in sys.modules:
+            raise exceptions.ImproperlyConfigured(
+                'ShardedCommando must be run before the Twisted reactor is '
+                'imported, since the workers are forked from this process.')
+
+        queue = multiprocessing.Queue()
+        # The budget, and how much of it each worker holds
+        budget = (multiprocessing.Semaphore(self.max_conns),
+                  multiprocessing.Array('i', len(self.shard_devices)))
+        self._remaining = [set(names) for names in self.shard_devices]
+        workers = []
+        try:
+            for index, names in enumerate(self.shard_devices):
+                worker = multiprocessing.Process(
+                    target=_run_shard,
+                    args=(index, self.commando_class, names, self.kwargs,
+                          budget, queue))
+                worker.start()
+                log.msg('Started shard %d (pid %d) with %d devices' %
+                        (index, worker.pid, len(names)))
+                if self.verbose:
+                    print 'Started shard %d with %d devices' % (index,
+                                                                 len(names))
+                workers.append(worker)
+            self._collect(queue, workers, budget)
+        finally:
+            for worker in workers:
+                worker.join(CHECK_INTERVAL)
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+            if self._owns_sink:
+                self.sink.close()
+                self._owns_sink = False
+
+    def _collect(self, queue, workers, budget):
+        """Handle messages from ``workers`` until they're all done."""
+        pending = set(xrange(len(workers)))
+        exited = set()
+        while pending:
+            # Anything a worker sent before it exited is already in the
+            # queue, so once a message put after that comes out, a worker
+            # that hasn't said it's done isn't going to.
+            for index in pending - exited:
+                if not workers[index].is_alive():
+                    exited.add(index)
+                    queue.put((EXITED, index, None))
+            try:
+                message, index, payload = queue.get(timeout=CHECK_INTERVAL)
+            except Queue.Empty:
+                continue
+
+            if message == EXITED:
+                if index in pending:
+                    self._shard_failed(index, 'exited with code %s' %
+                                       workers[index].exitcode)
+                    pending.discard(index)
+
+                    # Give back any connections it was holding so that the
+                    # other workers aren't left waiting on them.
+                    semaphore, held = budget
+                    for _ in xrange(held[index]):
+                        semaphore.release()
+                    held[index] = 0
+            elif message == RECORD:
+                self._store(index, *pickle.loads(payload))
+            elif message == TIMINGS:
+                self.store_timings(*pickle.loads(payload))
+            elif message == FAILED:
+                self._shard_failed(index, payload)
+                pending.discard(index)
+            else:
+                log.msg('Shard %d is done' % index)
+                pending.discard(index)
+
+    def _store(self, index, devname, kind, data):
+        """Store a record sent by a worker."""
+        if kind == RESULT:
+            self.store_results(devname, data)
+        elif kind == PARSED:
+            self.append_parsed_results(devname, data)
+            return
+        else:
+            self.store_error(devname, data)
+        self._remaining[index].discard(devname)
+
+    def _shard_failed(self, index, reason):
+        """Store an error for every device the worker didn't get to."""
+        msg = 'Worker for shard %d failed: %s' % (index, reason)
+        log.err(msg)
+        if self.verbose:
+            print 'ERROR:', msg
+        error = exceptions.ShardFailed(msg)
+        for devname in sorted(self._remaining[index]):
+            self.store_error(devname, error)
+        self._remaining[index].clear()
+
+    def store_error(self, device, error):
+        """
+        Store an error for ``device``. Overload this to customize how errors
+        are stored.
+        """
+        devname = str(device)
+        if self.sink is not None:
+            self.sink.write_error(devname, error)
+        if self.keep_results:
+            self.errors[devname] = error
+        return True
+
+    def append_parsed_results(self, device, results):
+        """
+        Store parsed results for ``device``. Overload this to customize how
+        parsed results are stored.
+        """
+        devname = str(device)
+        if self.sink is not None:
+            self.sink.write_parsed(devname, results)
+        if self.keep_results:
+            self.parsed_results.setdefault(devname, {}).update(results)
+        return True
+
+    def store_results(self, device, results):
+        """
+        Store results for ``device``. Overload this to customize how results
+        are stored.
+        """
+        devname = str(device)
+        if self.sink is not None:
+            self.sink.write_result(devname, results)
+        if self.keep_results:
+            self.results[devname] = results
+        return True
+
+    def store_timings(self, device, timings):
+        """
+        Store the connection timings for ``device``. Overload this to
+        customize how timings are stored.
+        """
+        devname = str(device)
+        self.timing_stats.add(timings)
+        if self.keep_results:
+            self.timings[devname] = timings
+        return True
+
+    def dump_timings(self, dest):
+        """
+        Write the count, mean and percentiles of each connection phase across
+        all of the workers to ``dest``, a file-like object or the path of a
+        file to create, as JSON.
+        """
+        self.timing_stats.dump(dest)
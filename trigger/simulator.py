@@ -0,0 +1,1005 @@
+# -*- coding: utf-8 -*-
+
+"""
+Simulated network devices for testing and benchmarking without real gear.
+
+A `~trigger.simulator.DeviceFarm` runs any number of virtual devices, each
+listening for SSH or telnet on its own loopback address, that log in and
+answer commands much like the real thing::
+
+    >>> from trigger.simulator import DeviceFarm
+    >>> farm = DeviceFarm(seed=42)
+    >>> devices = farm.add_many(1000, personality=['ios', 'junos'],
+    ...                         output_size=4096, latency=0.05)
+    >>> farm.start()
+    >>> farm.write_netdevices('/tmp/netdevices.json')
+
+Point :setting:`NETDEVICES_SOURCE` at the file (or build
+`~trigger.netdevices.NetDevice` objects from `~DeviceFarm.records`) and use
+`~trigger.twister.execute` or `~trigger.cmds.Commando` as usual. The farm must
+be started in the process that runs the reactor, or it can be run on its own
+with ``python -m trigger.simulator``. Run it in a different process from the
+client when simulating IOS-like devices over SSH: Trigger checks whether they
+have SSH with a blocking connection, which a farm sharing the client's reactor
+can't answer, so it would fall back to telnet.
+
+The personalities are:
+
+``ios``
+    IOS-like CLI over SSH or telnet, with a ``host#`` prompt.
+``junos``
+    Junos CLI over SSH, with a ``user@host>`` prompt, and JunoScript XML when
+    ``junoscript`` is run over SSH ``exec``.
+``netscreen``
+    ScreenOS CLI over SSH, with a ``host->`` prompt.
+``netscaler``
+    NetScaler CLI over SSH, which ends each result with ``Done``.
+
+Each device can be given an output size, a per-command latency, paging (until
+the vendor's command to disable it is sent, just like a real device) and a
+rate of injected errors. Devices are numbered from 127.1.0.1, which works on
+Linux where all of 127.0.0.0/8 is loopback; on other systems give them
+addresses that are configured on the loopback interface.
+"""
+
+
+# Imports
+import itertools
+import json
+import random
+import resource
+import socket
+import struct
+import sys
+from collections import deque
+from xml.sax.saxutils import escape
+
+from Crypto.PublicKey import RSA
+from twisted.conch import avatar, telnet
+from twisted.conch.interfaces import IConchUser
+from twisted.conch.ssh import channel, common, factory, keys, transport
+from twisted.cred import error as cred_error
+from twisted.cred.checkers import ICredentialsChecker
+from twisted.cred.credentials import IUsernamePassword, UsernamePassword
+from twisted.cred.portal import IRealm, Portal
+from twisted.internet import defer, protocol
+from twisted.python import log
+from zope.interface import implementer
+
+from trigger import exceptions
+
+
+# Exports
+__all__ = ('DeviceFarm', 'SimulatedDevice', 'Personality',
+           'IOSLikePersonality', 'JunosPersonality', 'NetScreenPersonality',
+           'NetScalerPersonality', 'generate_output', 'generate_host_key')
+
+
+# Constants
+# The first address given to devices added to a farm
+DEFAULT_BASE_ADDRESS = '127.1.0.1'
+
+# Default size in bytes of the output of each command
+DEFAULT_OUTPUT_SIZE = 1024
+
+# Default number of lines per page when paging is on
+DEFAULT_PAGE_LENGTH = 24
+
+# JunoScript namespaces
+XNM_NS = 'http://xml.juniper.net/xnm/1.1/xnm'
+JUNOS_NS = 'http://xml.juniper.net/junos/7.6R2/junos'
+
+# Commands that end a CLI session
+EXIT_COMMANDS = ('exit', 'quit', 'logout')
+
+# A line of filler for generated output
+_FILLER = ('interface GigabitEthernet0/%d is up, line protocol is up, '
+           'MTU 1500 bytes')
+
+# Generated output by size, shared by every device
+_OUTPUT_CACHE = {}
+
+# The host key shared by every farm, generated on first use
+_HOST_KEY = []
+
+
+# Functions
+def generate_output(command, size=DEFAULT_OUTPUT_SIZE):
+    """
+    Return about ``size`` bytes of made-up output for ``command``, as lines
+    separated by newlines.
+
+    :param command:
+        The command, which is named in the first line
+
+    :param size:
+        The size of the output in bytes
+    """
+    body = _OUTPUT_CACHE.get(size)
+    if body is None:
+        lines, total = [], 0
+        for num in itertools.count():
+            if total >= size:
+                break
+            line = _FILLER % num
+            lines.append(line)
+            total += len(line) + 1
+        body = _OUTPUT_CACHE[size] = '\n'.join(lines)
+    return 'Simulated output of %r\n%s' % (command, body)
+
+def generate_host_key(bits=1024):
+    """
+    Return an RSA host key for the simulated SSH servers. It's generated once
+    and then shared, since there's no need for the servers to be secure.
+    """
+    if not _HOST_KEY:
+        _HOST_KEY.append(keys.Key(RSA.generate(bits)))
+    return _HOST_KEY[0]
+
+def iter_addresses(base=DEFAULT_BASE_ADDRESS):
+    """
+    Yield consecutive IPv4 addresses starting at ``base``, skipping any that
+    end in .0 or .255.
+    """
+    num = struct.unpack('!L', socket.inet_aton(base))[0]
+    while True:
+        if num & 0xff not in (0, 255):
+            yield socket.inet_ntoa(struct.pack('!L', num))
+        num += 1
+
+
+# Personalities
+class Personality(object):
+    """
+    How a kind of device looks to a client: its prompts, errors and how it
+    pages output.
+
+    Subclasses set the class attributes and may override the methods.
+    """
+    #: Short name used to select the personality
+    name = None
+    #: Attributes of the `~trigger.netdevices.NetDevice` for the device
+    manufacturer = None
+    device_type = 'ROUTER'
+    make = None
+    model = None
+    #: Transports the device may listen on
+    transports = ('ssh',)
+    #: Whether ``junoscript`` may be run over SSH ``exec``
+    junoscript = False
+    #: Line ending used for output
+    eol = '\r\n'
+    #: Whether commands are echoed back
+    echo = True
+    #: Written when output is paused on a full page
+    pager = ' --More-- '
+    #: Commands that turn paging off, and what they print
+    paging_commands = ()
+    paging_output = ''
+
+    def prompt(self, hostname, username):
+        """Return the prompt."""
+        raise NotImplementedError
+
+    def banner(self, hostname):
+        """Return what's written when a session starts, before the prompt."""
+        return self.eol
+
+    def error(self, command):
+        """Return the error for an invalid ``command``."""
+        raise NotImplementedError
+
+    def format(self, text):
+        """Return ``text`` with the right line endings."""
+        if self.eol != '\n':
+            text = text.replace('\n', self.eol)
+        return text
+
+class IOSLikePersonality(Personality):
+    """Cisco IOS and the many vendors that look like it."""
+    name = 'ios'
+    manufacturer = 'CISCO SYSTEMS'
+    make = 'CATALYST 6509'
+    model = 'WS-C6509-E'
+    transports = ('ssh', 'telnet')
+    paging_commands = ('terminal length 0', 'terminal pager 0',
+                       'skip-page-display', 'terminal datadump', 'no paging')
+
+    def prompt(self, hostname, username):
+        return '%s#' % hostname
+
+    def error(self, command):
+        return "%s^\n%% Invalid input detected at '^' marker.\n" % (
+            ' ' * (len(command) + 8))
+
+class JunosPersonality(Personality):
+    """Junos, in CLI or JunoScript mode."""
+    name = 'junos'
+    manufacturer = 'JUNIPER'
+    make = 'MX960-BASE-AC'
+    model = 'MX960-BASE-AC'
+    junoscript = True
+    pager = '---(more)---'
+    paging_commands = ('set cli screen-length 0',)
+    paging_output = 'Screen length set to 0\n'
+
+    def prompt(self, hostname, username):
+        return '%s@%s> ' % (username, hostname)
+
+    def banner(self, hostname):
+        return '--- JUNOS 7.6R2.9 built 2006-06-27 04:09:54 UTC\r\n'
+
+    def error(self, command):
+        return '%s^\nunknown command.\n' % (' ' * (len(command) + 10))
+
+class NetScreenPersonality(Personality):
+    """
+    ScreenOS. Note that Trigger doesn't recognize ScreenOS errors, so they're
+    returned as results.
+    """
+    name = 'netscreen'
+    manufacturer = 'NETSCREEN TECHNOLOGIES'
+    device_type = 'FIREWALL'
+    make = 'NETSCREEN'
+    model = 'NS-5400'
+    pager = '--- more --- '
+    paging_commands = ('set console page 0',)
+
+    def prompt(self, hostname, username):
+        return '%s-> ' % hostname
+
+    def error(self, command):
+        word = command.split()[-1] if command.split() else command
+        return '%s^-----unknown keyword %s\n' % (' ' * (len(command) + 4),
+                                                  word)
+
+class NetScalerPersonality(Personality):
+    """
+    Citrix NetScaler. Each result ends with ``Done``, which is what Trigger
+    looks for instead of a prompt, so no prompt is written after it.
+    """
+    name = 'netscaler'
+    manufacturer = 'CITRIX'
+    device_type = 'SWITCH'
+    make = 'NETSCALER'
+    model = 'NETSCALER MPX'
+    eol = '\n'
+    echo = False
+    paging_commands = ('set cli mode page off',)
+
+    def prompt(self, hostname, username):
+        return ' Done\n'
+
+    def banner(self, hostname):
+        return '\n'
+
+    def error(self, command):
+        return 'ERROR: No such command\n'
+
+
+# Personalities by name
+PERSONALITIES = dict((cls.name, cls) for cls in (
+    IOSLikePersonality, JunosPersonality, NetScreenPersonality,
+    NetScalerPersonality))
+
+
+# Sessions
+class CLISession(object):
+    """
+    The command line of a device: echoes commands and answers them after the
+    device's latency, paging long output until paging is turned off.
+
+    :param device:
+        The `SimulatedDevice`
+
+    :param username:
+        The user that logged in
+
+    :param write:
+        Called with the data to send to the client
+
+    :param close:
+        Called to end the session
+    """
+    def __init__(self, device, username, write, close):
+        self.device = device
+        self.personality = device.personality
+        self.prompt = self.personality.prompt(device.hostname, username)
+        self.write = write
+        self.close = close
+        self.paging = device.paging
+        self.buffer = ''
+        self.pages = None    # Pages left to write once a key is pressed
+        self.busy = False    # Whether a command is being answered
+        self.delayed = None
+
+    def start(self):
+        """Write the banner and the first prompt."""
+        self.device.stats['sessions'] += 1
+        self.write(self.personality.banner(self.device.hostname) + self.prompt)
+
+    def stop(self):
+        """Forget about any pending answer once the client is gone."""
+        if self.delayed is not None and self.delayed.active():
+            self.delayed.cancel()
+        self.delayed = None
+
+    def dataReceived(self, data):
+        self.buffer += data
+        self.process()
+
+    def process(self):
+        """Handle buffered input until there's an answer to wait for."""
+        while not self.busy:
+            if self.pages is not None:
+                if not self.buffer:
+                    return None
+                key, self.buffer = self.buffer[0], self.buffer[1:]
+                self.next_page(key)
+                continue
+
+            line, sep, rest = self.buffer.partition('\n')
+            if not sep:
+                return None
+            self.buffer = rest
+            self.handle_line(line.rstrip('\r'))
+
+    def handle_line(self, line):
+        """Echo the command and answer it."""
+        if self.personality.echo:
+            self.write(line + self.personality.eol)
+        command = line.strip()
+        if not command:
+            self.write(self.prompt)
+        elif command in EXIT_COMMANDS:
+            self.close()
+        else:
+            self.busy = True
+            delay = self.device.delay()
+            if delay:
+                self.delayed = self.device.clock.callLater(delay, self.answer,
+                                                           command)
+            else:
+                self.answer(command)
+
+    def answer(self, command):
+        """Write the output of ``command``."""
+        self.busy = False
+        self.delayed = None
+        if command in self.personality.paging_commands:
+            self.paging = False
+            output = self.personality.paging_output
+        else:
+            output = self.device.respond(command)
+        lines = self.personality.format(output).splitlines(True)
+
+        page_length = self.device.page_length
+        if self.paging and len(lines) > page_length:
+            self.pages = deque(''.join(lines[idx:idx + page_length])
+                               for idx in xrange(0, len(lines), page_length))
+            self.next_page(' ')
+        else:
+            self.write(''.join(lines) + self.prompt)
+        self.process()
+
+    def next_page(self, key):
+        """Write the next page, or stop paging if ``key`` is ``q``."""
+        if key == 'q':
+            self.pages = None
+            self.write(self.personality.eol + self.prompt)
+            return None
+        page = self.pages.popleft()
+        if self.pages:
+            self.write(page + self.personality.pager)
+        else:
+            self.pages = None
+            self.write(page + self.prompt)
+
+class ExecSession(object):
+    """
+    A single command run using SSH ``exec``, which writes its output and then
+    closes the channel.
+    """
+    def __init__(self, device, command, chan):
+        self.device = device
+        self.command = command
+        self.chan = chan
+        self.delayed = None
+
+    def start(self):
+        self.device.stats['sessions'] += 1
+        delay = self.device.delay()
+        self.delayed = self.device.clock.callLater(delay, self.answer)
+
+    def stop(self):
+        if self.delayed is not None and self.delayed.active():
+            self.delayed.cancel()
+
+    def dataReceived(self, data):
+        pass
+
+    def answer(self):
+        chan = self.chan
+        chan.write(self.device.personality.format(
+            self.device.respond(self.command)))
+        chan.conn.sendRequest(chan, 'exit-status', struct.pack('>L', 0))
+        chan.conn.sendEOF(chan)
+        chan.loseConnection()
+
+class JunoscriptSession(object):
+    """
+    JunoScript XML: each ``<rpc>`` is answered with an ``<rpc-reply>``
+    containing an ``<output>`` element, or an ``<xnm:error>``.
+
+    The command for an ``<rpc>`` is the text of a ``<command>`` element, or
+    else the name of the element, such as ``get-software-information``.
+    Outputs given to the device are inserted into the ``<rpc-reply>`` as XML.
+    """
+    def __init__(self, device, write, close):
+        from trigger.twister import IncrementalXMLTreeBuilder
+        self.device = device
+        self.write = write
+        self.close = close
+        self.parser = IncrementalXMLTreeBuilder(self._endhandler)
+        self.queue = deque()
+        self.delayed = None
+
+    def start(self):
+        self.device.stats['sessions'] += 1
+        self.write(
+            '<?xml version="1.0" encoding="us-ascii"?>\n'
+            '<junoscript xmlns="%s" xmlns:junos="%s" os="JUNOS" '
+            'release="7.6R2.9" hostname="%s" version="1.0">\n' % (
+                XNM_NS, JUNOS_NS, self.device.hostname))
+
+    def stop(self):
+        if self.delayed is not None and self.delayed.active():
+            self.delayed.cancel()
+
+    def dataReceived(self, data):
+        self.parser.feed(data)
+
+    def _endhandler(self, tag):
+        if tag.tag != 'rpc':
+            return None
+        command = tag[0].text if len(tag) else ''
+        if len(tag) and tag[0].tag != 'command':
+            command = tag[0].tag
+        self.queue.append((command or '').strip())
+        if self.delayed is None:
+            self._next()
+
+    def _next(self):
+        if not self.queue:
+            self.delayed = None
+            return None
+        self.delayed = self.device.clock.callLater(self.device.delay(),
+                                                   self.answer)
+
+    def answer(self):
+        command = self.queue.popleft()
+        if command in self.device.outputs:
+            reply = self.device.respond(command)
+        elif self.device.is_error(command):
+            self.device.stats['errors'] += 1
+            reply = ('<xnm:error xmlns="%s" xmlns:xnm="%s">\n'
+                     '<message>syntax error</message>\n'
+                     '</xnm:error>\n' % (XNM_NS, XNM_NS))
+        else:
+            self.device.stats['commands'] += 1
+            reply = '<output>\n%s\n</output>\n' % escape(
+                generate_output(command, self.device.output_size))
+        self.write('<rpc-reply xmlns:junos="%s">\n%s</rpc-reply>\n' % (
+            JUNOS_NS, reply))
+        self._next()
+
+
+# SSH
+class SimulatorSSHChannel(channel.SSHChannel):
+    """A session channel that runs a CLI, ``exec`` or JunoScript session."""
+    name = 'session'
+
+    def __init__(self, *args, **kwargs):
+        channel.SSHChannel.__init__(self, *args, **kwargs)
+        self.session = None
+
+    def _start(self, session):
+        if self.session is not None:
+            return False
+        self.session = session
+        self.avatar.device.clock.callLater(0, session.start)
+        return True
+
+    def request_pty_req(self, data):
+        return True
+
+    def request_window_change(self, data):
+        return True
+
+    def request_shell(self, data):
+        device = self.avatar.device
+        return self._start(CLISession(device, self.avatar.username,
+                                      self.write, self.loseConnection))
+
+    def request_exec(self, data):
+        command, _ = common.getNS(data)
+        device = self.avatar.device
+        if command == 'junoscript' and device.personality.junoscript:
+            session = JunoscriptSession(device, self.write,
+                                        self.loseConnection)
+        else:
+            session = ExecSession(device, command, self)
+        return self._start(session)
+
+    def dataReceived(self, data):
+        if self.session is not None:
+            self.session.dataReceived(data)
+
+    def closed(self):
+        if self.session is not None:
+            self.session.stop()
+
+class SimulatorAvatar(avatar.ConchUser):
+    """A user logged in to a simulated device."""
+    def __init__(self, username, device):
+        avatar.ConchUser.__init__(self)
+        self.username = username
+        self.device = device
+        self.channelLookup['session'] = SimulatorSSHChannel
+
+@implementer(IRealm)
+class SimulatorRealm(object):
+    """Hand out avatars for a device."""
+    def __init__(self, device):
+        self.device = device
+
+    def requestAvatar(self, avatarId, mind, *interfaces):
+        if IConchUser not in interfaces:
+            raise NotImplementedError('No supported interfaces')
+        return IConchUser, SimulatorAvatar(avatarId, self.device), lambda: None
+
+@implementer(ICredentialsChecker)
+class SimulatorChecker(object):
+    """
+    Check usernames and passwords. If ``password`` is ``None`` any
+    credentials are accepted.
+    """
+    credentialInterfaces = (IUsernamePassword,)
+
+    def __init__(self, username=None, password=None):
+        self.username = username
+        self.password = password
+
+    def requestAvatarId(self, credentials):
+        if self.password is None or (
+                credentials.username == self.username and
+                credentials.password == self.password):
+            return defer.succeed(credentials.username)
+        return defer.fail(cred_error.UnauthorizedLogin('Bad credentials'))
+
+class SimulatorSSHServerTransport(transport.SSHServerTransport):
+    """
+    Like OpenSSH, wait for the client's version before starting the key
+    exchange, instead of sending both at once.
+    """
+    def connectionMade(self):
+        self.transport.write('%s\r\n' % self.ourVersionString)
+        self.currentEncryptions = transport.SSHCiphers('none', 'none', 'none',
+                                                       'none')
+        self.currentEncryptions.setKeys('', '', '', '', '', '')
+
+    def dataReceived(self, data):
+        got_version = self.gotVersion
+        transport.SSHServerTransport.dataReceived(self, data)
+        if (self.gotVersion and not got_version and
+                self._keyExchangeState == self._KEY_EXCHANGE_NONE):
+            self.sendKexInit()
+
+class SimulatorSSHFactory(factory.SSHFactory):
+    """SSH server for a device."""
+    noisy = False
+    protocol = SimulatorSSHServerTransport
+
+    def __init__(self, device, checker, host_key):
+        self.device = device
+        self.portal = Portal(SimulatorRealm(device), [checker])
+        self.publicKeys = {'ssh-rsa': host_key.public()}
+        self.privateKeys = {'ssh-rsa': host_key}
+        self.primes = None
+
+    def buildProtocol(self, addr):
+        self.device.stats['connections'] += 1
+        return factory.SSHFactory.buildProtocol(self, addr)
+
+
+# Telnet
+class SimulatorTelnetProtocol(telnet.TelnetProtocol):
+    """Log in like IOS and then run a CLI session."""
+    def __init__(self, device, checker):
+        self.device = device
+        self.checker = checker
+        self.buffer = ''
+        self.username = None
+        self.session = None
+
+    def connectionMade(self):
+        self.write('\r\nUser Access Verification\r\n\r\nUsername: ')
+
+    def write(self, data):
+        # The telnet transport turns each newline into CR LF itself.
+        self.transport.write(data.replace('\r\n', '\n'))
+
+    def dataReceived(self, data):
+        if self.session is not None:
+            return self.session.dataReceived(data)
+
+        self.buffer += data
+        line, sep, self.buffer = self.buffer.partition('\n')
+        if not sep:
+            self.buffer = line
+            return None
+        line = line.rstrip('\r')
+        if self.username is None:
+            self.username = line
+            self.write('\r\nPassword: ')
+        else:
+            d = self.checker.requestAvatarId(UsernamePassword(self.username,
+                                                              line))
+            d.addCallbacks(self._loggedIn, self._loginFailed)
+
+    def _loggedIn(self, username):
+        self.session = CLISession(self.device, username, self.write,
+                                  self.transport.loseConnection)
+        self.session.start()
+        if self.buffer:
+            data, self.buffer = self.buffer, ''
+            self.session.dataReceived(data)
+
+    def _loginFailed(self, failure):
+        failure.trap(cred_error.UnauthorizedLogin)
+        self.username = None
+        self.write('\r\n% Login invalid\r\n\r\nUsername: ')
+
+    def connectionLost(self, reason):
+        if self.session is not None:
+            self.session.stop()
+
+class SimulatorTelnetFactory(protocol.ServerFactory):
+    """Telnet server for a device."""
+    noisy = False
+
+    def __init__(self, device, checker):
+        self.device = device
+        self.checker = checker
+
+    def buildProtocol(self, addr):
+        self.device.stats['connections'] += 1
+        proto = telnet.TelnetTransport(SimulatorTelnetProtocol, self.device,
+                                       self.checker)
+        proto.factory = self
+        return proto
+
+
+# Devices
+class SimulatedDevice(object):
+    """
+    A virtual device. Create these using `DeviceFarm.add`.
+
+    :param hostname:
+        The hostname shown in prompts
+
+    :param personality:
+        The name of a personality (``ios``, ``junos``, ``netscreen`` or
+        ``netscaler``) or a `Personality` instance
+
+    :param address:
+        The address to listen on
+
+    :param transport:
+        (Optional) ``ssh`` or ``telnet``
+
+    :param port:
+        (Optional) The port to listen on. Defaults to a free port.
+
+    :param output_size:
+        (Optional) Size in bytes of the output of each command
+
+    :param latency:
+        (Optional) Seconds to wait before answering each command
+
+    :param jitter:
+        (Optional) Up to this many more seconds are added to the latency at
+        random
+
+    :param error_rate:
+        (Optional) Fraction of commands, from 0 to 1, that fail at random
+
+    :param error_commands:
+        (Optional) Commands that always fail
+
+    :param paging:
+        (Optional) Whether to page output until paging is turned off
+
+    :param page_length:
+        (Optional) Lines per page
+
+    :param outputs:
+        (Optional) A dict of output for specific commands
+    """
+    def __init__(self, hostname, personality, address, transport='ssh',
+                 port=0, output_size=DEFAULT_OUTPUT_SIZE, latency=0, jitter=0,
+                 error_rate=0, error_commands=(), paging=True,
+                 page_length=DEFAULT_PAGE_LENGTH, outputs=None, rng=None,
+                 clock=None):
+        if isinstance(personality, basestring):
+            if personality not in PERSONALITIES:
+                raise exceptions.ImproperlyConfigured(
+                    'Unknown personality %r; expected one of %s' % (
+                        personality, ', '.join(sorted(PERSONALITIES))))
+            personality = PERSONALITIES[personality]()
+        if transport not in personality.transports:
+            raise exceptions.ImproperlyConfigured(
+                '%s devices do not support %s' % (personality.name,
+                                                  transport))
+        if clock is None:
+            from twisted.internet import reactor as clock
+
+        self.hostname = hostname
+        self.personality = personality
+        self.address = address
+        self.transport = transport
+        self.port = port
+        self.output_size = output_size
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_commands = set(error_commands)
+        self.paging = paging
+        self.page_length = page_length
+        self.outputs = outputs or {}
+        self.random = rng or random.Random()
+        self.clock = clock
+        self.listener = None
+        self.stats = dict.fromkeys(('connections', 'sessions', 'commands',
+                                    'errors'), 0)
+
+    def __repr__(self):
+        return '<%s: %s (%s/%s) at %s:%s>' % (
+            self.__class__.__name__, self.hostname, self.personality.name,
+            self.transport, self.address, self.port)
+
+    def delay(self):
+        """Return how long to wait before answering a command."""
+        if self.jitter:
+            return self.latency + self.random.uniform(0, self.jitter)
+        return self.latency
+
+    def is_error(self, command):
+        """Return whether ``command`` should fail."""
+        if command in self.error_commands:
+            return True
+        return bool(self.error_rate) and self.random.random() < self.error_rate
+
+    def respond(self, command):
+        """Return the output of ``command``."""
+        if command in self.outputs:
+            self.stats['commands'] += 1
+            return self.outputs[command]
+        if self.is_error(command):
+            self.stats['errors'] += 1
+            return self.personality.error(command)
+        self.stats['commands'] += 1
+        return generate_output(command, self.output_size) + '\n'
+
+    def listen(self, checker, host_key=None):
+        """Start listening. Called by `DeviceFarm.start`."""
+        if self.transport == 'ssh':
+            server = SimulatorSSHFactory(self, checker, host_key)
+        else:
+            server = SimulatorTelnetFactory(self, checker)
+        self.listener = self.clock.listenTCP(self.port, server,
+                                             interface=self.address)
+        self.port = self.listener.getHost().port
+        return self.listener
+
+    def record(self):
+        """Return the device as a NetDevices record."""
+        personality = self.personality
+        return {
+            'nodeName': self.address,
+            'nodePort': self.port,
+            'deviceName': self.hostname,
+            'manufacturer': personality.manufacturer,
+            'deviceType': personality.device_type,
+            'make': personality.make,
+            'model': personality.model,
+            'adminStatus': 'PRODUCTION',
+            'owningTeam': 'Simulator',
+            'site': 'SIM',
+        }
+
+class DeviceFarm(object):
+    """
+    A collection of simulated devices.
+
+    :param username:
+        (Optional) The username devices accept
+
+    :param password:
+        (Optional) The password devices accept. If unset, any username and
+        password are accepted.
+
+    :param base_address:
+        (Optional) The address of the first device; the rest follow it
+
+    :param seed:
+        (Optional) Seed for latency jitter and injected errors, so runs can
+        be repeated
+    """
+    def __init__(self, username=None, password=None,
+                 base_address=DEFAULT_BASE_ADDRESS, seed=None):
+        self.checker = SimulatorChecker(username, password)
+        self.devices = []
+        self.random = random.Random(seed)
+        self._addresses = iter_addresses(base_address)
+        self._numbers = itertools.count(1)
+
+    def __repr__(self):
+        return '<%s: %d devices>' % (self.__class__.__name__,
+                                     len(self.devices))
+
+    def add(self, personality='ios', hostname=None, address=None, **options):
+        """
+        Add a device and return it. Keyword arguments are passed on to
+        `SimulatedDevice`.
+
+        :param personality:
+            The name of a personality or a `Personality` instance
+
+        :param hostname:
+            (Optional) The hostname. Defaults to one based on the
+            personality, such as ``ios-sim00001``.
+
+        :param address:
+            (Optional) The address to listen on. Defaults to the next free
+            address.
+        """
+        num = self._numbers.next()
+        if address is None:
+            address = self._addresses.next()
+        if hostname is None:
+            name = getattr(personality, 'name', personality)
+            hostname = '%s-sim%05d' % (name, num)
+        options.setdefault('rng', self.random)
+        device = SimulatedDevice(hostname, personality, address, **options)
+        self.devices.append(device)
+        return device
+
+    def add_many(self, count, personality='ios', **options):
+        """
+        Add ``count`` devices and return them.
+
+        :param personality:
+            A personality, or a list of them to take turns
+        """
+        if isinstance(personality, (basestring, Personality)):
+            personality = [personality]
+        cycle = itertools.cycle(personality)
+        return [self.add(cycle.next(), **options) for _ in xrange(count)]
+
+    def start(self):
+        """Start listening on every device that isn't already."""
+        host_key = None
+        for device in self.devices:
+            if device.listener is not None:
+                continue
+            if device.transport == 'ssh' and host_key is None:
+                host_key = generate_host_key()
+            device.listen(self.checker, host_key)
+        log.msg('Simulating %d devices' % len(self.devices))
+        return self
+
+    def stop(self):
+        """
+        Stop listening. Returns a ``Deferred`` that fires once every device
+        has stopped.
+        """
+        stopping = []
+        for device in self.devices:
+            if device.listener is not None:
+                stopping.append(
+                    defer.maybeDeferred(device.listener.stopListening))
+                device.listener = None
+        return defer.DeferredList(stopping)
+
+    @property
+    def stats(self):
+        """The totals of the stats of every device."""
+        totals = dict.fromkeys(('connections', 'sessions', 'commands',
+                                'errors'), 0)
+        for device in self.devices:
+            for key, value in device.stats.iteritems():
+                totals[key] += value
+        return totals
+
+    def records(self):
+        """Return a NetDevices record for each device."""
+        return [device.record() for device in self.devices]
+
+    def write_netdevices(self, path):
+        """Write the devices to ``path`` as NetDevices JSON."""
+        with open(path, 'w') as fh:
+            json.dump(self.records(), fh, indent=4)
+        return path
+
+
+def main(argv=None):
+    """Run a farm until interrupted."""
+    import optparse
+    parser = optparse.OptionParser(
+        usage='%prog [options]',
+        description='Run simulated network devices on loopback addresses.')
+    parser.add_option('-n', '--devices', type='int', default=10,
+                      help='Number of devices (default: %default)')
+    parser.add_option('-p', '--personality', default='ios',
+                      help='Comma-separated personalities to take turns: %s '
+                           '(default: %%default)' % ', '.join(
+                               sorted(PERSONALITIES)))
+    parser.add_option('-t', '--transport', default='ssh',
+                      help='ssh or telnet (default: %default)')
+    parser.add_option('-u', '--username', help='Username to accept')
+    parser.add_option('-P', '--password',
+                      help='Password to accept (default: accept any)')
+    parser.add_option('--base-address', default=DEFAULT_BASE_ADDRESS,
+                      help='Address of the first device (default: %default)')
+    parser.add_option('--output-size', type='int',
+                      default=DEFAULT_OUTPUT_SIZE,
+                      help='Bytes of output per command (default: %default)')
+    parser.add_option('--latency', type='float', default=0,
+                      help='Seconds before each answer (default: %default)')
+    parser.add_option('--jitter', type='float', default=0,
+                      help='Up to this many more seconds of latency '
+                           '(default: %default)')
+    parser.add_option('--error-rate', type='float', default=0,
+                      help='Fraction of commands that fail '
+                           '(default: %default)')
+    parser.add_option('--error-command', action='append', default=[],
+                      dest='error_commands', metavar='COMMAND',
+                      help='A command that always fails (may be repeated)')
+    parser.add_option('--no-paging', action='store_false', dest='paging',
+                      default=True, help='Never page output')
+    parser.add_option('-o', '--netdevices', metavar='PATH',
+                      help='Write the devices to PATH as NetDevices JSON')
+    parser.add_option('--seed', type='int', help='Random seed')
+    opts, args = parser.parse_args(argv)
+
+    # Each device needs a file descriptor to listen on.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    from twisted.internet import reactor
+    farm = DeviceFarm(opts.username, opts.password, opts.base_address,
+                      opts.seed)
+    try:
+        farm.add_many(opts.devices, opts.personality.split(','),
+                      transport=opts.transport, output_size=opts.output_size,
+                      latency=opts.latency, jitter=opts.jitter,
+                      error_rate=opts.error_rate,
+                      error_commands=opts.error_commands, paging=opts.paging)
+        farm.start()
+    except (exceptions.ImproperlyConfigured, socket.error) as err:
+        parser.error(err)
+    if opts.netdevices:
+        farm.write_netdevices(opts.netdevices)
+    for device in farm.devices[:10]:
+        print device
+    if len(farm.devices) > 10:
+        print '... and %d more' % (len(farm.devices) - 10)
+    print 'Listening with %d devices' % len(farm.devices)
+    sys.stdout.flush()
+    reactor.run()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
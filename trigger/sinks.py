@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+"""
+Result sinks for `~trigger.cmds.Commando`.
+
+A sink receives the results, parsed results and errors for each device as soon
+as the device is done, instead of them being kept in memory until the end of
+the run. Pass one to `~trigger.cmds.Commando` as ``sink``, and set
+``keep_results=False`` to keep nothing in memory at all::
+
+    >>> from trigger.cmds import Commando
+    >>> from trigger.sinks import JSONLinesSink
+    >>> c = Commando(devices=devices, commands=['show running-config'],
+    ...              sink=JSONLinesSink('configs.jsonl'), keep_results=False)
+
+The built-in sinks are:
+
+`~trigger.sinks.JSONLinesSink`
+    One JSON object per line in a file.
+`~trigger.sinks.DirectorySink`
+    A file per device in a directory.
+`~trigger.sinks.SQLiteSink`
+    A row per device in a SQLite table.
+`~trigger.sinks.CallbackSink`
+    Calls a function for each device.
+
+`~trigger.sinks.open_sink` creates a sink from a string such as
+``'jsonl:configs.jsonl'``, which is how command-line tools select one.
+"""
+
+
+# Imports
+import datetime
+import json
+import os
+import threading
+from xml.etree.cElementTree import tostring, iselement
+
+from twisted.python.failure import Failure
+
+from trigger import exceptions
+
+try:
+    import sqlite3
+except ImportError:
+    SQLITE_AVAILABLE = False
+else:
+    SQLITE_AVAILABLE = True
+
+
+# Exports
+__all__ = ('ResultSink', 'JSONLinesSink', 'DirectorySink', 'SQLiteSink',
+           'CallbackSink', 'open_sink', 'to_jsonable')
+
+
+# Constants
+# The kinds of data written to sinks
+RESULT = 'result'
+PARSED = 'parsed'
+ERROR = 'error'
+
+
+# Functions
+def to_jsonable(obj):
+    """
+    Return a JSON-serializable version of ``obj``, for use as the ``default``
+    of ``json.dump()``.
+
+    XML elements (such as JunoScript results) are serialized as XML, and
+    errors (exceptions or Twisted ``Failure`` objects) as a dict of their
+    type and message.
+    """
+    if isinstance(obj, Failure):
+        return {'type': obj.type.__name__, 'message': obj.getErrorMessage()}
+    if isinstance(obj, BaseException):
+        return {'type': obj.__class__.__name__, 'message': str(obj)}
+    if iselement(obj):
+        return tostring(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
+
+def _dumps(data):
+    """Serialize ``data`` to JSON."""
+    return json.dumps(data, default=to_jsonable)
+
+def _now():
+    """Return the current UTC time as an ISO 8601 string."""
+    return datetime.datetime.utcnow().isoformat()
+
+def open_sink(spec):
+    """
+    Create a sink from a string of the form ``{type}:{path}``, where type is
+    one of ``jsonl``, ``dir`` or ``sqlite``.
+
+    :param spec:
+        The sink to open, e.g. ``'jsonl:/tmp/results.jsonl'``
+    """
+    kind, sep, path = spec.partition(':')
+    if not sep or not path or kind not in SINK_TYPES:
+        raise exceptions.ImproperlyConfigured(
+            'Invalid result sink %r; expected one of %s followed by ":" and '
+            'a path' % (spec, ', '.join(sorted(SINK_TYPES))))
+    return SINK_TYPES[kind](path)
+
+
+# Classes
+class ResultSink(object):
+    """
+    Base class for result sinks.
+
+    Subclasses must implement `write`, and may implement `close` to release
+    any resources once the run is done.
+    """
+    def write_result(self, device, results):
+        """Write the ``results`` for ``device``."""
+        self.write(str(device), RESULT, results)
+
+    def write_parsed(self, device, results):
+        """Write the parsed ``results`` for ``device``."""
+        self.write(str(device), PARSED, results)
+
+    def write_error(self, device, error):
+        """Write the ``error`` for ``device``."""
+        self.write(str(device), ERROR, error)
+
+    def write(self, devname, kind, data):
+        """
+        Write ``data`` for the device named ``devname``.
+
+        :param devname:
+            The name of the device
+
+        :param kind:
+            One of ``'result'``, ``'parsed'`` or ``'error'``
+
+        :param data:
+            The results or error
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release any resources held by the sink."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class JSONLinesSink(ResultSink):
+    """
+    Write each device's data as a line of JSON, such as::
+
+        {"device": "dev1", "kind": "result", "data": {...}, "time": "..."}
+
+    Each line is flushed as it's written, so the file can be followed while
+    the run is going on. Lines may be written from more than one thread.
+
+    :param path:
+        A path to write to, which is truncated, or an open file object
+    """
+    def __init__(self, path):
+        if hasattr(path, 'write'):
+            self.fileobj, self._owned = path, False
+        else:
+            self.fileobj, self._owned = open(path, 'w'), True
+        self._lock = threading.Lock()
+
+    def write(self, devname, kind, data):
+        record = {'device': devname, 'kind': kind, 'data': data,
+                  'time': _now()}
+        line = _dumps(record) + '\n'
+        with self._lock:
+            self.fileobj.write(line)
+            self.fileobj.flush()
+
+    def close(self):
+        if self._owned and not self.fileobj.closed:
+            self.fileobj.close()
+
+class DirectorySink(ResultSink):
+    """
+    Write each device's data to its own file in a directory, named after the
+    device with an extension for the kind of data: ``{device}.txt`` for
+    results, ``{device}.parsed.json`` for parsed results and
+    ``{device}.error`` for errors.
+
+    Results that are a dict of ``{command: output}`` (as stored by
+    `~trigger.cmds.Commando`) are written with a header for each command;
+    anything else that isn't a string is written as JSON.
+
+    :param path:
+        The directory to write to, which is created if it doesn't exist
+    """
+    extensions = {RESULT: '.txt', PARSED: '.parsed.json', ERROR: '.error'}
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def filename(self, devname, kind):
+        """Return the path of the file for ``devname`` and ``kind``."""
+        name = devname.replace(os.sep, '_')
+        return os.path.join(self.path, name + self.extensions[kind])
+
+    def format(self, kind, data):
+        """Return ``data`` as a string."""
+        if isinstance(data, basestring):
+            return data
+        if kind == RESULT and isinstance(data, dict):
+            chunks = []
+            for command, output in data.iteritems():
+                if not isinstance(output, basestring):
+                    output = _dumps(output)
+                chunks.append('### %s\n%s\n' % (command, output))
+            return '\n'.join(chunks)
+        if kind == ERROR:
+            error = to_jsonable(data)
+            if isinstance(error, dict):
+                return '%(type)s: %(message)s\n' % error
+            return '%s\n' % error
+        return _dumps(data)
+
+    def write(self, devname, kind, data):
+        text = self.format(kind, data)
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        with open(self.filename(devname, kind), 'w') as fh:
+            fh.write(text)
+
+class SQLiteSink(ResultSink):
+    """
+    Write each device's data as a row in a SQLite table with the columns
+    ``device``, ``kind``, ``data`` (as JSON) and ``time``.
+
+    Rows are committed as they're written so that they can be read while the
+    run is going on. Rows may be written from more than one thread.
+
+    :param path:
+        The path to the database, which is created if it doesn't exist
+
+    :param table_name:
+        (Optional) The table to write to, which is created if it doesn't
+        exist
+    """
+    def __init__(self, path, table_name='results'):
+        if not SQLITE_AVAILABLE:
+            raise exceptions.ImproperlyConfigured(
+                'SQLiteSink requires the sqlite3 module')
+        self.table_name = table_name
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.connection.execute(
+            'create table if not exists %s (device text, kind text, '
+            'data text, time text)' % table_name)
+        self.connection.commit()
+
+    def write(self, devname, kind, data):
+        row = (devname, kind, _dumps(data), _now())
+        with self._lock:
+            self.connection.execute(
+                'insert into %s values (?, ?, ?, ?)' % self.table_name, row)
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+class CallbackSink(ResultSink):
+    """
+    Call a function with each device's data.
+
+    :param on_result:
+        Called with ``(devname, results)`` for results
+
+    :param on_error:
+        (Optional) Called with ``(devname, error)`` for errors
+
+    :param on_parsed:
+        (Optional) Called with ``(devname, results)`` for parsed results
+    """
+    def __init__(self, on_result, on_error=None, on_parsed=None):
+        self.callbacks = {RESULT: on_result, ERROR: on_error,
+                          PARSED: on_parsed}
+
+    def write(self, devname, kind, data):
+        callback = self.callbacks[kind]
+        if callback is not None:
+            callback(devname, data)
+
+
+# Sink types accepted by open_sink()
+SINK_TYPES = {
+    'jsonl': JSONLinesSink,
+    'dir': DirectorySink,
+    'sqlite': SQLiteSink,
+}
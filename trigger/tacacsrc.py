@@ -21,12 +21,15 @@ from time import strftime, localtime
 import os
 import pwd
 import sys
+import time
 from twisted.python import log
 from trigger.conf import settings
+from trigger.exceptions import AgentError
 
 # Exports
 __all__ = ('get_device_password', 'prompt_credentials', 'convert_tacacsrc',
-           'update_credentials', 'validate_credentials', 'Credentials', 'Tacacsrc')
+           'update_credentials', 'validate_credentials', 'Credentials', 'Tacacsrc',
+           'CredentialCache', 'CREDENTIAL_CACHE')
 
 # Credential object stored in Tacacsrc.creds
 Credentials = namedtuple('Credentials', 'username password realm')
@@ -49,10 +52,14 @@ def get_device_password(device=None, tcrc=None):
     :param device:
         Realm or device name to updated
 
-    :param device:
-        Optional `~trigger.tacacsrc.Tacacsrc` instance
+    :param tcrc:
+        Optional `~trigger.tacacsrc.Tacacsrc` instance. Its credentials are
+        only cached if it was read from the default ``.tacacsrc``.
     """
     if tcrc is None:
+        creds = CREDENTIAL_CACHE.get(device)
+        if creds is not None:
+            return creds
         tcrc = Tacacsrc()
 
     # If device isn't passed, assume we are initializing the .tacacsrc.
@@ -64,8 +71,19 @@ def get_device_password(device=None, tcrc=None):
         tcrc.creds[device] = creds
         tcrc.write()
 
+    if _is_default_file(tcrc.file_name):
+        CREDENTIAL_CACHE.update(tcrc.creds)
     return creds
 
+def _is_default_file(file_name):
+    """
+    Return whether ``file_name`` is the default ``.tacacsrc``, whose
+    credentials are the ones kept in `CREDENTIAL_CACHE`.
+    """
+    real_path = os.path.realpath(os.path.expanduser(file_name))
+    default = os.path.realpath(os.path.expanduser(settings.TACACSRC))
+    return real_path in (default, default + '.gpg')
+
 def prompt_credentials(device, user=None):
     """
     Prompt for username, password and return them as Credentials namedtuple.
@@ -113,7 +131,8 @@ def update_credentials(device, username=None):
     need this factored out so that we don't end up with a race condition when
     credentials are messed up.
 
-    Returns True if it actually updated something or None if it didn't.
+    Returns True if it actually updated something or None if it didn't. Any
+    credentials in `CREDENTIAL_CACHE` are cleared when the file is written.
 
     :param device: Device or realm name to update
     :param username: Username for credentials
@@ -136,7 +155,9 @@ def validate_credentials(creds=None):
     Given a set of credentials, try to return a `~trigger.tacacsrc.Credentials`
     object.
 
-    If ``creds`` is unset it will fetch from ``.tacacsrc``.
+    If ``creds`` is unset it will fetch from ``.tacacsrc``, or from
+    `CREDENTIAL_CACHE` if they were fetched less than
+    :setting:`TACACSRC_CACHE_TTL` seconds ago.
 
     Expects either a 2-tuple of (username, password) or a 3-tuple of (username,
     password, realm). If only (username, password) are provided, realm will be populated from
@@ -151,6 +172,9 @@ def validate_credentials(creds=None):
     # If it isn't set or it's a string, or less than 1 or more than 3 items,
     # get from .tacacsrc
     if (not creds) or (type(creds) == str) or (len(creds) not in (2, 3)):
+        cached = CREDENTIAL_CACHE.get(realm)
+        if cached is not None:
+            return cached
         log.msg('Creds not valid, fetching from .tacacsrc...')
         tcrc = Tacacsrc()
         return tcrc.creds.get(realm, get_device_password(realm, tcrc))
@@ -220,11 +244,16 @@ class Tacacsrc(object):
     Pass use_gpg=True to force GPG, otherwise it relies on
     settings.USE_GPG_AUTH
 
+    Unless a tacacsrc_file is given, or use_agent=False, the credentials are
+    fetched from the agent at settings.TACACSRC_AGENT_SOCKET if one is running
+    (see `~trigger.agent`), and handed to it when they're read or written. The
+    agent keeps them by file, so only those read from the same file are used.
+
     `*_old` functions should be removed after everyone is moved to the new
     system.
     """
     def __init__(self, tacacsrc_file=None, use_gpg=settings.USE_GPG_AUTH,
-                 generate_new=False):
+                 generate_new=False, use_agent=True):
         """
         Open .tacacsrc (tacacsrc_file or $TACACSRC or ~/.tacacsrc), or create
         a new file if one cannot be found on disk.
@@ -241,6 +270,11 @@ class Tacacsrc(object):
         self.creds = {}
         self.creds_updated = False
         self.version = LooseVersion('2.0')
+        self.agent = None
+        if use_agent and tacacsrc_file is None:
+            # Imported here because trigger.agent imports this module
+            from trigger.agent import get_agent
+            self.agent = get_agent()
 
         # If we're not generating a new file and gpg is enabled, turn it off if
         # the right files can't be found.
@@ -267,8 +301,11 @@ class Tacacsrc(object):
 
         if self.use_gpg:
             if not self.generate_new:
-                self.rawdata = self._decrypt_and_read()
-                self.creds = self._parse()
+                self.creds = self._get_agent_creds()
+                if not self.creds:
+                    self.rawdata = self._decrypt_and_read()
+                    self.creds = self._parse()
+                    self._set_agent_creds()
             else:
                 self.creds[settings.DEFAULT_REALM] = prompt_credentials(device='tacacsrc')
                 self.write()
@@ -284,15 +321,43 @@ class Tacacsrc(object):
                 self.key = self._get_key_old(settings.TACACSRC_KEYFILE)
 
             if not self.generate_new:
-                self.rawdata = self._read_file_old()
-                self.creds = self._parse_old()
-                if self.creds_updated: # _parse_old() might set this flag
-                    log.msg('creds updated, writing to file', debug=True)
-                    self.write()
+                self.creds = self._get_agent_creds()
+                if not self.creds:
+                    self.rawdata = self._read_file_old()
+                    self.creds = self._parse_old()
+                    if self.creds_updated: # _parse_old() might set this flag
+                        log.msg('creds updated, writing to file', debug=True)
+                        self.write()
+                    else:
+                        self._set_agent_creds()
             else:
                 self.creds[settings.DEFAULT_REALM] = prompt_credentials(device='tacacsrc')
                 self.write()
 
+    def _get_agent_creds(self):
+        """Return the credentials held by the agent, or {} if there are none."""
+        if self.agent is None:
+            return {}
+        try:
+            creds = self.agent.get_credentials(self.file_name)
+        except AgentError as err:
+            log.msg('Credential agent failed: %s' % err)
+            self.agent = None
+            return {}
+        if creds:
+            log.msg('Got credentials from %r' % self.agent, debug=True)
+        return creds
+
+    def _set_agent_creds(self):
+        """Hand the current credentials to the agent, if there is one."""
+        if self.agent is None:
+            return
+        try:
+            self.agent.set_credentials(self.creds, self.file_name)
+        except AgentError as err:
+            log.msg('Credential agent failed: %s' % err)
+            self.agent = None
+
     def _get_key_nonce_old(self):
         """Yes, the key nonce is the userid.  Awesome, right?"""
         return pwd.getpwuid(os.getuid())[0] + '\n'
@@ -459,10 +524,15 @@ class Tacacsrc(object):
 
     def write(self):
         """Writes .tacacsrc(.gpg) using the accurate method (old vs. new)."""
+        # Whatever was cached from the old file is stale now
+        CREDENTIAL_CACHE.invalidate()
         if self.use_gpg:
-            return self._write_new()
+            self._write_new()
+        else:
+            self._write_old()
 
-        return self._write_old()
+        # Only once they're safely on disk
+        self._set_agent_creds()
 
     def _update_perms(self):
         """Enforce -rw------- on the creds file"""
@@ -509,3 +579,74 @@ class Tacacsrc(object):
             return True
 
         return False
+
+
+class CredentialCache(object):
+    """
+    Credentials read from the ``.tacacsrc`` file, by realm, so that the file
+    is read and decrypted once per realm instead of once per connection.
+
+    Credentials expire ``ttl`` seconds after they're added, so that changes
+    made to the file by other processes are eventually seen, and
+    `~trigger.tacacsrc.Tacacsrc.write()` clears them all. The cache used by
+    the functions in this module is ``CREDENTIAL_CACHE``.
+
+    :param ttl:
+        (Optional) Seconds to keep credentials for. Defaults to
+        :setting:`TACACSRC_CACHE_TTL`. If ``0``, nothing is cached.
+
+    :param clock:
+        (Optional) A function returning the current time in seconds. Defaults
+        to ``time.time``.
+    """
+    def __init__(self, ttl=None, clock=time.time):
+        self._ttl = ttl
+        self.clock = clock
+        self._creds = {}
+
+    def __len__(self):
+        return len(self._creds)
+
+    @property
+    def ttl(self):
+        if self._ttl is None:
+            return settings.TACACSRC_CACHE_TTL
+        return self._ttl
+
+    def get(self, realm):
+        """
+        Return the credentials for ``realm``, or ``None`` if they aren't
+        cached or have expired.
+        """
+        try:
+            creds, expires = self._creds[realm]
+        except KeyError:
+            return None
+        if self.clock() >= expires:
+            del self._creds[realm]
+            return None
+        return creds
+
+    def update(self, creds):
+        """
+        Add the credentials in ``creds``, a dict mapping realms to
+        `~trigger.tacacsrc.Credentials` such as ``Tacacsrc.creds``.
+        """
+        ttl = self.ttl
+        if not ttl:
+            return
+        expires = self.clock() + ttl
+        for realm, realm_creds in creds.iteritems():
+            if realm_creds:
+                self._creds[realm] = (realm_creds, expires)
+
+    def invalidate(self, realm=None):
+        """Forget the credentials for ``realm``, or for every realm."""
+        if realm is None:
+            self._creds.clear()
+        else:
+            self._creds.pop(realm, None)
+
+
+# The cache used by get_device_password() and validate_credentials()
+CREDENTIAL_CACHE = CredentialCache()
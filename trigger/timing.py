@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+"""
+Timing of the phases of a connection to a device.
+
+Every connection made by `~trigger.twister` keeps a
+`~trigger.timing.PhaseTimer` that records how long it spent in each phase:
+
+``connect``
+    From asking for a TCP connection until it's up.
+``kex``
+    SSH only. Exchanging versions and keys until the connection is secure.
+``auth``
+    SSH only. Authenticating the user.
+``login``
+    Telnet only. Logging in, until the first prompt.
+``startup``
+    Opening a channel and waiting for the first prompt (SSH), then sending the
+    device's ``startup_commands`` such as disabling paging.
+``commands``
+    Sending the commands and getting their results, until the connection is
+    closed.
+
+The timer is available as the ``timings`` attribute of the ``Deferred``
+returned by `~trigger.twister.execute`, once it has fired::
+
+    >>> d = device.execute(['show version'])
+    >>> d.addBoth(lambda result: log.msg(d.timings.phases))
+
+Phases that a connection never got to, such as ``auth`` when the TCP
+connection is refused, are left out.
+
+`~trigger.timing.PhaseStats` collects the timings of many devices and
+summarizes each phase, and the ``total``, as a count, mean and percentiles.
+This is what `~trigger.cmds.Commando` keeps in ``timing_stats``::
+
+    >>> n = Commando(devices=devices, commands=['show version'])
+    >>> n.run()
+    >>> n.dump_timings('timings.json')
+"""
+
+
+# Imports
+from array import array
+import collections
+import json
+import math
+import time
+
+
+# Exports
+__all__ = ('PhaseTimer', 'PhaseStats', 'percentile', 'PHASES', 'CONNECT',
+           'KEX', 'AUTH', 'LOGIN', 'STARTUP', 'COMMANDS', 'TOTAL')
+
+
+# Constants
+CONNECT = 'connect'
+KEX = 'kex'
+AUTH = 'auth'
+LOGIN = 'login'
+STARTUP = 'startup'
+COMMANDS = 'commands'
+TOTAL = 'total'
+
+# The phases in the order they happen in
+PHASES = (CONNECT, KEX, AUTH, LOGIN, STARTUP, COMMANDS)
+
+# Percentiles reported for each phase
+PERCENTILES = (50, 95, 99)
+
+
+# Functions
+def percentile(values, pct):
+    """
+    Return the ``pct`` percentile of the sorted sequence ``values`` using the
+    nearest-rank method, or ``None`` if it's empty.
+
+    :param values:
+        A sorted sequence of numbers.
+
+    :param pct:
+        The percentile, from 0 to 100.
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(pct / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+# Classes
+class PhaseTimer(object):
+    """
+    Time the phases of a single connection.
+
+    Starting a phase ends the one before it, and ``phases`` maps each phase
+    that has ended to how long it took in seconds. Nothing is recorded once
+    the timer is finished.
+
+    :param phase:
+        (Optional) A phase to start right away.
+
+    :param clock:
+        (Optional) A function returning the current time in seconds. Defaults
+        to ``time.time``.
+    """
+    def __init__(self, phase=None, clock=time.time):
+        self.clock = clock
+        self.phases = collections.OrderedDict()
+        self.current = None
+        self.finished = False
+        self._started = None
+        if phase is not None:
+            self.start(phase)
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, ', '.join(
+            '%s=%.3f' % item for item in self.phases.iteritems()))
+
+    def start(self, phase):
+        """End the current phase, if any, and start ``phase``."""
+        if self.finished or phase == self.current:
+            return
+        now = self.clock()
+        self._end(now)
+        self.current = phase
+        self._started = now
+
+    def finish(self):
+        """End the current phase and stop timing."""
+        if self.finished:
+            return
+        self._end(self.clock())
+        self.current = None
+        self.finished = True
+
+    def _end(self, now):
+        """Add the time spent in the current phase."""
+        if self.current is None:
+            return
+        elapsed = max(now - self._started, 0.0)
+        self.phases[self.current] = self.phases.get(self.current, 0.0) + elapsed
+
+    @property
+    def total(self):
+        """The time spent in all of the phases that have ended."""
+        return sum(self.phases.itervalues())
+
+
+class PhaseStats(object):
+    """
+    Collect the phase timings of many devices and summarize them.
+
+    Samples are kept in compact arrays of doubles, so that runs against many
+    thousands of devices don't need much memory for them.
+
+    :param percentiles:
+        (Optional) The percentiles to report. Defaults to 50, 95 and 99.
+    """
+    def __init__(self, percentiles=PERCENTILES):
+        self.percentiles = percentiles
+        self.samples = {}
+
+    def __len__(self):
+        """The number of devices that have been added."""
+        return len(self.samples.get(TOTAL, ()))
+
+    def _append(self, phase, seconds):
+        if phase not in self.samples:
+            self.samples[phase] = array('d')
+        self.samples[phase].append(seconds)
+
+    def add(self, phases):
+        """
+        Add the timings of one device.
+
+        :param phases:
+            A `~trigger.timing.PhaseTimer`, or a dict mapping phases to
+            seconds.
+        """
+        if isinstance(phases, PhaseTimer):
+            phases = phases.phases
+        if not phases:
+            return
+        for phase, seconds in phases.iteritems():
+            self._append(phase, seconds)
+        self._append(TOTAL, sum(phases.itervalues()))
+
+    def merge(self, other):
+        """Add all of the samples from another ``PhaseStats``."""
+        for phase, samples in other.samples.iteritems():
+            if phase not in self.samples:
+                self.samples[phase] = array('d')
+            self.samples[phase].extend(samples)
+
+    def summarize(self, phase):
+        """
+        Return a dict of the ``count``, ``min``, ``mean``, ``max`` and each of
+        the ``percentiles`` (as ``p50`` and so on) of ``phase`` in seconds.
+        """
+        values = sorted(self.samples.get(phase, ()))
+        summary = collections.OrderedDict(count=len(values))
+        summary['min'] = values[0] if values else None
+        summary['mean'] = sum(values) / len(values) if values else None
+        for pct in self.percentiles:
+            summary['p%s' % pct] = percentile(values, pct)
+        summary['max'] = values[-1] if values else None
+        return summary
+
+    def summary(self):
+        """
+        Return a dict of `summarize()` for each phase that has samples, in the
+        order the phases happen in, followed by the ``total``.
+        """
+        known = [phase for phase in PHASES if phase in self.samples]
+        others = sorted(set(self.samples) - set(PHASES) - set([TOTAL]))
+        result = collections.OrderedDict()
+        for phase in known + others + [TOTAL]:
+            if phase in self.samples:
+                result[phase] = self.summarize(phase)
+        return result
+
+    def dump(self, dest):
+        """
+        Write `summary()` as JSON to ``dest``, a file-like object or the path
+        of a file to create.
+        """
+        if isinstance(dest, basestring):
+            with open(dest, 'w') as fh:
+                return self.dump(fh)
+        json.dump(self.summary(), dest, indent=2)
+        dest.write('\n')
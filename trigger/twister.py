@@ -6,15 +6,21 @@ I/O framework. The Trigger Twister is just like the Mersenne Twister, except
 not at all.
 """
 
+import collections
 import copy
 import fcntl
+import itertools
 import os
 import re
 import signal
 import socket
+import sre_constants
+import sre_parse
 import struct
 import sys
+import time
 import tty
+import weakref
 from twisted.conch.client.default import SSHUserAuthClient
 from twisted.conch.ssh import channel, common, session, transport
 from twisted.conch.ssh.connection import SSHConnection
@@ -22,11 +28,13 @@ from twisted.conch import telnet
 from twisted.internet import defer, protocol, reactor, stdio
 from twisted.protocols.policies import TimeoutMixin
 from twisted.python import log
+from twisted.python.failure import Failure
 from twisted.python.usage import Options
 from xml.etree.ElementTree import (Element, ElementTree, XMLTreeBuilder)
 
 from trigger.conf import settings
-from trigger import tacacsrc, exceptions
+from trigger import tacacsrc, exceptions, metrics, timing
+from trigger.logger import get_logger
 from trigger.utils import network, cli
 
 
@@ -42,6 +50,8 @@ __version__ = '1.5.8'
 # docs; so let's make sure we account for that ;)
 # __all__ = ('connect', 'execute', 'stop_reactor')
 
+logger = get_logger(__name__)
+
 
 #  Functions
 # ==================
@@ -117,13 +127,14 @@ def requires_enable(proto_obj, data):
         The channel data to check for an enable prompt
     """
     if not proto_obj.device.is_ioslike():
-        log.msg('[%s] Not IOS-like, setting enabled flag' % proto_obj.device)
+        logger.info('[%s] Not IOS-like, setting enabled flag',
+                    proto_obj.device)
         proto_obj.enabled = True
         return None
     match = proto_obj.enable_prompt.search(data)
     if match is not None:
-        log.msg('[%s] Enable prompt detected: %r' % (proto_obj.device,
-                                                     match.group()))
+        logger.debug('[%s] Enable prompt detected: %r', proto_obj.device,
+                     match.group())
     return match
 
 
@@ -137,13 +148,15 @@ def send_enable(proto_obj, disconnect_on_fail=True):
     :param disconnect_on_fail:
         If set, will forcefully disconnect on enable password failure
     """
-    log.msg('[%s] Enable required, sending enable commands' % proto_obj.device)
+    logger.info('[%s] Enable required, sending enable commands',
+                proto_obj.device)
 
     # Get enable password from env. or device object
     device_pw = getattr(proto_obj.device, 'enablePW', None)
     enable_pw = os.getenv('TRIGGER_ENABLEPW') or device_pw
     if enable_pw is not None:
-        log.msg('[%s] Enable password detected, sending...' % proto_obj.device)
+        logger.info('[%s] Enable password detected, sending...',
+                    proto_obj.device)
         proto_obj.data = ''  # Zero out the buffer before sending the password
         proto_obj.write('enable' + proto_obj.device.delimiter)
 
@@ -157,8 +170,8 @@ def send_enable(proto_obj, disconnect_on_fail=True):
         )
         proto_obj.enabled = True
     else:
-        log.msg('[%s] Enable password not found, not enabling.' %
-                proto_obj.device)
+        logger.warning('[%s] Enable password not found, not enabling.',
+                       proto_obj.device)
         proto_obj.factory.err = exceptions.EnablePasswordFailure(
             'Enable password not set. See documentation on '
             'settings.TRIGGER_ENABLEPW for help.'
@@ -171,7 +184,7 @@ def stop_reactor():
     """Stop the reactor if it's already running."""
     from twisted.internet import reactor
     if reactor.running:
-        log.msg('Stopping reactor')
+        logger.info('Stopping reactor')
         reactor.stop()
 
 # ==================
@@ -213,16 +226,16 @@ def pty_connect(device, action, creds=None, display_banner=None,
 
     # Only proceed if ping succeeds
     if ping_test:
-        log.msg('Pinging %s' % device, debug=True)
+        logger.debug('Pinging %s', device)
         if not network.ping(device.nodeName):
-            log.msg('Ping to %s failed' % device, debug=True)
+            logger.debug('Ping to %s failed', device)
             return None
 
     # SSH?
     if device.can_ssh_pty():
         interactive = hasattr(sys, 'ps1')
         all_tty = all(x.isatty() for x in (sys.stderr, sys.stdin, sys.stdout))
-        log.msg('[%s] SSH connection test PASSED' % device)
+        logger.info('[%s] SSH connection test PASSED', device)
         if interactive or not all_tty:
             # Shell not in interactive mode.
             pass
@@ -234,22 +247,22 @@ def pty_connect(device, action, creds=None, display_banner=None,
         factory = TriggerSSHPtyClientFactory(d, action, creds, display_banner,
                                              init_commands, device=device)
         port = device.nodePort or settings.SSH_PORT
-        log.msg('Trying SSH to %s:%s' % (device, port), debug=True)
+        logger.debug('Trying SSH to %s:%s', device, port)
 
     # or Telnet?
     elif settings.TELNET_ENABLED:
-        log.msg('[%s] SSH connection test FAILED, falling back to telnet' %
-                device)
+        logger.warning('[%s] SSH connection test FAILED, falling back to '
+                       'telnet', device)
         factory = TriggerTelnetClientFactory(d,
                                              action,
                                              creds,
                                              init_commands=init_commands,
                                              device=device)
         port = device.nodePort or settings.TELNET_PORT
-        log.msg('Trying telnet to %s:%s' % (device, port), debug=True)
+        logger.debug('Trying telnet to %s:%s', device, port)
     else:
-        log.msg('[%s] SSH connection test FAILED, '
-                'telnet fallback disabled' % device)
+        logger.warning('[%s] SSH connection test FAILED, '
+                       'telnet fallback disabled', device)
         return None
 
     reactor.connectTCP(device.nodeName, port, factory)
@@ -321,7 +334,7 @@ def connect(device, init_commands=None, output_logger=None, login_errback=None,
         d.addErrback(log.err)
         d.addCallback(lambda x: stop_reactor())
     except AttributeError as err:
-        log.msg(err)
+        logger.error('%s', err)
         sys.stderr.write('Could not connect to %s.\n' % device)
         return 2  # Bad exit code
 
@@ -385,7 +398,9 @@ def execute(
         with_errors=False,
         timeout=settings.DEFAULT_TIMEOUT,
         command_interval=0,
-        force_cli=False
+        force_cli=False,
+        exec_channels=None,
+        pipeline=None
         ):
     """
     Connect to a ``device`` and sequentially execute all the commands in the
@@ -447,19 +462,54 @@ def execute(
     :param force_cli:
         (Optional) Juniper-only: Force use of CLI instead of Junoscript.
 
+    :param exec_channels:
+        (Optional) Run each command in its own SSH ``exec`` channel instead
+        of a shell, with up to this many running at once over the one
+        connection. See `~trigger.twister.execute_exec_ssh`. Ignored unless
+        ``device.can_ssh_exec()``, or for Juniper devices without
+        ``force_cli``.
+
+    :param pipeline:
+        (Optional) Write up to this many commands ahead instead of waiting for
+        the prompt after each one, and split the output into a result per
+        command. Only for devices that buffer input typed ahead and echo it
+        after the prompt, and for commands that don't change the prompt or
+        ask for confirmation. Every command written ahead is run even if one
+        before it fails. Not used for Junoscript or NetScaler. See
+        `~trigger.twister.PipelineMixin`.
+
     :returns: A Twisted ``Deferred`` object
     """
     execute_func = _choose_execute(device, force_cli=force_cli)
+    if exec_channels:
+        if execute_func is not execute_junoscript and device.can_ssh_exec():
+            return execute_exec_ssh(device=device, commands=commands,
+                                    creds=creds, incremental=incremental,
+                                    with_errors=with_errors, timeout=timeout,
+                                    command_interval=command_interval,
+                                    max_channels=exec_channels)
+        logger.info('[%s] Exec channels are not supported, using %s',
+                    device, execute_func.__name__)
+
+    options = {}
+    if pipeline:
+        if execute_func in (execute_junoscript, execute_netscaler):
+            logger.info('[%s] Pipelining is not supported, sending commands '
+                        'one at a time', device)
+        else:
+            options['pipeline'] = pipeline
+
     return execute_func(device=device, commands=commands, creds=creds,
                         incremental=incremental, with_errors=with_errors,
-                        timeout=timeout, command_interval=command_interval)
+                        timeout=timeout, command_interval=command_interval,
+                        **options)
 
 
 def execute_generic_ssh(device, commands, creds=None, incremental=None,
                         with_errors=False, timeout=settings.DEFAULT_TIMEOUT,
                         command_interval=0, channel_class=None,
                         prompt_pattern=None, method='Generic',
-                        connection_class=None):
+                        connection_class=None, max_channels=1, pipeline=None):
     """
     Use default SSH channel to execute commands on a device. Should work with
     anything not wonky.
@@ -480,22 +530,26 @@ def execute_generic_ssh(device, commands, creds=None, incremental=None,
     factory = TriggerSSHChannelFactory(d, commands, creds, incremental,
                                        with_errors, timeout, channel_class,
                                        command_interval, prompt_pattern,
-                                       device, connection_class)
+                                       device, connection_class,
+                                       max_channels, pipeline)
 
     port = device.nodePort or settings.SSH_PORT
-    log.msg('Trying %s SSH to %s:%s' % (method, device, port), debug=True)
+    logger.debug('Trying %s SSH to %s:%s', method, device, port)
     reactor.connectTCP(device.nodeName, port, factory)
+    d.timings = factory.timings
     return d
 
 
 def execute_exec_ssh(device, commands, creds=None, incremental=None,
                      with_errors=False, timeout=settings.DEFAULT_TIMEOUT,
-                     command_interval=0):
+                     command_interval=0, max_channels=1):
     """
     Use multiplexed SSH 'exec' command channels to execute commands.
 
     This will maintain a single SSH connection and run each new command in a
-    separate channel after the previous command completes.
+    separate channel after a previous command completes, with up to
+    ``max_channels`` commands running at once. The results are in the same
+    order as the commands either way.
 
     Please see `~trigger.twister.execute` for a full description of the
     arguments and how this works.
@@ -507,7 +561,7 @@ def execute_exec_ssh(device, commands, creds=None, incremental=None,
     return execute_generic_ssh(device, commands, creds, incremental,
                                with_errors, timeout, command_interval,
                                channel_class, prompt_pattern, method,
-                               connection_class)
+                               connection_class, max_channels)
 
 
 def execute_junoscript(device, commands, creds=None, incremental=None,
@@ -534,7 +588,8 @@ def execute_junoscript(device, commands, creds=None, incremental=None,
 
 def execute_ioslike(device, commands, creds=None, incremental=None,
                     with_errors=False, timeout=settings.DEFAULT_TIMEOUT,
-                    command_interval=0, loginpw=None, enablepw=None):
+                    command_interval=0, loginpw=None, enablepw=None,
+                    pipeline=None):
     """
     Execute commands on a Cisco/IOS-like device. It will automatically try to
     connect using SSH if it is available and not disabled in ``settings.py``.
@@ -547,31 +602,34 @@ def execute_ioslike(device, commands, creds=None, incremental=None,
     """
     # Try SSH if it's available and enabled
     if device.can_ssh_async():
-        log.msg('execute_ioslike: SSH ENABLED for %s' % device.nodeName)
+        logger.info('execute_ioslike: SSH ENABLED for %s', device.nodeName)
         return execute_ioslike_ssh(device=device, commands=commands,
                                    creds=creds, incremental=incremental,
                                    with_errors=with_errors, timeout=timeout,
-                                   command_interval=command_interval)
+                                   command_interval=command_interval,
+                                   pipeline=pipeline)
 
     # Fallback to telnet if it's enabled
     elif settings.TELNET_ENABLED:
-        log.msg('execute_ioslike: TELNET ENABLED for %s' % device.nodeName)
+        logger.info('execute_ioslike: TELNET ENABLED for %s', device.nodeName)
         return execute_ioslike_telnet(device=device, commands=commands,
                                       creds=creds, incremental=incremental,
                                       with_errors=with_errors, timeout=timeout,
                                       command_interval=command_interval,
-                                      loginpw=loginpw, enablepw=enablepw)
+                                      loginpw=loginpw, enablepw=enablepw,
+                                      pipeline=pipeline)
 
     else:
         msg = 'Both SSH and telnet either failed or are disabled.'
-        log.msg('[%s]' % device, msg)
+        logger.warning('[%s] %s', device, msg)
         e = exceptions.ConnectionFailure(msg)
         return defer.fail(e)
 
 
 def execute_ioslike_telnet(device, commands, creds=None, incremental=None,
                            with_errors=False, timeout=settings.DEFAULT_TIMEOUT,
-                           command_interval=0, loginpw=None, enablepw=None):
+                           command_interval=0, loginpw=None, enablepw=None,
+                           pipeline=None):
     """
     Execute commands via telnet on a Cisco/IOS-like device.
 
@@ -582,18 +640,20 @@ def execute_ioslike_telnet(device, commands, creds=None, incremental=None,
 
     d = defer.Deferred()
     action = IoslikeSendExpect(device, commands, incremental, with_errors,
-                               timeout, command_interval)
+                               timeout, command_interval, pipeline)
     factory = TriggerTelnetClientFactory(d, action, creds, loginpw, enablepw)
 
     port = device.nodePort or settings.TELNET_PORT
-    log.msg('Trying IOS-like scripting to %s:%s' % (device, port), debug=True)
+    logger.debug('Trying IOS-like scripting to %s:%s', device, port)
     reactor.connectTCP(device.nodeName, port, factory)
+    d.timings = factory.timings
     return d
 
 
 def execute_async_pty_ssh(device, commands, creds=None, incremental=None,
                           with_errors=False, timeout=settings.DEFAULT_TIMEOUT,
-                          command_interval=0, prompt_pattern=None):
+                          command_interval=0, prompt_pattern=None,
+                          pipeline=None):
     """
     Execute via SSH for a device that requires shell + pty-req.
 
@@ -607,12 +667,13 @@ def execute_async_pty_ssh(device, commands, creds=None, incremental=None,
 
     return execute_generic_ssh(device, commands, creds, incremental,
                                with_errors, timeout, command_interval,
-                               channel_class, prompt_pattern, method)
+                               channel_class, prompt_pattern, method,
+                               pipeline=pipeline)
 
 
 def execute_ioslike_ssh(device, commands, creds=None, incremental=None,
                         with_errors=False, timeout=settings.DEFAULT_TIMEOUT,
-                        command_interval=0):
+                        command_interval=0, pipeline=None):
     """
     Execute via SSH for IOS-like devices with some exceptions.
 
@@ -624,18 +685,19 @@ def execute_ioslike_ssh(device, commands, creds=None, incremental=None,
     # Test if device requires shell + pty-req
     if device.requires_async_pty:
         return execute_async_pty_ssh(device, commands, creds, incremental,
-                                     with_errors, timeout, command_interval)
+                                     with_errors, timeout, command_interval,
+                                     pipeline=pipeline)
     # Or fallback to generic
     else:
         method = 'IOS-like'
         return execute_generic_ssh(device, commands, creds, incremental,
                                    with_errors, timeout, command_interval,
-                                   method=method)
+                                   method=method, pipeline=pipeline)
 
 
 def execute_netscreen(device, commands, creds=None, incremental=None,
                       with_errors=False, timeout=settings.DEFAULT_TIMEOUT,
-                      command_interval=0):
+                      command_interval=0, pipeline=None):
     """
     Execute commands on a NetScreen device running ScreenOS. For NetScreen
     devices running Junos, use `~trigger.twister.execute_junoscript`.
@@ -656,7 +718,8 @@ def execute_netscreen(device, commands, creds=None, incremental=None,
     return execute_generic_ssh(device, commands, creds, incremental,
                                with_errors, timeout, command_interval,
                                channel_class, method=method,
-                               prompt_pattern=prompt_pattern)
+                               prompt_pattern=prompt_pattern,
+                               pipeline=pipeline)
 
 
 def execute_netscaler(device, commands, creds=None, incremental=None,
@@ -679,7 +742,7 @@ def execute_netscaler(device, commands, creds=None, incremental=None,
 
 def execute_pica8(device, commands, creds=None, incremental=None,
                   with_errors=False, timeout=settings.DEFAULT_TIMEOUT,
-                  command_interval=0):
+                  command_interval=0, pipeline=None):
     """
     Execute commands on a Pica8 device.  This is only needed to append
     '| no-more' to show commands because Pica8 currently (v2.2) lacks
@@ -694,9 +757,283 @@ def execute_pica8(device, commands, creds=None, incremental=None,
     method = 'Async PTY'
     return execute_generic_ssh(device, commands, creds, incremental,
                                with_errors, timeout, command_interval,
-                               channel_class, method=method)
+                               channel_class, method=method,
+                               pipeline=pipeline)
 
 #  Classes
+# ==================
+#  Receive buffers
+# ==================
+
+# How many bytes before new data are searched again for a prompt, so that a
+# prompt split across packets is still found.
+PROMPT_WINDOW = 1024
+
+# Whether each prompt pattern seen so far can only match at the end. Weakly
+# keyed, since a pattern is made for the echo of every pipelined command.
+_END_ANCHORED = weakref.WeakKeyDictionary()
+
+
+class PromptBuffer(object):
+    """
+    A buffer of the output received from a device, which can be searched for
+    a prompt as data arrives without searching all of it every time.
+
+    Data is kept as a list of chunks, so appending doesn't copy what came
+    before it, and `find()` only searches what was appended since the last
+    search, along with ``window`` bytes before it. Patterns that end with
+    ``$``, as prompt patterns do, can only match at the end of the buffer, so
+    only the last ``window`` bytes are searched for them. Checking every
+    packet of a large command output for the prompt is linear in the size of
+    the output instead of quadratic.
+
+    :param window:
+        (Optional) How many bytes before new data to search again.
+    """
+    def __init__(self, window=PROMPT_WINDOW):
+        self.window = window
+        self.clear()
+
+    def __len__(self):
+        return self._length
+
+    def __repr__(self):
+        return '<%s: %d bytes>' % (self.__class__.__name__, self._length)
+
+    def clear(self):
+        """Empty the buffer."""
+        self._chunks = []
+        self._length = 0
+        self._searched = {}
+
+    def append(self, data):
+        """Add ``data`` to the end of the buffer."""
+        if data:
+            self._chunks.append(data)
+            self._length += len(data)
+
+    def getvalue(self):
+        """Return everything in the buffer as a string."""
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+    def tail(self, size):
+        """Return the last ``size`` bytes in the buffer."""
+        if size <= 0:
+            return ''
+        chunks = []
+        collected = 0
+        for chunk in reversed(self._chunks):
+            chunks.append(chunk)
+            collected += len(chunk)
+            if collected >= size:
+                break
+        return ''.join(reversed(chunks))[-size:]
+
+    def find(self, pattern):
+        """
+        Search the buffer for the compiled regex ``pattern`` and return a
+        match object, or ``None``.
+
+        Only data appended since ``pattern`` was last searched for, and the
+        ``window`` bytes before it, is searched, or just the last ``window``
+        bytes if ``pattern`` ends with ``$``. If a match begins right at the
+        start of that region it might really begin earlier, so the whole
+        buffer is searched instead. The positions of the match are always
+        relative to the whole buffer, as returned by `getvalue()`.
+        """
+        start = max(self._searched.get(pattern, 0) - self.window, 0)
+        if _is_end_anchored(pattern):
+            start = max(start, self._length - self.window)
+        self._searched[pattern] = self._length
+
+        # Start one byte early so that '^' and lookbehinds still see it
+        offset = max(start - 1, 0)
+        region = self.tail(self._length - offset)
+        match = pattern.search(region, start - offset)
+        if match is None:
+            return None
+        if start and match.start() == start - offset:
+            return pattern.search(self.getvalue())
+        return _OffsetMatch(match, offset) if offset else match
+
+
+def _is_end_anchored(pattern):
+    """
+    Return whether the compiled regex ``pattern`` can only match at the end
+    of a string, because it ends with ``$`` outside of any alternation.
+    """
+    anchored = _END_ANCHORED.get(pattern)
+    if anchored is None:
+        anchored = False
+        if not pattern.flags & re.MULTILINE:
+            try:
+                parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+            except (sre_constants.error, TypeError):
+                parsed = None
+            if parsed and parsed[-1] == (sre_constants.AT,
+                                         sre_constants.AT_END):
+                anchored = True
+        _END_ANCHORED[pattern] = anchored
+    return anchored
+
+
+def _echo_pattern(prompt, command):
+    """
+    Return a compiled regex matching the compiled ``prompt`` pattern, no
+    longer anchored to the end, where it's followed by the echo of
+    ``command``. The match ends with the prompt.
+    """
+    pattern = prompt.pattern
+    if _is_end_anchored(prompt):
+        pattern = pattern[:-1]
+    return re.compile('(?:%s)(?=%s)' % (pattern, re.escape(command)),
+                      prompt.flags)
+
+
+class _OffsetMatch(object):
+    """A match object whose positions are shifted by ``offset``."""
+    def __init__(self, match, offset):
+        self._match = match
+        self._offset = offset
+
+    def __getattr__(self, name):
+        return getattr(self._match, name)
+
+    def start(self, group=0):
+        return self._match.start(group) + self._offset
+
+    def end(self, group=0):
+        return self._match.end(group) + self._offset
+
+    def span(self, group=0):
+        return self.start(group), self.end(group)
+
+
+class PromptBufferMixin(object):
+    """
+    Keep the data received by a protocol in a `PromptBuffer`, as ``buffer``.
+
+    ``data`` is still available as a string, and setting it replaces what's
+    in the buffer, but appending to it copies the whole buffer each time.
+    """
+    _buffer = None
+
+    @property
+    def buffer(self):
+        if self._buffer is None:
+            self._buffer = PromptBuffer()
+        return self._buffer
+
+    def _get_data(self):
+        return self.buffer.getvalue()
+
+    def _set_data(self, data):
+        self.buffer.clear()
+        self.buffer.append(data)
+
+    data = property(_get_data, _set_data)
+
+
+class PipelineMixin(object):
+    """
+    Write up to ``pipeline`` commands ahead instead of waiting for the prompt
+    after each one, and split what comes back into a result per command.
+
+    The output of a command ends at the prompt followed by the echo of the
+    next command written, or at the prompt at the end of the buffer. This
+    only works for devices that buffer input typed ahead and echo each
+    command after the prompt once they read it, and for commands that don't
+    change the prompt or ask for confirmation. Every command written ahead is
+    run by the device even if one before it fails, and ``command_interval``
+    isn't waited between them.
+
+    Used by protocols with a ``buffer`` (see `PromptBufferMixin`),
+    ``prompt``, ``commanditer``, ``results``, ``device``, ``factory``,
+    ``write()``, ``_send_next()``, and ``_check_result()``, which returns
+    whether a result is free of errors.
+    """
+    pipeline = None
+    _pending = None
+
+    @property
+    def pending(self):
+        """
+        The commands written ahead and when they were sent, oldest first.
+        ``None`` commands hold their place in the results.
+        """
+        if self._pending is None:
+            self._pending = collections.deque()
+        return self._pending
+
+    def _fill_pipeline(self):
+        """
+        Write commands until ``pipeline`` of them are waiting on results, and
+        return whether any are.
+        """
+        waiting = sum(1 for command, _ in self.pending if command is not None)
+        while waiting < self.pipeline:
+            try:
+                command = self.commanditer.next()
+            except StopIteration:
+                break
+            if command is None:
+                if self.pending:
+                    self.pending.append((None, None))
+                else:
+                    self.results.append(None)
+                continue
+            logger.info('[%s] Sending pipelined command %r', self.device,
+                        command)
+            self.write(command + self.device.delimiter)
+            self.pending.append((command, self.factory.command_sent()))
+            waiting += 1
+        return bool(self.pending)
+
+    def _find_result_end(self):
+        """
+        Return a match for the prompt that ends the output of the oldest
+        command written ahead, or ``None`` if it hasn't all arrived.
+        """
+        for command, _ in itertools.islice(self.pending, 1, None):
+            if command is not None:
+                m = self.buffer.find(_echo_pattern(self.prompt, command))
+                if m is not None:
+                    return m
+                break
+        return self.buffer.find(self.prompt)
+
+    def _pipeline_received(self):
+        """
+        Take the result of each command written ahead whose output has all
+        arrived, in order, and then write more.
+        """
+        taken = False
+        while self.pending:
+            m = self._find_result_end()
+            if m is None:
+                break
+            data = self.data
+            result = data[:m.start()]
+            result = result[result.find('\n')+1:]  # Cut the echoed command
+            self.data = data[m.end():]  # Keep the next command's output
+            logger.debug('[%s] STATE: result %r', self.device, result)
+
+            command, sent = self.pending.popleft()
+            self.results.append(result)
+            self.factory.command_done(sent)
+            if not self._check_result(result):
+                return None
+            while self.pending and self.pending[0][0] is None:
+                self.pending.popleft()
+                self.results.append(None)
+            taken = True
+
+        if taken:
+            self._send_next()
+
+
 # ==================
 #  Client Factories
 # ==================
@@ -712,32 +1049,80 @@ class TriggerClientFactory(protocol.ClientFactory, object):
         self.results = []
         self.err = None
 
+        # How long each phase of the connection takes, starting now
+        self.timings = timing.PhaseTimer(timing.CONNECT)
+        self._connecting = False
+        self._command_sent = None
+
         # Setup and run the initial commands
         if init_commands is None:
             init_commands = []  # We need this to be a list
         self.init_commands = init_commands
-        log.msg('INITIAL COMMANDS: %r' % self.init_commands, debug=True)
+        logger.debug('INITIAL COMMANDS: %r', self.init_commands)
         self.initialized = False
 
+    def startedConnecting(self, connector):
+        """Count the connection as active."""
+        self._connecting = True
+        metrics.CONNECTIONS_ACTIVE.inc()
+
+    def _connection_closed(self, error=None):
+        """Stop timing the connection and update the metrics."""
+        self.timings.finish()
+        if not self._connecting:
+            return
+        self._connecting = False
+        metrics.CONNECTIONS_ACTIVE.dec()
+        if error is None:
+            result = 'ok'
+        elif isinstance(error, Failure):
+            result = error.type.__name__
+        else:
+            result = type(error).__name__
+        metrics.CONNECTIONS.labels(result).inc()
+        self._record_timings()
+
+    def _record_timings(self):
+        """Add the time spent in each phase to the metrics."""
+        for phase, seconds in self.timings.phases.iteritems():
+            metrics.PHASE_SECONDS.labels(phase).observe(seconds)
+
+    def command_sent(self):
+        """Note the time a command was sent, and return it."""
+        self._command_sent = time.time()
+        return self._command_sent
+
+    def command_done(self, sent=None):
+        """
+        Record how long the command that was sent last took, or the one sent
+        at ``sent`` when more than one runs at once.
+        """
+        if sent is None:
+            sent, self._command_sent = self._command_sent, None
+        if sent is not None:
+            metrics.COMMAND_SECONDS.observe(time.time() - sent)
+
     def clientConnectionFailed(self, connector, reason):
         """Do this when the connection fails."""
-        log.msg('Client connection failed. Reason: %s' % reason)
+        logger.warning('Client connection failed. Reason: %s', reason)
+        self._connection_closed(reason)
         self.d.errback(reason)
 
     def clientConnectionLost(self, connector, reason):
         """Do this when the connection is lost."""
-        log.msg('Client connection lost. Reason: %s' % reason)
+        logger.info('Client connection lost. Reason: %s', reason)
+        self._connection_closed(self.err)
         if self.err:
-            log.msg('Got err: %r' % self.err)
+            logger.info('Got err: %r', self.err)
             # log.err(self.err)
             self.d.errback(self.err)
         else:
-            log.msg('Got results: %r' % self.results)
+            logger.debug('Got results: %r', self.results)
             self.d.callback(self.results)
 
     def stopFactory(self):
         # IF we're out of channels, shut it down!
-        log.msg('All done!')
+        logger.info('All done!')
 
     def _init_commands(self, protocol):
         """
@@ -747,18 +1132,18 @@ class TriggerClientFactory(protocol.ClientFactory, object):
         the commands.
         """
         if not self.initialized:
-            log.msg('Not initialized, sending init commands', debug=True)
+            logger.debug('Not initialized, sending init commands')
             for next_init in self.init_commands:
-                log.msg('Sending: %r' % next_init, debug=True)
+                logger.debug('Sending: %r', next_init)
                 protocol.write(next_init + '\r\n')
             else:
                 self.initialized = True
 
     def connection_success(self, conn, transport):
-        log.msg('Connection success.')
+        logger.info('Connection success.')
         self.conn = conn
         self.transport = transport
-        log.msg('Connection information: %s' % self.transport)
+        logger.debug('Connection information: %s', self.transport)
 
 
 class TriggerSSHChannelFactory(TriggerClientFactory):
@@ -769,7 +1154,7 @@ class TriggerSSHChannelFactory(TriggerClientFactory):
     def __init__(self, deferred, commands, creds=None, incremental=None,
                  with_errors=False, timeout=None, channel_class=None,
                  command_interval=0, prompt_pattern=None, device=None,
-                 connection_class=None):
+                 connection_class=None, max_channels=1, pipeline=None):
 
         # Fallback to sane defaults if they aren't specified
         if channel_class is None:
@@ -792,6 +1177,8 @@ class TriggerSSHChannelFactory(TriggerClientFactory):
         self.prompt = re.compile(prompt_pattern)
         self.device = device
         self.connection_class = connection_class
+        self.max_channels = max_channels
+        self.pipeline = pipeline
         TriggerClientFactory.__init__(self, deferred, creds)
 
     def buildProtocol(self, addr):
@@ -799,6 +1186,15 @@ class TriggerSSHChannelFactory(TriggerClientFactory):
         self.protocol.factory = self
         return self.protocol
 
+    def channel_finished(self, channel):
+        """
+        Called by ``channel`` when it has run out of commands. Closes the
+        connection, which hands the results to the deferred.
+        """
+        logger.info('[%s] CHANNEL: out of commands, closing connection...',
+                    self.device)
+        channel.loseConnection()
+
 
 class TriggerSSHPtyClientFactory(TriggerClientFactory):
     """
@@ -820,6 +1216,335 @@ class TriggerSSHPtyClientFactory(TriggerClientFactory):
         self.command_interval = 0
         TriggerClientFactory.__init__(self, deferred, creds, init_commands)
 
+# ==================
+#  Session pools
+# ==================
+
+
+# The states of a pooled session
+CONNECTING = 'connecting'
+BUSY = 'busy'
+IDLE = 'idle'
+CLOSED = 'closed'
+
+
+class TriggerSSHPooledChannelFactory(TriggerSSHChannelFactory):
+    """
+    Factory for an SSH session kept open by a `~trigger.twister.SessionPool`.
+
+    Instead of closing the connection once the channel is out of commands, it
+    hands the results to the deferred for the request and waits, logged in
+    and initialized, for the next request from the pool.
+
+    :param pool:
+        The `~trigger.twister.SessionPool` the session belongs to.
+
+    :param key:
+        What the pool knows the session by.
+
+    The other arguments are those of `TriggerSSHChannelFactory`.
+    """
+    def __init__(self, pool, key, *args, **kwargs):
+        self.pool = pool
+        self.key = key
+        self.state = CONNECTING
+        self.channel = None
+        self.conn = None
+        self._idle_call = None
+        self._check_call = None
+        super(TriggerSSHPooledChannelFactory, self).__init__(*args, **kwargs)
+
+    def __repr__(self):
+        return '<%s: %s (%s)>' % (self.__class__.__name__, self.device,
+                                  self.state)
+
+    def run(self, deferred, commands, incremental=None, with_errors=False,
+            timeout=None, command_interval=0):
+        """Send ``commands`` over the open channel for a new request."""
+        self._cancel_calls()
+        self.state = BUSY
+        self.d = deferred
+        self.timings = deferred.timings
+        self.timings.start(timing.COMMANDS)
+        self._set_commands(commands, incremental, with_errors, timeout,
+                           command_interval)
+        self.channel.buffer.clear()
+        self.channel._setup_commands()
+        self.channel._send_next()
+
+    def _set_commands(self, commands, incremental=None, with_errors=False,
+                      timeout=None, command_interval=0):
+        self.commands = commands
+        self.commanditer = iter(commands)
+        self.results = []
+        self.err = None
+        self.incremental = incremental
+        self.with_errors = with_errors
+        self.timeout = timeout
+        self.command_interval = command_interval
+
+    def channel_finished(self, channel):
+        """
+        Hand the results to the deferred for the request and go idle, rather
+        than closing the connection.
+        """
+        self.channel = channel
+        deferred, self.d = self.d, None
+        if deferred is None:
+            # A prompt turned up while idle
+            return
+        results = self.results
+        self.timings.finish()
+        self._record_timings()
+        self.timings = timing.PhaseTimer()
+
+        # Output that turns up while idle is thrown away, errors and all.
+        self._set_commands([], with_errors=True)
+        channel._setup_commands()
+        self.state = IDLE
+        self._schedule_calls()
+        self.pool._session_idle(self)
+        deferred.callback(results)
+
+    def clientConnectionFailed(self, connector, reason):
+        self._session_closed()
+        super(TriggerSSHPooledChannelFactory, self).clientConnectionFailed(
+            connector, reason)
+
+    def clientConnectionLost(self, connector, reason):
+        self._session_closed()
+        if self.d is None:
+            logger.info('[%s] Pooled session closed', self.device)
+            self._connection_closed()
+            return
+        super(TriggerSSHPooledChannelFactory, self).clientConnectionLost(
+            connector, reason)
+
+    def _session_closed(self):
+        self.state = CLOSED
+        self._cancel_calls()
+        self.pool._session_closed(self)
+
+    def close(self):
+        """Close the session, if it's connected."""
+        if self.conn is not None and self.state != CLOSED:
+            self.transport.loseConnection()
+
+    def _schedule_calls(self):
+        """Close the session once it's been idle too long, and check it."""
+        if self.pool.idle_timeout:
+            self._idle_call = reactor.callLater(self.pool.idle_timeout,
+                                                self._idle_timeout)
+        if self.pool.health_check_interval:
+            self._check_call = reactor.callLater(
+                self.pool.health_check_interval, self.check)
+
+    def _cancel_calls(self):
+        for call in (self._idle_call, self._check_call):
+            if call is not None and call.active():
+                call.cancel()
+        self._idle_call = self._check_call = None
+
+    def _idle_timeout(self):
+        self._idle_call = None
+        logger.info('[%s] Closing pooled session after %s idle seconds',
+                    self.device, self.pool.idle_timeout)
+        self.close()
+
+    def check(self):
+        """
+        Check that an idle session is still alive with an SSH keepalive, like
+        OpenSSH's ``ServerAliveInterval``, and close it if there's no answer
+        within the pool's ``check_timeout``. Any answer will do, and most
+        servers refuse the request.
+        """
+        self._check_call = None
+        if self.state != IDLE:
+            return
+        logger.debug('[%s] Checking pooled session', self.device)
+        d = self.conn.sendGlobalRequest('keepalive@openssh.com', '',
+                                        wantReply=True)
+        timeout = reactor.callLater(self.pool.check_timeout, self._check_failed)
+
+        def alive(result):
+            if timeout.active():
+                timeout.cancel()
+            if self.state == IDLE and self._check_call is None:
+                self._check_call = reactor.callLater(
+                    self.pool.health_check_interval, self.check)
+        d.addBoth(alive)
+
+    def _check_failed(self):
+        logger.warning('[%s] Pooled session failed its health check',
+                       self.device)
+        self.close()
+
+
+class SessionPool(object):
+    """
+    Keep logged-in SSH sessions to devices open between requests.
+
+    Long-running applications, such as the XMLRPC server, that run commands
+    on the same devices over and over can use `execute()` in place of
+    `~trigger.twister.execute` to skip connecting, logging in and sending the
+    startup commands (which disable paging, and so on) for every request.
+    Once a request is done, its session waits for the next one to the same
+    device with the same credentials.
+
+    Only devices whose CLI is driven over an SSH shell are pooled, which
+    includes IOS-like devices, Arista and NetScaler. Others, such as those
+    using Junoscript or telnet, are passed on to `~trigger.twister.execute`.
+    A request whose command fails or times out closes its session.
+
+    :param max_per_device:
+        (Optional) How many sessions to keep open to each device. Requests
+        beyond that wait for a session to be free. Defaults to
+        :setting:`SESSION_POOL_MAX_PER_DEVICE`.
+
+    :param idle_timeout:
+        (Optional) Close sessions that have been idle this many seconds, or
+        never if ``0``. Defaults to :setting:`SESSION_POOL_IDLE_TIMEOUT`.
+
+    :param health_check_interval:
+        (Optional) Check idle sessions every this many seconds, or never if
+        ``0``. Defaults to :setting:`SESSION_POOL_HEALTH_CHECK_INTERVAL`.
+
+    :param check_timeout:
+        (Optional) Close a session that doesn't answer a health check within
+        this many seconds. Defaults to 10.
+    """
+    def __init__(self, max_per_device=None, idle_timeout=None,
+                 health_check_interval=None,
+                 check_timeout=10):
+        if max_per_device is None:
+            max_per_device = settings.SESSION_POOL_MAX_PER_DEVICE
+        if idle_timeout is None:
+            idle_timeout = settings.SESSION_POOL_IDLE_TIMEOUT
+        if health_check_interval is None:
+            health_check_interval = settings.SESSION_POOL_HEALTH_CHECK_INTERVAL
+        self.max_per_device = max_per_device
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.check_timeout = check_timeout
+        self.sessions = {}  # Sessions by key
+        self.waiting = {}  # Requests waiting for a session by key
+
+    def __repr__(self):
+        return '<%s: %d sessions>' % (self.__class__.__name__, len(self))
+
+    def __len__(self):
+        return sum(len(sessions) for sessions in self.sessions.itervalues())
+
+    def _choose_channel(self, device, force_cli=False):
+        """
+        Return the channel class for pooled sessions to ``device``, or
+        ``None`` if it can't be pooled. See `_choose_execute()`.
+        """
+        if device.is_ioslike():
+            if not device.can_ssh_async():
+                return None
+            if device.requires_async_pty:
+                return TriggerSSHAsyncPtyChannel
+            return TriggerSSHGenericChannel
+        elif device.is_netscaler():
+            return TriggerSSHNetscalerChannel
+        elif device.is_netscreen():
+            return None
+        elif device.vendor == 'juniper':
+            if force_cli:
+                return TriggerSSHAsyncPtyChannel
+            return None
+        elif device.is_pica8():
+            return TriggerSSHPica8Channel
+        return TriggerSSHAsyncPtyChannel
+
+    def execute(self, device, commands, creds=None, incremental=None,
+                with_errors=False, timeout=settings.DEFAULT_TIMEOUT,
+                command_interval=0, force_cli=False, exec_channels=None,
+                pipeline=None):
+        """
+        Execute ``commands`` on ``device`` over a pooled session, opening one
+        if none is free.
+
+        Takes the same arguments as, and returns the same ``Deferred`` as,
+        `~trigger.twister.execute`. Its ``timings`` only include the phases
+        of connecting if a new session was opened. Requests for
+        ``exec_channels`` or a ``pipeline`` are not pooled.
+        """
+        channel_class = None
+        if exec_channels or pipeline:
+            logger.info('[%s] Not pooling a request for exec channels or '
+                        'pipelining', device)
+        else:
+            channel_class = self._choose_channel(device, force_cli)
+        if channel_class is None:
+            return execute(device, commands, creds=creds,
+                           incremental=incremental, with_errors=with_errors,
+                           timeout=timeout, command_interval=command_interval,
+                           force_cli=force_cli, exec_channels=exec_channels,
+                           pipeline=pipeline)
+
+        creds = tacacsrc.validate_credentials(creds)
+        key = (device.nodeName, channel_class, creds)
+        d = defer.Deferred()
+        d.timings = timing.PhaseTimer()
+        request = (device, d, commands, incremental, with_errors, timeout,
+                   command_interval)
+        self.waiting.setdefault(key, collections.deque()).append(request)
+        self._dispatch(key)
+        return d
+
+    def _dispatch(self, key):
+        """Hand waiting requests to idle sessions, or to new ones."""
+        waiting = self.waiting.get(key)
+        sessions = self.sessions.setdefault(key, [])
+        while waiting:
+            idle = [s for s in sessions if s.state == IDLE]
+            if idle:
+                request = waiting.popleft()
+                logger.info('[%s] Reusing pooled session', request[0])
+                idle[0].run(*request[1:])
+            elif len(sessions) < self.max_per_device:
+                sessions.append(self._connect(key, *waiting.popleft()))
+            else:
+                break
+        if not waiting:
+            self.waiting.pop(key, None)
+        if not sessions:
+            del self.sessions[key]
+
+    def _connect(self, key, device, d, commands, incremental, with_errors,
+                 timeout, command_interval):
+        """Open a new session for a request and return its factory."""
+        name, channel_class, creds = key
+        factory = TriggerSSHPooledChannelFactory(
+            self, key, d, commands, creds, incremental, with_errors, timeout,
+            channel_class, command_interval, device.vendor.prompt_pattern,
+            device)
+        factory.state = BUSY
+        factory.timings = d.timings
+        factory.timings.start(timing.CONNECT)
+
+        port = device.nodePort or settings.SSH_PORT
+        logger.debug('Trying pooled SSH to %s:%s', device, port)
+        reactor.connectTCP(device.nodeName, port, factory)
+        return factory
+
+    def _session_idle(self, session):
+        self._dispatch(session.key)
+
+    def _session_closed(self, session):
+        sessions = self.sessions.get(session.key, [])
+        if session in sessions:
+            sessions.remove(session)
+        self._dispatch(session.key)
+
+    def close(self):
+        """Close every session."""
+        for sessions in self.sessions.values():
+            for session in list(sessions):
+                session.close()
+
 # ==================
 #  SSH Basics
 # ==================
@@ -841,6 +1566,7 @@ class TriggerSSHTransport(transport.SSHClientTransport, object):
         """
         Once the connection is up, set the ciphers but don't do anything else!
         """
+        self.factory.timings.start(timing.KEX)
         self.currentEncryptions = transport.SSHCiphers(
             'none', 'none', 'none', 'none'
         )
@@ -855,6 +1581,7 @@ class TriggerSSHTransport(transport.SSHClientTransport, object):
 
     def connectionSecure(self):
         """Once we're secure, authenticate."""
+        self.factory.timings.start(timing.AUTH)
         # The default SSHUserAuth requires options to be set.
         options = Options()
         options.identitys = None  # Let it use defaults
@@ -867,7 +1594,8 @@ class TriggerSSHTransport(transport.SSHClientTransport, object):
 
     def receiveError(self, reason, desc):
         """Do this when we receive an error."""
-        log.msg('Received an error, reason: %s, desc: %s)' % (reason, desc))
+        logger.warning('Received an error, reason: %s, desc: %s)', reason,
+                       desc)
         self.sendDisconnect(reason, desc)
 
     def connectionLost(self, reason):
@@ -876,12 +1604,12 @@ class TriggerSSHTransport(transport.SSHClientTransport, object):
         remote end closes the connection prematurely (hosts.allow, etc.)
         """
         super(TriggerSSHTransport, self).connectionLost(reason)
-        log.msg('Transport connection lost: %s' % reason.value)
+        logger.info('Transport connection lost: %s', reason.value)
 
     def sendDisconnect(self, reason, desc):
         """Trigger disconnect of the transport."""
-        log.msg('Got disconnect request, reason: '
-                '%r, desc: %r' % (reason, desc))
+        logger.info('Got disconnect request, reason: %r, desc: %r', reason,
+                    desc)
 
         # Only throw an error if this wasn't user-initiated (reason: 10)
         if reason == transport.DISCONNECT_CONNECTION_LOST:
@@ -907,7 +1635,7 @@ class TriggerSSHUserAuth(SSHUserAuthClient):
 
     def getPassword(self, prompt=None):
         """Send along the password."""
-        log.msg('Performing password authentication', debug=True)
+        logger.debug('Performing password authentication')
         return defer.succeed(self.transport.factory.creds.password)
 
     def getGenericAnswers(self, name, information, prompts):
@@ -917,8 +1645,8 @@ class TriggerSSHUserAuth(SSHUserAuthClient):
         when configured within self.preferredOrder, does not work using default
         getPassword() method.
         """
-        log.msg('Performing interactive authentication', debug=True)
-        log.msg('Prompts: %r' % prompts, debug=True)
+        logger.debug('Performing interactive authentication')
+        logger.debug('Prompts: %r', prompts)
 
         # The response must always a sequence, and the length must match that
         # of the prompts list
@@ -926,8 +1654,8 @@ class TriggerSSHUserAuth(SSHUserAuthClient):
         for idx, prompt_tuple in enumerate(prompts):
             prompt, echo = prompt_tuple  # e.g. [('Password: ', False)]
             if 'assword' in prompt:
-                log.msg("Got password prompt: %r, sending password!" % prompt,
-                        debug=True)
+                logger.debug("Got password prompt: %r, sending password!",
+                             prompt)
                 response[idx] = self.transport.factory.creds.password
 
         return defer.succeed(response)
@@ -950,7 +1678,7 @@ class TriggerSSHUserAuth(SSHUserAuthClient):
         """
         canContinue, partial = common.getNS(packet)
         partial = ord(partial)
-        log.msg('Previous method: %r ' % self.lastAuth, debug=True)
+        logger.debug('Previous method: %r ', self.lastAuth)
 
         # If the last method succeeded, track it. If network devices ever start
         # doing second-factor authentication this might be useful.
@@ -958,7 +1686,7 @@ class TriggerSSHUserAuth(SSHUserAuthClient):
             self.authenticatedWith.append(self.lastAuth)
         # If it failed, track that too...
         else:
-            log.msg('Previous method failed, skipping it...', debug=True)
+            logger.debug('Previous method failed, skipping it...')
             self.authenticatedWith.append(self.lastAuth)
 
         def orderByPreference(meth):
@@ -982,8 +1710,8 @@ class TriggerSSHUserAuth(SSHUserAuthClient):
                               if meth not in self.authenticatedWith],
                              key=orderByPreference)
 
-        log.msg('Can continue with: %s' % canContinue)
-        log.msg('Already tried: %s' % self.authenticatedWith, debug=True)
+        logger.info('Can continue with: %s', canContinue)
+        logger.debug('Already tried: %s', self.authenticatedWith)
         return self._cbUserauthFailure(None, iter(canContinue))
 
     def _cbUserauthFailure(self, result, iterator):
@@ -1020,7 +1748,8 @@ class TriggerSSHConnection(SSHConnection, object):
 
     def serviceStarted(self):
         """Open the channel once we start."""
-        log.msg('channel = %r' % self.transport.factory.channel_class)
+        self.transport.factory.timings.start(timing.STARTUP)
+        logger.debug('channel = %r', self.transport.factory.channel_class)
         self.channel_class = self.transport.factory.channel_class
         self.command_interval = self.transport.factory.command_interval
         self.transport.factory.connection_success(self, self.transport)
@@ -1038,7 +1767,7 @@ class TriggerSSHConnection(SSHConnection, object):
         Forcefully close the transport connection when a channel closes
         connection. This is assuming only one channel is open.
         """
-        log.msg('Forcefully closing transport connection!')
+        logger.info('Forcefully closing transport connection!')
         self.transport.loseConnection()
 
 
@@ -1046,48 +1775,68 @@ class TriggerSSHMultiplexConnection(TriggerSSHConnection):
     """
     Used for multiplexing SSH 'exec' channels on a single connection.
 
-    Opens a new channel for each command in the stack once the previous channel
-    has closed. In this pattern the Connection and the Channel are intertwined.
+    Opens a new channel for each command in the stack once a previous channel
+    has closed, with up to the factory's ``max_channels`` open at once. In this
+    pattern the Connection and the Channel are intertwined.
     """
     def _channelOpener(self):
-        log.msg('Multiplex connection started')
+        logger.info('Multiplex connection started')
+        self.transport.factory.timings.start(timing.COMMANDS)
         self.work = list(self.commands)  # Make sure this is a list :)
-        self.send_command()
+        self.sent = 0  # How many commands have been sent
+        self.finished = {}  # Results waiting on earlier commands, by index
+        for _ in xrange(max(self.transport.factory.max_channels, 1)):
+            self.send_command()
+
+    def command_result(self, chan, result):
+        """
+        Add the result of the command run by ``chan`` to the results, in the
+        order the commands were sent rather than the order they finished.
+        """
+        results = self.transport.factory.results
+        self.finished[chan.index] = result
+        while len(results) in self.finished:
+            results.append(self.finished.pop(len(results)))
 
     def channelClosed(self, channel):
         """
         Close the channel when we're done. But not the transport connection
         """
-        log.msg('CHANNEL %s closed' % channel.id)
+        logger.info('CHANNEL %s closed', channel.id)
         SSHConnection.channelClosed(self, channel)
 
     def send_command(self):
         """
-        Send the next command in the stack once the previous channel has closed
+        Send the next command in the stack once a previous channel has closed
         """
+        if self.transport.factory.err is not None:
+            return None
         try:
             command = self.work.pop(0)
         except IndexError:
-            log.msg('ALL COMMANDS HAVE FINISHED!')
+            logger.info('ALL COMMANDS HAVE BEEN SENT!')
             return None
 
         def command_completed(result, chan):
-            log.msg('Command completed: %r' % chan.command)
+            logger.info('Command completed: %r', chan.command)
             return result
 
         def command_failed(failure, chan):
-            log.msg('Command failed: %r' % chan.command)
+            logger.warning('Command failed: %r', chan.command)
             return failure
 
         def log_status(result):
-            log.msg('COMMANDS LEN: %s' % len(self.commands))
-            log.msg(' RESULTS LEN: %s' % len(self.transport.factory.results))
+            logger.debug('COMMANDS LEN: %s', len(self.commands))
+            logger.debug(' RESULTS LEN: %s',
+                         len(self.transport.factory.results))
             return result
 
-        log.msg('SENDING NEXT COMMAND: %s' % command)
+        logger.info('SENDING NEXT COMMAND: %s', command)
 
         # Send the command to the channel
         chan = self.channel_class(command, conn=self)
+        chan.index = self.sent
+        self.sent += 1
 
         d = defer.Deferred()
         reactor.callLater(
@@ -1132,7 +1881,8 @@ class Interactor(protocol.Protocol):
         Terminate the connection. Link this to the transport method of the same
         name.
         """
-        log.msg('[%s] Forcefully closing transport connection' % self.device)
+        logger.info('[%s] Forcefully closing transport connection',
+                    self.device)
         self.factory.transport.loseConnection()
 
     def dataReceived(self, data):
@@ -1150,8 +1900,8 @@ class Interactor(protocol.Protocol):
 
         # Check whether we need to send an enable password.
         if not self.enabled and requires_enable(self, data):
-            log.msg('[%s] '
-                    'Interactive PTY requires enable commands' % self.device)
+            logger.info('[%s] Interactive PTY requires enable commands',
+                        self.device)
             send_enable(self, disconnect_on_fail=False)  # Don't exit on fail
 
         # Setup and run the initial commands, and also assume we're enabled
@@ -1210,7 +1960,8 @@ class TriggerSSHPtyChannel(channel.SSHChannel):
 # ==================
 
 
-class TriggerSSHChannelBase(channel.SSHChannel, TimeoutMixin, object):
+class TriggerSSHChannelBase(channel.SSHChannel, TimeoutMixin,
+                             PromptBufferMixin, PipelineMixin):
     """
     Base class for SSH channels.
 
@@ -1230,25 +1981,34 @@ class TriggerSSHChannelBase(channel.SSHChannel, TimeoutMixin, object):
                 # etc.
         """
         self.factory = self.conn.transport.factory
-        self.commanditer = self.factory.commanditer
-        self.results = self.factory.results
-        self.with_errors = self.factory.with_errors
-        self.incremental = self.factory.incremental
-        self.command_interval = self.factory.command_interval
-        self.prompt = self.factory.prompt
-        self.setTimeout(self.factory.timeout)
         self.device = self.factory.device
-        log.msg('[%s] COMMANDS: %r' % (self.device, self.factory.commands))
+        self._setup_commands()
+        self.prompt = self.factory.prompt
+        logger.debug('[%s] COMMANDS: %r', self.device, self.factory.commands)
         self.data = ''
         self.initialized = self.factory.initialized
         self.startup_commands = copy.copy(self.device.startup_commands)
-        log.msg('[%s] My startup commands: %r' % (self.device,
-                                                  self.startup_commands))
+        logger.debug('[%s] My startup commands: %r', self.device,
+                     self.startup_commands)
 
         # For IOS-like devices that require 'enable'
         self.enable_prompt = re.compile(settings.IOSLIKE_ENABLE_PAT)
         self.enabled = False
 
+    def _setup_commands(self):
+        """
+        Take the commands to send, and how to send them, from the factory. A
+        channel kept open by a `~trigger.twister.SessionPool` does this again
+        for every request.
+        """
+        self.commanditer = self.factory.commanditer
+        self.results = self.factory.results
+        self.with_errors = self.factory.with_errors
+        self.incremental = self.factory.incremental
+        self.command_interval = self.factory.command_interval
+        self.pipeline = self.factory.pipeline
+        self.setTimeout(self.factory.timeout)
+
     def channelOpen(self, data):
         """Do this when the channel opens."""
         self._setup_channelOpen()
@@ -1266,125 +2026,148 @@ class TriggerSSHChannelBase(channel.SSHChannel, TimeoutMixin, object):
 
         If the shell never establishes, this won't be called.
         """
-        log.msg('[%s] Got channel request response!' % self.device)
+        logger.debug('[%s] Got channel request response!', self.device)
 
     def _ebShellOpen(self, reason):
-        log.msg('[%s] Channel request failed: %s' % (self.device, reason))
+        logger.warning('[%s] Channel request failed: %s', self.device, reason)
 
     def dataReceived(self, bytes):
         """Do this when we receive data."""
         # Append to the data buffer
-        self.data += bytes
-        log.msg('[%s] BYTES: %r' % (self.device, bytes))
+        self.buffer.append(bytes)
+        logger.debug('[%s] BYTES: %r', self.device, bytes)
         # log.msg('BYTES: (left: %r, max: %r, bytes: %r, data: %r)' %
         #         (self.remoteWindowLeft, self.localMaxPacket, len(bytes),
-        #          len(self.data)))
+        #          len(self.buffer)))
 
-        # Keep going til you get a prompt match
-        m = self.prompt.search(self.data)
+        # Commands written ahead are split up by the pipeline
+        if self.pending:
+            return self._pipeline_received()
+
+        # Keep going til you get a prompt match. Only the end of the buffer
+        # can hold an enable or confirmation prompt.
+        m = self.buffer.find(self.prompt)
         if not m:
+            tail = self.buffer.tail(self.buffer.window)
+
             # Do we need to send an enable password?
-            if not self.enabled and requires_enable(self, self.data):
+            if not self.enabled and requires_enable(self, tail):
                 send_enable(self)
                 return None
 
             # Check for confirmation prompts
             # If the prompt confirms set the index to the matched bytes
-            if is_awaiting_confirmation(self.data):
-                log.msg('[%s] Got confirmation prompt: '
-                        '%r' % (self.device, self.data))
+            if is_awaiting_confirmation(tail):
+                logger.debug('[%s] Got confirmation prompt: %r', self.device,
+                             self.data)
                 prompt_idx = self.data.find(bytes)
             else:
                 return None
         else:
             # Or just use the matched regex object...
-            log.msg('[%s] STATE: buffer %r' % (self.device, self.data))
-            log.msg('[%s] STATE: prompt %r' % (self.device, m.group()))
+            logger.debug('[%s] STATE: buffer %r', self.device, self.data)
+            logger.debug('[%s] STATE: prompt %r', self.device, m.group())
             prompt_idx = m.start()
 
         # Strip the prompt from the match result
         result = self.data[:prompt_idx]  # Cut the prompt out
         result = result[result.find('\n')+1:]  # Keep all from first newline
-        log.msg('[%s] STATE: result %r' % (self.device, result))
+        logger.debug('[%s] STATE: result %r', self.device, result)
 
         # Only keep the results once we've sent any startup_commands
         if self.initialized:
             self.results.append(result)
+            self.factory.command_done()
 
-        # By default we're checking for IOS-like or Juniper errors because most
-        # vendors # fall under this category.
-        has_errors = (has_ioslike_error(result) or has_juniper_error(result))
-        if has_errors and not self.with_errors:
-            log.msg('[%s] Command failed: %r' % (self.device, result))
-            self.factory.err = exceptions.CommandFailure(result)
-            self.loseConnection()
+        if not self._check_result(result):
             return None
 
         # Honor the command_interval and then send the next command
         else:
             if self.command_interval:
-                log.msg('[%s] Waiting %s seconds before sending next command' %
-                        (self.device, self.command_interval))
-            self.data = ''  # Flush the buffer before next command
+                logger.info('[%s] Waiting %s seconds before sending next '
+                            'command', self.device, self.command_interval)
+            self.buffer.clear()  # Flush the buffer before next command
             reactor.callLater(self.command_interval, self._send_next)
 
+    def _check_result(self, result):
+        """
+        Return whether ``result`` is free of errors, or fail and close the
+        connection if not.
+        """
+        # By default we're checking for IOS-like or Juniper errors because most
+        # vendors # fall under this category.
+        has_errors = (has_ioslike_error(result) or has_juniper_error(result))
+        if has_errors and not self.with_errors:
+            logger.warning('[%s] Command failed: %r', self.device, result)
+            self.factory.err = exceptions.CommandFailure(result)
+            self.loseConnection()
+            return False
+        return True
+
     def _send_next(self):
         """Send the next command in the stack."""
         self.resetTimeout()  # Reset the timeout
 
         if not self.initialized:
-            log.msg('[%s] Not initialized; sending startup commands' %
-                    self.device)
+            logger.info('[%s] Not initialized; sending startup commands',
+                        self.device)
             if self.startup_commands:
                 next_init = self.startup_commands.pop(0)
-                log.msg('[%s] Sending initialize command: %r' % (self.device,
-                                                                 next_init))
+                logger.info('[%s] Sending initialize command: %r', self.device,
+                            next_init)
                 self.write(next_init.strip() + self.device.delimiter)
                 return None
             else:
-                log.msg('[%s] Successfully initialized for command execution' %
-                        self.device)
+                logger.info('[%s] Successfully initialized for command '
+                            'execution', self.device)
                 self.initialized = True
+                self.factory.timings.start(timing.COMMANDS)
 
         if self.incremental:
             self.incremental(self.results)
 
+        if self.pipeline:
+            if not self._fill_pipeline():
+                self.factory.channel_finished(self)
+            return None
+
         try:
             next_command = self.commanditer.next()
         except StopIteration:
-            log.msg('[%s] CHANNEL: out of commands, closing connection...' %
-                    self.device)
-            self.loseConnection()
+            self.factory.channel_finished(self)
             return None
 
         if next_command is None:
             self.results.append(None)
             self._send_next()
         else:
-            log.msg('[%s] Sending SSH command %r' % (self.device,
-                                                     next_command))
+            logger.info('[%s] Sending SSH command %r', self.device,
+                        next_command)
             self.write(next_command + self.device.delimiter)
+            self.factory.command_sent()
 
     def loseConnection(self):
         """
         Terminate the connection. Link this to the transport method of the same
         name.
         """
-        log.msg('[%s] Forcefully closing transport connection' % self.device)
+        logger.info('[%s] Forcefully closing transport connection',
+                    self.device)
         self.conn.transport.loseConnection()
 
     def timeoutConnection(self):
         """
         Do this when the connection times out.
         """
-        log.msg('[%s] Timed out while sending commands' % self.device)
+        logger.warning('[%s] Timed out while sending commands', self.device)
         self.factory.err = exceptions.CommandTimeout('Timed out while sending '
                                                      'commands')
         self.loseConnection()
 
     def request_exit_status(self, data):
         status = struct.unpack('>L', data)[0]
-        log.msg('[%s] Exit status: %s' % (self.device, status))
+        logger.info('[%s] Exit status: %s', self.device, status)
 
 
 class TriggerSSHGenericChannel(TriggerSSHChannelBase):
@@ -1434,15 +2217,18 @@ class TriggerSSHCommandChannel(TriggerSSHChannelBase):
     def __init__(self, command, *args, **kwargs):
         super(TriggerSSHCommandChannel, self).__init__(*args, **kwargs)
         self.command = command
+        self.index = None  # Where the result goes, set by the connection
+        self.sent_at = None
         self.result = None
         self.data = ''
 
     def channelOpen(self, data):
         """Do this when the channel opens."""
         self._setup_channelOpen()
-        log.msg('[%s] Channel was opened' % self.device)
+        logger.info('[%s] Channel was opened', self.device)
         d = self.conn.sendRequest(self, 'exec', common.NS(self.command),
                                   wantReply=True)
+        self.sent_at = self.factory.command_sent()
         d.addCallback(self._gotResponse)
         d.addErrback(self._ebShellOpen)
 
@@ -1450,67 +2236,74 @@ class TriggerSSHCommandChannel(TriggerSSHChannelBase):
         """
         If the shell never establishes, this won't be called.
         """
-        log.msg('[%s] CHANNEL %s: Exec finished.' % (self.device, self.id))
+        logger.info('[%s] CHANNEL %s: Exec finished.', self.device, self.id)
         self.conn.sendEOF(self)
 
     def _ebShellOpen(self, reason):
-        log.msg('[%s] CHANNEL %s: Channel request failed: %s' % (self.device,
-                                                                 reason,
-                                                                 self.id))
+        logger.warning('[%s] CHANNEL %s: Channel request failed: %s',
+                       self.device, reason, self.id)
 
     def dataReceived(self, bytes):
-        self.data += bytes
+        self.buffer.append(bytes)
         # log.msg('BYTES INFO: (left: %r, max: %r, bytes: %r, data: %r)' %
         #         (self.remoteWindowLeft,
         #          self.localMaxPacket,
         #          len(bytes),
-        #          len(self.data)))
-        log.msg('[%s] BYTES RECV: %r' % (self.device, bytes))
+        #          len(self.buffer)))
+        logger.debug('[%s] BYTES RECV: %r', self.device, bytes)
 
     def eofReceived(self):
-        log.msg('[%s] CHANNEL %s: EOF received.' % (self.device, self.id))
+        logger.info('[%s] CHANNEL %s: EOF received.', self.device, self.id)
         result = self.data
 
-        # By default we're checking for IOS-like errors because most vendors
-        # fall under this category.
-        if has_ioslike_error(result) and not self.with_errors:
-            log.msg('[%s] Command failed: %r' % (self.device, result))
+        # Exec channels are only used for Juniper and IOS-like devices.
+        has_errors = (has_ioslike_error(result) or has_juniper_error(result))
+        if has_errors and not self.with_errors:
+            logger.warning('[%s] Command failed: %r', self.device, result)
             self.factory.err = exceptions.CommandFailure(result)
 
         # Honor the command_interval and then send the next command
         else:
             self.result = result
-            self.conn.transport.factory.results.append(self.result)
+            self.conn.command_result(self, self.result)
+            self.conn.transport.factory.command_done(self.sent_at)
             self.send_next_command()
 
     def send_next_command(self):
         """Send the next command in the stack stored on the connection"""
-        log.msg('[%s] CHANNEL %s: '
-                'sending next command!' % (self.device, self.id))
+        logger.info('[%s] CHANNEL %s: sending next command!', self.device,
+                    self.id)
         self.conn.send_command()
 
     def closeReceived(self):
-        log.msg('[%s] CHANNEL %s: Close received.' % (self.device, self.id))
+        logger.info('[%s] CHANNEL %s: Close received.', self.device, self.id)
         self.loseConnection()
 
     def loseConnection(self):
         """Default loseConnection"""
-        log.msg("[%s] LOSING CHANNEL CONNECTION" % self.device)
+        logger.info("[%s] LOSING CHANNEL CONNECTION", self.device)
         channel.SSHChannel.loseConnection(self)
 
     def closed(self):
-        log.msg('[%s] Channel %s closed' % (self.device, self.id))
-        log.msg('[%s] CONN CHANNELS: %s' % (self.device,
-                                            len(self.conn.channels)))
+        logger.info('[%s] Channel %s closed', self.device, self.id)
+        logger.debug('[%s] CONN CHANNELS: %s', self.device,
+                     len(self.conn.channels))
 
         # If we're out of channels, shut it down!
-        if len(self.conn.transport.factory.results) == len(self.conn.commands):
-            log.msg('[%s] RESULTS MATCHES COMMANDS SENT.' % self.device)
+        factory = self.conn.transport.factory
+        if len(factory.results) == len(self.conn.commands):
+            logger.info('[%s] RESULTS MATCHES COMMANDS SENT.', self.device)
+            self.conn.transport.loseConnection()
+
+        # Or if a command failed, don't wait on the others
+        elif factory.err is not None:
+            logger.info('[%s] Command failed, closing connection',
+                        self.device)
             self.conn.transport.loseConnection()
 
     def request_exit_status(self, data):
         exitStatus = int(struct.unpack('>L', data)[0])
-        log.msg('[%s] Exit status: %s' % (self.device, exitStatus))
+        logger.info('[%s] Exit status: %s', self.device, exitStatus)
 
 
 class TriggerSSHJunoscriptChannel(TriggerSSHChannelBase):
@@ -1534,11 +2327,12 @@ class TriggerSSHJunoscriptChannel(TriggerSSHChannelBase):
         self.write(_xml)
         self.xmltb = IncrementalXMLTreeBuilder(self._endhandler)
 
+        self.factory.timings.start(timing.COMMANDS)
         self._send_next()
 
     def dataReceived(self, data):
         """Do this when we receive data."""
-        log.msg('[%s] BYTES: %r' % (self.device, data))
+        logger.debug('[%s] BYTES: %r', self.device, data)
         self.xmltb.feed(data)
 
     def _send_next(self):
@@ -1550,12 +2344,12 @@ class TriggerSSHJunoscriptChannel(TriggerSSHChannelBase):
 
         try:
             next_command = self.commanditer.next()
-            log.msg('[%s] COMMAND: next command %s' % (self.device,
-                                                       next_command))
+            logger.info('[%s] COMMAND: next command %s', self.device,
+                        next_command)
 
         except StopIteration:
-            log.msg('[%s] CHANNEL: out of commands, closing connection...' %
-                    self.device)
+            logger.info('[%s] CHANNEL: out of commands, closing connection...',
+                        self.device)
             self.loseConnection()
             return None
 
@@ -1566,15 +2360,17 @@ class TriggerSSHJunoscriptChannel(TriggerSSHChannelBase):
             rpc = Element('rpc')
             rpc.append(next_command)
             ElementTree(rpc).write(self)
+            self.factory.command_sent()
 
     def _endhandler(self, tag):
         """Do this when the XML stream ends."""
         if tag.tag != '{http://xml.juniper.net/xnm/1.1/xnm}rpc-reply':
             return None  # hopefully it's interior to an <rpc-reply>
         self.results.append(tag)
+        self.factory.command_done()
 
         if has_junoscript_error(tag) and not self.with_errors:
-            log.msg('[%s] Command failed: %r' % (self.device, tag))
+            logger.warning('[%s] Command failed: %r', self.device, tag)
             self.factory.err = exceptions.JunoscriptCommandFailure(tag)
             self.loseConnection()
             return None
@@ -1583,8 +2379,8 @@ class TriggerSSHJunoscriptChannel(TriggerSSHChannelBase):
         # stack
         else:
             if self.command_interval:
-                log.msg('[%s] Waiting %s seconds before sending next command' %
-                        (self.device, self.command_interval))
+                logger.info('[%s] Waiting %s seconds before sending next '
+                            'command', self.device, self.command_interval)
             reactor.callLater(self.command_interval, self._send_next)
 
 
@@ -1599,7 +2395,7 @@ class TriggerSSHNetscalerChannel(TriggerSSHChannelBase):
     def dataReceived(self, bytes):
         """Do this when we receive data."""
         self.data += bytes
-        log.msg('[%s] BYTES: %r' % (self.device, bytes))
+        logger.debug('[%s] BYTES: %r', self.device, bytes)
         # log.msg('BYTES: (left: %r, max: %r, bytes: %r, data: %r)' %
         #        (self.remoteWindowLeft,
         #         self.localMaxPacket,
@@ -1611,28 +2407,31 @@ class TriggerSSHNetscalerChannel(TriggerSSHChannelBase):
         if has_netscaler_error(self.data):
             err = self.data
             if not self.with_errors:
-                log.msg('[%s] Command failed: %r' % (self.device, err))
+                logger.warning('[%s] Command failed: %r', self.device, err)
                 self.factory.err = exceptions.CommandFailure(err)
                 self.loseConnection()
                 return None
             else:
                 self.results.append(err)
+                self.factory.command_done()
                 self._send_next()
 
         m = self.prompt.search(self.data)
         if not m:
             # log.msg('STATE: prompt match failure', debug=True)
             return None
-        log.msg('[%s] STATE: prompt %r' % (self.device, m.group()))
+        logger.debug('[%s] STATE: prompt %r', self.device, m.group())
 
         result = self.data[:m.start()]  # Strip ' Done\n' from results.
 
         if self.initialized:
             self.results.append(result)
+            self.factory.command_done()
 
+        self.data = ''  # Flush the buffer before next command
         if self.command_interval:
-            log.msg('[%s] Waiting %s seconds before sending next command' %
-                    (self.device, self.command_interval))
+            logger.info('[%s] Waiting %s seconds before sending next '
+                        'command', self.device, self.command_interval)
         reactor.callLater(self.command_interval, self._send_next)
 
 PICA8_NO_MORE_COMMANDS = ['show']
@@ -1654,12 +2453,12 @@ class TriggerSSHPica8Channel(TriggerSSHAsyncPtyChannel):
             new_commands.append(command)
         self.commanditer = iter(new_commands)
 
-    def channelOpen(self, data):
+    def _setup_commands(self):
         """
-        Override channel open, which is where commanditer is setup in the
-        base class.
+        Override taking the commands from the factory, which is where
+        commanditer is setup in the base class.
         """
-        super(TriggerSSHPica8Channel, self).channelOpen(data)
+        super(TriggerSSHPica8Channel, self)._setup_commands()
         self._setup_commanditer()  # Replace self.commanditer with our version
 
 # ==================
@@ -1725,6 +2524,11 @@ class TriggerTelnet(
         self.setTimeout(self.timeout)
         telnet.Telnet.__init__(self)
 
+    def connectionMade(self):
+        """Start timing the login once we're connected."""
+        self.factory.timings.start(timing.LOGIN)
+        telnet.Telnet.connectionMade(self)
+
     def enableRemote(self, option):
         """
         Allow telnet clients to enable options if for some reason they aren't
@@ -1733,21 +2537,21 @@ class TriggerTelnet(
         method right now.
         """
         # log.msg('[%s] enableRemote option: %r' % (self.host, option))
-        log.msg('enableRemote option: %r' % option)
+        logger.debug('enableRemote option: %r', option)
         return True
 
     def login_state_machine(self, bytes):
         """Track user login state."""
         self.host = self.transport.connector.host
-        log.msg('[%s] CONNECTOR HOST: %s' % (self.host,
-                                             self.transport.connector.host))
+        logger.debug('[%s] CONNECTOR HOST: %s', self.host,
+                     self.transport.connector.host)
         self.data += bytes
-        log.msg('[%s] STATE:  got data %r' % (self.host, self.data))
+        logger.debug('[%s] STATE:  got data %r', self.host, self.data)
         for (text, next_state) in self.waiting_for:
-            log.msg('[%s] STATE:  possible matches %r' % (self.host, text))
+            logger.debug('[%s] STATE:  possible matches %r', self.host, text)
             if self.data.endswith(text):
-                log.msg('[%s] Entering state %r' % (self.host,
-                                                    next_state.__name__))
+                logger.debug('[%s] Entering state %r', self.host,
+                             next_state.__name__)
                 self.resetTimeout()
                 next_state()
                 self.data = ''
@@ -1780,8 +2584,9 @@ class TriggerTelnet(
         action.
         """
         self.setTimeout(None)
+        self.factory.timings.start(timing.STARTUP)
         data = self.data.lstrip('\n')
-        log.msg('[%s] state_logged_in, DATA: %r' % (self.host, data))
+        logger.debug('[%s] state_logged_in, DATA: %r', self.host, data)
         del self.waiting_for, self.data
 
         # Run init_commands
@@ -1803,7 +2608,7 @@ class TriggerTelnet(
         TACACS by default. Use 'aaa authentication login privilege-mode'.
         Also, why no space after the Password: prompt here?
         """
-        log.msg("[%s] ENABLE: Sending command: enable" % self.host)
+        logger.info("[%s] ENABLE: Sending command: enable", self.host)
         self.write('enable\n')
         self.waiting_for = [
             ('Password: ', self.state_enable_pw),  # Foundry
@@ -1853,28 +2658,29 @@ class TriggerTelnet(
     def state_raise_error(self):
         """Do this when we get a login failure."""
         self.waiting_for = []
-        log.msg('Failed logging into %s' % self.transport.connector.host)
+        logger.warning('Failed logging into %s', self.transport.connector.host)
         self.factory.err = exceptions.LoginFailure('%r' % self.data.rstrip())
         self.loseConnection()
 
     def timeoutConnection(self):
         """Do this when we timeout logging in."""
-        log.msg('[%s] '
-                'Timed out while logging in' % self.transport.connector.host)
+        logger.warning('[%s] Timed out while logging in',
+                       self.transport.connector.host)
         self.factory.err = exceptions.LoginTimeout('Timed out while '
                                                    'logging in')
         self.loseConnection()
 
 
-class IoslikeSendExpect(protocol.Protocol, TimeoutMixin):
+class IoslikeSendExpect(protocol.Protocol, TimeoutMixin,
+                        PromptBufferMixin, PipelineMixin):
     """
     Action for use with TriggerTelnet as a state machine.
 
     Take a list of commands, and send them to the device until we run out or
-    one errors. Wait for a prompt after each.
+    one errors. Wait for a prompt after each, unless ``pipeline`` is set.
     """
     def __init__(self, device, commands, incremental=None, with_errors=False,
-                 timeout=None, command_interval=0):
+                 timeout=None, command_interval=0, pipeline=None):
         self.device = device
         self._commands = commands
         self.commanditer = iter(commands)
@@ -1882,10 +2688,11 @@ class IoslikeSendExpect(protocol.Protocol, TimeoutMixin):
         self.with_errors = with_errors
         self.timeout = timeout
         self.command_interval = command_interval
+        self.pipeline = pipeline
         self.prompt = re.compile(settings.IOSLIKE_PROMPT_PAT)
         self.startup_commands = copy.copy(self.device.startup_commands)
-        log.msg('[%s] My initialize commands: %r' % (self.device,
-                                                     self.startup_commands))
+        logger.debug('[%s] My initialize commands: %r', self.device,
+                     self.startup_commands)
         self.initialized = False
 
     def connectionMade(self):
@@ -1893,25 +2700,29 @@ class IoslikeSendExpect(protocol.Protocol, TimeoutMixin):
         self.setTimeout(self.timeout)
         self.results = self.factory.results = []
         self.data = ''
-        log.msg('[%s] connectionMade, data: %r' % (self.device, self.data))
+        logger.debug('[%s] connectionMade, data: %r', self.device, self.data)
 
         # Don't call _send_next, since we expect to see a prompt, which
         # will kick off initialization.
 
     def dataReceived(self, bytes):
         """Do this when we get data."""
-        log.msg('[%s] BYTES: %r' % (self.device, bytes))
-        self.data += bytes
+        logger.debug('[%s] BYTES: %r', self.device, bytes)
+        self.buffer.append(bytes)
+
+        # Commands written ahead are split up by the pipeline
+        if self.pending:
+            return self._pipeline_received()
 
         # See if the prompt matches, and if it doesn't, see if it is waiting
         # for more input (like a [y/n]) prompt), and continue, otherwise return
         # None
-        m = self.prompt.search(self.data)
+        m = self.buffer.find(self.prompt)
         if not m:
             # If the prompt confirms set the index to the matched bytes,
-            if is_awaiting_confirmation(self.data):
-                log.msg('[%s] Got confirmation prompt: %r' % (self.device,
-                                                              self.data))
+            if is_awaiting_confirmation(self.buffer.tail(self.buffer.window)):
+                logger.debug('[%s] Got confirmation prompt: %r', self.device,
+                             self.data)
                 prompt_idx = self.data.find(bytes)
             else:
                 return None
@@ -1924,50 +2735,68 @@ class IoslikeSendExpect(protocol.Protocol, TimeoutMixin):
         # since the telnet session is in WONT ECHO.  This is confirmed with
         # a packet trace, and running self.transport.dont(ECHO) from
         # connectionMade() returns an AlreadyDisabled error.  What's up?
-        log.msg('[%s] result BEFORE: %r' % (self.device, result))
+        logger.debug('[%s] result BEFORE: %r', self.device, result)
         result = result[result.find('\n')+1:]
-        log.msg('[%s] result AFTER: %r' % (self.device, result))
+        logger.debug('[%s] result AFTER: %r', self.device, result)
 
         if self.initialized:
             self.results.append(result)
+            self.factory.command_done()
 
+        if self._check_result(result):
+            if self.command_interval:
+                logger.info('[%s] Waiting %s seconds before sending next '
+                            'command', self.device, self.command_interval)
+            reactor.callLater(self.command_interval, self._send_next)
+
+    def _check_result(self, result):
+        """
+        Return whether ``result`` is free of errors, or fail and close the
+        connection if not.
+        """
         if has_ioslike_error(result) and not self.with_errors:
-            log.msg('[%s] Command failed: %r' % (self.device, result))
+            logger.warning('[%s] Command failed: %r', self.device, result)
             self.factory.err = exceptions.IoslikeCommandFailure(result)
             self.loseConnection()
-        else:
-            if self.command_interval:
-                log.msg('[%s] Waiting %s seconds before sending next command' %
-                        (self.device, self.command_interval))
-            reactor.callLater(self.command_interval, self._send_next)
+            return False
+        return True
 
     def _send_next(self):
         """Send the next command in the stack."""
-        self.data = ''
+        if not self.pending:
+            self.buffer.clear()
         self.resetTimeout()
 
         if not self.initialized:
-            log.msg('[%s] Not initialized, sending startup commands' %
-                    self.device)
+            logger.info('[%s] Not initialized, sending startup commands',
+                        self.device)
             if self.startup_commands:
                 next_init = self.startup_commands.pop(0)
-                log.msg('[%s] Sending initialize command: %r' % (self.device,
-                                                                 next_init))
+                logger.info('[%s] Sending initialize command: %r', self.device,
+                            next_init)
                 self.write(next_init.strip() + self.device.delimiter)
                 return None
             else:
-                log.msg('[%s] Successfully initialized for command execution' %
-                        self.device)
+                logger.info('[%s] Successfully initialized for command '
+                            'execution', self.device)
                 self.initialized = True
+                self.factory.timings.start(timing.COMMANDS)
 
         if self.incremental:
             self.incremental(self.results)
 
+        if self.pipeline:
+            if not self._fill_pipeline():
+                logger.info('[%s] No more commands to send, disconnecting...',
+                            self.device)
+                self.loseConnection()
+            return None
+
         try:
             next_command = self.commanditer.next()
         except StopIteration:
-            log.msg('[%s] No more commands to send, disconnecting...' %
-                    self.device)
+            logger.info('[%s] No more commands to send, disconnecting...',
+                        self.device)
             self.loseConnection()
             return None
 
@@ -1975,12 +2804,13 @@ class IoslikeSendExpect(protocol.Protocol, TimeoutMixin):
             self.results.append(None)
             self._send_next()
         else:
-            log.msg('[%s] Sending command %r' % (self.device, next_command))
+            logger.info('[%s] Sending command %r', self.device, next_command)
             self.write(next_command + self.device.delimiter)
+            self.factory.command_sent()
 
     def timeoutConnection(self):
         """Do this when we timeout."""
-        log.msg('[%s] Timed out while sending commands' % self.device)
+        logger.warning('[%s] Timed out while sending commands', self.device)
         self.factory.err = exceptions.CommandTimeout('Timed out while '
                                                      'sending commands')
         self.loseConnection()
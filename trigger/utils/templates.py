@@ -28,7 +28,8 @@ except ImportError:
 
 
 # Exports
-__all__ = ('get_template_path', 'load_cmd_template', 'get_textfsm_object')
+__all__ = ('get_template_path', 'load_cmd_template', 'get_textfsm_object',
+           'parse_textfsm')
 
 
 def get_template_path(cmd, dev_type=None):
@@ -74,3 +75,23 @@ def get_textfsm_object(re_table, cli_output):
         rv[k].append(v)
 
     return dict(rv)
+
+
+def parse_textfsm(cmd, dev_type, cli_output):
+    """
+    Parse ``cli_output`` from ``cmd`` using the template for ``dev_type``
+    and return the structured data.
+
+    This is a plain function so that it can be run in a
+    `~trigger.pools.ProcessParsePool`.
+
+    :param cmd: CLI command that was run.
+    :type  cmd: str
+    :param dev_type: Type of device ie cisco_ios, arista_eos
+    :type  dev_type: str
+    :param cli_output: Output of the command.
+    :type  cli_output: str
+    :returns: dict of ``{field: [values]}``
+    """
+    re_table = load_cmd_template(cmd, dev_type=dev_type)
+    return get_textfsm_object(re_table, cli_output)
@@ -10,7 +10,7 @@ __email__ = 'jathan.mccollum@teamaol.com'
 __copyright__ = 'Copyright 2012-2013, AOL Inc.'
 
 from zope.interface import implements
-from twisted.application.internet import TCPServer, SSLServer
+from twisted.application.internet import TCPServer, SSLServer, TimerService
 from twisted.application.service import IServiceMaker, MultiService
 from twisted.conch.manhole_tap import makeService as makeConsoleService
 from twisted.plugin import IPlugin
@@ -27,12 +27,17 @@ except ImportError:
                   RuntimeWarning)
     ssl = None
 
+from trigger.conf import settings
 from trigger.contrib.xmlrpc.server import TriggerXMLRPCServer
+from trigger.metrics import MetricsResource
+from trigger.netdevices import NetDevices
 
 
 # Defaults
 XML_PORT = 8000
 SSH_PORT = 8001
+METRICS_PORT = 0
+METRICS_INTERFACE = '127.0.0.1'
 SSH_USERS = 'users.txt'
 SSL_KEYFILE = 'server.key'
 SSL_CERTFILE = 'cacert.pem'
@@ -42,6 +47,10 @@ class Options(usage.Options):
     optParameters = [
         ['port', 'p', XML_PORT, 'Listening port for XMLRPC'],
         ['ssh-port', 's', SSH_PORT, 'Listening port for SSH manhole'],
+        ['metrics-port', 'm', METRICS_PORT,
+         'Listening port for Prometheus metrics over HTTP (0 to disable)'],
+        ['metrics-interface', None, METRICS_INTERFACE,
+         'Interface to serve Prometheus metrics on'],
         ['ssh-users', 'u', SSH_USERS,
          'Path to a passwd(5)-format username/password file'],
         ['ssl-keyfile', 'k', SSL_KEYFILE,
@@ -87,6 +96,27 @@ class TriggerXMLRPCServiceMaker(object):
         svc = MultiService()
         xmlrpc_service.setServiceParent(svc)
         console_service.setServiceParent(svc)
+
+        # Serve metrics for Prometheus to scrape
+        if int(options['metrics-port']) and settings.METRICS_ENABLED:
+            metrics_service = TCPServer(
+                int(options['metrics-port']), server.Site(MetricsResource()),
+                interface=options['metrics-interface'])
+            metrics_service.setServiceParent(svc)
+
+        # Periodically pick up changes to NetDevices
+        if settings.NETDEVICES_RELOAD_INTERVAL:
+            reload_service = TimerService(settings.NETDEVICES_RELOAD_INTERVAL,
+                                          reload_netdevices)
+            reload_service.setServiceParent(svc)
+
         return svc
 
+def reload_netdevices():
+    """Reload NetDevices, logging rather than raising any errors."""
+    try:
+        NetDevices().reload()
+    except Exception:
+        log.err(None, 'Failed to reload NetDevices')
+
 serviceMaker = TriggerXMLRPCServiceMaker()